@@ -41,6 +41,13 @@ class Settings(BaseSettings):
     # Supabase
     supabase_url: str = ""
     supabase_service_role_key: str = ""
+    # Conexión Postgres directa (opcional) para ingesta masiva vía COPY
+    database_url: str = ""
+    bulk_ingest_copy: bool = True
+    # Backend de storage: "supabase" (PostgREST) | "sqlite" (embebido: single-node, backtests, offline)
+    storage_backend: str = "supabase"
+    sqlite_path: str = "data/local.db"              # ":memory:" para tests/replays efímeros
+    sqlite_migrations_dir: str = ""                 # vacío = supabase/migrations del repo
 
     # Binance Proxy
     binance_proxy_url: str = "https://binance.italicia.com"
@@ -55,6 +62,9 @@ class Settings(BaseSettings):
 
     # Kill Switch — set to True to enable trade execution
     trading_enabled: bool = False
+    # Ejecución de proposals aprobados: carriles por símbolo en paralelo
+    execution_max_concurrency: int = 4
+    execution_orders_per_second: float = 5.0   # bucket de órdenes (límite Binance: 10/s por cuenta)
 
     # Security - shared secret for Next.js → Python calls (MUST be set via env)
     backend_secret: str = ""
@@ -74,6 +84,61 @@ class Settings(BaseSettings):
     risk_min_account_balance: float = 1000.0
     risk_max_account_utilization: float = 0.8
     risk_auto_approval_threshold: float = 100.0
+    risk_short_circuit: bool = True            # cortar la validación en el primer check rechazado
+    risk_snapshot_max_age_seconds: int = 90    # reusar entropía/régimen del tick quant si son más nuevos
+    # VaR / CVaR del book (horizonte: una vela del intervalo primario)
+    portfolio_var_enabled: bool = True
+    portfolio_var_limit_usd: float = 75.0      # VaR máximo del book tras el proposal
+    portfolio_var_confidence: float = 0.99
+    portfolio_var_lambda: float = 0.94         # decay EWMA de la covarianza (RiskMetrics)
+    portfolio_var_window: int = 200            # velas para VaR histórico
+    # Position book en memoria: cada cuánto se verifica contra la DB
+    position_book_verify_seconds: int = 300
+
+    # Protección SL/TP nativa en el exchange (OCO). Con esto el fast loop queda como backstop.
+    exchange_protection_enabled: bool = False
+    protection_stop_limit_offset_pct: float = 0.003  # límite por debajo del stop (slippage tolerado)
+    protection_fallback_stop_limit: bool = True      # si el OCO falla, al menos un STOP_LOSS_LIMIT
+    protection_poll_seconds: int = 5                 # cada cuánto consultar el estado de las órdenes
+    protection_retry_seconds: int = 60               # reintento de colocación tras un fallo
+    # exchangeInfo (LOT_SIZE / PRICE_FILTER / NOTIONAL) cacheado + conexión HTTP compartida a Binance
+    exchange_filters_refresh_seconds: int = 3600
+    binance_http_keepalive_seconds: float = 55.0     # conexiones ociosas del pool se cierran después de esto
+    binance_http_max_connections: int = 10
+    # User data stream: executionReport / outboundAccountPosition por websocket (el polling queda de red)
+    user_stream_enabled: bool = False
+    user_stream_ws_url: str = "wss://testnet.binance.vision/ws"
+    user_stream_keepalive_seconds: int = 1800        # keep-alive del listenKey (vence a los 60 min)
+    user_stream_safety_poll_seconds: int = 120       # polling de protecciones con el stream conectado
+    # Trailing stop: el SL sube en memoria cada tick; a la DB como máximo 1 escritura / N s por posición
+    trailing_persist_seconds: int = 30
+    # Write-behind de telemetría (risk_events, indicadores, entropía, regímenes)
+    write_behind_enabled: bool = True
+    write_behind_batch_size: int = 200
+    write_behind_flush_seconds: float = 5.0
+    write_behind_max_pending: int = 5000            # back-pressure: el productor hace flush
+    write_behind_spill_path: str = "data/write_behind_spill.jsonl"
+    write_behind_spill_max_bytes: int = 20_000_000
+    # Instrumentación de queries a Supabase (conteo/latencia/filas/bytes por tick o request)
+    db_instrumentation_enabled: bool = True
+    db_tick_query_budget: int = 0                   # queries por tick del main loop; 0 = sin límite
+    db_n_plus_one_threshold: int = 5                # misma forma de query N veces en un scope = sospecha N+1
+    # Trazas de latencia vela → señal → fill (persistidas en trade_proposals/positions.latency_trace)
+    latency_trace_enabled: bool = True
+    latency_trace_samples: int = 2000               # muestras por etapa y símbolo para p50/p95/p99
+    # Scheduler por cierre de vela: quant/señales al cerrar cada vela (el main loop de 60s queda para housekeeping)
+    candle_scheduler_enabled: bool = False
+    candle_settle_seconds: float = 2.0              # margen después del cierre para que la vela sea final
+    candle_jitter_seconds: float = 0.5              # jitter aleatorio acotado sobre el despertar
+    # Mark-to-market de posiciones abiertas (una escritura bulk por período)
+    mark_to_market_seconds: int = 60
+    # Estado de la cuenta (un get_account por tick + ledger de fills propios)
+    account_state_max_age_seconds: int = 45         # < período del main loop: a lo sumo un refresh por tick
+    # Reconciliación incremental/adaptativa
+    reconciliation_fast_seconds: int = 60           # cadencia después de actividad (fills, cierres)
+    reconciliation_idle_seconds: int = 240          # tope sin actividad (health marca stale a los 300s)
+    reconciliation_full_seconds: int = 900          # corrida completa contra el exchange
+    reconciliation_order_recheck_seconds: int = 300 # re-verificar una orden no terminal
 
     # Quant Engine
     quant_enabled: bool = True
@@ -87,6 +152,11 @@ class Settings(BaseSettings):
     max_risk_per_trade_pct: float = 0.01
     quant_buy_notional_usd: float = 60.0
     kline_backfill_days: int = 30
+    # Resampling local: pedir sólo velas base y derivar 5m/15m/1h/4h/1d (opt-in hasta validarlo en producción)
+    kline_resample_enabled: bool = False
+    kline_base_interval: str = "1m"
+    kline_resample_check_ticks: int = 60   # cada cuántos ticks comparar contra Binance
+    kline_gap_repair_ticks: int = 360      # scan + reparación de gaps (6h)
     sr_clusters: int = 8
     sr_lookback: int = 500
 
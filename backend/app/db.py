@@ -1,5 +1,6 @@
 from supabase import create_client, Client
 from .config import settings
+from .services.query_budget import instrument
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,7 +11,15 @@ _client: Client | None = None
 def get_supabase() -> Client:
     global _client
     if _client is None:
-        if not settings.supabase_url or not settings.supabase_service_role_key:
-            raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
-        _client = create_client(settings.supabase_url, settings.supabase_service_role_key)
+        if settings.storage_backend == "sqlite":
+            # Store embebido (single-node / offline): misma interfaz table()/rpc()
+            from .services.local_store import LocalClient
+            _client = LocalClient(settings.sqlite_path, settings.sqlite_migrations_dir or None)
+            logger.info(f"Using local SQLite storage at {settings.sqlite_path}")
+        else:
+            if not settings.supabase_url or not settings.supabase_service_role_key:
+                raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+            _client = create_client(settings.supabase_url, settings.supabase_service_role_key)
+        if settings.db_instrumentation_enabled:
+            _client = instrument(_client)
     return _client
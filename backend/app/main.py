@@ -12,6 +12,9 @@ from .routers import dead_letter, reconciliation, graduation, daily_analyst
 # Note: agent, status, orders, positions, prices are legacy routers
 # that depend on sqlmodel/app.state which are no longer used
 from .services.trading_loop import run_loop
+from .services.write_behind import get_write_behind
+from .services.user_stream import get_user_stream
+from .services.query_budget import query_scope
 from .config import settings
 
 
@@ -33,6 +36,14 @@ class AuthMiddleware(BaseHTTPMiddleware):
 
         return await call_next(request)
 
+
+class QueryScopeMiddleware(BaseHTTPMiddleware):
+    """Count the Supabase queries of each request (N+1 detection, see query_budget)."""
+
+    async def dispatch(self, request: Request, call_next):
+        with query_scope(f"{request.method} {request.url.path}"):
+            return await call_next(request)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(name)s: %(message)s",
@@ -66,9 +77,24 @@ async def lifespan(app: FastAPI):
     logger.info(f"Trading backend starting (env={settings.binance_env}, proxy={settings.binance_proxy_url})")
 
     # Sync clock with Binance server before starting trading loop
-    from .services.binance_client import _sync_server_time
+    from .services.binance_client import _sync_server_time, close_client, warm_up
     await _sync_server_time()
 
+    # Filtros de exchangeInfo en caché + conexión keep-alive abierta antes de la primera orden
+    from .services.exchange_filters import get_exchange_filters
+    await get_exchange_filters().maybe_refresh()
+    await warm_up()
+
+    # Telemetría no crítica en batches (risk_events, indicadores, entropía, regímenes)
+    write_behind = get_write_behind()
+    if settings.write_behind_enabled:
+        write_behind.start()
+
+    # Fills y balances por websocket; el polling de órdenes queda como red de seguridad
+    user_stream = get_user_stream()
+    if settings.user_stream_enabled:
+        user_stream.start()
+
     _loop_task = asyncio.create_task(run_loop(interval_seconds=60))
     yield
     if _loop_task:
@@ -77,6 +103,11 @@ async def lifespan(app: FastAPI):
             await _loop_task
         except asyncio.CancelledError:
             pass
+    if user_stream.running:
+        await user_stream.stop()
+    if write_behind.running:
+        await write_behind.stop()
+    await close_client()
     logger.info("Trading backend stopped")
 
 
@@ -91,6 +122,7 @@ _allowed_origins = [
     if o.strip()
 ]
 
+app.add_middleware(QueryScopeMiddleware)
 app.add_middleware(AuthMiddleware)
 app.add_middleware(
     CORSMiddleware,
@@ -1,7 +1,7 @@
 """Models package - re-exports from original models.py for backwards compatibility."""
 
 from pydantic import BaseModel
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 from datetime import datetime
 from enum import Enum
 
@@ -29,6 +29,7 @@ class ValidationResult(BaseModel):
     risk_score: float
     checks: List[RiskCheck]
     rejection_reason: Optional[str] = None
+    timings_ms: Dict[str, float] = {}
 
 
 class CreateProposalRequest(BaseModel):
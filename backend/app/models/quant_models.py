@@ -29,7 +29,11 @@ class KlineStatusItem(BaseModel):
     symbol: str
     interval: str
     latest_open_time: Optional[str] = None
+    first_open_time: Optional[str] = None
     count: int = 0
+    gap_count: int = 0
+    missing_candles: int = 0
+    freshness_lag_seconds: Optional[int] = None
 
 
 # ============================================================================
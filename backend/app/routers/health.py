@@ -2,6 +2,8 @@ from fastapi import APIRouter
 from datetime import datetime, timezone, timedelta
 from ..db import get_supabase
 from ..services import binance_client
+from ..services.account_state import get_account_state
+from ..services.user_stream import get_user_stream
 from ..services.telegram_notifier import is_telegram_configured
 from ..config import settings
 
@@ -30,6 +32,13 @@ async def health():
     # Telegram check
     checks["telegram"] = "ok" if is_telegram_configured() else "not_configured"
 
+    # User data stream (sin stream, fills y balances se resuelven por polling)
+    if not settings.user_stream_enabled:
+        checks["user_stream"] = "not_configured"
+    else:
+        checks["user_stream"] = "ok" if get_user_stream().is_live() else "disconnected"
+        metrics["user_stream"] = get_user_stream().status()
+
     # Reconciliation staleness check
     try:
         supabase = get_supabase()
@@ -40,7 +49,8 @@ async def health():
             last_recon = recon_resp.data[0]
             last_recon_time = datetime.fromisoformat(last_recon["created_at"].replace("Z", "+00:00"))
             staleness = (datetime.now(timezone.utc) - last_recon_time).total_seconds()
-            if staleness > 300:  # >5 min stale
+            # >5 min stale (o más que la cadencia ociosa de la reconciliación)
+            if staleness > max(300, settings.reconciliation_idle_seconds + 60):
                 checks["reconciliation"] = f"stale ({int(staleness)}s ago)"
             else:
                 checks["reconciliation"] = "ok"
@@ -62,7 +72,7 @@ async def health():
 
     # Total balance
     try:
-        account = await binance_client.get_account()
+        account = await get_account_state().get_account()
         usdt_balance = next(
             (float(b["free"]) + float(b["locked"]) for b in account.get("balances", []) if b["asset"] == "USDT"),
             0.0,
@@ -64,6 +64,23 @@ async def trigger_backfill(req: BackfillRequest):
 
 @router.get("/status/all")
 async def klines_status():
-    """Get latest timestamps per symbol/interval."""
+    """Coverage per symbol/interval (count, range, gaps, freshness lag) in one DB round trip."""
     status = await kline_collector.get_klines_status()
-    return {"status": status}
+    stale = [
+        f"{s['symbol']}:{s['interval']}"
+        for s in status
+        if s["freshness_lag_seconds"] is None
+        or s["freshness_lag_seconds"] * 1000 > kline_collector.interval_ms(s["interval"])
+    ]
+    return {"status": status, "stale": stale}
+
+
+@router.get("/status/completeness")
+async def klines_completeness(
+    days: int = Query(30, ge=1, le=365),
+    repair: bool = Query(False, description="Re-fetch missing ranges after scanning"),
+):
+    """Completeness % and merged gap ranges per symbol/interval over the last N days."""
+    from ..services import kline_gaps
+    symbols = [s.strip() for s in settings.quant_symbols.split(",") if s.strip()]
+    return await kline_gaps.scan_and_repair(symbols, days=days, repair=repair, all_pairs=True)
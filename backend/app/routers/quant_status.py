@@ -1,7 +1,15 @@
 """API routes for quant engine status and performance."""
 
-from fastapi import APIRouter
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Query
 from ..services.quant_orchestrator import get_engine_status, get_quant_snapshot
+from ..services.query_budget import recent_reports
+from ..services.portfolio_risk import get_portfolio_risk
+from ..services.latency_trace import LatencyStats, get_latency_stats
+from ..services.candle_scheduler import get_candle_scheduler
+from ..services.risk_manager import load_open_positions
 from ..db import get_supabase
 from ..config import settings
 import logging
@@ -26,6 +34,59 @@ async def quant_performance():
     return {"metrics": metrics}
 
 
+@router.get("/db-queries")
+async def quant_db_queries():
+    """Query counts, latency and N+1 suspects of the last ticks/requests."""
+    return {"scopes": recent_reports()}
+
+
+@router.get("/portfolio-risk")
+async def quant_portfolio_risk():
+    """Book VaR/CVaR (horizon: one primary-interval candle) and model state."""
+    model = get_portfolio_risk()
+    # Con el book frío es una query sync a Supabase: fuera del event loop
+    positions = await asyncio.to_thread(load_open_positions)
+    exposures, uncovered = model.exposures(positions)
+    report = model.measure(exposures)[0] if model.ready else None
+    return {
+        "model": model.status(),
+        "limit_usd": settings.portfolio_var_limit_usd,
+        "exposure_by_symbol": {s: round(float(v), 2) for s, v in zip(model.symbols, exposures) if v},
+        "uncovered_exposure": round(uncovered, 2),
+        "risk": report.as_dict() if report else None,
+    }
+
+
+@router.get("/latency")
+async def quant_latency(
+    symbol: Optional[str] = None,
+    source: str = Query("memory", pattern="^(memory|db)$"),
+    limit: int = Query(500, ge=1, le=5000),
+):
+    """p50/p95/p99 per stage (and per symbol) from candle close to order fill.
+
+    ``source=memory``: samples of this process. ``source=db``: the last
+    ``limit`` persisted proposal traces (survives restarts).
+    """
+    if source == "memory":
+        stats = get_latency_stats()
+    else:
+        query = get_supabase().table("trade_proposals").select("latency_trace").not_.is_("latency_trace", "null")
+        if symbol:
+            query = query.eq("symbol", symbol.upper())
+        rows = query.order("created_at", desc=True).limit(limit).execute().data or []
+        stats = LatencyStats(maxlen=limit)
+        for row in rows:
+            stats.observe_dict(row["latency_trace"])
+    return {"source": source, **stats.summary(symbol.upper() if symbol else None)}
+
+
+@router.get("/scheduler")
+async def quant_scheduler():
+    """Candle-close scheduler: jobs, coalesced closes and lag (close → job done) per job."""
+    return get_candle_scheduler().status()
+
+
 @router.get("/health")
 async def quant_health():
     """Health check of all quant modules."""
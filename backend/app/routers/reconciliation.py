@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Query
 from ..services.reconciliation import (
     run_reconciliation,
+    reconciliation_status,
     get_latest_reconciliation,
     get_reconciliation_history,
 )
@@ -13,11 +14,17 @@ logger = logging.getLogger(__name__)
 
 @router.post("/reconciliation/run")
 async def trigger_reconciliation():
-    """Trigger a manual reconciliation run."""
-    result = await run_reconciliation()
+    """Trigger a manual (full) reconciliation run."""
+    result = await run_reconciliation(full=True)
     return result
 
 
+@router.get("/reconciliation/status")
+async def reconciliation_state():
+    """Incremental state, adaptive cadence and cost of the last runs."""
+    return reconciliation_status()
+
+
 @router.get("/reconciliation/latest")
 async def latest_reconciliation():
     """Get the most recent reconciliation result."""
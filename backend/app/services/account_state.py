@@ -0,0 +1,225 @@
+"""Tick-scoped account state: one ``get_account`` per tick plus a fill ledger.
+
+``get_account`` es un endpoint firmado de peso 20 y se pedía en cada
+``validate_proposal``, en cada ``compute_position_size``, en
+``get_portfolio_state``, en el health check y en el reporte diario: N
+proposals costaban ~2N llamadas por tick.
+
+``AccountState`` guarda el último snapshot de balances y lo sirve desde
+memoria mientras tenga menos de ``ACCOUNT_STATE_MAX_AGE_SECONDS`` (por
+debajo del período del main loop, así cada tick hace a lo sumo un refresh).
+Entre refreshes, las órdenes que ejecuta el propio bot se aplican a un
+ledger local (``apply_order``): el USDT libre que ve el segundo proposal del
+tick ya descuenta la compra del primero. Cualquier cambio que el ledger no
+puede modelar (fills de protecciones en el exchange, errores de ejecución)
+llama ``invalidate()`` y el próximo lector refresca. Con el user data
+stream conectado, ``outboundAccountPosition`` trae los balances absolutos de
+los assets que cambiaron (``apply_stream_balances``), incluidos los fills de
+protecciones.
+
+Cada respuesta lleva ``freshness`` (edad, fills aplicados desde el refresh,
+origen) para que el caller sepa qué tan viejo es el dato.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from ..config import settings
+from . import binance_client
+
+logger = logging.getLogger(__name__)
+
+QUOTE_ASSETS = ("USDT", "FDUSD", "USDC", "BUSD", "BTC", "ETH", "BNB")
+_DRIFT_TOLERANCE = 0.01   # 1% del balance (o $1) entre ledger y exchange
+_MAX_STREAM_ORDERS = 500  # órdenes cuyo balance ya llegó por el stream
+
+
+def split_symbol(symbol: str) -> tuple[str, str]:
+    """BTCUSDT -> ("BTC", "USDT")."""
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[: -len(quote)], quote
+    return symbol, "USDT"
+
+
+class AccountState:
+    """Cached Binance balances adjusted by our own fills between refreshes."""
+
+    def __init__(self):
+        self._account: Optional[Dict[str, Any]] = None
+        self._balances: Dict[str, Dict[str, float]] = {}
+        self._fetched_at: Optional[str] = None
+        self._fetched_mono = 0.0
+        self._fills = 0
+        self._stale = False
+        self._stream_updates = 0
+        self._stream_orders: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self.stats: Dict[str, Any] = {"refreshes": 0, "hits": 0, "fills_applied": 0, "invalidations": 0,
+                                      "drift_events": 0, "stream_updates": 0}
+
+    # ── Lectura ──
+
+    async def get_account(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Account en formato Binance (``balances``) + ``freshness``.
+
+        Refresca si no hay snapshot, si fue invalidado o si tiene más de
+        ``max_age`` segundos (default ``ACCOUNT_STATE_MAX_AGE_SECONDS``).
+        Lectores concurrentes comparten un solo request.
+        """
+        max_age = settings.account_state_max_age_seconds if max_age is None else max_age
+        if not self._needs_refresh(max_age):
+            self.stats["hits"] += 1
+            return self._render()
+        async with self._lock:
+            if self._needs_refresh(max_age):
+                await self.refresh()
+            else:
+                self.stats["hits"] += 1
+        return self._render()
+
+    async def free(self, asset: str = "USDT", max_age: Optional[float] = None) -> float:
+        await self.get_account(max_age)
+        return self._balances.get(asset, {}).get("free", 0.0)
+
+    def freshness(self) -> Dict[str, Any]:
+        return {
+            "fetched_at": self._fetched_at,
+            "age_seconds": round(time.monotonic() - self._fetched_mono, 1) if self._fetched_at else None,
+            "fills_since_refresh": self._fills,
+            "source": "ledger" if self._fills else "stream" if self._stream_updates else "exchange",
+        }
+
+    def _needs_refresh(self, max_age: float) -> bool:
+        return self._account is None or self._stale or time.monotonic() - self._fetched_mono > max_age
+
+    def _render(self) -> Dict[str, Any]:
+        balances = [
+            {"asset": asset, "free": f"{b['free']:.8f}", "locked": f"{b['locked']:.8f}"}
+            for asset, b in self._balances.items()
+        ]
+        return {**(self._account or {}), "balances": balances, "freshness": self.freshness()}
+
+    # ── Refresh ──
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Leer la cuenta del exchange y reemplazar el snapshot."""
+        account = await binance_client.get_account()
+        if "code" in account and "balances" not in account:
+            raise RuntimeError(f"Binance error {account.get('code')}: {account.get('msg', 'Unknown')}")
+        self.observe(account)
+        return self._render()
+
+    def observe(self, account: Dict[str, Any]) -> None:
+        """Adoptar un account leído por otro camino (p.ej. reconciliación)."""
+        balances = {
+            b["asset"]: {"free": float(b.get("free", 0)), "locked": float(b.get("locked", 0))}
+            for b in account.get("balances", [])
+        }
+        if self._fills and self._account is not None:
+            self._check_drift(balances)
+        self._account = {k: v for k, v in account.items() if k not in ("balances", "freshness")}
+        self._balances = balances
+        self._fetched_at = datetime.now(timezone.utc).isoformat()
+        self._fetched_mono = time.monotonic()
+        self._fills = 0
+        self._stream_updates = 0
+        self._stale = False
+        self.stats["refreshes"] += 1
+
+    def _check_drift(self, exchange: Dict[str, Dict[str, float]]) -> None:
+        for asset in {"USDT"} | set(self._balances):
+            ours = self._balances.get(asset, {}).get("free", 0.0)
+            theirs = exchange.get(asset, {}).get("free", 0.0)
+            if abs(ours - theirs) > max(1.0 if asset == "USDT" else 0.0, abs(theirs) * _DRIFT_TOLERANCE):
+                self.stats["drift_events"] += 1
+                logger.warning(
+                    f"Account ledger drift on {asset}: ledger={ours:.8f} exchange={theirs:.8f} "
+                    f"({self._fills} fills since refresh)"
+                )
+
+    def invalidate(self, reason: str = "") -> None:
+        """Forzar refresh en la próxima lectura (cambio que el ledger no modela)."""
+        if self._account is None:
+            return
+        self._stale = True
+        self.stats["invalidations"] += 1
+        if reason:
+            logger.debug(f"Account state invalidated: {reason}")
+
+    # ── Ledger ──
+
+    def apply_order(self, symbol: str, side: str, order: Dict[str, Any]) -> None:
+        """Aplicar una orden ejecutada por el bot (respuesta FULL de Binance).
+
+        BUY suma base y resta quote; SELL al revés. La comisión se descuenta
+        del asset en que se cobró. Sin snapshot previo no hay nada que
+        ajustar: el próximo refresh ya trae el resultado.
+        """
+        if self._account is None:
+            return
+        if order.get("orderId") is not None and int(order["orderId"]) in self._stream_orders:
+            return  # el stream ya trajo (o está trayendo) el balance resultante
+        qty = float(order.get("executedQty", 0) or 0)
+        if qty <= 0:
+            return
+        fills = order.get("fills") or []
+        quote_qty = float(order.get("cummulativeQuoteQty", 0) or 0)
+        if quote_qty <= 0:
+            quote_qty = sum(float(f.get("price", 0)) * float(f.get("qty", 0)) for f in fills)
+        base, quote = split_symbol(symbol)
+        sign = 1 if side.upper() == "BUY" else -1
+        self._adjust(base, sign * qty)
+        self._adjust(quote, -sign * quote_qty)
+        for f in fills:
+            commission = float(f.get("commission", 0) or 0)
+            if commission:
+                self._adjust(f.get("commissionAsset", quote), -commission)
+        self._fills += 1
+        self.stats["fills_applied"] += 1
+
+    # ── User data stream ──
+
+    def apply_stream_balances(self, balances: List[Dict[str, Any]]) -> None:
+        """``outboundAccountPosition``: balances absolutos (``a``/``f``/``l``) de los assets que cambiaron."""
+        if self._account is None:
+            return
+        for b in balances:
+            self._balances[b["a"]] = {"free": float(b.get("f", 0)), "locked": float(b.get("l", 0))}
+        self._stream_updates += 1
+        self.stats["stream_updates"] += 1
+
+    def note_stream_fill(self, order_id: int) -> None:
+        """Marcar una orden cuyo efecto en balances llega por el stream (``apply_order`` la ignora)."""
+        self._stream_orders[int(order_id)] = None
+        while len(self._stream_orders) > _MAX_STREAM_ORDERS:
+            self._stream_orders.popitem(last=False)
+
+    def _adjust(self, asset: str, delta: float) -> None:
+        bal = self._balances.setdefault(asset, {"free": 0.0, "locked": 0.0})
+        bal["free"] += delta
+        if bal["free"] < 0:
+            # Vender lo que estaba bloqueado por una protección recién liberada
+            bal["locked"] = max(0.0, bal["locked"] + bal["free"])
+            bal["free"] = 0.0
+
+    # ── Estado ──
+
+    def status(self) -> Dict[str, Any]:
+        return {"loaded": self._account is not None, "stale": self._stale, **self.freshness(), **self.stats}
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+_state = AccountState()
+
+
+def get_account_state() -> AccountState:
+    return _state
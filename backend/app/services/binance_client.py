@@ -1,8 +1,11 @@
+import asyncio
 import hashlib
 import hmac
+import json
 import time
 import httpx
-from typing import Optional
+from decimal import Decimal
+from typing import Dict, Optional
 from ..config import settings
 import logging
 
@@ -15,6 +18,15 @@ PROXY_BASE = settings.binance_proxy_url.rstrip("/") + "/binance" if settings.bin
 # Clock drift compensation: offset in ms to add to local time to match Binance server
 _server_time_offset_ms: int = 0
 
+# Cliente HTTP compartido (keep-alive): sin él cada request abría TCP + TLS
+# nuevos, y el POST de una orden pagaba el handshake completo. httpx ata el
+# pool al event loop donde se creó, así que se recrea si cambia el loop.
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# HMAC con la clave ya procesada: firmar = copy() + update()
+_hmac_keys: Dict[str, "hmac.HMAC"] = {}
+
 
 async def _sync_server_time() -> None:
     """Fetch Binance server time and calculate clock offset."""
@@ -44,11 +56,45 @@ def _server_timestamp() -> int:
 
 def _sign(params: dict, secret: str) -> str:
     query_string = "&".join([f"{k}={v}" for k, v in params.items()])
-    return hmac.new(
-        secret.encode("utf-8"),
-        query_string.encode("utf-8"),
-        hashlib.sha256,
-    ).hexdigest()
+    keyed = _hmac_keys.get(secret)
+    if keyed is None:
+        keyed = _hmac_keys[secret] = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+    mac = keyed.copy()
+    mac.update(query_string.encode("utf-8"))
+    return mac.hexdigest()
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for the running event loop."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_keepalive_connections=settings.binance_http_max_connections,
+                max_connections=settings.binance_http_max_connections * 2,
+                keepalive_expiry=settings.binance_http_keepalive_seconds,
+            ),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client() -> None:
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client, _client_loop = None, None
+
+
+async def warm_up() -> bool:
+    """Abrir (o mantener viva) la conexión del cliente compartido con un ping (peso 1)."""
+    try:
+        await _request(method="GET", endpoint="/api/v3/ping", params={}, timeout=5, signed=False)
+        return True
+    except Exception as e:
+        logger.warning(f"Binance connection warm-up failed: {e}")
+        return False
 
 
 def _headers(signed: bool = False, use_proxy: Optional[bool] = None) -> dict:
@@ -69,54 +115,56 @@ async def _request(
     signed: bool = False,
 ) -> dict | list:
     """Request helper: uses proxy when configured, falls back to direct only if no proxy."""
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        if USE_PROXY and PROXY_BASE:
-            proxy_url = f"{PROXY_BASE}{endpoint}"
-            try:
-                proxy_resp = await client.request(
-                    method,
-                    proxy_url,
-                    params=params,
-                    headers=_headers(signed=signed, use_proxy=True),
-                )
-                proxy_resp.raise_for_status()
-                return proxy_resp.json()
-            except httpx.HTTPStatusError as e:
-                status = e.response.status_code
-                body = e.response.text[:200]
-                if status in (401, 403):
-                    raise RuntimeError(
-                        f"Proxy auth failed ({status}) for {endpoint}. "
-                        f"Check BINANCE_PROXY_AUTH_SECRET. Response: {body}"
-                    ) from e
-                if status in (502, 503, 504):
-                    logger.error(
-                        f"Proxy unavailable ({status}) for {endpoint}: {body}"
-                    )
-                    raise RuntimeError(
-                        f"Proxy unavailable ({status}) for {endpoint}. "
-                        f"Check that {settings.binance_proxy_url} is running."
-                    ) from e
-                # Other errors (400, 429, etc.) — log Binance error body, then re-raise
+    client = _get_client()
+    if USE_PROXY and PROXY_BASE:
+        proxy_url = f"{PROXY_BASE}{endpoint}"
+        try:
+            proxy_resp = await client.request(
+                method,
+                proxy_url,
+                params=params,
+                headers=_headers(signed=signed, use_proxy=True),
+                timeout=timeout,
+            )
+            proxy_resp.raise_for_status()
+            return proxy_resp.json()
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            body = e.response.text[:200]
+            if status in (401, 403):
+                raise RuntimeError(
+                    f"Proxy auth failed ({status}) for {endpoint}. "
+                    f"Check BINANCE_PROXY_AUTH_SECRET. Response: {body}"
+                ) from e
+            if status in (502, 503, 504):
                 logger.error(
-                    f"Binance API error {status} for {endpoint}: {body}"
+                    f"Proxy unavailable ({status}) for {endpoint}: {body}"
                 )
-                raise
-            except httpx.RequestError as e:
                 raise RuntimeError(
-                    f"Proxy unreachable for {endpoint}: {e}. "
-                    f"Check BINANCE_PROXY_URL={settings.binance_proxy_url}"
+                    f"Proxy unavailable ({status}) for {endpoint}. "
+                    f"Check that {settings.binance_proxy_url} is running."
                 ) from e
-
-        # No proxy configured — direct access
-        direct_resp = await client.request(
-            method,
-            f"{DIRECT_BASE}{endpoint}",
-            params=params,
-            headers=_headers(signed=signed, use_proxy=False),
-        )
-        direct_resp.raise_for_status()
-        return direct_resp.json()
+            # Other errors (400, 429, etc.) — log Binance error body, then re-raise
+            logger.error(
+                f"Binance API error {status} for {endpoint}: {body}"
+            )
+            raise
+        except httpx.RequestError as e:
+            raise RuntimeError(
+                f"Proxy unreachable for {endpoint}: {e}. "
+                f"Check BINANCE_PROXY_URL={settings.binance_proxy_url}"
+            ) from e
+
+    # No proxy configured — direct access
+    direct_resp = await client.request(
+        method,
+        f"{DIRECT_BASE}{endpoint}",
+        params=params,
+        headers=_headers(signed=signed, use_proxy=False),
+        timeout=timeout,
+    )
+    direct_resp.raise_for_status()
+    return direct_resp.json()
 
 
 async def get_price(symbol: str) -> dict:
@@ -129,6 +177,17 @@ async def get_price(symbol: str) -> dict:
     )
 
 
+async def get_prices(symbols: list[str]) -> list:
+    """Precios de varios símbolos en un solo request (``[{symbol, price}, ...]``)."""
+    return await _request(
+        method="GET",
+        endpoint="/api/v3/ticker/price",
+        params={"symbols": json.dumps(symbols, separators=(",", ":"))},
+        timeout=10,
+        signed=False,
+    )
+
+
 async def get_price_direct(symbol: str) -> dict:
     """Hit testnet.binance.vision DIRECTLY, bypassing proxy.
 
@@ -199,25 +258,36 @@ async def get_ticker_24hr(symbol: str) -> dict:
     )
 
 
+def _decimal_str(value: float) -> str:
+    """Sin notación científica (``str(0.00001)`` es ``1e-05``, que Binance rechaza)."""
+    return format(Decimal(repr(float(value))).normalize(), "f")
+
+
 async def place_order(
     symbol: str,
     side: str,
     order_type: str,
     quantity: float,
     price: Optional[float] = None,
+    params: Optional[dict] = None,
 ) -> dict:
-    params: dict = {
-        "symbol": symbol,
-        "side": side.upper(),
-        "type": order_type.upper(),
-        "quantity": str(quantity),
-        "timestamp": _server_timestamp(),
-        "recvWindow": 5000,
-    }
-    if order_type.upper() == "LIMIT" and price:
-        params["price"] = str(price)
-        params["timeInForce"] = "GTC"
-
+    """Place an order. ``params``: parámetros ya validados (``exchange_filters.prepare_order``)."""
+    if params is None:
+        params = {
+            "symbol": symbol,
+            "side": side.upper(),
+            "type": order_type.upper(),
+            "quantity": _decimal_str(quantity),
+        }
+        if order_type.upper() == "LIMIT" and price:
+            params["price"] = _decimal_str(price)
+            params["timeInForce"] = "GTC"
+    return await submit_order(params)
+
+
+async def submit_order(order_params: dict) -> dict:
+    """POST de una orden ya armada (``exchange_filters.prepare_order``): sólo timestamp + firma."""
+    params = {**order_params, "timestamp": _server_timestamp(), "recvWindow": 5000}
     params["signature"] = _sign(params, settings.binance_testnet_secret)
 
     return await _request(
@@ -229,6 +299,18 @@ async def place_order(
     )
 
 
+async def get_exchange_info(symbols: Optional[list[str]] = None) -> dict:
+    """Reglas de trading por símbolo (filtros LOT_SIZE, PRICE_FILTER, NOTIONAL...)."""
+    params = {"symbols": json.dumps(symbols, separators=(",", ":"))} if symbols else {}
+    return await _request(
+        method="GET",
+        endpoint="/api/v3/exchangeInfo",
+        params=params,
+        timeout=10,
+        signed=False,
+    )
+
+
 async def get_klines(
     symbol: str,
     interval: str = "1h",
@@ -297,3 +379,151 @@ async def cancel_order(symbol: str, order_id: int) -> dict:
         timeout=10,
         signed=True,
     )
+
+
+async def place_oco_order(
+    symbol: str,
+    side: str,
+    quantity: float,
+    above_price: float,
+    below_stop_price: float,
+    below_price: float,
+) -> dict:
+    """OCO (POST /api/v3/orderList/oco): LIMIT_MAKER arriba + STOP_LOSS_LIMIT abajo.
+
+    Para cerrar un long (side=SELL): arriba = take profit, abajo = stop loss.
+    Cuando una pata se ejecuta, el exchange cancela la otra.
+    """
+    params: dict = {
+        "symbol": symbol,
+        "side": side.upper(),
+        "quantity": str(quantity),
+        "aboveType": "LIMIT_MAKER",
+        "abovePrice": str(above_price),
+        "belowType": "STOP_LOSS_LIMIT",
+        "belowStopPrice": str(below_stop_price),
+        "belowPrice": str(below_price),
+        "belowTimeInForce": "GTC",
+        "timestamp": _server_timestamp(),
+        "recvWindow": 5000,
+    }
+    params["signature"] = _sign(params, settings.binance_testnet_secret)
+    return await _request(
+        method="POST",
+        endpoint="/api/v3/orderList/oco",
+        params=params,
+        timeout=20,
+        signed=True,
+    )
+
+
+async def place_stop_limit_order(
+    symbol: str,
+    side: str,
+    quantity: float,
+    stop_price: float,
+    price: float,
+) -> dict:
+    """Single STOP_LOSS_LIMIT order (GTC)."""
+    params: dict = {
+        "symbol": symbol,
+        "side": side.upper(),
+        "type": "STOP_LOSS_LIMIT",
+        "quantity": str(quantity),
+        "stopPrice": str(stop_price),
+        "price": str(price),
+        "timeInForce": "GTC",
+        "timestamp": _server_timestamp(),
+        "recvWindow": 5000,
+    }
+    params["signature"] = _sign(params, settings.binance_testnet_secret)
+    return await _request(
+        method="POST",
+        endpoint="/api/v3/order",
+        params=params,
+        timeout=20,
+        signed=True,
+    )
+
+
+async def get_order_list(order_list_id: int) -> dict:
+    """Estado de un order list (OCO): listOrderStatus EXECUTING | ALL_DONE | REJECT."""
+    params = {
+        "orderListId": order_list_id,
+        "timestamp": _server_timestamp(),
+    }
+    params["signature"] = _sign(params, settings.binance_testnet_secret)
+    return await _request(
+        method="GET",
+        endpoint="/api/v3/orderList",
+        params=params,
+        timeout=10,
+        signed=True,
+    )
+
+
+async def cancel_order_list(symbol: str, order_list_id: int) -> dict:
+    """Cancel an entire order list (both OCO legs)."""
+    params = {
+        "symbol": symbol,
+        "orderListId": order_list_id,
+        "timestamp": _server_timestamp(),
+    }
+    params["signature"] = _sign(params, settings.binance_testnet_secret)
+    return await _request(
+        method="DELETE",
+        endpoint="/api/v3/orderList",
+        params=params,
+        timeout=10,
+        signed=True,
+    )
+
+
+async def get_my_trades(symbol: str, order_id: int) -> list:
+    """Fills (trades) de una orden: precio, cantidad y comisión por fill."""
+    params = {
+        "symbol": symbol,
+        "orderId": order_id,
+        "timestamp": _server_timestamp(),
+    }
+    params["signature"] = _sign(params, settings.binance_testnet_secret)
+    return await _request(
+        method="GET",
+        endpoint="/api/v3/myTrades",
+        params=params,
+        timeout=10,
+        signed=True,
+    )
+
+
+async def create_listen_key() -> dict:
+    """listenKey del user data stream (sólo API key, sin firma). Vence a los 60 min sin keep-alive."""
+    return await _request(
+        method="POST",
+        endpoint="/api/v3/userDataStream",
+        params={},
+        timeout=10,
+        signed=True,
+    )
+
+
+async def keepalive_listen_key(listen_key: str) -> dict:
+    """Extender la validez del listenKey 60 minutos."""
+    return await _request(
+        method="PUT",
+        endpoint="/api/v3/userDataStream",
+        params={"listenKey": listen_key},
+        timeout=10,
+        signed=True,
+    )
+
+
+async def close_listen_key(listen_key: str) -> dict:
+    """Cerrar el user data stream."""
+    return await _request(
+        method="DELETE",
+        endpoint="/api/v3/userDataStream",
+        params={"listenKey": listen_key},
+        timeout=10,
+        signed=True,
+    )
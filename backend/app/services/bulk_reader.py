@@ -0,0 +1,202 @@
+"""Keyset-paginated bulk reader for large Supabase tables.
+
+``.range(offset, offset + 999)`` obliga a Postgres a recorrer y descartar
+``offset`` filas en cada página (cada vez más lento) y, si hay upserts
+concurrentes, una fila nueva delante del cursor desplaza todo y se
+duplican o saltean filas. El reader pagina por clave:
+
+    WHERE (symbol, interval, open_time) > (último visto) ORDER BY ... LIMIT n
+
+usando el índice único, así que cada página cuesta lo mismo y ninguna fila
+existente se repite ni se pierde. La página siguiente se pide en un thread
+mientras el caller procesa la actual.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..db import get_supabase
+from .kline_arrays import empty_batch, from_db_rows, merge_batches
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000  # máximo por request de PostgREST
+
+Filter = Tuple[str, str, Any]  # (operador PostgREST, columna, valor)
+
+
+def _or_value(value: Any) -> str:
+    """Quote a value for a PostgREST ``or=(...)`` filter when needed."""
+    text = str(value)
+    if any(ch in text for ch in ',.:()" '):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+def keyset_condition(keys: Sequence[str], last: Dict[str, Any], descending: bool = False) -> str:
+    """Build the row-value comparison ``(k1, k2, ...) > (v1, v2, ...)`` as an or-filter.
+
+    PostgREST no soporta comparación de tuplas, así que se expande a
+    ``k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...``.
+    """
+    op = "lt" if descending else "gt"
+    clauses = []
+    for i, key in enumerate(keys):
+        parts = [f"{k}.eq.{_or_value(last[k])}" for k in keys[:i]]
+        parts.append(f"{key}.{op}.{_or_value(last[key])}")
+        clauses.append(f"and({','.join(parts)})" if len(parts) > 1 else parts[0])
+    return ",".join(clauses)
+
+
+class BulkReader:
+    """Iterate a table page by page with keyset pagination and one-page prefetch.
+
+    Args:
+        table: Tabla a leer.
+        select: Columnas (las claves se agregan si faltan).
+        keys: Columnas que forman una clave única (orden de paginación).
+        filters: Filtros fijos ``(op, columna, valor)``, ej. ``("eq", "symbol", "BTCUSDT")``.
+        descending: Paginar de la clave más nueva a la más vieja.
+        limit: Máximo de filas a devolver en total (None = todas).
+        page_size: Filas por request.
+        prefetch: Pedir la página siguiente mientras se procesa la actual.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        select: str = "*",
+        keys: Sequence[str] = ("id",),
+        filters: Optional[Sequence[Filter]] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+        page_size: int = PAGE_SIZE,
+        prefetch: bool = True,
+        client=None,
+    ):
+        self.table = table
+        self.keys = tuple(keys)
+        self.select = self._with_keys(select, self.keys)
+        self.filters = list(filters or [])
+        self.descending = descending
+        self.limit = limit
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self._client = client
+        self.stats: Dict[str, Any] = {"pages": 0, "rows": 0, "fetch_seconds": 0.0}
+
+    @staticmethod
+    def _with_keys(select: str, keys: Sequence[str]) -> str:
+        if select.strip() == "*":
+            return select
+        cols = [c.strip() for c in select.split(",") if c.strip()]
+        return ",".join(cols + [k for k in keys if k not in cols])
+
+    def _fetch(self, last: Optional[Dict[str, Any]], size: int) -> List[Dict[str, Any]]:
+        client = self._client or get_supabase()
+        query = client.table(self.table).select(self.select)
+        for op, column, value in self.filters:
+            query = getattr(query, op)(column, value)
+        if last is not None:
+            if len(self.keys) == 1:
+                key = self.keys[0]
+                query = getattr(query, "lt" if self.descending else "gt")(key, last[key])
+            else:
+                query = query.or_(keyset_condition(self.keys, last, self.descending))
+        for key in self.keys:
+            query = query.order(key, desc=self.descending)
+        t0 = time.perf_counter()
+        resp = query.limit(size).execute()
+        self.stats["fetch_seconds"] += time.perf_counter() - t0
+        return resp.data or []
+
+    def _next_size(self, returned: int) -> int:
+        if self.limit is None:
+            return self.page_size
+        return max(0, min(self.page_size, self.limit - returned))
+
+    def pages(self) -> Iterator[List[Dict[str, Any]]]:
+        """Yield pages of row dicts in key order."""
+        returned = 0
+        size = self._next_size(returned)
+        if size == 0:
+            return
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-reader") as pool:
+            pending: Optional[Future] = pool.submit(self._fetch, None, size)
+            while pending is not None:
+                rows = pending.result()
+                pending = None
+                if not rows:
+                    return
+                returned += len(rows)
+                self.stats["pages"] += 1
+                self.stats["rows"] = returned
+                next_size = self._next_size(returned)
+                if len(rows) == size and next_size > 0:
+                    pending = pool.submit(self._fetch, rows[-1], next_size)
+                    if not self.prefetch:
+                        pending.result()  # sin solapamiento: esperar antes de entregar
+                    size = next_size
+                yield rows
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        for page in self.pages():
+            yield from page
+
+
+def kline_reader(
+    symbol: Optional[str],
+    interval: Optional[str],
+    columns: Optional[Sequence[str]] = None,
+    start_iso: Optional[str] = None,
+    end_iso: Optional[str] = None,
+    limit: Optional[int] = None,
+    descending: bool = False,
+    page_size: int = PAGE_SIZE,
+    client=None,
+) -> BulkReader:
+    """BulkReader over ``klines_ohlcv`` keyed by (symbol, interval, open_time).
+
+    Con symbol e interval fijos la clave efectiva es sólo open_time (un
+    simple ``gt``); sin ellos se pagina la tabla completa por la clave compuesta.
+    """
+    filters: List[Filter] = []
+    keys: List[str] = []
+    if symbol is not None:
+        filters.append(("eq", "symbol", symbol))
+    else:
+        keys.append("symbol")
+    if interval is not None:
+        filters.append(("eq", "interval", interval))
+    else:
+        keys.append("interval")
+    keys.append("open_time")
+    if start_iso is not None:
+        filters.append(("gte", "open_time", start_iso))
+    if end_iso is not None:
+        filters.append(("lte", "open_time", end_iso))
+    select = ",".join(columns) if columns else "*"
+    return BulkReader(
+        "klines_ohlcv", select=select, keys=keys, filters=filters,
+        descending=descending, limit=limit, page_size=page_size, client=client,
+    )
+
+
+def iter_kline_batches(symbol: str, interval: str, **kwargs) -> Iterator[np.ndarray]:
+    """Yield one typed KLINE_DTYPE batch per page for a single pair."""
+    for page in kline_reader(symbol, interval, **kwargs).pages():
+        yield from_db_rows(page)
+
+
+def read_klines(symbol: str, interval: str, **kwargs) -> np.ndarray:
+    """Read a pair's klines into one typed batch, sorted by open_time ascending."""
+    batches = list(iter_kline_batches(symbol, interval, **kwargs))
+    if not batches:
+        return empty_batch()
+    return merge_batches(*batches)
@@ -0,0 +1,232 @@
+"""Bulk ingestion: COPY into a staging table + one merge statement.
+
+Con ``DATABASE_URL`` configurado y ``psycopg`` instalado, las filas se
+envían con ``COPY ... FROM STDIN`` a una tabla temporal y se fusionan con un
+único ``INSERT ... SELECT ... ON CONFLICT DO UPDATE`` dentro de la misma
+transacción: un round trip de datos en lugar de uno por cada 500 filas, sin
+serializar JSON.
+
+Sin conexión directa (sólo el endpoint REST de Supabase) se usa el camino
+PostgREST de siempre: upsert/insert JSON en batches de 500.
+
+Ambos caminos devuelven las mismas métricas (filas, segundos, rows/sec).
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ..config import settings
+from ..db import get_supabase
+from .kline_arrays import KLINE_DTYPE
+
+logger = logging.getLogger(__name__)
+
+REST_BATCH_SIZE = 500
+KLINE_CONFLICT = ("symbol", "interval", "open_time")
+_KLINE_VALUE_COLUMNS = [n for n in KLINE_DTYPE.names if n not in ("open_time", "close_time")]
+KLINE_COLUMNS = ["symbol", "interval", "open_time", "close_time", *_KLINE_VALUE_COLUMNS]
+
+
+def _load_psycopg():
+    try:
+        import psycopg
+    except ImportError:
+        return None
+    return psycopg
+
+
+def copy_available() -> bool:
+    """True si el camino COPY está habilitado y es utilizable."""
+    return bool(
+        settings.bulk_ingest_copy
+        and settings.database_url
+        and settings.storage_backend != "sqlite"  # el store local recibe todo por table()
+        and _load_psycopg() is not None
+    )
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def merge_statement(
+    table: str,
+    stage: str,
+    columns: Sequence[str],
+    conflict: Optional[Sequence[str]] = None,
+) -> str:
+    """SQL que mueve el staging a la tabla destino en una sola sentencia.
+
+    Con ``conflict``, ``DISTINCT ON`` deja una fila por clave (la última
+    copiada, por ``ctid``) para que ON CONFLICT no toque la misma fila dos veces.
+    """
+    cols = ", ".join(_ident(c) for c in columns)
+    if not conflict:
+        return f"INSERT INTO {_ident(table)} ({cols}) SELECT {cols} FROM {_ident(stage)}"
+    keys = ", ".join(_ident(c) for c in conflict)
+    updates = [c for c in columns if c not in conflict]
+    action = (
+        "DO UPDATE SET " + ", ".join(f"{_ident(c)} = EXCLUDED.{_ident(c)}" for c in updates)
+        if updates
+        else "DO NOTHING"
+    )
+    return (
+        f"INSERT INTO {_ident(table)} ({cols}) "
+        f"SELECT DISTINCT ON ({keys}) {cols} FROM {_ident(stage)} "
+        f"ORDER BY {keys}, ctid DESC "
+        f"ON CONFLICT ({keys}) {action}"
+    )
+
+
+def _copy_write(
+    table: str,
+    columns: Sequence[str],
+    rows: List[Sequence[Any]],
+    conflict: Optional[Sequence[str]],
+) -> int:
+    psycopg = _load_psycopg()
+    stage = f"_stage_{table}"
+    with psycopg.connect(settings.database_url) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"CREATE TEMP TABLE {_ident(stage)} "
+                f"(LIKE {_ident(table)} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            copy_sql = (
+                f"COPY {_ident(stage)} ({', '.join(_ident(c) for c in columns)}) FROM STDIN"
+            )
+            with cur.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            cur.execute(merge_statement(table, stage, columns, conflict))
+            written = cur.rowcount
+        conn.commit()
+    return max(written, 0)
+
+
+def _rest_write(
+    table: str,
+    columns: Sequence[str],
+    rows: List[Sequence[Any]],
+    conflict: Optional[Sequence[str]],
+) -> tuple[int, int]:
+    supabase = get_supabase()
+    written = 0
+    errors = 0
+    for i in range(0, len(rows), REST_BATCH_SIZE):
+        batch = [dict(zip(columns, r)) for r in rows[i : i + REST_BATCH_SIZE]]
+        try:
+            query = supabase.table(table)
+            if conflict:
+                query = query.upsert(batch, on_conflict=",".join(conflict))
+            else:
+                query = query.insert(batch)
+            resp = query.execute()
+            written += len(resp.data) if resp.data else 0
+        except Exception as e:
+            errors += 1
+            logger.error(f"Bulk REST write {table} rows {i}-{i + len(batch)} failed: {e}")
+    return written, errors
+
+
+def bulk_write(
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    conflict: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Write row tuples to ``table`` via COPY when available, else PostgREST.
+
+    Args:
+        table: Tabla destino.
+        columns: Nombres de columna en el orden de cada tupla.
+        rows: Tuplas de valores (None = NULL).
+        conflict: Columnas de la constraint única para upsert; None = insert.
+
+    Returns:
+        ``{method, rows, written, errors, seconds, rows_per_sec}``.
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    result: Dict[str, Any] = {"method": "rest", "rows": len(rows), "written": 0, "errors": 0}
+    if not rows:
+        return {**result, "seconds": 0.0, "rows_per_sec": 0.0}
+
+    t0 = time.perf_counter()
+    if copy_available():
+        try:
+            result["written"] = _copy_write(table, columns, rows, conflict)
+            result["method"] = "copy"
+        except Exception as e:
+            logger.warning(f"COPY ingest into {table} failed, falling back to PostgREST: {e}")
+    if result["method"] == "rest":
+        result["written"], result["errors"] = _rest_write(table, columns, rows, conflict)
+
+    elapsed = time.perf_counter() - t0
+    result["seconds"] = round(elapsed, 3)
+    result["rows_per_sec"] = round(len(rows) / elapsed, 1) if elapsed > 0 else float(len(rows))
+    logger.info(
+        f"Bulk write {table}: {result['written']}/{len(rows)} rows via {result['method']} "
+        f"({result['rows_per_sec']:.0f} rows/s)"
+    )
+    return result
+
+
+def bulk_write_records(
+    table: str,
+    records: List[Dict[str, Any]],
+    conflict: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """``bulk_write`` for callers that already hold row dicts (same keys in every row)."""
+    if not records:
+        return bulk_write(table, [], [], conflict)
+    columns = list(records[0].keys())
+    return bulk_write(table, columns, [tuple(r[c] for c in columns) for r in records], conflict)
+
+
+def _clean(value: Any) -> Any:
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def bulk_write_frame(
+    table: str,
+    df: pd.DataFrame,
+    conflict: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """``bulk_write`` from a DataFrame; NaN/inf become NULL, timestamps ISO-8601 UTC."""
+    out = df.copy()
+    for col in out.columns:
+        if pd.api.types.is_datetime64_any_dtype(out[col]):
+            ts = out[col].dt.tz_convert("UTC") if out[col].dt.tz is not None else out[col]
+            out[col] = ts.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+    out = out.astype(object)
+    rows = [tuple(_clean(v) for v in row) for row in out.itertuples(index=False, name=None)]
+    return bulk_write(table, list(out.columns), rows, conflict)
+
+
+def bulk_write_klines(symbol: str, interval: str, batch: np.ndarray) -> Dict[str, Any]:
+    """Upsert a typed KLINE_DTYPE batch into ``klines_ohlcv`` without building dicts."""
+    if len(batch) == 0:
+        return bulk_write("klines_ohlcv", KLINE_COLUMNS, [], KLINE_CONFLICT)
+    n = len(batch)
+    open_iso = np.datetime_as_string(
+        batch["open_time"].astype("datetime64[ms]"), unit="ms", timezone="UTC",
+    ).tolist()
+    close_iso = np.datetime_as_string(
+        batch["close_time"].astype("datetime64[ms]"), unit="ms", timezone="UTC",
+    ).tolist()
+    rows = list(zip(
+        [symbol] * n, [interval] * n, open_iso, close_iso,
+        *(batch[name].tolist() for name in _KLINE_VALUE_COLUMNS),
+    ))
+    return bulk_write("klines_ohlcv", KLINE_COLUMNS, rows, KLINE_CONFLICT)
@@ -0,0 +1,238 @@
+"""Candle-close event scheduler.
+
+El main loop despertaba cada 60s sin importar el mercado y ``run_quant_tick``
+decidía qué correr con contadores módulo tick (entropía cada 5, régimen cada
+15, S/R cada 60, métricas cada 360). Entre velas recalculaba sobre los mismos
+datos, y un cierre de vela esperaba hasta un minuto para verse.
+
+``CandleScheduler`` dispara cada ``CandleJob`` cuando cierra la vela de su
+intervalo (por símbolo e intervalo):
+
+- Despierta en el próximo cierre de cualquier job + ``CANDLE_SETTLE_SECONDS``
+  (margen para que Binance tenga la vela final) + un jitter acotado
+  (``CANDLE_JITTER_SECONDS``, para no pegarle al exchange justo en el borde).
+  El error de despertar (real − objetivo) queda medido.
+- Todos los jobs que vencen en el mismo borde corren en un único batch, por
+  ``stage`` (klines → análisis → señales); dentro de un stage, concurrentes.
+- Coalescing: si un batch tarda más que la vela siguiente o el proceso se
+  atrasa, los cierres perdidos de un job se colapsan en una sola corrida
+  sobre el último cierre (se cuentan en ``coalesced``).
+- Lag por job: cierre de vela → fin del job, con p50/p95/max en ``status()``
+  (``GET /quant/scheduler``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, ContextManager, Deque, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_LAG_SAMPLES = 500
+_IDLE_WAKE_MS = 60_000   # sin jobs: re-chequear cada minuto
+
+
+def _now_ms() -> float:
+    return time.time() * 1000
+
+
+def _pct(samples: Iterable[float]) -> Optional[Dict[str, float]]:
+    arr = np.fromiter(samples, dtype=float)
+    if not len(arr):
+        return None
+    p50, p95 = np.percentile(arr, [50, 95])
+    return {"count": len(arr), "p50": round(float(p50), 1), "p95": round(float(p95), 1),
+            "max": round(float(arr.max()), 1)}
+
+
+@dataclass
+class CandleJob:
+    """Una computación que depende del cierre de la vela ``interval`` (de ``symbol``, si aplica)."""
+
+    name: str
+    interval: str
+    fn: Callable[[int], Awaitable[Any]]     # recibe el close (ms) de la vela que la disparó
+    symbol: Optional[str] = None
+    stage: int = 0                          # orden dentro de un batch: menor primero
+    step_ms: int = field(init=False)
+    last_close_ms: Optional[int] = None
+    runs: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    last_duration_ms: Optional[float] = None
+    lags: Deque[float] = field(default_factory=lambda: deque(maxlen=_LAG_SAMPLES))
+
+    def __post_init__(self):
+        from .kline_collector import interval_ms
+        self.step_ms = interval_ms(self.interval)
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.symbol}@{self.interval}" if self.symbol else f"{self.name}@{self.interval}"
+
+    def latest_close(self, now_ms: float, settle_ms: float) -> int:
+        """Cierre de la última vela ya asentada."""
+        return int((now_ms - settle_ms) // self.step_ms * self.step_ms)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "symbol": self.symbol,
+            "stage": self.stage,
+            "last_close_ms": self.last_close_ms,
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "last_duration_ms": self.last_duration_ms,
+            "lag_ms": _pct(self.lags),
+        }
+
+
+class CandleScheduler:
+    """Event loop de cierres de vela para los jobs registrados."""
+
+    def __init__(self):
+        self._jobs: Dict[str, CandleJob] = {}
+        self._running = False
+        self._wake: Optional[asyncio.Event] = None
+        self._next_wake_ms: Optional[float] = None
+        self._wake_errors: Deque[float] = deque(maxlen=_LAG_SAMPLES)
+        self.stats: Dict[str, int] = {"batches": 0, "runs": 0, "coalesced": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def settle_ms(self) -> float:
+        return settings.candle_settle_seconds * 1000
+
+    def add(self, job: CandleJob) -> CandleJob:
+        self._jobs[job.key] = job
+        return job
+
+    def set_jobs(self, jobs: Iterable[CandleJob]) -> None:
+        self._jobs = {}
+        for job in jobs:
+            self.add(job)
+
+    def jobs(self) -> List[CandleJob]:
+        return list(self._jobs.values())
+
+    def due(self, now_ms: Optional[float] = None) -> List[Tuple[CandleJob, int]]:
+        """Jobs con un cierre nuevo desde su última corrida; los cierres perdidos se coalescen."""
+        now_ms = _now_ms() if now_ms is None else now_ms
+        due = []
+        for job in self._jobs.values():
+            close = job.latest_close(now_ms, self.settle_ms)
+            if job.last_close_ms is not None:
+                if close <= job.last_close_ms:
+                    continue
+                missed = (close - job.last_close_ms) // job.step_ms - 1
+                if missed > 0:
+                    job.coalesced += missed
+                    self.stats["coalesced"] += missed
+            due.append((job, close))
+        return due
+
+    def next_wake_ms(self, now_ms: Optional[float] = None) -> float:
+        """Próximo cierre (+ settle) de cualquier job."""
+        now_ms = _now_ms() if now_ms is None else now_ms
+        if not self._jobs:
+            return now_ms + _IDLE_WAKE_MS
+        return min(
+            (job.latest_close(now_ms, self.settle_ms) + job.step_ms) + self.settle_ms
+            for job in self._jobs.values()
+        )
+
+    async def run_due(self, now_ms: Optional[float] = None,
+                      scope: Optional[Callable[[int], ContextManager]] = None) -> int:
+        """Correr en un batch todos los jobs vencidos. ``scope(close_ms)`` envuelve el batch."""
+        due = self.due(now_ms)
+        if not due:
+            return 0
+        for job, close in due:
+            job.last_close_ms = close   # un cierre que llegue mientras corre se coalesce
+        self.stats["batches"] += 1
+        with scope(max(close for _, close in due)) if scope else nullcontext():
+            for stage in sorted({job.stage for job, _ in due}):
+                await asyncio.gather(*[self._run_job(job, close) for job, close in due if job.stage == stage])
+        return len(due)
+
+    async def _run_job(self, job: CandleJob, close_ms: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            await job.fn(close_ms)
+        except Exception as e:
+            job.errors += 1
+            self.stats["errors"] += 1
+            logger.error(f"Candle job {job.key} failed: {e}")
+        finally:
+            job.runs += 1
+            self.stats["runs"] += 1
+            job.last_duration_ms = round((time.perf_counter() - t0) * 1000, 1)
+            job.lags.append(_now_ms() - close_ms)
+
+    async def run(self, scope: Optional[Callable[[int], ContextManager]] = None) -> None:
+        """Loop: batch de lo vencido, dormir hasta el próximo cierre, repetir hasta ``stop()``."""
+        self._running = True
+        self._wake = asyncio.Event()
+        logger.info(f"Candle scheduler started — {len(self._jobs)} jobs, settle={settings.candle_settle_seconds}s")
+        try:
+            while self._running:
+                try:
+                    await self.run_due(scope=scope)
+                except Exception as e:
+                    logger.error(f"Candle scheduler batch error: {e}")
+                jitter_ms = random.uniform(0, settings.candle_jitter_seconds * 1000)
+                self._next_wake_ms = self.next_wake_ms() + jitter_ms
+                await self._sleep_until(self._next_wake_ms)
+                if self._running:
+                    self._wake_errors.append(_now_ms() - self._next_wake_ms)
+        finally:
+            self._running = False
+
+    async def _sleep_until(self, target_ms: float) -> None:
+        delay = max(0.0, (target_ms - _now_ms()) / 1000)
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def stop(self) -> None:
+        self._running = False
+        if self._wake is not None:
+            self._wake.set()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.candle_scheduler_enabled,
+            "running": self._running,
+            "settle_seconds": settings.candle_settle_seconds,
+            "jitter_seconds": settings.candle_jitter_seconds,
+            "next_wake_ms": int(self._next_wake_ms) if self._next_wake_ms else None,
+            "wake_error_ms": _pct(self._wake_errors),
+            **self.stats,
+            "jobs": {job.key: job.status() for job in sorted(self._jobs.values(), key=lambda j: (j.stage, j.key))},
+        }
+
+    def reset(self) -> None:
+        self.stop()
+        self.__init__()
+
+
+_scheduler = CandleScheduler()
+
+
+def get_candle_scheduler() -> CandleScheduler:
+    return _scheduler
@@ -6,7 +6,7 @@ from datetime import datetime, timezone, timedelta
 
 from ..db import get_supabase
 from ..config import settings
-from . import binance_client
+from .account_state import get_account_state
 from .telegram_notifier import send_telegram
 
 logger = logging.getLogger(__name__)
@@ -37,7 +37,7 @@ async def send_daily_report() -> dict:
         # 1. Balance
         total_balance = 0.0
         try:
-            account = await binance_client.get_account()
+            account = await get_account_state().get_account()
             for b in account.get("balances", []):
                 if b["asset"] == "USDT":
                     total_balance = float(b["free"]) + float(b["locked"])
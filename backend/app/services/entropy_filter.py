@@ -15,6 +15,7 @@ from ..db import get_supabase
 from ..config import settings
 from ..models.quant_models import EntropyReading
 from .technical_analysis import _load_klines_df
+from . import write_behind
 
 logger = logging.getLogger(__name__)
 
@@ -81,11 +82,13 @@ def compute_entropy(symbol: str, interval: str = "1h") -> Optional[EntropyReadin
 
 
 def store_entropy(reading: EntropyReading) -> None:
-    """Store/update entropy reading in DB."""
-    supabase = get_supabase()
+    """Store/update entropy reading in DB (vía write-behind si está corriendo)."""
     data = reading.model_dump()
     data["measured_at"] = datetime.now(timezone.utc).isoformat()
+    if write_behind.enqueue("entropy_readings", data, on_conflict="symbol,interval"):
+        return
 
+    supabase = get_supabase()
     try:
         supabase.table("entropy_readings").upsert(
             data, on_conflict="symbol,interval"
@@ -0,0 +1,227 @@
+"""Cached exchangeInfo filters and pre-validated order templates.
+
+Antes de cada orden, ``execute_proposal`` redondeaba la cantidad con las
+tablas fijas de ``utils/binance_utils`` (``_SYMBOL_PRECISION``), armaba y
+firmaba el request desde cero y abría una conexión HTTP nueva. Si el
+exchange cambiaba un filtro, o el notional quedaba bajo el mínimo, la orden
+volvía con un 400 después de un round trip completo.
+
+``ExchangeFilters`` carga ``exchangeInfo`` (LOT_SIZE, MARKET_LOT_SIZE,
+PRICE_FILTER, MIN_NOTIONAL / NOTIONAL) al arrancar y lo refresca cada
+``EXCHANGE_FILTERS_REFRESH_SECONDS`` desde el main loop, nunca en el camino
+de la orden. Por símbolo precomputa un ``OrderTemplate`` con los steps, los
+decimales y los parámetros fijos de la orden, y registra los filtros reales
+en ``binance_utils``, así todos los redondeos del bot usan los mismos.
+
+``prepare_order`` es puro (sin I/O): trunca la cantidad al step, valida
+mínimos y máximos de cantidad y el notional mínimo, y devuelve los
+parámetros listos para ``binance_client.submit_order``, que sólo agrega
+timestamp y firma. Con el cliente HTTP compartido ya precalentado, el único
+I/O al enviar la orden es el POST. ``benchmarks/bench_order_submit.py``
+mide el camino.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..config import settings
+from ..utils import binance_utils
+from . import binance_client
+
+logger = logging.getLogger(__name__)
+
+
+class OrderFilterError(ValueError):
+    """La orden no pasa los filtros del símbolo (el exchange la rechazaría)."""
+
+
+@dataclass(frozen=True)
+class OrderTemplate:
+    """Reglas de un símbolo, precomputadas para armar órdenes sin I/O."""
+
+    symbol: str
+    step_size: float
+    min_qty: float
+    max_qty: float
+    market_step_size: float
+    market_max_qty: float
+    tick_size: float
+    min_notional: float
+    apply_min_to_market: bool = True
+    qty_decimals: int = field(init=False)
+    market_qty_decimals: int = field(init=False)
+    price_decimals: int = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "qty_decimals", binance_utils.step_decimals(self.step_size))
+        object.__setattr__(self, "market_qty_decimals", binance_utils.step_decimals(self.market_step_size))
+        object.__setattr__(self, "price_decimals", binance_utils.step_decimals(self.tick_size))
+
+    @classmethod
+    def from_symbol_info(cls, info: Dict[str, Any]) -> "OrderTemplate":
+        filters = {f["filterType"]: f for f in info.get("filters", [])}
+        lot = filters.get("LOT_SIZE", {})
+        market_lot = filters.get("MARKET_LOT_SIZE", {})
+        price = filters.get("PRICE_FILTER", {})
+        notional = filters.get("NOTIONAL") or filters.get("MIN_NOTIONAL") or {}
+        step = float(lot.get("stepSize", 0) or 0) or 1e-8
+        market_step = float(market_lot.get("stepSize", 0) or 0) or step
+        return cls(
+            symbol=info["symbol"],
+            step_size=step,
+            min_qty=float(lot.get("minQty", 0) or 0),
+            max_qty=float(lot.get("maxQty", 0) or 0) or float("inf"),
+            market_step_size=market_step,
+            market_max_qty=float(market_lot.get("maxQty", 0) or 0) or float("inf"),
+            tick_size=float(price.get("tickSize", 0) or 0) or 1e-8,
+            min_notional=float(notional.get("minNotional", 0) or 0),
+            apply_min_to_market=bool(notional.get("applyMinToMarket", notional.get("applyToMarket", True))),
+        )
+
+    @classmethod
+    def fallback(cls, symbol: str) -> "OrderTemplate":
+        """Sin exchangeInfo: los steps de las tablas de ``binance_utils``, sin mínimos."""
+        _, step = binance_utils.quantity_precision(symbol)
+        _, tick = binance_utils.price_precision(symbol)
+        return cls(symbol, step, 0.0, float("inf"), step, float("inf"), tick, 0.0)
+
+    def floor_quantity(self, qty: float, market: bool = False) -> float:
+        step, decimals = (self.market_step_size, self.market_qty_decimals) if market else (self.step_size, self.qty_decimals)
+        return binance_utils.floor_to_step(qty, step, decimals)
+
+    def round_price(self, price: float) -> float:
+        return round(round(price / self.tick_size) * self.tick_size, self.price_decimals)
+
+    def format_quantity(self, qty: float, market: bool = False) -> str:
+        decimals = self.market_qty_decimals if market else self.qty_decimals
+        return f"{qty:.{decimals}f}"
+
+    def format_price(self, price: float) -> str:
+        return f"{price:.{self.price_decimals}f}"
+
+
+@dataclass(frozen=True)
+class PreparedOrder:
+    """Orden validada: ``params`` va tal cual a ``binance_client.submit_order``."""
+
+    symbol: str
+    side: str
+    order_type: str
+    quantity: float
+    price: Optional[float]
+    notional: float
+    params: Dict[str, str]
+
+
+class ExchangeFilters:
+    """Cache of per-symbol order templates built from ``exchangeInfo``."""
+
+    def __init__(self):
+        self._templates: Dict[str, OrderTemplate] = {}
+        self._loaded_at: Optional[str] = None
+        self._loaded_mono = 0.0
+        self.stats: Dict[str, Any] = {"refreshes": 0, "refresh_errors": 0, "prepared": 0, "rejected": 0, "fallbacks": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._templates)
+
+    def template(self, symbol: str) -> OrderTemplate:
+        tpl = self._templates.get(symbol)
+        if tpl is None:
+            self.stats["fallbacks"] += 1
+            return OrderTemplate.fallback(symbol)
+        return tpl
+
+    async def refresh(self, symbols: Optional[Iterable[str]] = None) -> int:
+        """Cargar ``exchangeInfo`` de ``symbols`` (default: los monitoreados + los ya cargados)."""
+        wanted = sorted(set(symbols or _monitored_symbols()) | set(self._templates))
+        info = await binance_client.get_exchange_info(wanted)
+        if "code" in info and "symbols" not in info:
+            raise RuntimeError(f"Binance error {info.get('code')}: {info.get('msg', 'Unknown')}")
+        templates = {s["symbol"]: OrderTemplate.from_symbol_info(s) for s in info.get("symbols", [])}
+        for tpl in templates.values():
+            binance_utils.set_symbol_filters(tpl.symbol, tpl.step_size, tpl.tick_size)
+        self._templates.update(templates)
+        self._loaded_at = datetime.now(timezone.utc).isoformat()
+        self._loaded_mono = time.monotonic()
+        self.stats["refreshes"] += 1
+        logger.info(f"Exchange filters loaded for {len(templates)} symbols")
+        return len(templates)
+
+    async def maybe_refresh(self) -> bool:
+        """Refrescar si nunca se cargó o venció ``EXCHANGE_FILTERS_REFRESH_SECONDS``. Errores: se logean."""
+        if self.loaded and time.monotonic() - self._loaded_mono < settings.exchange_filters_refresh_seconds:
+            return False
+        try:
+            await self.refresh()
+            return True
+        except Exception as e:
+            self.stats["refresh_errors"] += 1
+            logger.warning(f"Exchange filters refresh failed (using cached/fallback precision): {e}")
+            return False
+
+    def prepare_order(self, symbol: str, side: str, order_type: str, quantity: float,
+                      price: Optional[float] = None, reference_price: Optional[float] = None) -> PreparedOrder:
+        """Truncar y validar contra los filtros; sin I/O.
+
+        ``reference_price`` (precio de la señal) sirve para el notional
+        mínimo de las órdenes MARKET. Raises ``OrderFilterError``.
+        """
+        tpl = self.template(symbol)
+        side, order_type = side.upper(), order_type.upper()
+        market = order_type == "MARKET"
+        qty = tpl.floor_quantity(quantity, market=market)
+        limit_price = tpl.round_price(price) if price and not market else None
+
+        error = None
+        if qty <= 0 or qty < tpl.min_qty:
+            error = f"quantity {quantity} below minQty {tpl.min_qty} (step {tpl.step_size})"
+        elif qty > (tpl.market_max_qty if market else tpl.max_qty):
+            error = f"quantity {qty} above maxQty"
+        else:
+            ref = limit_price or reference_price
+            notional = qty * ref if ref else 0.0
+            if ref and tpl.min_notional and (tpl.apply_min_to_market or not market) and notional < tpl.min_notional:
+                error = f"notional ${notional:.2f} below minNotional ${tpl.min_notional:.2f}"
+        if error:
+            self.stats["rejected"] += 1
+            raise OrderFilterError(f"{symbol} {side} {order_type}: {error}")
+
+        params = {"symbol": symbol, "side": side, "type": order_type,
+                  "quantity": tpl.format_quantity(qty, market=market)}
+        if order_type == "LIMIT" and limit_price:
+            params["price"] = tpl.format_price(limit_price)
+            params["timeInForce"] = "GTC"
+        self.stats["prepared"] += 1
+        ref = limit_price or reference_price or 0.0
+        return PreparedOrder(symbol, side, order_type, qty, limit_price, qty * ref, params)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "symbols": sorted(self._templates),
+            "loaded_at": self._loaded_at,
+            "age_seconds": round(time.monotonic() - self._loaded_mono, 1) if self.loaded else None,
+            **self.stats,
+        }
+
+    def reset(self) -> None:
+        self.__init__()
+        binance_utils.clear_symbol_filters()
+
+
+def _monitored_symbols() -> List[str]:
+    return [s.strip().upper() for s in settings.quant_symbols.split(",") if s.strip()]
+
+
+_filters = ExchangeFilters()
+
+
+def get_exchange_filters() -> ExchangeFilters:
+    return _filters
@@ -0,0 +1,159 @@
+"""Concurrent execution of approved proposals.
+
+``execute_all_approved`` recorría los proposals aprobados de a uno, con
+``asyncio.sleep(0.1)`` entre cada uno: una ráfaga de señales en N símbolos
+tardaba N × (claim + guards + place_order + insert de posición + avisos)
+en ejecutarse, y el último fill llegaba segundos después del primero.
+
+``ExecutionScheduler`` agrupa los proposals por símbolo en carriles:
+
+- dentro de un carril el orden es el de creación (un exit y una re-entrada
+  del mismo símbolo nunca se cruzan);
+- carriles distintos corren en paralelo hasta ``EXECUTION_MAX_CONCURRENCY``;
+- cada orden consume tokens de un bucket de ``EXECUTION_ORDERS_PER_SECOND``
+  (el límite de órdenes de Binance), que reemplaza al sleep fijo;
+- un BUY entra sólo si su notional cabe en el USDT libre menos lo reservado
+  por los BUY en vuelo, y si queda un slot de posición
+  (``RISK_MAX_OPEN_POSITIONS``). Si no entra, espera a que termine alguno en
+  vuelo; sin nada en vuelo se ejecuta igual y decide el guard de
+  ``execute_proposal`` / el exchange, como antes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..config import settings
+from .account_state import get_account_state
+from .position_book import get_position_book
+
+logger = logging.getLogger(__name__)
+
+
+class OrderRateBudget:
+    """Token bucket para el rate limit de órdenes."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = max(rate, 0.001)
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, cost: float = 1.0) -> float:
+        """Esperar hasta tener ``cost`` tokens. Devuelve los segundos esperados."""
+        cost = min(cost, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            while self._tokens < cost:
+                delay = (cost - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= cost
+        return waited
+
+
+_budget: Optional[OrderRateBudget] = None
+
+
+def get_order_budget() -> OrderRateBudget:
+    """Bucket compartido entre corridas (el límite del exchange es por cuenta)."""
+    global _budget
+    if _budget is None or _budget.rate != settings.execution_orders_per_second:
+        _budget = OrderRateBudget(settings.execution_orders_per_second)
+    return _budget
+
+
+class ExecutionScheduler:
+    """Una corrida sobre un lote de proposals aprobados."""
+
+    def __init__(self, execute: Callable[[str], Awaitable[Dict[str, Any]]],
+                 max_concurrency: Optional[int] = None, budget: Optional[OrderRateBudget] = None):
+        self._execute = execute
+        self._slots = asyncio.Semaphore(max_concurrency or settings.execution_max_concurrency)
+        self._budget = budget or get_order_budget()
+        self._admission = asyncio.Condition()
+        self._reserved_usd = 0.0
+        self._buys_in_flight = 0
+        self._in_flight = 0
+        self.stats: Dict[str, Any] = {"lanes": 0, "admission_waits": 0, "rate_wait_s": 0.0}
+
+    async def run(self, proposals: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Ejecutar en paralelo por símbolo. Resultados en el orden de ``proposals``."""
+        lanes: "OrderedDict[str, List[int]]" = OrderedDict()
+        for i, p in enumerate(proposals):
+            lanes.setdefault(p.get("symbol") or p["id"], []).append(i)
+        self.stats["lanes"] = len(lanes)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(proposals)
+
+        async def lane(indexes: List[int]) -> None:
+            for i in indexes:
+                results[i] = await self._run_one(proposals[i])
+
+        await asyncio.gather(*(lane(ix) for ix in lanes.values()))
+        return results  # type: ignore[return-value]
+
+    async def _run_one(self, proposal: Dict[str, Any]) -> Dict[str, Any]:
+        is_buy = proposal.get("type") == "buy"
+        need = _notional(proposal) if is_buy else 0.0
+        await self._admit(is_buy, need)  # antes del slot: un BUY esperando fondos no bloquea otros carriles
+        try:
+            async with self._slots:
+                cost = 2 if is_buy and settings.exchange_protection_enabled else 1  # + OCO de protección
+                self.stats["rate_wait_s"] += await self._budget.acquire(cost)
+                return await self._execute(proposal["id"])
+        except Exception as e:
+            logger.error(f"Execution of proposal {proposal['id']} failed: {e}")
+            return {"success": False, "error": str(e)}
+        finally:
+            await self._release(is_buy, need)
+
+    async def _admit(self, is_buy: bool, need: float) -> None:
+        async with self._admission:
+            while is_buy and self._in_flight and not await self._fits(need):
+                self.stats["admission_waits"] += 1
+                await self._admission.wait()
+            self._in_flight += 1
+            if is_buy:
+                self._buys_in_flight += 1
+                self._reserved_usd += need
+
+    async def _release(self, is_buy: bool, need: float) -> None:
+        async with self._admission:
+            self._in_flight -= 1
+            if is_buy:
+                self._buys_in_flight -= 1
+                self._reserved_usd -= need
+            self._admission.notify_all()
+
+    async def _fits(self, need: float) -> bool:
+        """¿Hay USDT y slot de posición para un BUY más además de los que están en vuelo?"""
+        book = get_position_book()
+        if not book.loaded:
+            return self._buys_in_flight == 0  # sin book no se puede reservar slot: BUYs de a uno
+        if book.count() + self._buys_in_flight >= settings.risk_max_open_positions:
+            return False
+        try:
+            usdt_free = await get_account_state().free("USDT")
+        except Exception as e:
+            logger.warning(f"Balance reservation unavailable, serializing buys: {e}")
+            return self._buys_in_flight == 0
+        return usdt_free - self._reserved_usd >= need
+
+
+def _notional(proposal: Dict[str, Any]) -> float:
+    if proposal.get("notional"):
+        return float(proposal["notional"])
+    return float(proposal.get("quantity") or 0) * float(proposal.get("price") or 0)
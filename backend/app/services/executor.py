@@ -1,3 +1,4 @@
+import asyncio
 import time
 from typing import Optional
 from datetime import datetime, timezone
@@ -5,6 +6,12 @@ from ..db import get_supabase
 from ..config import settings
 from . import binance_client
 from .technical_analysis import compute_indicators
+from .account_state import get_account_state, split_symbol
+from .exchange_filters import OrderFilterError, get_exchange_filters
+from .position_book import get_position_book
+from . import protective_orders
+from . import latency_trace
+from .trade_stats import get_trade_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,6 +32,12 @@ async def _convert_commission_to_usdt(commission: float, commission_asset: str)
 
 
 async def execute_proposal(proposal_id: str) -> dict:
+    """Claim, guard and execute an approved proposal (continues its latency trace)."""
+    with latency_trace.execution_trace(proposal_id):
+        return await _execute_proposal(proposal_id)
+
+
+async def _execute_proposal(proposal_id: str) -> dict:
     # Kill switch check
     if not settings.trading_enabled:
         return {"success": False, "error": "Trading is disabled (kill switch)"}
@@ -34,10 +47,11 @@ async def execute_proposal(proposal_id: str) -> dict:
 
     # 1. Atomic claim: UPDATE WHERE status="approved" → "executing"
     # Solo un caller puede reclamar el proposal (compare-and-swap via PostgREST)
-    claimed = supabase.table("trade_proposals").update({
-        "status": "executing",
-        "updated_at": now,
-    }).eq("id", proposal_id).eq("status", "approved").execute()
+    with latency_trace.span("claim"):
+        claimed = supabase.table("trade_proposals").update({
+            "status": "executing",
+            "updated_at": now,
+        }).eq("id", proposal_id).eq("status", "approved").execute()
 
     if not claimed.data:
         # Verificar si ya está siendo ejecutado o no existe
@@ -49,6 +63,9 @@ async def execute_proposal(proposal_id: str) -> dict:
 
     proposal = claimed.data[0]
     symbol = proposal["symbol"]
+    trace = latency_trace.current_trace()
+    if trace is not None and trace.symbol is None:
+        trace.symbol = symbol
     side = "BUY" if proposal["type"] == "buy" else "SELL"
     order_type = proposal.get("order_type", "MARKET")
     quantity = float(proposal["quantity"])
@@ -58,8 +75,12 @@ async def execute_proposal(proposal_id: str) -> dict:
     # Re-validate limits right before placing the order.
     # Prevents duplicates when multiple proposals were approved before any executed.
     if side == "BUY":
-        sym_resp = supabase.table("positions").select("id").eq("symbol", symbol).eq("status", "open").execute()
-        sym_count = len(sym_resp.data) if sym_resp.data else 0
+        book = get_position_book()
+        if book.loaded:
+            sym_count = book.count(symbol)
+        else:
+            sym_resp = supabase.table("positions").select("id").eq("symbol", symbol).eq("status", "open").execute()
+            sym_count = len(sym_resp.data) if sym_resp.data else 0
         if sym_count >= settings.risk_max_positions_per_symbol:
             supabase.table("trade_proposals").update({
                 "status": "rejected",
@@ -69,8 +90,11 @@ async def execute_proposal(proposal_id: str) -> dict:
             logger.warning("Execution blocked: %d open positions for %s (max %d)", sym_count, symbol, settings.risk_max_positions_per_symbol)
             return {"success": False, "error": f"Per-symbol limit: {sym_count}/{settings.risk_max_positions_per_symbol}"}
 
-        open_resp = supabase.table("positions").select("id").eq("status", "open").execute()
-        open_count = len(open_resp.data) if open_resp.data else 0
+        if book.loaded:
+            open_count = book.count()
+        else:
+            open_resp = supabase.table("positions").select("id").eq("status", "open").execute()
+            open_count = len(open_resp.data) if open_resp.data else 0
         if open_count >= settings.risk_max_open_positions:
             supabase.table("trade_proposals").update({
                 "status": "rejected",
@@ -81,8 +105,23 @@ async def execute_proposal(proposal_id: str) -> dict:
             return {"success": False, "error": f"Max positions: {open_count}/{settings.risk_max_open_positions}"}
 
     try:
-        # 2. Place order
-        order = await binance_client.place_order(symbol, side, order_type, quantity, price)
+        # 2a. Exit: liberar la protección del exchange (OCO) antes de vender.
+        # Si una pata ya se ejecutó, la posición está cerrada: no vender de nuevo.
+        if side == "SELL" and await protective_orders.release_symbol(supabase, symbol):
+            supabase.table("trade_proposals").update({
+                "status": "rejected",
+                "error_message": "Position already closed by exchange protective order",
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }).eq("id", proposal_id).execute()
+            return {"success": False, "error": "Position already closed by exchange protective order"}
+
+        # 2. Place order: cantidad truncada y validada contra los filtros cacheados
+        # (sin I/O); el único I/O es el POST por la conexión compartida.
+        prepared = get_exchange_filters().prepare_order(symbol, side, order_type, quantity, price, reference_price=price)
+        with latency_trace.span("place_order"):
+            order = await binance_client.place_order(
+                symbol, side, order_type, prepared.quantity, prepared.price, params=prepared.params,
+            )
         logger.info(f"Order placed: {order}")
 
         if "code" in order and order["code"] < 0:
@@ -108,6 +147,9 @@ async def execute_proposal(proposal_id: str) -> dict:
         order_status = order.get("status", "FILLED")
         executed_qty = float(order.get("executedQty", 0))
 
+        # Ledger local: los próximos lectores del tick ven el balance post-fill
+        get_account_state().apply_order(symbol, side, order)
+
         if order_status in ("CANCELED", "EXPIRED", "REJECTED") or executed_qty == 0:
             supabase.table("trade_proposals").update({
                 "status": "error",
@@ -116,6 +158,7 @@ async def execute_proposal(proposal_id: str) -> dict:
             }).eq("id", proposal_id).execute()
             return {"success": False, "error": f"Order {order_status}"}
 
+        latency_trace.mark_fill()
         commission_raw = sum(float(f.get("commission", 0)) for f in fills)
         commission_asset = fills[0].get("commissionAsset", "BNB") if fills else "BNB"
         commission = await _convert_commission_to_usdt(commission_raw, commission_asset)
@@ -134,13 +177,15 @@ async def execute_proposal(proposal_id: str) -> dict:
             "executed_at": now,
             "updated_at": now,
         }).eq("id", proposal_id).execute()
+        latency_trace.persist_trace(supabase, "trade_proposals", proposal_id)
 
         # 5. Update positions (use actual executed_qty, not requested)
         proposal_id_str = str(proposal_id)
-        if side == "BUY":
-            await _open_position(supabase, symbol, executed_price, executed_qty, order_id, proposal_id_str, commission, commission_asset, proposal.get("strategy_id"))
-        else:
-            await _close_position(supabase, symbol, executed_price, executed_qty, order_id, proposal_id_str, commission, commission_asset)
+        with latency_trace.span("position_update"):
+            if side == "BUY":
+                await _open_position(supabase, symbol, executed_price, executed_qty, order_id, proposal_id_str, commission, commission_asset, proposal.get("strategy_id"), commission_raw)
+            else:
+                await _close_position(supabase, symbol, executed_price, executed_qty, order_id, proposal_id_str, commission, commission_asset)
 
         # 6. Log risk event
         fill_info = f"({order_status})" if order_status != "FILLED" else ""
@@ -160,11 +205,14 @@ async def execute_proposal(proposal_id: str) -> dict:
 
     except Exception as e:
         logger.error(f"Execution failed for {proposal_id}: {e}")
+        get_account_state().invalidate("execution error")
 
         # 4xx client errors are permanent (bad params, insufficient balance, etc.)
         # Never retry them — they won't succeed without fixing the underlying issue.
         error_str = str(e)
-        is_permanent = any(code in error_str for code in ("400 Bad Request", "400 Client Error", "422"))
+        is_permanent = isinstance(e, OrderFilterError) or any(
+            code in error_str for code in ("400 Bad Request", "400 Client Error", "422")
+        )
 
         if is_permanent:
             new_status = "error"
@@ -287,7 +335,7 @@ def _compute_sl_tp(symbol: str, price: float) -> tuple[float, float]:
     return _clamp_sl_tp(sl, tp, "fallback")
 
 
-async def _open_position(supabase, symbol, price, qty, order_id, proposal_id, commission, commission_asset, strategy_id):
+async def _open_position(supabase, symbol, price, qty, order_id, proposal_id, commission, commission_asset, strategy_id, commission_raw=0.0):
     now = datetime.now(timezone.utc).isoformat()
 
     # Calcula SL/TP basado en ATR (1:2 risk:reward)
@@ -303,7 +351,7 @@ async def _open_position(supabase, symbol, price, qty, order_id, proposal_id, co
     unrealized_pnl = (current_price - price) * qty - commission
     unrealized_pnl_pct = (unrealized_pnl / (price * qty)) * 100 if price * qty > 0 else 0
 
-    supabase.table("positions").insert({
+    row = {
         "symbol": symbol,
         "side": "long",
         "entry_price": price,
@@ -323,23 +371,44 @@ async def _open_position(supabase, symbol, price, qty, order_id, proposal_id, co
         "strategy_id": strategy_id,
         "opened_at": now,
         "updated_at": now,
-    }).execute()
+    }
+    resp = supabase.table("positions").insert(row).execute()
+    # PostgREST devuelve la fila insertada (con id); sin ella el book se recarga
+    position = resp.data[0] if resp.data else {}
+    get_position_book().add(position)
+    latency_trace.persist_trace(supabase, "positions", position.get("id"))  # vela → fill de la entrada
+
+    # Protección después del insert: un OCO vivo siempre tiene una fila que lo apunta
+    if protective_orders.protection_enabled():
+        if position.get("id"):
+            # La comisión cobrada en el asset base no está en el balance: un OCO por la qty bruta se rechaza
+            held_qty = qty - commission_raw if commission_asset == split_symbol(symbol)[0] else qty
+            await protective_orders.protect_position(supabase, position, held_qty)
+        else:
+            logger.warning(f"Position insert for {symbol} returned no row — protection left to the fast loop")
 
     logger.info(f"Position opened with SL=${sl_price:.2f} TP=${tp_price:.2f}")
     await _log_risk_event(supabase, "position_opened", "info",
         f"Opened LONG {qty} {symbol} @ {price}", {"price": price, "qty": qty, "sl_price": sl_price, "tp_price": tp_price}, proposal_id=proposal_id)
 
 
-async def _close_position(supabase, symbol, exit_price, exit_qty, order_id, proposal_id, commission, commission_asset):
+async def _close_position(supabase, symbol, exit_price, exit_qty, order_id, proposal_id, commission, commission_asset, position_id=None):
     now = datetime.now(timezone.utc).isoformat()
 
-    # Find open position for this symbol
-    resp = supabase.table("positions").select("*").eq("symbol", symbol).eq("status", "open").order("opened_at").execute()
-    if not resp.data:
+    # Find open position for this symbol (oldest first), or the given one
+    book = get_position_book()
+    if book.loaded:
+        candidates = book.open_positions(symbol)
+    else:
+        resp = supabase.table("positions").select("*").eq("symbol", symbol).eq("status", "open").order("opened_at").execute()
+        candidates = resp.data or []
+    if position_id is not None:
+        candidates = [p for p in candidates if p["id"] == position_id]
+    if not candidates:
         logger.warning(f"No open position found for {symbol} to close")
         return
 
-    position = resp.data[0]
+    position = candidates[0]
     entry_price = float(position["entry_price"])
     entry_qty = float(position["entry_quantity"])
     total_commission = float(position.get("total_commission", 0)) + commission
@@ -354,7 +423,7 @@ async def _close_position(supabase, symbol, exit_price, exit_qty, order_id, prop
     remaining_qty = entry_qty - exit_qty
     new_status = "closed" if remaining_qty <= 0.0001 else "partially_closed"
 
-    supabase.table("positions").update({
+    changes = {
         "exit_price": exit_price,
         "exit_quantity": exit_qty,
         "exit_notional": exit_price * exit_qty,
@@ -367,34 +436,76 @@ async def _close_position(supabase, symbol, exit_price, exit_qty, order_id, prop
         "status": new_status,
         "closed_at": now if new_status == "closed" else None,
         "updated_at": now,
-    }).eq("id", position["id"]).execute()
+    }
+    supabase.table("positions").update(changes).eq("id", position["id"]).execute()
+    # closed y partially_closed salen del set "open" que vigila el fast loop
+    book.remove(position["id"], **changes)
+
+    if new_status == "closed":
+        # Agregados incrementales (Kelly, portfolio, performance_metrics)
+        try:
+            get_trade_stats().record_close(supabase, {**position, **changes})
+        except Exception as e:
+            logger.warning(f"Trade aggregates update failed for {symbol}: {e}")
 
     await _log_risk_event(supabase, "position_closed", "info",
         f"Closed {exit_qty} {symbol} @ {exit_price} | PnL: ${realized_pnl:.4f}",
         {"realized_pnl": realized_pnl, "exit_price": exit_price}, proposal_id=proposal_id)
 
 
+# Una corrida de execute_all_approved a la vez (por event loop): el main loop,
+# el job de señales del scheduler de velas y la API pueden dispararla juntos, y
+# cada ExecutionScheduler lleva su propia reserva de USDT y de slots.
+_execute_lock: Optional[tuple] = None
+
+
+def _execution_lock() -> asyncio.Lock:
+    global _execute_lock
+    loop = asyncio.get_running_loop()
+    if _execute_lock is None or _execute_lock[0] is not loop:
+        _execute_lock = (loop, asyncio.Lock())
+    return _execute_lock[1]
+
+
 async def execute_all_approved(supabase=None) -> dict:
+    """Ejecutar los proposals aprobados: en paralelo entre símbolos, en orden dentro de cada uno.
+
+    Serializado: una corrida que llega mientras otra está en curso espera y
+    después ve sólo lo que siga aprobado.
+    """
+    async with _execution_lock():
+        return await _execute_all_approved(supabase)
+
+
+async def _execute_all_approved(supabase=None) -> dict:
+    from .execution_scheduler import ExecutionScheduler
+
     if supabase is None:
         supabase = get_supabase()
-    resp = supabase.table("trade_proposals").select("id").eq("status", "approved").order("created_at").execute()
+    resp = (
+        supabase.table("trade_proposals")
+        .select("id,symbol,type,quantity,price,notional")
+        .eq("status", "approved")
+        .order("created_at")
+        .execute()
+    )
     proposals = resp.data or []
-    executed = 0
-    failed = 0
-    results = []
-    for p in proposals:
-        result = await execute_proposal(p["id"])
-        if result["success"]:
-            executed += 1
-        else:
-            failed += 1
-        results.append(result)
-        import asyncio
-        await asyncio.sleep(0.1)
-    return {"executed": executed, "failed": failed, "total": len(proposals), "results": results}
+    if not proposals:
+        return {"executed": 0, "failed": 0, "total": 0, "results": []}
+
+    started = time.monotonic()
+    scheduler = ExecutionScheduler(execute_proposal)
+    results = await scheduler.run(proposals)
+    executed = sum(1 for r in results if r.get("success"))
+    logger.info(
+        f"Executed {executed}/{len(proposals)} approved proposals across {scheduler.stats['lanes']} symbols "
+        f"in {(time.monotonic() - started) * 1000:.0f}ms"
+    )
+    return {"executed": executed, "failed": len(results) - executed, "total": len(proposals), "results": results}
 
 
 async def _log_risk_event(supabase, event_type: str, severity: str, message: str, details: dict = None, position_id: str = None, proposal_id: str = None):
+    # Auditoría del ciclo de vida (órdenes, posiciones, errores): síncrona, nunca por el write-behind
     try:
         supabase.table("risk_events").insert({
             "event_type": event_type,
@@ -0,0 +1,172 @@
+"""Typed columnar representation of Binance klines.
+
+Las velas viajan como arrays estructurados de NumPy (``KLINE_DTYPE``) con
+timestamps int64 en epoch-ms y precios float64. Los dicts con strings ISO
+sólo se generan en el borde con la base de datos (``to_db_rows``), y las
+filas leídas de la DB se convierten de vuelta en una sola pasada
+(``from_db_rows`` / ``to_frame``).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+KLINE_DTYPE = np.dtype([
+    ("open_time", "i8"),
+    ("close_time", "i8"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "f8"),
+    ("quote_volume", "f8"),
+    ("trades_count", "i8"),
+    ("taker_buy_base_volume", "f8"),
+    ("taker_buy_quote_volume", "f8"),
+])
+
+# Columnas del CSV / array de Binance, en orden (la columna 11 "ignore" se descarta)
+_SOURCE_COLUMNS = (
+    "open_time", "open", "high", "low", "close", "volume",
+    "close_time", "quote_volume", "trades_count",
+    "taker_buy_base_volume", "taker_buy_quote_volume",
+)
+_TIME_COLUMNS = ("open_time", "close_time")
+_INT_COLUMNS = ("open_time", "close_time", "trades_count")
+
+# Binance pasó de ms (13 dígitos) a us (16 dígitos) en los archivos desde 2025
+_US_THRESHOLD = 10**15
+
+
+def empty_batch() -> np.ndarray:
+    return np.empty(0, dtype=KLINE_DTYPE)
+
+
+def _from_matrix(matrix: np.ndarray) -> np.ndarray:
+    """Build a KLINE_DTYPE array from an (n, 11) float64 matrix in source order."""
+    out = np.empty(len(matrix), dtype=KLINE_DTYPE)
+    for i, name in enumerate(_SOURCE_COLUMNS):
+        col = matrix[:, i]
+        if name in _TIME_COLUMNS:
+            ts = col.astype(np.int64)
+            out[name] = np.where(ts > _US_THRESHOLD, ts // 1000, ts)
+        else:
+            out[name] = col
+    return out
+
+
+def parse_csv_lines(lines: Iterable[str]) -> np.ndarray:
+    """Parse raw CSV lines from a data.binance.vision archive into a typed batch.
+
+    Las líneas que no empiezan con un dígito (headers, líneas vacías) se ignoran.
+    Timestamps en microsegundos se normalizan a milisegundos.
+    """
+    rows = [
+        line.rstrip().split(",", 11)[:11]
+        for line in lines
+        if line and line[0].isdigit()
+    ]
+    rows = [r for r in rows if len(r) == 11]
+    if not rows:
+        return empty_batch()
+    return _from_matrix(np.asarray(rows, dtype=object).astype(np.float64))
+
+
+def parse_raw_klines(raw: list) -> np.ndarray:
+    """Parse REST ``/api/v3/klines`` arrays (12 campos, strings) into a typed batch."""
+    if not raw:
+        return empty_batch()
+    # Cast en bloque desde un array object: ~2.5x más rápido que convertir fila por fila
+    return _from_matrix(np.asarray(raw, dtype=object)[:, :11].astype(np.float64))
+
+
+def merge_batches(*batches: np.ndarray) -> np.ndarray:
+    """Concatenate batches, sort by open_time and keep the LAST row per open_time.
+
+    Útil para refrescar la vela en curso: la versión más nueva gana.
+    """
+    parts = [b for b in batches if len(b)]
+    if not parts:
+        return empty_batch()
+    merged = np.concatenate(parts)
+    # Último por open_time: ordenar estable y quedarse con la última ocurrencia
+    order = np.argsort(merged["open_time"], kind="stable")
+    merged = merged[order]
+    is_last = np.append(merged["open_time"][1:] != merged["open_time"][:-1], True)
+    return merged[is_last]
+
+
+def iso_to_ms(values: Iterable[str]) -> np.ndarray:
+    """ISO-8601 timestamps (como los devuelve PostgREST) → int64 epoch-ms."""
+    values = list(values)
+    if not values:
+        return np.empty(0, dtype=np.int64)
+    # Camino rápido: PostgREST devuelve todo en UTC ("+00:00" o "Z"); sin el
+    # sufijo, numpy parsea ISO directo a datetime64 sin pasar por strptime.
+    naive = [
+        v[:-6] if v.endswith("+00:00") else v[:-1] if v.endswith("Z") else None
+        for v in values
+    ]
+    if None not in naive:
+        return np.array(naive, dtype="datetime64[ms]").astype(np.int64)
+    return pd.to_datetime(values, utc=True, format="ISO8601").as_unit("ms").asi8
+
+
+def from_db_rows(rows: Sequence[dict[str, Any]]) -> np.ndarray:
+    """Convert ``klines_ohlcv`` rows (PostgREST JSON) into a typed batch.
+
+    Columnas ausentes en el select quedan en 0; NULLs numéricos quedan en NaN
+    (0 para columnas enteras).
+    """
+    out = np.zeros(len(rows), dtype=KLINE_DTYPE)
+    if not rows:
+        return out
+    present = rows[0].keys()
+    for name in KLINE_DTYPE.names:
+        if name not in present:
+            continue
+        values = [r[name] for r in rows]
+        if name in _TIME_COLUMNS:
+            out[name] = iso_to_ms(values)
+        elif name in _INT_COLUMNS:
+            out[name] = np.nan_to_num(np.asarray(values, dtype=np.float64))
+        else:
+            out[name] = np.asarray(values, dtype=np.float64)
+    return out
+
+
+def to_frame(batch: np.ndarray, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Typed batch → DataFrame indexed by a UTC ``open_time`` DatetimeIndex."""
+    columns = columns or [n for n in KLINE_DTYPE.names if n != "open_time"]
+    index = pd.DatetimeIndex(
+        pd.to_datetime(batch["open_time"], unit="ms", utc=True), name="open_time",
+    )
+    return pd.DataFrame({c: batch[c] for c in columns if c != "open_time"}, index=index)
+
+
+def to_db_rows(symbol: str, interval: str, batch: np.ndarray) -> list[dict[str, Any]]:
+    """Convert a typed batch into ``klines_ohlcv`` rows (ISO-8601 timestamps).
+
+    Único punto donde se materializan dicts: justo antes del upsert.
+    """
+    if len(batch) == 0:
+        return []
+    n = len(batch)
+    open_iso = np.datetime_as_string(
+        batch["open_time"].astype("datetime64[ms]"), unit="ms", timezone="UTC",
+    ).tolist()
+    close_iso = np.datetime_as_string(
+        batch["close_time"].astype("datetime64[ms]"), unit="ms", timezone="UTC",
+    ).tolist()
+    names = [name for name in KLINE_DTYPE.names if name not in _TIME_COLUMNS]
+    keys = ("symbol", "interval", "open_time", "close_time", *names)
+    return [
+        dict(zip(keys, values))
+        for values in zip(
+            [symbol] * n, [interval] * n, open_iso, close_iso,
+            *(batch[name].tolist() for name in names),
+        )
+    ]
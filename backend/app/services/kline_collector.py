@@ -6,9 +6,13 @@ Handles fetching, normalizing, storing, and backfilling OHLCV data.
 import logging
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Any, Optional
+
+import numpy as np
+
 from ..db import get_supabase
 from ..config import settings
 from . import binance_client
+from .kline_arrays import parse_raw_klines, to_db_rows
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +23,7 @@ INTERVALS = ["1m", "5m", "15m", "1h", "4h", "1d"]
 
 
 def _parse_kline(symbol: str, interval: str, raw: list) -> Dict[str, Any]:
-    """Convert Binance kline array to dict."""
+    """Convert a single Binance kline array to dict (pages go through fetch_klines_batch)."""
     return {
         "symbol": symbol,
         "interval": interval,
@@ -37,14 +41,14 @@ def _parse_kline(symbol: str, interval: str, raw: list) -> Dict[str, Any]:
     }
 
 
-async def fetch_klines(
+async def fetch_klines_batch(
     symbol: str,
     interval: str = "1h",
     limit: int = 500,
     start_time: Optional[int] = None,
     end_time: Optional[int] = None,
-) -> List[Dict[str, Any]]:
-    """Fetch klines from Binance and normalize them."""
+) -> np.ndarray:
+    """Fetch klines from Binance as a typed KLINE_DTYPE batch (epoch-ms, float64)."""
     raw = await binance_client.get_klines(
         symbol=symbol,
         interval=interval,
@@ -52,7 +56,19 @@ async def fetch_klines(
         start_time=start_time,
         end_time=end_time,
     )
-    return [_parse_kline(symbol, interval, k) for k in raw]
+    return parse_raw_klines(raw)
+
+
+async def fetch_klines(
+    symbol: str,
+    interval: str = "1h",
+    limit: int = 500,
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Fetch klines from Binance and normalize them into klines_ohlcv rows."""
+    batch = await fetch_klines_batch(symbol, interval, limit, start_time, end_time)
+    return to_db_rows(symbol, interval, batch)
 
 
 async def store_klines(klines: List[Dict[str, Any]]) -> int:
@@ -74,12 +90,15 @@ async def store_klines(klines: List[Dict[str, Any]]) -> int:
     return inserted
 
 
-def _interval_ms(interval: str) -> int:
-    """Convert interval string to milliseconds."""
-    multipliers = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+_UNIT_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+
+def interval_ms(interval: str) -> int:
+    """Convert a Binance interval string (``1m``, ``4h``, ``1d``, ``1w``) to milliseconds."""
     unit = interval[-1]
-    num = int(interval[:-1])
-    return num * multipliers[unit]
+    if unit not in _UNIT_MS:
+        raise ValueError(f"Unsupported interval: {interval}")
+    return int(interval[:-1]) * _UNIT_MS[unit]
 
 
 async def backfill(
@@ -90,31 +109,46 @@ async def backfill(
     """Backfill historical klines in batches of 1000 going backward."""
     now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
     start_ms = now_ms - (days * 86_400_000)
+    return await backfill_range(symbol, interval, start_ms, now_ms)
+
+
+async def backfill_range(
+    symbol: str,
+    interval: str,
+    start_ms: int,
+    end_ms: int,
+) -> int:
+    """Fetch and store every candle with open_time in [start_ms, end_ms].
+
+    Camino común del backfill por días y de la reparación de gaps
+    (kline_gaps.repair_gaps), que sólo pide las ventanas faltantes.
+    """
     total_stored = 0
     current_start = start_ms
     batch_size = 1000
-    interval_duration = _interval_ms(interval)
+    interval_duration = interval_ms(interval)
 
-    while current_start < now_ms:
+    while current_start <= end_ms:
         try:
-            klines = await fetch_klines(
+            batch = await fetch_klines_batch(
                 symbol=symbol,
                 interval=interval,
                 limit=batch_size,
                 start_time=current_start,
+                end_time=end_ms,
             )
-            if not klines:
+            if len(batch) == 0:
                 break
-            stored = await store_klines(klines)
+            stored = await store_klines(to_db_rows(symbol, interval, batch))
             total_stored += stored
             # Move to after last candle
-            last_open = klines[-1]["open_time"]
-            last_ts = int(datetime.fromisoformat(last_open).timestamp() * 1000)
-            current_start = last_ts + interval_duration
+            current_start = int(batch["open_time"][-1]) + interval_duration
             logger.info(
                 f"Backfill {symbol} {interval}: stored {stored} candles "
                 f"(total: {total_stored})"
             )
+            if len(batch) < batch_size:
+                break
         except Exception as e:
             logger.error(f"Backfill error {symbol} {interval}: {e}")
             break
@@ -128,10 +162,68 @@ async def collect_latest(symbol: str, interval: str = "1h") -> int:
     return await store_klines(klines)
 
 
+def _to_epoch_ms(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def _coverage_item(
+    symbol: str,
+    interval: str,
+    row: Optional[Dict[str, Any]],
+    now_ms: int,
+) -> Dict[str, Any]:
+    """Build a status item (with freshness lag) from an RPC coverage row."""
+    row = row or {}
+    last_open = row.get("last_open_time")
+    last_ms = _to_epoch_ms(last_open)
+    lag_seconds = None
+    if last_ms is not None:
+        # Lag = tiempo desde que cerró la última vela almacenada (0 si es la vela en curso)
+        lag_seconds = max(0, (now_ms - (last_ms + interval_ms(interval))) // 1000)
+    return {
+        "symbol": symbol,
+        "interval": interval,
+        "latest_open_time": last_open,
+        "first_open_time": row.get("first_open_time"),
+        "count": int(row.get("candle_count") or 0),
+        "gap_count": int(row.get("gap_count") or 0),
+        "missing_candles": int(row.get("missing_candles") or 0),
+        "freshness_lag_seconds": lag_seconds,
+    }
+
+
 async def get_klines_status() -> List[Dict[str, Any]]:
-    """Get latest timestamps per symbol/interval pair."""
+    """Coverage per symbol/interval pair in a single round trip.
+
+    Usa la RPC ``get_klines_coverage`` (migración 20261019_klines_coverage):
+    count, primer/último open_time y gaps agregados en Postgres (los gaps,
+    sólo de los últimos 30 días: default de ``p_since``). Si la RPC no existe
+    todavía, cae al camino legacy (2 queries por par).
+    """
     supabase = get_supabase()
-    symbols = settings.quant_symbols.split(",")
+    symbols = [s.strip() for s in settings.quant_symbols.split(",") if s.strip()]
+    try:
+        resp = supabase.rpc("get_klines_coverage", {"p_symbols": symbols}).execute()
+        rows = resp.data or []
+    except Exception as e:
+        logger.warning(f"get_klines_coverage RPC unavailable, using legacy status: {e}")
+        return _get_klines_status_legacy(symbols)
+
+    by_key = {(r["symbol"], r["interval"]): r for r in rows}
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    return [
+        _coverage_item(sym, iv, by_key.get((sym, iv)), now_ms)
+        for sym in symbols
+        for iv in INTERVALS
+    ]
+
+
+def _get_klines_status_legacy(symbols: List[str]) -> List[Dict[str, Any]]:
+    """Latest timestamp + count per pair (one PostgREST query pair per combination)."""
+    supabase = get_supabase()
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
     status = []
     for sym in symbols:
         for iv in INTERVALS:
@@ -152,12 +244,11 @@ async def get_klines_status() -> List[Dict[str, Any]]:
                     .eq("interval", iv)
                     .execute()
                 )
-                status.append({
-                    "symbol": sym,
-                    "interval": iv,
-                    "latest_open_time": resp.data[0]["open_time"] if resp.data else None,
-                    "count": count_resp.count or 0,
-                })
+                row = {
+                    "last_open_time": resp.data[0]["open_time"] if resp.data else None,
+                    "candle_count": count_resp.count or 0,
+                }
+                status.append(_coverage_item(sym, iv, row, now_ms))
             except Exception:
-                status.append({"symbol": sym, "interval": iv, "latest_open_time": None, "count": 0})
+                status.append(_coverage_item(sym, iv, None, now_ms))
     return status
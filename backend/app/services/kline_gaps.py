@@ -0,0 +1,320 @@
+"""Vectorized kline gap detection, completeness report and targeted repair.
+
+El scanner trabaja sobre columnas (symbol, interval, open_time int64 epoch-ms):
+ordena una sola vez con ``np.lexsort`` y detecta gaps con ``np.diff`` dentro
+de cada grupo (symbol, interval). Los rangos faltantes se fusionan en ventanas
+de a lo sumo una página REST y se re-descargan por ``kline_collector.backfill_range``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ..db import get_supabase
+from .bulk_reader import read_klines
+from .kline_collector import interval_ms
+
+logger = logging.getLogger(__name__)
+
+# Binance devuelve hasta 1000 velas por request: ventana máxima de reparación
+REPAIR_PAGE_CANDLES = 1000
+
+RepairFn = Callable[[str, str, int, int], Awaitable[int]]
+
+
+def ms_to_iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def _sorted_columns(symbols, intervals, open_times):
+    sym = np.asarray(symbols)
+    iv = np.asarray(intervals)
+    ot = np.asarray(open_times, dtype=np.int64)
+    order = np.lexsort((ot, iv, sym))
+    sym, iv, ot = sym[order], iv[order], ot[order]
+    uniq, inverse = np.unique(iv, return_inverse=True)
+    step = np.array([interval_ms(u) for u in uniq], dtype=np.int64)[inverse]
+    return sym, iv, ot, step
+
+
+def _group_bounds(sym: np.ndarray, iv: np.ndarray) -> np.ndarray:
+    """Start index of each (symbol, interval) run in sorted columns."""
+    change = (sym[1:] != sym[:-1]) | (iv[1:] != iv[:-1])
+    return np.flatnonzero(np.r_[True, change])
+
+
+def scan_gaps(
+    symbols: Sequence[str] | np.ndarray,
+    intervals: Sequence[str] | np.ndarray,
+    open_times: Sequence[int] | np.ndarray,
+) -> List[Dict[str, Any]]:
+    """Find missing candle ranges per (symbol, interval) in one pass.
+
+    Args:
+        symbols, intervals, open_times: Columnas paralelas (cualquier orden).
+
+    Returns:
+        Lista de gaps ``{symbol, interval, start_ms, end_ms, missing}`` donde
+        start/end son el primer y último open_time faltante (inclusive).
+    """
+    if len(open_times) < 2:
+        return []
+    sym, iv, ot, step = _sorted_columns(symbols, intervals, open_times)
+    same_group = (sym[1:] == sym[:-1]) & (iv[1:] == iv[:-1])
+    diffs = np.diff(ot)
+    idx = np.flatnonzero(same_group & (diffs > step[:-1]))
+
+    starts = ot[idx] + step[idx]
+    ends = ot[idx + 1] - step[idx]
+    missing = diffs[idx] // step[idx] - 1
+    return [
+        {
+            "symbol": str(sym[i]),
+            "interval": str(iv[i]),
+            "start_ms": int(s),
+            "end_ms": int(e),
+            "missing": int(m),
+        }
+        for i, s, e, m in zip(idx, starts, ends, missing)
+        if m > 0
+    ]
+
+
+def merge_gap_ranges(
+    gaps: List[Dict[str, Any]],
+    max_span_candles: int = REPAIR_PAGE_CANDLES,
+) -> List[Dict[str, Any]]:
+    """Merge nearby gaps of the same pair into windows of at most one REST page.
+
+    Varios huecos chicos cercanos se reparan con un solo request en lugar de
+    uno por hueco. Un gap más largo que la ventana queda tal cual (el backfill
+    pagina).
+    """
+    merged: List[Dict[str, Any]] = []
+    for gap in sorted(gaps, key=lambda g: (g["symbol"], g["interval"], g["start_ms"])):
+        if merged:
+            cur = merged[-1]
+            step = interval_ms(gap["interval"])
+            span = (gap["end_ms"] - cur["start_ms"]) // step + 1
+            if (
+                cur["symbol"] == gap["symbol"]
+                and cur["interval"] == gap["interval"]
+                and span <= max_span_candles
+            ):
+                cur["end_ms"] = max(cur["end_ms"], gap["end_ms"])
+                cur["missing"] += gap["missing"]
+                cur["gaps"] += 1
+                continue
+        merged.append({**gap, "gaps": 1})
+    return merged
+
+
+def completeness_report(
+    symbols: Sequence[str] | np.ndarray,
+    intervals: Sequence[str] | np.ndarray,
+    open_times: Sequence[int] | np.ndarray,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    pairs: Optional[Sequence[tuple]] = None,
+) -> List[Dict[str, Any]]:
+    """Data completeness per (symbol, interval).
+
+    Si se pasan start_ms/end_ms, las velas esperadas se cuentan sobre esa
+    ventana (alineada al intervalo); si no, entre la primera y la última vela.
+    ``pairs``: pares esperados; los que no tienen ninguna vela salen con
+    ``candles=0`` y ``completeness_pct=0`` (una serie ausente no es completa).
+    """
+    report = []
+    if len(open_times):
+        report = _completeness_rows(symbols, intervals, open_times, start_ms, end_ms)
+    seen = {(r["symbol"], r["interval"]) for r in report}
+    for symbol, interval in pairs or ():
+        if (symbol, interval) in seen:
+            continue
+        seen.add((symbol, interval))
+        s = interval_ms(interval)
+        expected = 0
+        if start_ms is not None and end_ms is not None:
+            lo, hi = _aligned_window(start_ms, end_ms, s)
+            expected = max(0, int((hi - lo) // s + 1))
+        report.append({
+            "symbol": symbol,
+            "interval": interval,
+            "candles": 0,
+            "expected": expected,
+            "missing": expected,
+            "duplicates": 0,
+            "first_open_time": None,
+            "last_open_time": None,
+            "completeness_pct": 0.0,
+        })
+    report.sort(key=lambda r: (r["symbol"], r["interval"]))
+    return report
+
+
+def _aligned_window(start_ms: Optional[int], end_ms: Optional[int], step: int) -> tuple:
+    """Primer bucket >= start y último bucket <= end (None si no se pasó)."""
+    lo = None if start_ms is None else -(-start_ms // step) * step
+    hi = None if end_ms is None else end_ms - (end_ms % step)
+    return lo, hi
+
+
+def _completeness_rows(symbols, intervals, open_times, start_ms, end_ms) -> List[Dict[str, Any]]:
+    sym, iv, ot, step = _sorted_columns(symbols, intervals, open_times)
+    bounds = _group_bounds(sym, iv)
+    ends = np.r_[bounds[1:], len(ot)]
+
+    report = []
+    for b, e in zip(bounds, ends):
+        times = ot[b:e]
+        s = int(step[b])
+        unique = np.unique(times)
+        lo, hi = _aligned_window(start_ms, end_ms, s)
+        lo = unique[0] if lo is None else lo
+        hi = unique[-1] if hi is None else hi
+        in_window = unique[(unique >= lo) & (unique <= hi)]
+        expected = max(0, int((hi - lo) // s + 1))
+        present = len(in_window)
+        report.append({
+            "symbol": str(sym[b]),
+            "interval": str(iv[b]),
+            "candles": present,
+            "expected": expected,
+            "missing": max(0, expected - present),
+            "duplicates": int(len(times) - len(unique)),
+            "first_open_time": ms_to_iso(int(unique[0])),
+            "last_open_time": ms_to_iso(int(unique[-1])),
+            "completeness_pct": round(100.0 * present / expected, 2) if expected else 100.0,
+        })
+    return report
+
+
+def load_open_times(
+    symbol: str,
+    interval: str,
+    start_ms: Optional[int] = None,
+) -> np.ndarray:
+    """Load only the open_time column for a pair as int64 epoch-ms (keyset pages)."""
+    start_iso = ms_to_iso(start_ms) if start_ms is not None else None
+    return read_klines(symbol, interval, columns=["open_time"], start_iso=start_iso)["open_time"]
+
+
+async def repair_gaps(
+    gaps: List[Dict[str, Any]],
+    repair: Optional[RepairFn] = None,
+    max_concurrency: int = 2,
+) -> Dict[str, Any]:
+    """Re-fetch merged gap windows through the REST backfill path."""
+    if repair is None:
+        from .kline_collector import backfill_range as repair
+
+    windows = merge_gap_ranges(gaps)
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def _one(w: Dict[str, Any]) -> int:
+        async with sem:
+            return await repair(w["symbol"], w["interval"], w["start_ms"], w["end_ms"])
+
+    results = await asyncio.gather(*[_one(w) for w in windows], return_exceptions=True)
+    stored = 0
+    failed = 0
+    for w, r in zip(windows, results):
+        if isinstance(r, Exception):
+            failed += 1
+            logger.warning(
+                f"Gap repair {w['symbol']} {w['interval']} "
+                f"{ms_to_iso(w['start_ms'])}..{ms_to_iso(w['end_ms'])} failed: {r}"
+            )
+        else:
+            stored += r
+    return {
+        "windows": len(windows),
+        "requested_candles": sum(w["missing"] for w in windows),
+        "stored": stored,
+        "failed_windows": failed,
+    }
+
+
+def _pairs_with_gaps(symbols: List[str], intervals: List[str], start_ms: int) -> List[tuple]:
+    """Use the coverage RPC to skip pairs without gaps; scan everything if unavailable.
+
+    ``p_since`` = inicio de la ventana de escaneo: un gap fuera de la ventana
+    no se puede reparar y no debe marcar el par.
+    """
+    try:
+        resp = get_supabase().rpc(
+            "get_klines_coverage", {"p_symbols": symbols, "p_since": ms_to_iso(start_ms)}
+        ).execute()
+        return [
+            (r["symbol"], r["interval"])
+            for r in (resp.data or [])
+            if r["interval"] in intervals and int(r.get("gap_count") or 0) > 0
+        ]
+    except Exception as e:
+        logger.warning(f"get_klines_coverage unavailable, scanning all pairs: {e}")
+        return [(s, iv) for s in symbols for iv in intervals]
+
+
+async def scan_and_repair(
+    symbols: List[str],
+    intervals: Optional[List[str]] = None,
+    days: int = 30,
+    repair: bool = True,
+    all_pairs: bool = False,
+) -> Dict[str, Any]:
+    """Scan stored klines for gaps in the last ``days`` and optionally repair them.
+
+    Args:
+        symbols: Pares a revisar.
+        intervals: Intervalos (default: kline_collector.INTERVALS).
+        days: Ventana hacia atrás.
+        repair: Si True, re-descarga los rangos faltantes.
+        all_pairs: Si True, escanea todos los pares (reporte completo);
+            si False, sólo los que la RPC de cobertura marca con gaps.
+    """
+    from .kline_collector import INTERVALS
+
+    intervals = intervals or INTERVALS
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    start_ms = now_ms - days * 86_400_000
+    pairs = (
+        [(s, iv) for s in symbols for iv in intervals]
+        if all_pairs
+        else _pairs_with_gaps(symbols, intervals, start_ms)
+    )
+
+    sym_cols, iv_cols, ot_cols = [], [], []
+    for sym, iv in pairs:
+        times = await asyncio.to_thread(load_open_times, sym, iv, start_ms)
+        sym_cols.append(np.full(len(times), sym))
+        iv_cols.append(np.full(len(times), iv))
+        ot_cols.append(times)
+
+    if ot_cols:
+        sym_arr = np.concatenate(sym_cols)
+        iv_arr = np.concatenate(iv_cols)
+        ot_arr = np.concatenate(ot_cols)
+    else:
+        sym_arr = iv_arr = np.empty(0, dtype=str)
+        ot_arr = np.empty(0, dtype=np.int64)
+
+    gaps = scan_gaps(sym_arr, iv_arr, ot_arr)
+    result: Dict[str, Any] = {
+        "pairs_scanned": len(pairs),
+        "gaps_found": len(gaps),
+        "missing_candles": sum(g["missing"] for g in gaps),
+        "completeness": completeness_report(sym_arr, iv_arr, ot_arr, start_ms=start_ms, end_ms=now_ms, pairs=pairs),
+        "gaps": gaps[:50],
+    }
+    if repair and gaps:
+        result["repair"] = await repair_gaps(gaps)
+        logger.info(
+            f"Gap repair: {result['gaps_found']} gaps, "
+            f"{result['repair']['windows']} windows, {result['repair']['stored']} candles stored"
+        )
+    return result
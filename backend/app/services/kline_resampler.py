@@ -0,0 +1,203 @@
+"""Local multi-timeframe resampling from base-interval candles.
+
+En lugar de pedir 1m, 5m, 15m, 1h, 4h y 1d a Binance por separado, el
+orchestrator pide sólo las velas base (1m) y deriva los intervalos mayores
+localmente. Así todos los timeframes salen de los mismos datos y coinciden
+por construcción.
+
+Reglas de agregación (idénticas a Binance spot):
+  - Buckets alineados a epoch UTC (1d empieza a las 00:00 UTC, 4h a 00/04/08...).
+  - open = primer open, high = max, low = min, close = último close.
+  - volume / quote_volume / trades / taker volumes = suma.
+  - close_time = bucket_start + duración - 1ms.
+
+Velas parciales:
+  - Un bucket completo (todas sus velas base) se emite como cerrado.
+  - El bucket en curso se emite si sus velas base son contiguas desde el inicio
+    del bucket (misma semántica que la vela "viva" que devuelve Binance).
+  - Un bucket sin su cabecera (el buffer no llega al inicio) o con huecos
+    internos NO se emite: no se puede derivar fielmente.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .kline_arrays import KLINE_DTYPE, empty_batch, merge_batches
+from .kline_collector import interval_ms
+
+logger = logging.getLogger(__name__)
+
+_SUM_FIELDS = (
+    "volume", "quote_volume", "trades_count",
+    "taker_buy_base_volume", "taker_buy_quote_volume",
+)
+_PRICE_FIELDS = ("open", "high", "low", "close")
+_VOLUME_FIELDS = ("volume", "quote_volume", "taker_buy_base_volume", "taker_buy_quote_volume")
+
+
+def _aligned_ms(interval: str) -> int:
+    """Duración en ms de un intervalo que se puede derivar: sólo m/h/d (alineados a epoch)."""
+    if interval[-1] not in "mhd":
+        raise ValueError(f"Interval {interval} is not epoch-aligned and cannot be resampled")
+    return interval_ms(interval)
+
+
+def bucket_start(open_times: np.ndarray | int, target_interval: str):
+    step = _aligned_ms(target_interval)
+    return open_times - (open_times % step)
+
+
+def resample(
+    base: np.ndarray,
+    base_interval: str,
+    target_interval: str,
+    include_partial: bool = True,
+) -> np.ndarray:
+    """Agrega velas base (KLINE_DTYPE, ordenadas por open_time) al intervalo objetivo.
+
+    Args:
+        base: Velas base sin duplicados, ordenadas ascendentemente.
+        base_interval: Intervalo de las velas base (ej: ``1m``).
+        target_interval: Intervalo a derivar (múltiplo del base).
+        include_partial: Si True, emite el último bucket aunque esté incompleto
+            siempre que sea contiguo desde su inicio (vela en curso).
+
+    Returns:
+        Array KLINE_DTYPE con un registro por bucket derivable.
+    """
+    base_ms = _aligned_ms(base_interval)
+    target_ms = _aligned_ms(target_interval)
+    if target_ms % base_ms != 0:
+        raise ValueError(f"{target_interval} is not a multiple of {base_interval}")
+    if len(base) == 0:
+        return empty_batch()
+
+    per_bucket = target_ms // base_ms
+    open_times = base["open_time"]
+    buckets = open_times - (open_times % target_ms)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(base)]
+    counts = ends - starts
+
+    first_open = open_times[starts]
+    last_open = open_times[ends - 1]
+    bucket_keys = buckets[starts]
+    # Contiguo desde el inicio del bucket: sin cabecera faltante ni huecos internos
+    contiguous = (first_open == bucket_keys) & ((last_open - first_open) // base_ms + 1 == counts)
+    complete = contiguous & (counts == per_bucket)
+    keep = complete.copy()
+    if include_partial and len(keep):
+        keep[-1] = contiguous[-1]
+
+    out = np.empty(len(starts), dtype=KLINE_DTYPE)
+    out["open_time"] = bucket_keys
+    out["close_time"] = bucket_keys + target_ms - 1
+    out["open"] = base["open"][starts]
+    out["close"] = base["close"][ends - 1]
+    out["high"] = np.maximum.reduceat(base["high"], starts)
+    out["low"] = np.minimum.reduceat(base["low"], starts)
+    for name in _SUM_FIELDS:
+        out[name] = np.add.reduceat(base[name], starts)
+    return out[keep]
+
+
+def compare_candles(
+    derived: np.ndarray,
+    exchange: np.ndarray,
+    price_tol: float = 1e-9,
+    volume_tol: float = 1e-6,
+) -> List[dict]:
+    """Compara velas derivadas vs las del exchange en los open_time comunes.
+
+    Sólo se comparan velas cerradas en ambos lados (la vela en curso cambia
+    entre el fetch y la comparación). Retorna una lista de discrepancias.
+    """
+    if len(derived) == 0 or len(exchange) == 0:
+        return []
+    common, d_idx, e_idx = np.intersect1d(
+        derived["open_time"], exchange["open_time"], return_indices=True,
+    )
+    # Excluir la última vela común (puede estar en curso)
+    if len(common) and common[-1] == max(derived["open_time"][-1], exchange["open_time"][-1]):
+        common, d_idx, e_idx = common[:-1], d_idx[:-1], e_idx[:-1]
+
+    mismatches = []
+    for name in _PRICE_FIELDS + _VOLUME_FIELDS + ("trades_count",):
+        tol = price_tol if name in _PRICE_FIELDS else volume_tol
+        d = derived[name][d_idx].astype(np.float64)
+        e = exchange[name][e_idx].astype(np.float64)
+        rel = np.abs(d - e) / np.maximum(np.abs(e), 1e-12)
+        for i in np.flatnonzero(rel > tol):
+            mismatches.append({
+                "open_time": int(common[i]),
+                "field": name,
+                "derived": float(d[i]),
+                "exchange": float(e[i]),
+            })
+    return mismatches
+
+
+class KlineResampler:
+    """Buffer por símbolo de velas base + derivación incremental.
+
+    ``update`` recibe las velas base nuevas (o refrescadas), las fusiona en el
+    buffer, y devuelve sólo los buckets derivados que esas velas tocaron, para
+    que cada tick escriba un puñado de filas en lugar de re-escribir todo.
+    """
+
+    def __init__(self, base_interval: str, target_intervals: List[str]):
+        self.base_interval = base_interval
+        self.target_intervals = [iv for iv in target_intervals if iv != base_interval]
+        self._base_ms = _aligned_ms(base_interval)
+        # Retener lo suficiente para reconstruir el bucket más largo + 1 de margen
+        longest = max((_aligned_ms(iv) for iv in self.target_intervals), default=self._base_ms)
+        self._retain_ms = 2 * longest
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def is_seeded(self, symbol: str) -> bool:
+        return len(self._buffers.get(symbol, ())) > 0
+
+    def last_open_time(self, symbol: str) -> Optional[int]:
+        buf = self._buffers.get(symbol)
+        return int(buf["open_time"][-1]) if buf is not None and len(buf) else None
+
+    def seed_start_ms(self, now_ms: int) -> int:
+        """Primer open_time base necesario para derivar todos los buckets en curso."""
+        longest = max((_aligned_ms(iv) for iv in self.target_intervals), default=self._base_ms)
+        return now_ms - (now_ms % longest)
+
+    def buffer(self, symbol: str) -> np.ndarray:
+        return self._buffers.get(symbol, empty_batch())
+
+    def update(self, symbol: str, base_batch: np.ndarray) -> Dict[str, np.ndarray]:
+        """Fusiona velas base y retorna ``{interval: velas derivadas tocadas}``."""
+        if len(base_batch) == 0:
+            return {}
+        merged = merge_batches(self._buffers.get(symbol, empty_batch()), base_batch)
+        cutoff = merged["open_time"][-1] - self._retain_ms
+        merged = merged[merged["open_time"] >= cutoff]
+        self._buffers[symbol] = merged
+
+        touched_from = int(base_batch["open_time"].min())
+        out: Dict[str, np.ndarray] = {}
+        for iv in self.target_intervals:
+            first_bucket = int(bucket_start(touched_from, iv))
+            window = merged[merged["open_time"] >= first_bucket]
+            derived = resample(window, self.base_interval, iv)
+            if len(derived):
+                out[iv] = derived
+        return out
+
+    def derive(self, symbol: str, target_interval: str, include_partial: bool = True) -> np.ndarray:
+        """Todas las velas derivables del buffer para un intervalo."""
+        return resample(self.buffer(symbol), self.base_interval, target_interval, include_partial)
+
+    def reset(self, symbol: Optional[str] = None) -> None:
+        if symbol is None:
+            self._buffers.clear()
+        else:
+            self._buffers.pop(symbol, None)
@@ -0,0 +1,312 @@
+"""Signal-to-fill latency tracing.
+
+No había forma de saber cuánto tarda el camino desde que cierra una vela
+hasta el fill de la orden: ``run_quant_tick`` → ``generate_signals`` →
+``_submit_proposal`` (insert, validación, update, Telegram) →
+``execute_proposal`` → ``place_order``.
+
+- ``tick_trace()`` abre una traza por tick del main loop. Su origen es el
+  cierre de la última vela del intervalo primario.
+- ``span(stage, symbol)`` mide una etapa dentro de la traza activa
+  (``ContextVar``: la heredan las tareas lanzadas dentro, como en
+  ``query_budget``). Fuera de una traza no mide nada.
+- ``proposal_trace(symbol)`` abre la traza de un proposal. Hereda las
+  etapas del tick que corresponden a ese símbolo (análisis, evaluación), y
+  ``execution_trace(proposal_id)`` la retoma aunque la ejecución ocurra
+  después, desde ``execute_all_approved``.
+- Hitos end-to-end: ``candle_to_signal``, ``candle_to_fill`` y
+  ``signal_to_fill``.
+
+La traza se persiste en ``trade_proposals.latency_trace`` y
+``positions.latency_trace`` con ``persist_trace``: un update aparte y
+best-effort, nunca dentro del write del fill (sin la migración la columna
+no existe y PostgREST rechazaría el write entero). ``get_latency_stats()`` guarda las últimas
+``LATENCY_TRACE_SAMPLES`` muestras por etapa y símbolo para los
+p50/p95/p99 de ``GET /quant/latency``.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+ALL_SYMBOLS = "*"
+_MAX_PENDING = 500   # trazas de proposals aprobados esperando ejecución
+
+_tick: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("latency_tick", default=None)
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("latency_trace", default=None)
+_pending: "OrderedDict[str, Trace]" = OrderedDict()
+_column_ok = True    # latency_trace existe en la DB (se apaga cuando PostgREST la rechaza)
+
+
+def _now_ms() -> float:
+    return time.time() * 1000
+
+
+def last_candle_close_ms(interval: Optional[str] = None, now_ms: Optional[float] = None) -> int:
+    """Cierre de la última vela del intervalo (= apertura de la vela en curso)."""
+    from .kline_collector import interval_ms
+
+    step = interval_ms(interval or settings.quant_primary_interval)
+    now_ms = _now_ms() if now_ms is None else now_ms
+    return int(now_ms // step * step)
+
+
+class Trace:
+    """Etapas (``spans``) e hitos (``marks``) de un tick o de un proposal."""
+
+    def __init__(self, symbol: Optional[str] = None, origin_ms: Optional[int] = None,
+                 tick_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.tick_id = tick_id
+        self.symbol = symbol
+        self.proposal_id: Optional[str] = None
+        self.origin_ms = origin_ms
+        self.started_ms = _now_ms()
+        self.spans: List[Dict[str, Any]] = []
+        self.marks: Dict[str, float] = {}
+        self._observed_spans = 0
+        self._observed_marks: set = set()
+        self._counted = False
+
+    def add(self, stage: str, at_ms: float, ms: float, symbol: Optional[str] = None) -> None:
+        span = {"stage": stage, "at_ms": int(at_ms), "ms": round(ms, 3)}
+        if symbol:
+            span["symbol"] = symbol
+        self.spans.append(span)
+
+    def mark(self, name: str, since: str = "origin") -> Optional[float]:
+        """Hito end-to-end: ms desde el cierre de vela (``origin``) o desde el inicio de la traza (``start``)."""
+        base = self.origin_ms if since == "origin" else self.started_ms
+        if base is None:
+            return None
+        self.marks[name] = round(_now_ms() - base, 3)
+        return self.marks[name]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "tick_id": self.tick_id,
+            "symbol": self.symbol,
+            "candle_close_ms": self.origin_ms,
+            "started_ms": int(self.started_ms),
+            "spans": list(self.spans),
+            "marks": dict(self.marks),
+        }
+
+
+class LatencyStats:
+    """Ventanas de muestras por (etapa, símbolo) para percentiles."""
+
+    def __init__(self, maxlen: Optional[int] = None):
+        self.maxlen = maxlen or settings.latency_trace_samples
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self.traces = 0
+
+    def add(self, stage: str, ms: float, symbol: Optional[str] = None) -> None:
+        for key in ((stage, ALL_SYMBOLS), (stage, symbol)) if symbol else ((stage, ALL_SYMBOLS),):
+            self._samples.setdefault(key, deque(maxlen=self.maxlen)).append(ms)
+
+    def observe(self, trace: Trace) -> None:
+        """Ingerir lo que la traza agregó desde la última vez (las retomadas no se cuentan dos veces)."""
+        for span in trace.spans[trace._observed_spans:]:
+            self.add(span["stage"], span["ms"], span.get("symbol") or trace.symbol)
+        trace._observed_spans = len(trace.spans)
+        for name, ms in trace.marks.items():
+            if name not in trace._observed_marks:
+                self.add(name, ms, trace.symbol)
+                trace._observed_marks.add(name)
+        if not trace._counted:
+            trace._counted = True
+            self.traces += 1
+
+    def observe_dict(self, data: Dict[str, Any]) -> None:
+        """Ingerir una traza persistida (``latency_trace`` de la DB)."""
+        symbol = data.get("symbol")
+        for span in data.get("spans") or []:
+            self.add(span["stage"], float(span["ms"]), span.get("symbol") or symbol)
+        for name, ms in (data.get("marks") or {}).items():
+            self.add(name, float(ms), symbol)
+        self.traces += 1
+
+    def summary(self, symbol: Optional[str] = None) -> Dict[str, Any]:
+        """p50/p95/p99 por etapa (todas o de un símbolo) y, sin símbolo, desglose por símbolo."""
+        def _pct(samples: Iterable[float]) -> Dict[str, Any]:
+            arr = np.fromiter(samples, dtype=float)
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+            return {"count": len(arr), "p50": round(float(p50), 2), "p95": round(float(p95), 2),
+                    "p99": round(float(p99), 2), "max": round(float(arr.max()), 2)}
+
+        target = symbol or ALL_SYMBOLS
+        result: Dict[str, Any] = {
+            "traces": self.traces,
+            "stages": {stage: _pct(s) for (stage, sym), s in sorted(self._samples.items()) if sym == target and s},
+        }
+        if symbol is None:
+            by_symbol: Dict[str, Dict[str, Any]] = {}
+            for (stage, sym), s in sorted(self._samples.items()):
+                if sym != ALL_SYMBOLS and s:
+                    by_symbol.setdefault(sym, {})[stage] = _pct(s)
+            result["by_symbol"] = by_symbol
+        return result
+
+    def reset(self) -> None:
+        self.__init__(self.maxlen)
+
+
+_stats = LatencyStats()
+
+
+def get_latency_stats() -> LatencyStats:
+    return _stats
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get() or _tick.get()
+
+
+def reset_traces() -> None:
+    global _column_ok
+    _pending.clear()
+    _stats.reset()
+    _column_ok = True
+
+
+# ── Scopes ──
+
+
+@contextmanager
+def tick_trace(interval: Optional[str] = None, origin_ms: Optional[int] = None) -> Iterator[Optional[Trace]]:
+    """Traza del tick del main loop (origen: ``origin_ms`` o el cierre de la última vela)."""
+    if not settings.latency_trace_enabled:
+        yield None
+        return
+    trace = Trace(origin_ms=last_candle_close_ms(interval) if origin_ms is None else origin_ms)
+    trace.tick_id = trace.trace_id
+    trace.mark("tick_lag")   # cierre de vela → inicio del tick
+    token = _tick.set(trace)
+    try:
+        yield trace
+    finally:
+        _tick.reset(token)
+        _stats.observe(trace)
+
+
+@contextmanager
+def span(stage: str, symbol: Optional[str] = None) -> Iterator[None]:
+    """Medir una etapa en la traza activa (no-op fuera de una traza)."""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    at_ms, t0 = _now_ms(), time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, at_ms, (time.perf_counter() - t0) * 1000, symbol if symbol != trace.symbol else None)
+
+
+@contextmanager
+def proposal_trace(symbol: str) -> Iterator[Optional[Trace]]:
+    """Traza de un proposal: hereda del tick sus etapas generales y las de ``symbol``."""
+    if not settings.latency_trace_enabled:
+        yield None
+        return
+    tick = _tick.get()
+    trace = Trace(symbol=symbol, origin_ms=tick.origin_ms if tick else last_candle_close_ms(),
+                  tick_id=tick.tick_id if tick else None)
+    if tick is not None:
+        trace.spans = [dict(s) for s in tick.spans if s.get("symbol") in (None, symbol)]
+        trace.marks = {k: v for k, v in tick.marks.items()}
+        trace._observed_spans = len(trace.spans)      # ya las cuenta la traza del tick
+        trace._observed_marks = set(trace.marks)
+    trace.mark("candle_to_signal")
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        _stats.observe(trace)
+
+
+def attach(trace: Optional[Trace], proposal_id: str) -> None:
+    """Asociar la traza a su proposal para que la ejecución posterior la retome."""
+    if trace is None:
+        return
+    trace.proposal_id = str(proposal_id)
+    _pending[trace.proposal_id] = trace
+    while len(_pending) > _MAX_PENDING:
+        _pending.popitem(last=False)
+
+
+@contextmanager
+def execution_trace(proposal_id: str) -> Iterator[Optional[Trace]]:
+    """Traza de ``execute_proposal``: la del proposal si sigue activa o pendiente, si no una nueva."""
+    if not settings.latency_trace_enabled:
+        yield None
+        return
+    active = _current.get()
+    if active is not None and active.proposal_id == str(proposal_id):
+        try:
+            yield active   # ejecución inline desde _submit_proposal
+        finally:
+            _pending.pop(str(proposal_id), None)
+        return
+    trace = _pending.pop(str(proposal_id), None)
+    if trace is None:
+        tick = _tick.get()
+        trace = Trace(origin_ms=tick.origin_ms if tick else None, tick_id=tick.tick_id if tick else None)
+        trace.proposal_id = str(proposal_id)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        _stats.observe(trace)
+
+
+def mark_fill() -> None:
+    """Hitos del fill sobre la traza activa."""
+    trace = _current.get()
+    if trace is None:
+        return
+    trace.mark("candle_to_fill")
+    if "candle_to_signal" in trace.marks:
+        trace.marks["signal_to_fill"] = round(trace.marks["candle_to_fill"] - trace.marks["candle_to_signal"], 3)
+    else:
+        trace.mark("signal_to_fill", since="start")
+
+
+def trace_payload() -> Dict[str, Any]:
+    """``{"latency_trace": ...}`` para sumar a un insert/update (vacío sin traza)."""
+    trace = _current.get()
+    return {"latency_trace": trace.to_dict()} if trace is not None else {}
+
+
+def persist_trace(supabase, table: str, row_id: Optional[str]) -> bool:
+    """Guardar la traza activa en ``table.latency_trace`` (update aparte, best-effort)."""
+    global _column_ok
+    payload = trace_payload()
+    if not payload or not row_id or not _column_ok:
+        return False
+    try:
+        supabase.table(table).update(payload).eq("id", row_id).execute()
+        return True
+    except Exception as e:
+        if "latency_trace" in str(e):   # migración 20261019_latency_trace sin aplicar
+            _column_ok = False
+            logger.warning(f"{table}.latency_trace unavailable, not persisting traces: {e}")
+        else:
+            logger.warning(f"Could not persist latency trace on {table} [{row_id}]: {e}")
+        return False
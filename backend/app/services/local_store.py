@@ -0,0 +1,833 @@
+"""Embedded SQLite storage backend with the supabase-py query surface.
+
+Todo acceso a datos pasaba por Supabase (PostgREST sobre HTTPS), incluso en
+un deploy de un solo nodo, en backtests y replays: cada query pagaba
+latencia WAN y no había modo offline.
+
+``LocalClient`` implementa sobre SQLite el subconjunto del cliente de
+supabase-py que usa la app:
+
+- ``table(name)`` → ``select/insert/upsert/update/delete`` con filtros
+  ``eq/neq/gt/gte/lt/lte/like/ilike/is_/in_/not_/or_/match/filter`` y
+  modificadores ``order/limit/offset/range/single/maybe_single``;
+- ``select(..., count="exact")``;
+- ``rpc(fn, params)`` para las funciones con implementación local
+  (``mark_positions_to_market``, ``get_klines_coverage``); el resto levanta
+  ``LocalStoreError`` y los callers caen a su camino legacy, igual que con
+  una RPC que todavía no se migró.
+
+El schema sale de ``supabase/migrations``: ``load_schema`` lee los
+``CREATE TABLE``/``ALTER TABLE``/``CREATE INDEX`` en orden (columnas,
+defaults, PK, UNIQUE, índices btree y triggers de ``updated_at``). Los
+tipos se mapean a afinidades de SQLite; JSONB y arrays se guardan como
+JSON, timestamps como ISO-8601 UTC con microsegundos (comparables como
+texto). CHECK, FKs, RLS e índices GIN/vector se ignoran.
+
+Se selecciona con ``STORAGE_BACKEND=sqlite`` (ver ``db.get_supabase``).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .kline_collector import interval_ms
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIGRATIONS_DIR = Path(__file__).resolve().parents[3] / "supabase" / "migrations"
+
+_SQLITE_TYPES = {"text": "TEXT", "ts": "TEXT", "date": "TEXT", "int": "INTEGER", "real": "REAL", "bool": "INTEGER", "json": "TEXT"}
+_COLUMN_STOP = {"NOT", "NULL", "DEFAULT", "PRIMARY", "UNIQUE", "CHECK", "REFERENCES", "GENERATED", "CONSTRAINT", "COLLATE"}
+_TABLE_CONSTRAINTS = {"CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN", "EXCLUDE"}
+
+
+class LocalStoreError(Exception):
+    """Error de query contra el store local (equivalente a un APIError de PostgREST)."""
+
+    def __init__(self, message: str, code: str = "LOCAL"):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+# ── Schema ──
+
+
+@dataclass
+class Column:
+    name: str
+    kind: str                       # text | ts | date | int | real | bool | json
+    default: Optional[str] = None   # expresión SQL cruda del DEFAULT
+    array: bool = False             # TEXT[]/UUID[]: '{}' es lista vacía, no objeto
+
+
+@dataclass
+class TableSchema:
+    name: str
+    columns: Dict[str, Column] = field(default_factory=dict)
+    primary_key: Tuple[str, ...] = ()
+    unique: List[Tuple[str, ...]] = field(default_factory=list)
+    indexes: List[Tuple[str, ...]] = field(default_factory=list)
+    touch_updated_at: bool = False
+
+
+def _column_kind(type_sql: str) -> str:
+    t = type_sql.upper()
+    if "[]" in t or t.startswith("ARRAY") or "JSON" in t or t.startswith("VECTOR"):
+        return "json"
+    if t.startswith("BOOL"):
+        return "bool"
+    if "TIMESTAMP" in t:
+        return "ts"
+    if t.startswith("DATE"):
+        return "date"
+    if "INT" in t or "SERIAL" in t:
+        return "int"
+    if any(k in t for k in ("DECIMAL", "NUMERIC", "REAL", "DOUBLE", "FLOAT")):
+        return "real"
+    return "text"
+
+
+def _split_top_level(text: str, sep: str = ",") -> List[str]:
+    """Split on ``sep`` outside parentheses and quotes."""
+    parts, depth, quote, buf = [], 0, None, []
+    for ch in text:
+        if quote:
+            buf.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", '"'):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append("".join(buf).strip())
+            buf = []
+            continue
+        buf.append(ch)
+    if "".join(buf).strip():
+        parts.append("".join(buf).strip())
+    return parts
+
+
+def _ident(token: str) -> str:
+    return token.strip().strip('"').lower()
+
+
+def _column_list(text: str) -> Tuple[str, ...]:
+    return tuple(_ident(c.split()[0]) for c in text.split(",") if c.strip())
+
+
+def _parse_column(item: str) -> Tuple[Column, bool, bool]:
+    """``name TYPE ...`` → (Column, is_primary_key, is_unique)."""
+    tokens = item.split()
+    name = _ident(tokens[0])
+    type_tokens = []
+    for tok in tokens[1:]:
+        if tok.upper().rstrip(",") in _COLUMN_STOP:
+            break
+        type_tokens.append(tok)
+    type_sql = " ".join(type_tokens)
+    upper = item.upper()
+    default = None
+    m = re.search(r"\bDEFAULT\s+('(?:[^']|'')*'(?:::[\w\[\]]+)?|ARRAY\[\](?:::[\w\[\]]+)?|[\w.]+\(\)|-?[\w.]+)", item, re.I)
+    if m:
+        default = m.group(1)
+    column = Column(name, _column_kind(type_sql), default, array="[]" in type_sql or type_sql.upper().startswith("ARRAY"))
+    return column, "PRIMARY KEY" in upper, bool(re.search(r"\bUNIQUE\b", upper))
+
+
+def _add_column(table: TableSchema, item: str) -> None:
+    col, is_pk, is_unique = _parse_column(item)
+    table.columns[col.name] = col
+    if is_pk:
+        table.primary_key = (col.name,)
+    if is_unique:
+        table.unique.append((col.name,))
+
+
+def _table_constraint(table: TableSchema, item: str) -> None:
+    m = re.search(r"PRIMARY\s+KEY\s*\(([^)]*)\)", item, re.I)
+    if m:
+        table.primary_key = _column_list(m.group(1))
+        return
+    m = re.search(r"\bUNIQUE\s*\(([^)]*)\)", item, re.I)
+    if m:
+        table.unique.append(_column_list(m.group(1)))
+
+
+def _statements(sql: str) -> List[str]:
+    sql = re.sub(r"--[^\n]*", "", sql)
+    # Cuerpos de funciones: no aportan schema y tienen ';' internos
+    sql = re.sub(r"\bAS\s+(\$\w*\$).*?\1", "AS NULL", sql, flags=re.S | re.I)
+    return [s.strip() for s in sql.split(";") if s.strip()]
+
+
+def load_schema(migrations_dir: Optional[Path] = None) -> Dict[str, TableSchema]:
+    """Aplicar las migraciones (en orden de nombre) a un schema en memoria."""
+    directory = Path(migrations_dir or DEFAULT_MIGRATIONS_DIR)
+    files = sorted(directory.glob("*.sql"))
+    if not files:
+        raise LocalStoreError(f"No migrations found in {directory} (set SQLITE_MIGRATIONS_DIR)")
+    tables: Dict[str, TableSchema] = {}
+    for path in files:
+        for stmt in _statements(path.read_text(encoding="utf-8")):
+            _apply_statement(tables, stmt)
+    return tables
+
+
+def _apply_statement(tables: Dict[str, TableSchema], stmt: str) -> None:
+    m = re.search(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:public\.)?\"?(\w+)\"?\s*\((.*)\)\s*$", stmt, re.S | re.I)
+    if m:
+        name = m.group(1).lower()
+        if name in tables:  # IF NOT EXISTS
+            return
+        table = TableSchema(name)
+        for item in _split_top_level(m.group(2)):
+            if item.split()[0].upper() in _TABLE_CONSTRAINTS:
+                _table_constraint(table, item)
+            else:
+                _add_column(table, item)
+        tables[name] = table
+        return
+
+    m = re.search(r"ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?(?:public\.)?\"?(\w+)\"?\s+(.*)$", stmt, re.S | re.I)
+    if m:
+        table = tables.get(m.group(1).lower())
+        if table is None:
+            return
+        for action in _split_top_level(m.group(2)):
+            _alter(tables, table, action)
+        return
+
+    m = re.search(
+        r"CREATE\s+(UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?\w+\s+ON\s+(?:public\.)?(\w+)\s*(USING\s+\w+\s*)?\(([^()]*)\)",
+        stmt, re.I,
+    )
+    if m:
+        table = tables.get(m.group(2).lower())
+        if table is None or (m.group(3) and "btree" not in m.group(3).lower()):
+            return
+        cols = _column_list(m.group(4))
+        if not all(c in table.columns for c in cols):
+            return
+        (table.unique if m.group(1) else table.indexes).append(cols)
+        return
+
+    m = re.search(r"CREATE\s+TRIGGER\s+\w+.*?\bON\s+(?:public\.)?(\w+).*update_updated_at", stmt, re.S | re.I)
+    if m and m.group(1).lower() in tables:
+        tables[m.group(1).lower()].touch_updated_at = True
+        return
+
+    m = re.search(r"DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?(?:public\.)?(\w+)", stmt, re.I)
+    if m:
+        tables.pop(m.group(1).lower(), None)
+
+
+def _alter(tables: Dict[str, TableSchema], table: TableSchema, action: str) -> None:
+    m = re.match(r"ADD\s+COLUMN\s+(?:IF\s+NOT\s+EXISTS\s+)?(.*)$", action, re.S | re.I)
+    if m:
+        _add_column(table, m.group(1))
+        return
+    m = re.match(r"ADD\s+CONSTRAINT\s+\w+\s+(.*)$", action, re.S | re.I)
+    if m:
+        _table_constraint(table, m.group(1))
+        return
+    m = re.match(r"RENAME\s+TO\s+\"?(\w+)\"?", action, re.I)
+    if m:
+        tables.pop(table.name, None)
+        table.name = m.group(1).lower()
+        tables[table.name] = table
+        return
+    m = re.match(r"RENAME\s+COLUMN\s+\"?(\w+)\"?\s+TO\s+\"?(\w+)\"?", action, re.I)
+    if m and m.group(1).lower() in table.columns:
+        col = table.columns.pop(m.group(1).lower())
+        col.name = m.group(2).lower()
+        table.columns[col.name] = col
+        return
+    m = re.match(r"DROP\s+COLUMN\s+(?:IF\s+EXISTS\s+)?\"?(\w+)\"?", action, re.I)
+    if m:
+        table.columns.pop(m.group(1).lower(), None)
+
+
+# ── Codec ──
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _normalize_ts(value: Any) -> Any:
+    if isinstance(value, datetime):
+        ts = value
+    elif isinstance(value, str):
+        try:
+            ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    else:
+        return value
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _encode(col: Column, value: Any) -> Any:
+    if value is None:
+        return None
+    kind = col.kind
+    if kind == "json":
+        return json.dumps(value, default=str)
+    if kind == "bool":
+        if isinstance(value, str):
+            return 1 if value.lower() in ("true", "t", "1") else 0
+        return 1 if value else 0
+    if kind == "ts":
+        return _normalize_ts(value)
+    if kind == "date":
+        return value.isoformat() if isinstance(value, (date, datetime)) else str(value)[:10]
+    if kind == "real" and isinstance(value, str):
+        return float(value)
+    if kind == "int" and isinstance(value, (str, float)) and not isinstance(value, bool):
+        return int(float(value))
+    return value
+
+
+def _decode(col: Column, value: Any) -> Any:
+    if value is None:
+        return None
+    if col.kind == "json":
+        return json.loads(value)
+    if col.kind == "bool":
+        return bool(value)
+    if col.kind == "real":
+        return float(value)
+    return value
+
+
+def _default_value(col: Column) -> Any:
+    raw = col.default
+    if raw is None:
+        return None
+    low = raw.lower()
+    if low == "gen_random_uuid()" or low == "uuid_generate_v4()":
+        return str(uuid.uuid4())
+    if low in ("now()", "current_timestamp"):
+        return _now_iso()
+    if low == "current_date":
+        return datetime.now(timezone.utc).date().isoformat()
+    if low in ("true", "false"):
+        return low == "true"
+    if low == "null":
+        return None
+    if low.startswith("array["):
+        return []
+    if raw.startswith("'"):
+        text = raw[1:raw.rindex("'")].replace("''", "'")
+        if col.kind == "json":
+            return [] if col.array and text == "{}" else json.loads(text)
+        return text
+    try:
+        return int(raw) if re.fullmatch(r"-?\d+", raw) else float(raw)
+    except ValueError:
+        return None
+
+
+# ── Queries ──
+
+
+@dataclass
+class LocalResponse:
+    """Mismo contrato que ``postgrest.APIResponse``: ``data`` y ``count``."""
+
+    data: Any
+    count: Optional[int] = None
+
+
+_OPS = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1].replace('\\"', '"')
+    return value
+
+
+class LocalQuery:
+    """Request builder con la interfaz de ``postgrest.SyncRequestBuilder``."""
+
+    def __init__(self, client: "LocalClient", table: str):
+        self._client = client
+        self._schema = client.schema_for(table)
+        self._method = "select"
+        self._columns = "*"
+        self._count: Optional[str] = None
+        self._values: Any = None
+        self._on_conflict: Optional[str] = None
+        self._ignore_duplicates = False
+        self._where: List[Tuple[str, List[Any]]] = []
+        self._order: List[str] = []
+        self._limit: Optional[int] = None
+        self._offset: Optional[int] = None
+        self._single: Optional[str] = None
+        self._negate = False
+
+    # -- operaciones --
+
+    def select(self, *columns: str, count: Optional[str] = None) -> "LocalQuery":
+        self._method = "select"
+        self._columns = ",".join(columns) if columns else "*"
+        self._count = count
+        return self
+
+    def insert(self, json: Any, *, count: Optional[str] = None, returning: str = "representation",
+               upsert: bool = False, default_to_null: bool = True) -> "LocalQuery":
+        self._method = "upsert" if upsert else "insert"
+        self._values = json
+        return self
+
+    def upsert(self, json: Any, *, count: Optional[str] = None, returning: str = "representation",
+               ignore_duplicates: bool = False, on_conflict: str = "", default_to_null: bool = True) -> "LocalQuery":
+        self._method = "upsert"
+        self._values = json
+        self._on_conflict = on_conflict or None
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, json: Dict[str, Any], *, count: Optional[str] = None, returning: str = "representation") -> "LocalQuery":
+        self._method = "update"
+        self._values = json
+        return self
+
+    def delete(self, *, count: Optional[str] = None, returning: str = "representation") -> "LocalQuery":
+        self._method = "delete"
+        return self
+
+    # -- filtros --
+
+    @property
+    def not_(self) -> "LocalQuery":
+        self._negate = True
+        return self
+
+    def _column(self, name: str) -> Column:
+        col = self._schema.columns.get(name.strip().strip('"').lower())
+        if col is None:
+            raise LocalStoreError(f"column {self._schema.name}.{name} does not exist", "42703")
+        return col
+
+    def _condition(self, column: str, op: str, value: Any) -> Tuple[str, List[Any]]:
+        col = self._column(column)
+        ident = f'"{col.name}"'
+        if op in _OPS:
+            return f"{ident} {_OPS[op]} ?", [_encode(col, value)]
+        if op in ("like", "ilike"):
+            pattern = str(value).replace("*", "%")
+            return (f"{ident} LIKE ?" if op == "ilike" else f"{ident} GLOB ?"), [
+                pattern if op == "ilike" else pattern.replace("%", "*").replace("_", "?")
+            ]
+        if op == "is":
+            text = str(value).lower()
+            if value is None or text == "null":
+                return f"{ident} IS NULL", []
+            return f"{ident} IS ?", [1 if text == "true" else 0]
+        if op == "in":
+            values = list(value)
+            if not values:
+                return "0", []
+            return f"{ident} IN ({','.join('?' * len(values))})", [_encode(col, v) for v in values]
+        raise LocalStoreError(f"operator {op} not supported by the local store")
+
+    def _add(self, sql: str, params: List[Any]) -> "LocalQuery":
+        if self._negate:
+            sql = f"NOT ({sql})"
+            self._negate = False
+        self._where.append((sql, params))
+        return self
+
+    def eq(self, column: str, value: Any) -> "LocalQuery":
+        return self._add(*self._condition(column, "eq", value))
+
+    def neq(self, column: str, value: Any) -> "LocalQuery":
+        return self._add(*self._condition(column, "neq", value))
+
+    def gt(self, column: str, value: Any) -> "LocalQuery":
+        return self._add(*self._condition(column, "gt", value))
+
+    def gte(self, column: str, value: Any) -> "LocalQuery":
+        return self._add(*self._condition(column, "gte", value))
+
+    def lt(self, column: str, value: Any) -> "LocalQuery":
+        return self._add(*self._condition(column, "lt", value))
+
+    def lte(self, column: str, value: Any) -> "LocalQuery":
+        return self._add(*self._condition(column, "lte", value))
+
+    def like(self, column: str, pattern: str) -> "LocalQuery":
+        return self._add(*self._condition(column, "like", pattern))
+
+    def ilike(self, column: str, pattern: str) -> "LocalQuery":
+        return self._add(*self._condition(column, "ilike", pattern))
+
+    def is_(self, column: str, value: Any) -> "LocalQuery":
+        return self._add(*self._condition(column, "is", value))
+
+    def in_(self, column: str, values: Sequence[Any]) -> "LocalQuery":
+        return self._add(*self._condition(column, "in", values))
+
+    def match(self, query: Dict[str, Any]) -> "LocalQuery":
+        for column, value in query.items():
+            self.eq(column, value)
+        return self
+
+    def filter(self, column: str, operator: str, criteria: str) -> "LocalQuery":
+        negate = operator.startswith("not.")
+        op = operator[4:] if negate else operator
+        value: Any = criteria
+        if op == "in":
+            value = [_unquote(v) for v in _split_top_level(criteria.strip("()"))]
+        self._negate = self._negate or negate
+        return self._add(*self._condition(column, op, value))
+
+    def or_(self, filters: str, reference_table: Optional[str] = None) -> "LocalQuery":
+        return self._add(*self._logic(filters, "OR"))
+
+    def _logic(self, text: str, joiner: str) -> Tuple[str, List[Any]]:
+        """Parsear la gramática de ``or=(...)`` de PostgREST (con ``and(...)`` anidados)."""
+        parts, params = [], []
+        for item in _split_top_level(text):
+            m = re.match(r"(not\.)?(and|or)\((.*)\)$", item, re.S)
+            if m:
+                negate = bool(m.group(1))
+                sql, p = self._logic(m.group(3), m.group(2).upper())
+            else:
+                column, rest = item.split(".", 1)
+                negate = rest.startswith("not.")
+                rest = rest[4:] if negate else rest
+                op, raw = rest.split(".", 1)
+                value: Any = [_unquote(v) for v in _split_top_level(raw.strip("()"))] if op == "in" else _unquote(raw)
+                sql, p = self._condition(column, op, value)
+            if negate:
+                sql = f"NOT ({sql})"
+            parts.append(f"({sql})")
+            params.extend(p)
+        return f" {joiner} ".join(parts) or "1", params
+
+    # -- modificadores --
+
+    def order(self, column: str, *, desc: bool = False, nullsfirst: Optional[bool] = None,
+              foreign_table: Optional[str] = None) -> "LocalQuery":
+        col = self._column(column)
+        nulls_first = desc if nullsfirst is None else nullsfirst  # default de Postgres
+        self._order.append(f'"{col.name}" {"DESC" if desc else "ASC"} NULLS {"FIRST" if nulls_first else "LAST"}')
+        return self
+
+    def limit(self, size: int, *, foreign_table: Optional[str] = None) -> "LocalQuery":
+        self._limit = size
+        return self
+
+    def offset(self, size: int) -> "LocalQuery":
+        self._offset = size
+        return self
+
+    def range(self, start: int, end: int, foreign_table: Optional[str] = None) -> "LocalQuery":
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def single(self) -> "LocalQuery":
+        self._single = "single"
+        return self
+
+    def maybe_single(self) -> "LocalQuery":
+        self._single = "maybe"
+        return self
+
+    # -- ejecución --
+
+    def _where_sql(self) -> Tuple[str, List[Any]]:
+        if not self._where:
+            return "", []
+        params: List[Any] = []
+        for _, p in self._where:
+            params.extend(p)
+        return " WHERE " + " AND ".join(f"({sql})" for sql, _ in self._where), params
+
+    def _selected(self) -> List[Column]:
+        if self._columns.strip() in ("", "*"):
+            return list(self._schema.columns.values())
+        return [self._column(c) for c in self._columns.split(",") if c.strip()]
+
+    def _row(self, columns: Sequence[Column], values: Sequence[Any]) -> Dict[str, Any]:
+        return {col.name: _decode(col, v) for col, v in zip(columns, values)}
+
+    def execute(self) -> LocalResponse:
+        with self._client.lock:
+            if self._method == "select":
+                resp = self._execute_select()
+            elif self._method in ("insert", "upsert"):
+                resp = self._execute_write()
+            elif self._method == "update":
+                resp = self._execute_update()
+            else:
+                resp = self._execute_delete()
+        if self._single:
+            rows = resp.data or []
+            if len(rows) != 1 and not (self._single == "maybe" and not rows):
+                raise LocalStoreError(
+                    f"JSON object requested, multiple (or no) rows returned ({len(rows)})", "PGRST116"
+                )
+            resp.data = rows[0] if rows else None
+        return resp
+
+    def _execute_select(self) -> LocalResponse:
+        columns = self._selected()
+        where, params = self._where_sql()
+        table = f'"{self._schema.name}"'
+        sql = f"SELECT {', '.join(chr(34) + c.name + chr(34) for c in columns)} FROM {table}{where}"
+        if self._order:
+            sql += " ORDER BY " + ", ".join(self._order)
+        if self._limit is not None or self._offset:
+            sql += f" LIMIT {int(self._limit) if self._limit is not None else -1}"
+            if self._offset:
+                sql += f" OFFSET {int(self._offset)}"
+        conn = self._client.conn
+        rows = [self._row(columns, r) for r in conn.execute(sql, params).fetchall()]
+        count = None
+        if self._count:
+            count = conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+        return LocalResponse(rows, count)
+
+    def _prepare(self, row: Dict[str, Any], with_defaults: bool) -> Dict[str, Any]:
+        for key in row:
+            self._column(key)
+        prepared = {k.lower(): v for k, v in row.items()}
+        if with_defaults:
+            for col in self._schema.columns.values():
+                if col.name not in prepared and col.default is not None:
+                    prepared[col.name] = _default_value(col)
+        return prepared
+
+    def _execute_write(self) -> LocalResponse:
+        rows = self._values if isinstance(self._values, list) else [self._values]
+        conflict = (
+            _column_list(self._on_conflict) if self._on_conflict
+            else self._schema.primary_key
+        )
+        table = f'"{self._schema.name}"'
+        conn = self._client.conn
+        out: List[Dict[str, Any]] = []
+        all_columns = list(self._schema.columns.values())
+        conn.execute("BEGIN")
+        try:
+            for raw in rows:
+                given = {k.lower() for k in raw}
+                row = self._prepare(raw, with_defaults=True)
+                cols = list(row)
+                encoded = [_encode(self._schema.columns[c], row[c]) for c in cols]
+                sql = (
+                    f"INSERT INTO {table} ({', '.join(chr(34) + c + chr(34) for c in cols)}) "
+                    f"VALUES ({', '.join('?' * len(cols))})"
+                )
+                if self._method == "upsert":
+                    target = ", ".join(f'"{c}"' for c in conflict)
+                    updates = [c for c in cols if c in given and c not in conflict]
+                    if self._schema.touch_updated_at and "updated_at" in self._schema.columns and "updated_at" not in given:
+                        updates.append("updated_at")
+                    if self._ignore_duplicates or not updates:
+                        sql += f" ON CONFLICT ({target}) DO NOTHING"
+                    else:
+                        sql += f" ON CONFLICT ({target}) DO UPDATE SET " + ", ".join(
+                            f'"{c}" = excluded."{c}"' for c in updates
+                        )
+                sql += " RETURNING " + ", ".join(f'"{c.name}"' for c in all_columns)
+                result = conn.execute(sql, encoded).fetchone()
+                if result is not None:
+                    out.append(self._row(all_columns, result))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            raise LocalStoreError(f"{self._method} into {self._schema.name} failed: {e}", _sqlite_code(e)) from e
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return LocalResponse(out)
+
+    def _execute_update(self) -> LocalResponse:
+        values = self._prepare(self._values, with_defaults=False)
+        if self._schema.touch_updated_at and "updated_at" in self._schema.columns and "updated_at" not in values:
+            values["updated_at"] = _now_iso()
+        where, params = self._where_sql()
+        all_columns = list(self._schema.columns.values())
+        sql = (
+            f'UPDATE "{self._schema.name}" SET '
+            + ", ".join(f'"{c}" = ?' for c in values)
+            + where
+            + " RETURNING " + ", ".join(f'"{c.name}"' for c in all_columns)
+        )
+        encoded = [_encode(self._schema.columns[c], v) for c, v in values.items()]
+        try:
+            rows = self._client.conn.execute(sql, encoded + params).fetchall()
+        except sqlite3.Error as e:
+            raise LocalStoreError(f"update {self._schema.name} failed: {e}", _sqlite_code(e)) from e
+        return LocalResponse([self._row(all_columns, r) for r in rows])
+
+    def _execute_delete(self) -> LocalResponse:
+        where, params = self._where_sql()
+        all_columns = list(self._schema.columns.values())
+        sql = (
+            f'DELETE FROM "{self._schema.name}"{where} RETURNING '
+            + ", ".join(f'"{c.name}"' for c in all_columns)
+        )
+        rows = self._client.conn.execute(sql, params).fetchall()
+        return LocalResponse([self._row(all_columns, r) for r in rows])
+
+
+def _sqlite_code(e: sqlite3.Error) -> str:
+    return "23505" if isinstance(e, sqlite3.IntegrityError) else "LOCAL"
+
+
+class LocalRpc:
+    """``client.rpc(fn, params)``: ``execute()`` corre la implementación local."""
+
+    def __init__(self, client: "LocalClient", fn: str, params: Optional[Dict[str, Any]]):
+        self._client = client
+        self._fn = fn
+        self._params = params or {}
+
+    def execute(self) -> LocalResponse:
+        impl = _RPCS.get(self._fn)
+        if impl is None:
+            raise LocalStoreError(f"function {self._fn} is not available in the local store", "PGRST202")
+        with self._client.lock:
+            return LocalResponse(impl(self._client, self._params))
+
+
+class LocalClient:
+    """Drop-in de ``supabase.Client`` para ``table()/from_()/rpc()`` sobre SQLite."""
+
+    def __init__(self, path: str = ":memory:", migrations_dir: Optional[Path] = None):
+        self.path = path
+        self.schema = load_schema(migrations_dir)
+        for table in self.schema.values():
+            if not table.primary_key and "id" in table.columns:
+                table.primary_key = ("id",)
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        with self.lock:
+            for table in self.schema.values():
+                cols = ", ".join(f'"{c.name}" {_SQLITE_TYPES[c.kind]}' for c in table.columns.values())
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table.name}" ({cols})')
+                existing = {r[1] for r in self.conn.execute(f'PRAGMA table_info("{table.name}")')}
+                for col in table.columns.values():
+                    if col.name not in existing:
+                        self.conn.execute(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {_SQLITE_TYPES[col.kind]}')
+                keys = ([table.primary_key] if table.primary_key else []) + table.unique
+                for i, cols in enumerate(dict.fromkeys(keys)):
+                    self._index(table.name, f"uq_{table.name}_{i}", cols, unique=True)
+                for i, cols in enumerate(dict.fromkeys(table.indexes)):
+                    self._index(table.name, f"ix_{table.name}_{i}", cols, unique=False)
+
+    def _index(self, table: str, name: str, cols: Tuple[str, ...], unique: bool) -> None:
+        self.conn.execute(
+            f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" '
+            f'ON "{table}" ({", ".join(chr(34) + c + chr(34) for c in cols)})'
+        )
+
+    def schema_for(self, table: str) -> TableSchema:
+        schema = self.schema.get(table.lower())
+        if schema is None:
+            raise LocalStoreError(f"relation {table} does not exist", "42P01")
+        return schema
+
+    def table(self, table_name: str) -> LocalQuery:
+        return LocalQuery(self, table_name)
+
+    from_ = table
+
+    def rpc(self, fn: str, params: Optional[Dict[str, Any]] = None) -> LocalRpc:
+        return LocalRpc(self, fn, params)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# ── RPCs con implementación local ──
+
+
+def _rpc_mark_positions_to_market(client: LocalClient, params: Dict[str, Any]) -> int:
+    now = _now_iso()
+    updated = 0
+    for mark in params.get("p_marks") or []:
+        cur = client.conn.execute(
+            'UPDATE positions SET current_price = ?, unrealized_pnl = ?, unrealized_pnl_percent = ?, updated_at = ? '
+            "WHERE id = ? AND status IN ('open', 'partially_closed')",
+            (mark.get("current_price"), mark.get("unrealized_pnl"), mark.get("unrealized_pnl_percent"), now, mark["id"]),
+        )
+        updated += cur.rowcount
+    return updated
+
+
+def _rpc_get_klines_coverage(client: LocalClient, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    symbols = params.get("p_symbols")
+    # Igual que en Postgres: gaps sólo desde p_since (default 30 días); totales de toda la historia
+    since = params.get("p_since", (datetime.now(timezone.utc) - timedelta(days=30)).isoformat())
+    where, args = "", []
+    if symbols:
+        where = f" WHERE symbol IN ({','.join('?' * len(symbols))})"
+        args = list(symbols)
+    totals = client.conn.execute(
+        "SELECT symbol, interval, COUNT(*), MIN(open_time), MAX(open_time) "
+        f"FROM klines_ohlcv{where} GROUP BY symbol, interval",
+        args,
+    ).fetchall()
+    out: Dict[Tuple[str, str], Dict[str, Any]] = {
+        (symbol, interval): {
+            "symbol": symbol, "interval": interval, "candle_count": count,
+            "first_open_time": first, "last_open_time": last, "gap_count": 0, "missing_candles": 0,
+        }
+        for symbol, interval, count, first, last in totals
+    }
+    if since is not None:
+        where = f"{where} AND" if where else " WHERE"
+        where = f"{where} julianday(open_time) >= julianday(?)"
+        args = args + [since]
+    rows = client.conn.execute(
+        "SELECT symbol, interval, "
+        "(julianday(open_time) - julianday(LAG(open_time) OVER (PARTITION BY symbol, interval ORDER BY open_time))) * 86400.0 "
+        f"FROM klines_ohlcv{where}",
+        args,
+    ).fetchall()
+    for symbol, interval, step in rows:
+        expected = interval_ms(interval) / 1000
+        if step is not None and step > expected + 0.5:
+            item = out[(symbol, interval)]
+            item["gap_count"] += 1
+            item["missing_candles"] += int(round(step / expected)) - 1
+    return [out[k] for k in sorted(out)]
+
+
+_RPCS: Dict[str, Callable[[LocalClient, Dict[str, Any]], Any]] = {
+    "mark_positions_to_market": _rpc_mark_positions_to_market,
+    "get_klines_coverage": _rpc_get_klines_coverage,
+}
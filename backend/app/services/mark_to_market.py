@@ -0,0 +1,209 @@
+"""Mark-to-market of open positions from one price snapshot.
+
+``get_portfolio_state`` pedía un precio por posición y hacía un ``update``
+de ``current_price``/``unrealized_pnl`` por fila en cada llamada (main loop
+y cada GET /portfolio).
+
+Acá una corrida hace:
+
+- una query de posiciones ``open``/``partially_closed``;
+- un ``get_prices`` con todos los símbolos;
+- una RPC ``mark_positions_to_market`` (migración 20261019_mark_to_market)
+  que actualiza todas las filas. Si la RPC todavía no existe se cae al
+  camino legacy (un update por fila).
+
+El main loop llama ``run()``; con ``MARK_TO_MARKET_SECONDS`` la escritura se
+hace a lo sumo una vez por período. ``/portfolio`` lee el último snapshot
+(``fresh()``) o, si es viejo, calcula uno en memoria sin escribir.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from ..config import settings
+from ..db import get_supabase
+from . import binance_client
+
+logger = logging.getLogger(__name__)
+
+RPC_NAME = "mark_positions_to_market"
+MARKED_STATUSES = ["open", "partially_closed"]
+_CADENCE_SLACK = 1.0   # segundos: el main loop llega con algo de jitter
+
+
+@dataclass
+class MarkSnapshot:
+    """Unrealized PnL of every open position at one set of prices."""
+
+    as_of: str
+    positions: List[Dict[str, Any]] = field(default_factory=list)
+    prices: Dict[str, float] = field(default_factory=dict)
+    in_positions: float = 0.0
+    unrealized_pnl: float = 0.0
+    persisted: bool = False
+
+
+def _display(pos: Dict[str, Any], upnl: float, upnl_pct: float) -> str:
+    return (
+        f"{'LONG' if pos['side'] == 'long' else 'SHORT'} {pos['current_quantity']} {pos['symbol']} "
+        f"@ {pos['entry_price']} | uPnL: ${upnl:.4f} ({upnl_pct:.2f}%)"
+    )
+
+
+def compute_marks(positions: List[Dict[str, Any]], prices: Dict[str, float]) -> MarkSnapshot:
+    """Pure computation: mark every position at ``prices`` (symbol -> price).
+
+    Sin precio para un símbolo la posición queda con sus valores guardados y
+    cuenta a ``entry_notional`` (igual que antes cuando fallaba el ticker).
+    """
+    snap = MarkSnapshot(as_of=datetime.now(timezone.utc).isoformat(), prices=dict(prices))
+    for pos in positions:
+        price = prices.get(pos.get("symbol"))
+        if price is None:
+            snap.in_positions += float(pos.get("entry_notional", 0) or 0)
+            snap.positions.append(pos)
+            continue
+        entry_price = float(pos["entry_price"])
+        current_qty = float(pos["current_quantity"])
+        commission = float(pos.get("total_commission", 0) or 0)
+
+        upnl = (price - entry_price) * current_qty - commission
+        upnl_pct = (upnl / (entry_price * current_qty)) * 100 if entry_price * current_qty > 0 else 0
+
+        snap.in_positions += price * current_qty
+        snap.unrealized_pnl += upnl
+        snap.positions.append({
+            **pos,
+            "current_price": price,
+            "unrealized_pnl": upnl,
+            "unrealized_pnl_percent": upnl_pct,
+            "display": _display(pos, upnl, upnl_pct),
+        })
+    return snap
+
+
+class MarkToMarket:
+    """Periodic mark-to-market with one bulk write per run."""
+
+    def __init__(self):
+        self._latest: Optional[MarkSnapshot] = None
+        self._last_run = 0.0
+        self.stats: Dict[str, Any] = {
+            "runs": 0, "skipped": 0, "rows_written": 0, "legacy_writes": 0, "write_failures": 0,
+        }
+        self.last_error: Optional[str] = None
+
+    def latest(self) -> Optional[MarkSnapshot]:
+        """Último snapshot (None antes de la primera corrida); ``persisted`` dice si llegó a la DB."""
+        return self._latest
+
+    def fresh(self) -> Optional[MarkSnapshot]:
+        """Último snapshot si no pasó más de un período desde que se tomó."""
+        if self._latest is None:
+            return None
+        if time.monotonic() - self._last_run > max(settings.mark_to_market_seconds, 1) + _CADENCE_SLACK:
+            return None
+        return self._latest
+
+    def reset(self) -> None:
+        self._latest = None
+        self._last_run = 0.0
+
+    async def snapshot(self, supabase=None) -> MarkSnapshot:
+        """Marcar todas las posiciones a precios actuales, sin escribir."""
+        supabase = supabase or get_supabase()
+        positions = (
+            supabase.table("positions").select("*").in_("status", MARKED_STATUSES).execute()
+        ).data or []
+        prices: Dict[str, float] = {}
+        symbols = sorted({p["symbol"] for p in positions if p.get("symbol")})
+        if symbols:
+            try:
+                tickers = await binance_client.get_prices(symbols)
+                prices = {t["symbol"]: float(t["price"]) for t in tickers}
+            except Exception as e:
+                logger.warning(f"Mark-to-market price snapshot failed: {e}")
+        return compute_marks(positions, prices)
+
+    async def run(self, supabase=None, force: bool = False) -> MarkSnapshot:
+        """Marcar y persistir si venció ``MARK_TO_MARKET_SECONDS`` (o ``force``)."""
+        elapsed = time.monotonic() - self._last_run
+        if (
+            not force
+            and self._latest is not None
+            and elapsed < settings.mark_to_market_seconds - _CADENCE_SLACK
+        ):
+            self.stats["skipped"] += 1
+            return self._latest
+
+        supabase = supabase or get_supabase()
+        snap = await self.snapshot(supabase)
+        marks = [
+            {
+                "id": p["id"],
+                "current_price": p["current_price"],
+                "unrealized_pnl": p["unrealized_pnl"],
+                "unrealized_pnl_percent": p["unrealized_pnl_percent"],
+            }
+            for p in snap.positions
+            if p.get("symbol") in snap.prices
+        ]
+        written = self._persist(supabase, marks) if marks else 0
+        snap.persisted = written > 0 or not marks
+        if not snap.persisted:
+            self.stats["write_failures"] += 1
+            logger.error(f"Mark-to-market wrote none of {len(marks)} positions: {self.last_error}")
+        self._latest = snap
+        self._last_run = time.monotonic()
+        self.stats["runs"] += 1
+        self.stats["rows_written"] += written
+        return snap
+
+    def _persist(self, supabase, marks: List[Dict[str, Any]]) -> int:
+        """Escribir las marcas; devuelve cuántas filas se escribieron."""
+        try:
+            supabase.rpc(RPC_NAME, {"p_marks": marks}).execute()
+            self.last_error = None
+            return len(marks)
+        except Exception as e:
+            self.last_error = f"{RPC_NAME}: {e}"
+            logger.warning(f"{RPC_NAME} RPC unavailable, using per-row updates: {e}")
+        now_iso = datetime.now(timezone.utc).isoformat()
+        written = 0
+        for mark in marks:
+            try:
+                supabase.table("positions").update({
+                    "current_price": mark["current_price"],
+                    "unrealized_pnl": mark["unrealized_pnl"],
+                    "unrealized_pnl_percent": mark["unrealized_pnl_percent"],
+                    "updated_at": now_iso,
+                }).eq("id", mark["id"]).in_("status", MARKED_STATUSES).execute()
+                self.stats["legacy_writes"] += 1
+                written += 1
+            except Exception as e:
+                self.last_error = f"positions.update: {e}"
+                logger.warning(f"Could not mark position {mark['id']}: {e}")
+        return written
+
+    def status(self) -> Dict[str, Any]:
+        latest = self._latest
+        return {
+            "as_of": latest.as_of if latest else None,
+            "positions": len(latest.positions) if latest else 0,
+            "unrealized_pnl": latest.unrealized_pnl if latest else None,
+            "persisted": latest.persisted if latest else None,
+            "last_error": self.last_error,
+            **self.stats,
+        }
+
+
+_mtm = MarkToMarket()
+
+
+def get_mark_to_market() -> MarkToMarket:
+    return _mtm
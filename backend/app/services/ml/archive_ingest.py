@@ -0,0 +1,399 @@
+"""Streaming ingestion of data.binance.vision monthly kline archives.
+
+A diferencia del backfill original (ZIP completo en memoria → string → lista
+de dicts), este ingester:
+
+1. Obtiene cada ZIP mensual como archivo en disco (descarga en streaming o
+   directorio local), y verifica su SHA-256 contra el ``.CHECKSUM`` publicado.
+2. Lee la entrada CSV del ZIP en streaming y la parsea en chunks de tamaño
+   fijo directamente a batches columnares tipados (``KLINE_DTYPE``).
+3. Entrega cada batch a un ``sink`` (por defecto: upsert a ``klines_ohlcv``)
+   y lo descarta, de modo que la memoria pico queda acotada por
+   ``max_concurrency * chunk_rows`` sin importar el tamaño del mes.
+4. Procesa varios meses en paralelo (semáforo) y detecta gaps en streaming.
+
+Usage (offline, contra un directorio local con el layout de data.binance.vision):
+    source = LocalArchiveSource("/data/binance")
+    asyncio.run(ingest_symbol_archive("BTCUSDT", "1h", source=source))
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import itertools
+import logging
+import os
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import httpx
+import numpy as np
+
+from ..kline_arrays import parse_csv_lines
+from ..kline_collector import interval_ms
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BASE = "https://data.binance.vision/data/spot/monthly/klines"
+
+CHUNK_ROWS = 5_000          # filas por batch columnar (~440 KB por batch)
+MAX_CONCURRENCY = 3         # meses procesados en paralelo
+_HASH_BLOCK = 1 << 20       # 1 MiB por lectura al verificar checksum
+
+BatchSink = Callable[[str, str, np.ndarray], Awaitable[int]]
+
+
+class ChecksumMismatch(Exception):
+    """El SHA-256 del archivo no coincide con el ``.CHECKSUM`` publicado."""
+
+
+# ---------------------------------------------------------------------------
+# Fuentes de archivos
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ArchiveFile:
+    """ZIP mensual disponible en disco, con su checksum esperado (si existe)."""
+
+    path: Path
+    expected_sha256: Optional[str] = None
+    temporary: bool = False
+
+    def release(self) -> None:
+        if self.temporary:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+def archive_filename(symbol: str, interval: str, year: int, month: int) -> str:
+    return f"{symbol}-{interval}-{year}-{month:02d}.zip"
+
+
+def _parse_checksum(text: str) -> Optional[str]:
+    """Formato data.binance.vision: ``<sha256>  <filename>``."""
+    token = text.strip().split()[0] if text.strip() else ""
+    return token.lower() if len(token) == 64 else None
+
+
+class LocalArchiveSource:
+    """Directorio local con archivos ZIP (y ``.CHECKSUM`` opcionales).
+
+    Acepta el layout de data.binance.vision (``root/SYMBOL/INTERVAL/file.zip``)
+    o un directorio plano (``root/file.zip``).
+    """
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+
+    async def fetch(self, symbol: str, interval: str, filename: str) -> Optional[ArchiveFile]:
+        for candidate in (self.root / symbol / interval / filename, self.root / filename):
+            if candidate.exists():
+                checksum_path = candidate.with_name(candidate.name + ".CHECKSUM")
+                expected = None
+                if checksum_path.exists():
+                    expected = _parse_checksum(checksum_path.read_text(encoding="utf-8"))
+                return ArchiveFile(path=candidate, expected_sha256=expected)
+        return None
+
+
+class HttpArchiveSource:
+    """data.binance.vision: descarga en streaming a un archivo temporal."""
+
+    def __init__(self, base_url: str = ARCHIVE_BASE, client: Optional[httpx.AsyncClient] = None):
+        self.base_url = base_url.rstrip("/")
+        self._client = client
+
+    async def fetch(self, symbol: str, interval: str, filename: str) -> Optional[ArchiveFile]:
+        url = f"{self.base_url}/{symbol}/{interval}/{filename}"
+        client = self._client or httpx.AsyncClient(timeout=60, verify=False)
+        try:
+            expected = None
+            checksum_resp = await client.get(url + ".CHECKSUM")
+            if checksum_resp.status_code == 200:
+                expected = _parse_checksum(checksum_resp.text)
+
+            fd, tmp_name = tempfile.mkstemp(suffix=".zip")
+            try:
+                async with client.stream("GET", url) as resp:
+                    if resp.status_code == 404:
+                        os.close(fd)
+                        os.unlink(tmp_name)
+                        return None
+                    resp.raise_for_status()
+                    with os.fdopen(fd, "wb") as out:
+                        async for block in resp.aiter_bytes(_HASH_BLOCK):
+                            out.write(block)
+            except BaseException:
+                try:
+                    os.unlink(tmp_name)
+                except OSError:
+                    pass
+                raise
+            return ArchiveFile(path=Path(tmp_name), expected_sha256=expected, temporary=True)
+        finally:
+            if self._client is None:
+                await client.aclose()
+
+
+# ---------------------------------------------------------------------------
+# Lectura en streaming
+# ---------------------------------------------------------------------------
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def verify_checksum(archive: ArchiveFile) -> bool:
+    """Verifica el SHA-256. Retorna False si no hay checksum publicado.
+
+    Raises:
+        ChecksumMismatch: si el checksum existe y no coincide.
+    """
+    if not archive.expected_sha256:
+        return False
+    actual = sha256_file(archive.path)
+    if actual != archive.expected_sha256:
+        raise ChecksumMismatch(
+            f"{archive.path.name}: sha256 {actual} != expected {archive.expected_sha256}"
+        )
+    return True
+
+
+def iter_archive_batches(path: Path, chunk_rows: int = CHUNK_ROWS):
+    """Genera batches tipados leyendo las entradas CSV del ZIP en streaming."""
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            if not name.endswith(".csv"):
+                continue
+            with zf.open(name) as raw:
+                text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+                while True:
+                    lines = list(itertools.islice(text, chunk_rows))
+                    if not lines:
+                        break
+                    batch = parse_csv_lines(lines)
+                    if len(batch):
+                        yield batch
+
+
+class _StreamingGapCounter:
+    """Cuenta gaps entre batches consecutivos sin retener timestamps."""
+
+    def __init__(self, interval_ms: int):
+        self.interval_ms = interval_ms
+        self.last_open: Optional[int] = None
+        self.gaps = 0
+        self.missing_candles = 0
+
+    def update(self, open_times: np.ndarray) -> None:
+        if len(open_times) == 0:
+            return
+        if self.last_open is not None:
+            open_times = np.concatenate(([self.last_open], open_times))
+        diffs = np.diff(open_times)
+        bad = diffs != self.interval_ms
+        self.gaps += int(bad.sum())
+        self.missing_candles += int(np.clip(diffs[bad] // self.interval_ms - 1, 0, None).sum())
+        self.last_open = int(open_times[-1])
+
+
+# ---------------------------------------------------------------------------
+# Ingesta
+# ---------------------------------------------------------------------------
+
+@dataclass
+class MonthResult:
+    year: int
+    month: int
+    rows: int = 0
+    stored: int = 0
+    batches: int = 0
+    gaps: int = 0
+    checksum_verified: bool = False
+    missing: bool = False
+    error: Optional[str] = None
+    error_kind: Optional[str] = None   # "fetch" | "checksum" | "ingest"
+    first_open_time: Optional[int] = field(default=None, repr=False)
+    last_open_time: Optional[int] = field(default=None, repr=False)
+
+
+def month_range(months_back: int, now: Optional[datetime] = None) -> list[tuple[int, int]]:
+    """Últimos ``months_back`` meses completos (excluye el mes en curso), del más viejo al más nuevo."""
+    now = now or datetime.now(timezone.utc)
+    index = now.year * 12 + (now.month - 1)
+    months = []
+    for m in range(months_back, 0, -1):
+        year, month0 = divmod(index - m, 12)
+        months.append((year, month0 + 1))
+    return months
+
+
+async def _default_sink(symbol: str, interval: str, batch: np.ndarray) -> int:
+    from ..bulk_writer import bulk_write_klines
+    result = await asyncio.to_thread(bulk_write_klines, symbol, interval, batch)
+    return result["written"]
+
+
+async def _ingest_month(
+    source,
+    symbol: str,
+    interval: str,
+    year: int,
+    month: int,
+    sink: BatchSink,
+    chunk_rows: int,
+    require_checksum: bool,
+) -> MonthResult:
+    result = MonthResult(year=year, month=month)
+    filename = archive_filename(symbol, interval, year, month)
+    try:
+        archive = await source.fetch(symbol, interval, filename)
+    except Exception as e:
+        # Un mes que no se pudo descargar no corta el resto del backfill
+        result.error, result.error_kind = str(e), "fetch"
+        logger.error("ARCHIVE %s: descarga falló: %s", filename, e)
+        return result
+    if archive is None:
+        result.missing = True
+        logger.debug("Archivo no encontrado: %s", filename)
+        return result
+
+    try:
+        result.checksum_verified = await asyncio.to_thread(verify_checksum, archive)
+        if require_checksum and not result.checksum_verified:
+            raise ChecksumMismatch(f"{filename}: checksum no publicado")
+
+        gap_counter = _StreamingGapCounter(interval_ms(interval))
+        batches = iter_archive_batches(archive.path, chunk_rows)
+        while True:
+            # Parseo (CPU + I/O de disco) fuera del event loop
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            gap_counter.update(batch["open_time"])
+            if result.first_open_time is None:
+                result.first_open_time = int(batch["open_time"][0])
+            result.last_open_time = int(batch["open_time"][-1])
+            result.rows += len(batch)
+            result.batches += 1
+            result.stored += await sink(symbol, interval, batch)
+        result.gaps = gap_counter.gaps
+    except ChecksumMismatch as e:
+        result.error, result.error_kind = str(e), "checksum"
+        logger.error("ARCHIVE %s falló: %s", filename, e)
+    except Exception as e:
+        result.error, result.error_kind = str(e), "ingest"
+        logger.error("ARCHIVE %s falló: %s", filename, e)
+    finally:
+        archive.release()
+
+    logger.info(
+        "ARCHIVE %s %d-%02d: %d candles, %d batches, checksum=%s",
+        symbol, year, month, result.rows, result.batches,
+        "ok" if result.checksum_verified else "n/a",
+    )
+    return result
+
+
+async def ingest_symbol_archive(
+    symbol: str,
+    interval: str = "1h",
+    months_back: int = 12,
+    source=None,
+    sink: Optional[BatchSink] = None,
+    max_concurrency: int = MAX_CONCURRENCY,
+    chunk_rows: int = CHUNK_ROWS,
+    require_checksum: bool = False,
+    now: Optional[datetime] = None,
+) -> dict:
+    """Ingesta streaming de los ZIP mensuales de un símbolo.
+
+    Args:
+        symbol: Par de trading (ej: BTCUSDT).
+        interval: Intervalo de velas.
+        months_back: Cantidad de meses completos hacia atrás.
+        source: ``LocalArchiveSource`` / ``HttpArchiveSource`` (default: HTTP).
+        sink: Corrutina ``(symbol, interval, batch) -> filas guardadas``.
+            Default: upsert a ``klines_ohlcv``.
+        max_concurrency: Meses procesados en paralelo.
+        chunk_rows: Filas por batch columnar.
+        require_checksum: Si True, un mes sin ``.CHECKSUM`` se considera fallido.
+
+    Returns:
+        Dict con estadísticas agregadas y el detalle por mes.
+    """
+    source = source or HttpArchiveSource()
+    sink = sink or _default_sink
+    start = datetime.now(timezone.utc)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _bounded(year: int, month: int) -> MonthResult:
+        async with semaphore:
+            return await _ingest_month(
+                source, symbol, interval, year, month, sink, chunk_rows, require_checksum,
+            )
+
+    months = month_range(months_back, now)
+    logger.info(
+        "ARCHIVE streaming %s %s: %d meses (concurrency=%d, chunk=%d)",
+        symbol, interval, len(months), max_concurrency, chunk_rows,
+    )
+    results = await asyncio.gather(*(_bounded(y, m) for y, m in months))
+
+    # Gaps entre meses consecutivos (borde de archivo)
+    step_ms = interval_ms(interval)
+    boundary_gaps = 0
+    prev_last: Optional[int] = None
+    for r in results:
+        if r.first_open_time is None:
+            prev_last = None
+            continue
+        if prev_last is not None and r.first_open_time - prev_last != step_ms:
+            boundary_gaps += 1
+        prev_last = r.last_open_time
+
+    elapsed = (datetime.now(timezone.utc) - start).total_seconds()
+    total_rows = sum(r.rows for r in results)
+    summary = {
+        "symbol": symbol,
+        "interval": interval,
+        "months": months_back,
+        "total_fetched": total_rows,
+        "total_stored": sum(r.stored for r in results),
+        "gaps_found": sum(r.gaps for r in results) + boundary_gaps,
+        "failed_months": sum(1 for r in results if r.missing or r.error),
+        "checksum_failures": sum(1 for r in results if r.error_kind == "checksum"),
+        "elapsed_seconds": round(elapsed, 1),
+        "rows_per_sec": round(total_rows / elapsed, 1) if elapsed > 0 else None,
+        "months_detail": [
+            {
+                "month": f"{r.year}-{r.month:02d}",
+                "rows": r.rows,
+                "stored": r.stored,
+                "gaps": r.gaps,
+                "checksum_verified": r.checksum_verified,
+                "missing": r.missing,
+                "error": r.error,
+                "error_kind": r.error_kind,
+            }
+            for r in results
+        ],
+    }
+    logger.info(
+        "ARCHIVE streaming %s completo: %d fetched, %d stored, %d gaps, %d meses fallidos, %.1fs",
+        symbol, summary["total_fetched"], summary["total_stored"],
+        summary["gaps_found"], summary["failed_months"], elapsed,
+    )
+    return summary
@@ -11,16 +11,15 @@ Usage:
 """
 
 import asyncio
-import csv
-import io
 import logging
-import zipfile
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from typing import Any
 
 import httpx
+import numpy as np
 
-from ...db import get_supabase
+from ..bulk_writer import KLINE_CONFLICT, bulk_write_records
+from ..kline_arrays import iso_to_ms, parse_raw_klines, to_db_rows
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +37,6 @@ INTERVAL = "1h"
 INTERVAL_MS = 3_600_000  # 1 hora en milisegundos
 MAX_CANDLES_PER_REQUEST = 1000
 BACKFILL_DAYS = 365  # 1 año
-SUPABASE_BATCH_SIZE = 500
 
 # Rate limiting: Binance permite 1200 req/min para endpoints públicos,
 # pero usamos un intervalo conservador para evitar problemas.
@@ -63,36 +61,21 @@ _IGNORE = 11  # Ignore field
 # Parsing
 # ---------------------------------------------------------------------------
 
-def _parse_kline(symbol: str, interval: str, raw: list) -> dict[str, Any]:
-    """Convierte un array de kline de Binance en un dict compatible con klines_ohlcv.
+def _parse_klines(symbol: str, interval: str, raw: list[list]) -> list[dict[str, Any]]:
+    """Convierte arrays de kline de Binance en dicts compatibles con klines_ohlcv.
+
+    Parsea la página entera a un batch tipado (int64 epoch-ms, float64) y
+    sólo materializa dicts para el upsert.
 
     Args:
         symbol: Par de trading (ej: BTCUSDT).
         interval: Intervalo temporal (ej: 1h).
-        raw: Array de 12 elementos de la API de Binance.
+        raw: Arrays de 12 elementos de la API de Binance.
 
     Returns:
-        Dict con las columnas de la tabla klines_ohlcv.
+        Lista de dicts con las columnas de la tabla klines_ohlcv.
     """
-    return {
-        "symbol": symbol,
-        "interval": interval,
-        "open_time": datetime.fromtimestamp(
-            raw[_OT] / 1000, tz=timezone.utc
-        ).isoformat(),
-        "close_time": datetime.fromtimestamp(
-            raw[_CT] / 1000, tz=timezone.utc
-        ).isoformat(),
-        "open": float(raw[_O]),
-        "high": float(raw[_H]),
-        "low": float(raw[_L]),
-        "close": float(raw[_C]),
-        "volume": float(raw[_V]),
-        "quote_volume": float(raw[_QV]),
-        "trades_count": int(raw[_T]),
-        "taker_buy_base_volume": float(raw[_TBV]),
-        "taker_buy_quote_volume": float(raw[_TQV]),
-    }
+    return to_db_rows(symbol, interval, parse_raw_klines(raw))
 
 
 # ---------------------------------------------------------------------------
@@ -143,7 +126,10 @@ async def _fetch_klines_page(
 # ---------------------------------------------------------------------------
 
 def _batch_upsert(klines: list[dict[str, Any]]) -> int:
-    """Upsert en batches a la tabla klines_ohlcv de Supabase.
+    """Upsert a la tabla klines_ohlcv de Supabase.
+
+    Usa COPY + merge cuando hay DATABASE_URL (``bulk_writer``); si no,
+    upserts JSON por PostgREST en batches de 500.
 
     Args:
         klines: Lista de dicts parseados listos para insertar.
@@ -153,28 +139,8 @@ def _batch_upsert(klines: list[dict[str, Any]]) -> int:
     """
     if not klines:
         return 0
-
-    supabase = get_supabase()
-    total = 0
-
-    for i in range(0, len(klines), SUPABASE_BATCH_SIZE):
-        batch = klines[i : i + SUPABASE_BATCH_SIZE]
-        try:
-            resp = (
-                supabase.table("klines_ohlcv")
-                .upsert(batch, on_conflict="symbol,interval,open_time")
-                .execute()
-            )
-            total += len(resp.data) if resp.data else 0
-        except Exception as e:
-            logger.error(
-                "Error upserting batch %d-%d: %s",
-                i,
-                i + len(batch),
-                e,
-            )
-
-    return total
+    result = bulk_write_records("klines_ohlcv", klines, conflict=KLINE_CONFLICT)
+    return result["written"]
 
 
 # ---------------------------------------------------------------------------
@@ -187,8 +153,8 @@ def check_gaps(
 ) -> list[dict[str, Any]]:
     """Verifica que no haya gaps en los timestamps de las klines.
 
-    Compara cada open_time consecutivo; la diferencia esperada es
-    exactamente interval_ms.
+    Convierte los open_time a int64 epoch-ms de una vez y compara con
+    ``np.diff``; la diferencia esperada es exactamente interval_ms.
 
     Args:
         klines: Lista de klines ordenadas por open_time ascendente.
@@ -200,27 +166,18 @@ def check_gaps(
     if len(klines) < 2:
         return []
 
-    gaps = []
-    for i in range(1, len(klines)):
-        prev_ts = int(
-            datetime.fromisoformat(klines[i - 1]["open_time"]).timestamp() * 1000
-        )
-        curr_ts = int(
-            datetime.fromisoformat(klines[i]["open_time"]).timestamp() * 1000
-        )
-        diff = curr_ts - prev_ts
-
-        if diff != interval_ms:
-            missing_count = (diff // interval_ms) - 1
-            gaps.append({
-                "after": klines[i - 1]["open_time"],
-                "before": klines[i]["open_time"],
-                "expected_ms": interval_ms,
-                "actual_ms": diff,
-                "missing_candles": max(0, missing_count),
-            })
-
-    return gaps
+    times = iso_to_ms(k["open_time"] for k in klines)
+    diffs = np.diff(times)
+    return [
+        {
+            "after": klines[i]["open_time"],
+            "before": klines[i + 1]["open_time"],
+            "expected_ms": interval_ms,
+            "actual_ms": int(diffs[i]),
+            "missing_candles": max(0, int(diffs[i] // interval_ms) - 1),
+        }
+        for i in np.flatnonzero(diffs != interval_ms)
+    ]
 
 
 # ---------------------------------------------------------------------------
@@ -302,7 +259,7 @@ async def backfill_symbol(
                 )
                 break
 
-            parsed = [_parse_kline(symbol, interval, k) for k in raw_klines]
+            parsed = _parse_klines(symbol, interval, raw_klines)
             all_klines.extend(parsed)
 
             # Avanzar el cursor después de la última vela recibida
@@ -446,125 +403,33 @@ async def backfill_all_symbols(
 # Método alternativo: data.binance.vision (archivos ZIP mensuales)
 # ---------------------------------------------------------------------------
 
-ARCHIVE_BASE = "https://data.binance.vision/data/spot/monthly/klines"
-
-
-def _ts_to_iso(raw_ts: int) -> str:
-    """Convierte timestamp de Binance a ISO. Auto-detecta ms vs us."""
-    # Binance cambió de ms (13 dígitos) a us (16 dígitos) en archivos recientes
-    if raw_ts > 1e15:  # microsegundos
-        return datetime.fromtimestamp(raw_ts / 1_000_000, tz=timezone.utc).isoformat()
-    return datetime.fromtimestamp(raw_ts / 1000, tz=timezone.utc).isoformat()
-
-
-def _parse_archive_row(symbol: str, interval: str, row: list) -> dict[str, Any] | None:
-    """Parsea una fila CSV del archivo de data.binance.vision."""
-    if len(row) < 11:
-        return None
-    try:
-        return {
-            "symbol": symbol,
-            "interval": interval,
-            "open_time": _ts_to_iso(int(row[0])),
-            "close_time": _ts_to_iso(int(row[6])),
-            "open": float(row[1]),
-            "high": float(row[2]),
-            "low": float(row[3]),
-            "close": float(row[4]),
-            "volume": float(row[5]),
-            "quote_volume": float(row[7]),
-            "trades_count": int(row[8]),
-            "taker_buy_base_volume": float(row[9]),
-            "taker_buy_quote_volume": float(row[10]),
-        }
-    except (ValueError, IndexError):
-        return None
-
-
 async def backfill_symbol_archive(
     symbol: str,
     interval: str = INTERVAL,
     months_back: int = 12,
+    source=None,
+    max_concurrency: int | None = None,
 ) -> dict[str, Any]:
     """Backfill descargando archivos ZIP mensuales de data.binance.vision.
 
     Más confiable que la REST API (no tiene rate limits ni WAF blocks).
-    """
-    now = datetime.now(timezone.utc)
-    all_klines: list[dict[str, Any]] = []
-    start_time = datetime.now(timezone.utc)
-    failed_months = 0
+    Delegado a :mod:`archive_ingest`: streaming por chunks, checksums
+    verificados y varios meses en paralelo con memoria acotada.
 
-    logger.info("Backfill ARCHIVE %s %s: %d meses", symbol, interval, months_back)
-
-    async with httpx.AsyncClient(timeout=60, verify=False) as client:
-        for m in range(months_back, 0, -1):
-            # Calcular año-mes target
-            target = now - timedelta(days=m * 30)
-            year = target.year
-            month = target.month
-
-            url = (
-                f"{ARCHIVE_BASE}/{symbol}/{interval}/"
-                f"{symbol}-{interval}-{year}-{month:02d}.zip"
-            )
-
-            try:
-                resp = await client.get(url)
-                if resp.status_code == 404:
-                    logger.debug("Archivo no encontrado (404): %s", url)
-                    failed_months += 1
-                    continue
-                resp.raise_for_status()
-
-                # Descomprimir ZIP en memoria
-                zip_data = io.BytesIO(resp.content)
-                with zipfile.ZipFile(zip_data) as zf:
-                    for name in zf.namelist():
-                        if not name.endswith(".csv"):
-                            continue
-                        with zf.open(name) as f:
-                            reader = csv.reader(io.TextIOWrapper(f, "utf-8"))
-                            for row in reader:
-                                parsed = _parse_archive_row(symbol, interval, row)
-                                if parsed:
-                                    all_klines.append(parsed)
-
-                logger.info(
-                    "ARCHIVE %s %d-%02d: %d candles acumuladas",
-                    symbol, year, month, len(all_klines),
-                )
-                await asyncio.sleep(0.3)
-
-            except Exception as e:
-                logger.error("Error descargando %s: %s", url, e)
-                failed_months += 1
-                continue
-
-    # Upsert
-    total_stored = _batch_upsert(all_klines)
-
-    # Verificar gaps
-    all_klines.sort(key=lambda k: k["open_time"])
-    gaps = check_gaps(all_klines, INTERVAL_MS)
-
-    elapsed = (datetime.now(timezone.utc) - start_time).total_seconds()
-    result = {
-        "symbol": symbol,
-        "interval": interval,
-        "months": months_back,
-        "total_fetched": len(all_klines),
-        "total_stored": total_stored,
-        "gaps_found": len(gaps),
-        "failed_months": failed_months,
-        "elapsed_seconds": round(elapsed, 1),
-    }
-
-    logger.info(
-        "ARCHIVE backfill %s completo: %d fetched, %d stored, %d gaps, %.1fs",
-        symbol, len(all_klines), total_stored, len(gaps), elapsed,
+    Args:
+        source: Fuente de archivos (default: data.binance.vision). Usar
+            ``LocalArchiveSource(dir)`` para ingerir offline.
+        max_concurrency: Meses en paralelo (default: ``archive_ingest.MAX_CONCURRENCY``).
+    """
+    from .archive_ingest import MAX_CONCURRENCY, ingest_symbol_archive
+
+    return await ingest_symbol_archive(
+        symbol=symbol,
+        interval=interval,
+        months_back=months_back,
+        source=source,
+        max_concurrency=max_concurrency or MAX_CONCURRENCY,
     )
-    return result
 
 
 async def backfill_all_symbols_archive(
@@ -20,7 +20,9 @@ import numpy as np
 import pandas as pd
 import pandas_ta_classic as ta
 
-from ...db import get_supabase
+from ..bulk_reader import read_klines
+from ..bulk_writer import bulk_write_frame
+from ..kline_arrays import to_frame
 
 logger = logging.getLogger(__name__)
 
@@ -92,52 +94,19 @@ def _load_klines(
     interval: str = "1h",
     limit: int = 500,
 ) -> Optional[pd.DataFrame]:
-    """Lee klines de Supabase con paginación automática (PostgREST max 1000/req)."""
-    supabase = get_supabase()
-    PAGE_SIZE = 1000
-    all_rows: list[dict] = []
-    remaining = limit
-    offset = 0
-
-    while remaining > 0:
-        page_limit = min(PAGE_SIZE, remaining)
-        resp = (
-            supabase.table("klines_ohlcv")
-            .select(",".join(_REQUIRED_KLINE_COLS))
-            .eq("symbol", symbol)
-            .eq("interval", interval)
-            .order("open_time", desc=True)
-            .limit(page_limit)
-            .offset(offset)
-            .execute()
-        )
-        batch = resp.data or []
-        all_rows.extend(batch)
-        if len(batch) < page_limit:
-            break  # No hay más datos
-        remaining -= len(batch)
-        offset += len(batch)
-
-    if len(all_rows) < _MIN_ROWS:
+    """Lee las últimas ``limit`` klines de Supabase (paginación keyset, PostgREST max 1000/req)."""
+    batch = read_klines(
+        symbol, interval, columns=_REQUIRED_KLINE_COLS, limit=limit, descending=True,
+    )
+    if len(batch) < _MIN_ROWS:
         logger.warning(
             "Pocas klines para %s %s: %d (min %d)",
-            symbol, interval, len(all_rows), _MIN_ROWS,
+            symbol, interval, len(batch), _MIN_ROWS,
         )
         return None
 
-    rows = all_rows
-    rows.reverse()  # mas vieja primero
-
-    df = pd.DataFrame(rows)
-    df["open_time"] = pd.to_datetime(df["open_time"], utc=True)
-    numeric_cols = [
-        "open", "high", "low", "close", "volume",
-        "quote_volume", "trades_count", "taker_buy_base_volume",
-    ]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    df.set_index("open_time", inplace=True)
-    df.sort_index(inplace=True)
+    # read_klines ya devuelve la más vieja primero
+    df = to_frame(batch, _REQUIRED_KLINE_COLS)
     return df
 
 
@@ -390,28 +359,9 @@ def persist_features(features_df: pd.DataFrame) -> int:
         logger.warning("Ningun registro sin NaN para persistir.")
         return 0
 
-    # Convertir timestamps a ISO 8601 para Supabase
-    df_clean["open_time"] = df_clean["open_time"].dt.strftime("%Y-%m-%dT%H:%M:%S+00:00")
-
-    # Reemplazar NaN/inf por None para JSON
-    df_clean = df_clean.replace([np.inf, -np.inf], np.nan)
-    records = df_clean.where(df_clean.notna(), None).to_dict(orient="records")
-
-    supabase = get_supabase()
-    inserted = 0
-    batch_size = 500
-
-    for i in range(0, len(records), batch_size):
-        batch = records[i : i + batch_size]
-        try:
-            resp = (
-                supabase.table("ml_features_1h")
-                .upsert(batch, on_conflict="symbol,open_time")
-                .execute()
-            )
-            inserted += len(resp.data) if resp.data else 0
-        except Exception as e:
-            logger.error("Error persistiendo features batch %d: %s", i, e)
+    # COPY + merge si hay DATABASE_URL; si no, upserts PostgREST de 500 filas
+    result = bulk_write_frame("ml_features_1h", df_clean, conflict=("symbol", "open_time"))
+    inserted = result["written"]
 
     logger.info(
         "Persistidas %d filas de features para %s",
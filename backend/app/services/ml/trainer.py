@@ -788,44 +788,17 @@ def _persist_oos_predictions(
         return 0
 
     try:
-        supabase = get_supabase()
+        from ..bulk_writer import bulk_write_frame
+
+        df_clean = oos_df[["symbol", "open_time", "y_true", "y_pred", "fold"]].copy()
+        df_clean["open_time"] = pd.to_datetime(df_clean["open_time"], utc=True)
+        df_clean["fold"] = df_clean["fold"].astype(int)
+        if run_id:
+            df_clean["run_id"] = run_id
 
-        df_clean = oos_df.copy()
-        df_clean["open_time"] = pd.to_datetime(
-            df_clean["open_time"], utc=True
-        ).dt.strftime("%Y-%m-%dT%H:%M:%S+00:00")
-
-        # Reemplazar NaN/inf
-        df_clean = df_clean.replace([np.inf, -np.inf], np.nan)
-
-        records = []
-        for _, row in df_clean.iterrows():
-            record = {
-                "symbol": row["symbol"],
-                "open_time": row["open_time"],
-                "y_true": float(row["y_true"]) if pd.notna(row["y_true"]) else None,
-                "y_pred": float(row["y_pred"]) if pd.notna(row["y_pred"]) else None,
-                "fold": int(row["fold"]),
-            }
-            if run_id:
-                record["run_id"] = run_id
-            records.append(record)
-
-        inserted = 0
-        batch_size = 500
-        for i in range(0, len(records), batch_size):
-            batch = records[i : i + batch_size]
-            try:
-                resp = (
-                    supabase.table("ml_predictions")
-                    .insert(batch)
-                    .execute()
-                )
-                inserted += len(resp.data) if resp.data else 0
-            except Exception as e:
-                logger.warning(
-                    "Error insertando predicciones batch %d: %s", i, e,
-                )
+        # Insert-only: COPY si hay DATABASE_URL, si no batches PostgREST de 500
+        result = bulk_write_frame("ml_predictions", df_clean)
+        inserted = result["written"]
 
         logger.info("Persistidas %d predicciones OOS en Supabase", inserted)
         return inserted
@@ -0,0 +1,284 @@
+"""Portfolio-level VaR / CVaR over an incrementally updated covariance.
+
+Los límites de ``quant_risk`` son por trade y por símbolo: nada mira el
+riesgo conjunto del book. Recalcular una matriz de covarianza de N símbolos
+en cada proposal sería caro, así que ``PortfolioRisk`` la mantiene
+incrementalmente:
+
+- cada vela cerrada del intervalo primario (todas las de un mismo
+  ``open_time`` juntas) es un vector de retornos ``r``;
+- covarianza EWMA estilo RiskMetrics, media cero:
+  ``Σ = λ·Σ + (1-λ)·r·rᵀ`` — O(N²) por vela, con corrección de sesgo
+  mientras hay pocas observaciones;
+- un ring buffer con los últimos ``PORTFOLIO_VAR_WINDOW`` vectores para la
+  versión histórica.
+
+Por proposal sólo se arma el vector de exposiciones (USD por símbolo) del
+book antes y después del trade y se evalúan, vectorizado, VaR/CVaR
+paramétricos (normal) e históricos de ambos. El horizonte es una vela del
+intervalo primario. ``benchmarks/bench_portfolio_var.py`` mide el costo a
+50 símbolos.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from statistics import NormalDist
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_MIN_OBSERVATIONS = 30    # velas antes de usar el modelo para gatear
+
+
+@dataclass
+class VarReport:
+    """VaR / CVaR (USD, pérdida positiva) de un vector de exposiciones."""
+
+    parametric_var: float
+    parametric_cvar: float
+    historical_var: float
+    historical_cvar: float
+
+    @property
+    def worst(self) -> float:
+        return max(self.parametric_var, self.historical_var)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "parametric_var": round(self.parametric_var, 4),
+            "parametric_cvar": round(self.parametric_cvar, 4),
+            "historical_var": round(self.historical_var, 4),
+            "historical_cvar": round(self.historical_cvar, 4),
+        }
+
+
+@dataclass
+class VarImpact:
+    """Riesgo del book antes / después de un proposal."""
+
+    before: VarReport
+    after: VarReport
+    gross_exposure: float
+    uncovered_exposure: float   # posiciones en símbolos sin historia en el modelo
+
+    @property
+    def marginal(self) -> float:
+        return self.after.worst - self.before.worst
+
+
+class PortfolioRisk:
+    """EWMA covariance + historical return window across symbols."""
+
+    def __init__(self, lam: Optional[float] = None, window: Optional[int] = None,
+                 confidence: Optional[float] = None):
+        self.lam = settings.portfolio_var_lambda if lam is None else lam
+        self.window = settings.portfolio_var_window if window is None else window
+        self.confidence = settings.portfolio_var_confidence if confidence is None else confidence
+        z = NormalDist().inv_cdf(self.confidence)
+        self._z = z
+        self._cvar_factor = NormalDist().pdf(z) / (1 - self.confidence)
+
+        self.interval: Optional[str] = None
+        self._index: Dict[str, int] = {}
+        self._last_close = np.zeros(0)
+        self._cov = np.zeros((0, 0))       # EWMA sin corregir
+        self._cov_hat = np.zeros((0, 0))   # con corrección de sesgo (lo que se usa)
+        self._returns = np.zeros((self.window, 0))
+        self._updates = 0
+        self._last_bar: Optional[int] = None
+
+    # ── Estado ──
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._index)
+
+    @property
+    def observations(self) -> int:
+        return self._updates
+
+    @property
+    def ready(self) -> bool:
+        return self._updates >= _MIN_OBSERVATIONS
+
+    @property
+    def last_bar(self) -> Optional[int]:
+        return self._last_bar
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "symbols": len(self._index),
+            "observations": self._updates,
+            "ready": self.ready,
+            "last_bar": (
+                datetime.fromtimestamp(self._last_bar / 1000, tz=timezone.utc).isoformat()
+                if self._last_bar is not None else None
+            ),
+            "lambda": self.lam,
+            "window": self.window,
+            "confidence": self.confidence,
+        }
+
+    def reset(self) -> None:
+        self.__init__(self.lam, self.window, self.confidence)
+
+    # ── Actualización por vela cerrada ──
+
+    def _ensure(self, symbol: str) -> int:
+        idx = self._index.get(symbol)
+        if idx is None:
+            idx = self._index[symbol] = len(self._index)
+            self._last_close = np.append(self._last_close, 0.0)
+            self._cov = np.pad(self._cov, ((0, 1), (0, 1)))
+            self._cov_hat = np.pad(self._cov_hat, ((0, 1), (0, 1)))
+            self._returns = np.pad(self._returns, ((0, 0), (0, 1)))
+        return idx
+
+    def observe(self, open_time_ms: int, closes: Dict[str, float]) -> bool:
+        """Incorporar una vela cerrada (cierres por símbolo del mismo ``open_time``).
+
+        Velas repetidas o más viejas que la última se ignoran. La primera vela
+        de un símbolo sólo fija su cierre de referencia (retorno 0).
+        """
+        if self._last_bar is not None and open_time_ms <= self._last_bar:
+            return False
+        for symbol in closes:
+            self._ensure(symbol)
+        r = np.zeros(len(self._index))
+        for symbol, close in closes.items():
+            i = self._index[symbol]
+            prev = self._last_close[i]
+            if close and close > 0:
+                if prev > 0:
+                    r[i] = close / prev - 1.0
+                self._last_close[i] = close
+        first = self._last_bar is None
+        self._last_bar = open_time_ms
+        if first:
+            return True
+
+        self._cov *= self.lam
+        self._cov += (1.0 - self.lam) * np.outer(r, r)
+        self._returns[self._updates % self.window] = r
+        self._updates += 1
+        self._cov_hat = self._cov / (1.0 - self.lam ** self._updates)
+        return True
+
+    # ── Medición ──
+
+    def exposures(self, positions: Iterable[Dict[str, Any]],
+                  prices: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, float]:
+        """Vector USD por símbolo del book + exposición fuera del modelo."""
+        prices = prices or {}
+        x = np.zeros(len(self._index))
+        uncovered = 0.0
+        for p in positions:
+            symbol = p.get("symbol")
+            qty = float(p.get("current_quantity") or p.get("entry_quantity") or 0)
+            price = prices.get(symbol) or p.get("current_price") or p.get("entry_price")
+            value = qty * float(price) if price else float(p.get("entry_notional") or 0)
+            idx = self._index.get(symbol)
+            if idx is None:
+                uncovered += value
+            else:
+                x[idx] += value
+        return x, uncovered
+
+    def measure(self, exposures: np.ndarray) -> List[VarReport]:
+        """VaR/CVaR de una o varias filas de exposiciones (vectorizado)."""
+        X = np.atleast_2d(exposures)
+        variance = ((X @ self._cov_hat) * X).sum(axis=1)
+        sigma = np.sqrt(np.maximum(variance, 0.0))
+
+        filled = min(self._updates, self.window)
+        if filled:
+            pnl = self._returns[:filled] @ X.T          # (T, filas)
+            k = min(int((1 - self.confidence) * filled), filled - 1)
+            worst = np.partition(pnl, k, axis=0)[: k + 1]
+            hist_var = -worst[k]
+            hist_cvar = -worst.mean(axis=0)
+        else:
+            hist_var = hist_cvar = np.zeros(len(X))
+
+        return [
+            VarReport(
+                parametric_var=float(self._z * s),
+                parametric_cvar=float(self._cvar_factor * s),
+                historical_var=max(0.0, float(hv)),
+                historical_cvar=max(0.0, float(hc)),
+            )
+            for s, hv, hc in zip(sigma, hist_var, hist_cvar)
+        ]
+
+    def impact(self, positions: Iterable[Dict[str, Any]], symbol: str, trade_type: str,
+               notional: float, prices: Optional[Dict[str, float]] = None) -> VarImpact:
+        """Riesgo del book con y sin el proposal (buy suma, sell resta exposición)."""
+        x, uncovered = self.exposures(positions, prices)
+        after = x.copy()
+        idx = self._index.get(symbol)
+        if idx is not None:
+            if trade_type.lower() == "buy":
+                after[idx] += notional
+            else:
+                after[idx] = max(0.0, after[idx] - notional)
+        elif trade_type.lower() == "buy":
+            uncovered += notional
+        before_report, after_report = self.measure(np.vstack([x, after]))
+        return VarImpact(before_report, after_report, float(np.abs(after).sum()) + uncovered, uncovered)
+
+
+_model = PortfolioRisk()
+
+
+def get_portfolio_risk() -> PortfolioRisk:
+    return _model
+
+
+def sync_closed_candles(symbols: List[str], interval: str, now_ms: Optional[int] = None) -> int:
+    """Alimentar el modelo con las velas cerradas nuevas de ``symbols``.
+
+    Lee los frames de velas ya cacheados por el análisis del tick (mismo
+    ``limit`` que los indicadores) y sólo procesa velas posteriores a la
+    última incorporada: en régimen es una vela por intervalo. El primer
+    llamado recorre la historia disponible como warm-up.
+    """
+    import pandas as pd
+    from .kline_collector import interval_ms
+    from .technical_analysis import _load_klines_df
+
+    model = get_portfolio_risk()
+    if model.interval != interval:
+        if model.interval is not None:
+            logger.info(f"Portfolio risk interval changed {model.interval} -> {interval}, resetting")
+        model.reset()
+        model.interval = interval
+
+    frames = {}
+    for symbol in symbols:
+        df = _load_klines_df(symbol, interval, limit=250)
+        if df is not None and len(df):
+            frames[symbol] = df["close"]
+    if not frames:
+        return 0
+
+    closes = pd.DataFrame(frames).sort_index()
+    bar_ms = closes.index.asi8 // 1_000_000
+    now_ms = now_ms if now_ms is not None else int(datetime.now(timezone.utc).timestamp() * 1000)
+    mask = bar_ms + interval_ms(interval) <= now_ms
+    if model.last_bar is not None:
+        mask &= bar_ms > model.last_bar
+
+    columns = list(closes.columns)
+    added = 0
+    for t, row in zip(bar_ms[mask], closes.to_numpy()[mask]):
+        bar = {sym: float(v) for sym, v in zip(columns, row) if not np.isnan(v)}
+        added += model.observe(int(t), bar)
+    return added
@@ -0,0 +1,251 @@
+"""In-process book of open positions.
+
+El fast loop (cada 2s), el generador de señales, el guard de ejecución y el
+risk manager consultaban ``positions WHERE status='open'`` una y otra vez,
+aunque las únicas escrituras sobre esas filas salen de este mismo proceso
+(executor al abrir/cerrar, trailing stop, reparación de SL/TP).
+
+El book se carga una vez al arrancar, lo actualiza cada escritor justo
+después de su UPDATE/INSERT en la DB y se verifica periódicamente contra la
+DB (que sigue siendo la fuente de verdad: si hay drift, gana la DB). Los
+consumidores leen copias, así que mutar lo devuelto no altera el book.
+
+Los cambios se publican como ``PositionEvent`` a suscriptores async
+(``asyncio.Queue`` por suscriptor).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ..db import get_supabase
+
+logger = logging.getLogger(__name__)
+
+# Campos cuyo cambio se considera drift al verificar contra la DB
+_TRACKED_FIELDS = ("current_quantity", "stop_loss_price", "take_profit_price", "entry_price")
+
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+@dataclass
+class PositionEvent:
+    """Cambio en el book: ``opened``, ``updated``, ``closed`` o ``resync``."""
+
+    kind: str
+    position: Dict[str, Any]
+    changes: Dict[str, Any] = field(default_factory=dict)
+    ts: float = field(default_factory=time.time)
+
+
+class PositionBook:
+    """Authoritative in-memory view of ``positions`` with ``status='open'``."""
+
+    def __init__(self):
+        self._positions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._subscribers: List[asyncio.Queue] = []
+        self.stats: Dict[str, Any] = {
+            "loads": 0, "verifications": 0, "drift": 0, "events": 0,
+            "dropped_events": 0, "last_verified": None,
+        }
+
+    # ── Carga / verificación ───────────────────────────────────────────
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @staticmethod
+    def _query_open(supabase) -> List[Dict[str, Any]]:
+        resp = supabase.table("positions").select("*").eq("status", "open").execute()
+        return resp.data or []
+
+    def load(self, supabase=None) -> int:
+        """Replace the book with the open positions currently in the DB."""
+        rows = self._query_open(supabase or get_supabase())
+        with self._lock:
+            self._positions = {r["id"]: dict(r) for r in rows if r.get("id")}
+            self._loaded = True
+        self.stats["loads"] += 1
+        logger.info(f"Position book loaded: {len(rows)} open positions")
+        return len(rows)
+
+    def ensure_loaded(self, supabase=None) -> None:
+        if not self._loaded:
+            self.load(supabase)
+
+    def invalidate(self) -> None:
+        """Forzar recarga en el próximo acceso (ej. insert sin fila devuelta)."""
+        with self._lock:
+            self._loaded = False
+
+    def verify(self, supabase=None) -> Dict[str, Any]:
+        """Compare the book with the DB; the DB wins and every difference is published.
+
+        Returns:
+            ``{"missing": [...], "stale": [...], "changed": [...]}`` con ids:
+            ``missing`` = abiertas en DB pero no en el book, ``stale`` = en el
+            book pero ya no abiertas en DB, ``changed`` = campos distintos.
+        """
+        rows = {r["id"]: dict(r) for r in self._query_open(supabase or get_supabase()) if r.get("id")}
+        with self._lock:
+            current = self._positions
+            missing = [pid for pid in rows if pid not in current]
+            stale = [pid for pid in current if pid not in rows]
+            changed = []
+            for pid, row in rows.items():
+                if pid in current:
+                    diff = self._diff(current[pid], row)
+                    if diff:
+                        changed.append((pid, diff))
+            self._positions = rows
+            self._loaded = True
+            stale_rows = {pid: current[pid] for pid in stale}
+
+        drift = len(missing) + len(stale) + len(changed)
+        self.stats["verifications"] += 1
+        self.stats["drift"] += drift
+        self.stats["last_verified"] = time.time()
+        if drift:
+            logger.warning(
+                f"Position book drift: {len(missing)} missing, {len(stale)} stale, "
+                f"{len(changed)} changed — resynced from DB"
+            )
+            for pid in missing:
+                self._publish(PositionEvent("resync", dict(rows[pid])))
+            for pid in stale:
+                self._publish(PositionEvent("resync", {**stale_rows[pid], "status": "unknown"}))
+            for pid, diff in changed:
+                self._publish(PositionEvent("resync", dict(rows[pid]), diff))
+        return {"missing": missing, "stale": stale, "changed": [pid for pid, _ in changed]}
+
+    @staticmethod
+    def _diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+        diff = {}
+        for key in _TRACKED_FIELDS:
+            a, b = old.get(key), new.get(key)
+            try:
+                same = (a is None and b is None) or (
+                    a is not None and b is not None and abs(float(a) - float(b)) < 1e-9
+                )
+            except (TypeError, ValueError):
+                same = a == b
+            if not same:
+                diff[key] = b
+        return diff
+
+    # ── Lecturas ───────────────────────────────────────────────────────
+
+    def open_positions(self, symbol: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Copies of the open positions (optionally one symbol), oldest first."""
+        with self._lock:
+            rows = [
+                dict(p) for p in self._positions.values()
+                if symbol is None or p.get("symbol") == symbol
+            ]
+        rows.sort(key=lambda p: p.get("opened_at") or "")
+        return rows
+
+    def get(self, position_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            pos = self._positions.get(position_id)
+            return dict(pos) if pos is not None else None
+
+    def count(self, symbol: Optional[str] = None) -> int:
+        with self._lock:
+            if symbol is None:
+                return len(self._positions)
+            return sum(1 for p in self._positions.values() if p.get("symbol") == symbol)
+
+    def symbols(self) -> set[str]:
+        with self._lock:
+            return {p["symbol"] for p in self._positions.values() if p.get("symbol")}
+
+    # ── Escrituras (llamar después de persistir en la DB) ──────────────
+
+    def add(self, row: Dict[str, Any]) -> None:
+        """Registrar una posición recién insertada (fila devuelta por la DB)."""
+        if not row.get("id"):
+            self.invalidate()
+            return
+        with self._lock:
+            self._positions[row["id"]] = dict(row)
+        self._publish(PositionEvent("opened", dict(row)))
+
+    def update(self, position_id: str, **changes: Any) -> None:
+        """Aplicar campos ya escritos en la DB a una posición abierta."""
+        with self._lock:
+            pos = self._positions.get(position_id)
+            if pos is None:
+                return
+            pos.update(changes)
+            snapshot = dict(pos)
+        self._publish(PositionEvent("updated", snapshot, dict(changes)))
+
+    def remove(self, position_id: str, **changes: Any) -> None:
+        """Sacar del book una posición que dejó de estar ``open``."""
+        with self._lock:
+            pos = self._positions.pop(position_id, None)
+        if pos is None:
+            return
+        pos.update(changes)
+        self._publish(PositionEvent("closed", pos, dict(changes)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._positions = {}
+            self._loaded = False
+
+    # ── Suscripciones ──────────────────────────────────────────────────
+
+    def subscribe(self, maxsize: int = SUBSCRIBER_QUEUE_SIZE) -> asyncio.Queue:
+        """Queue que recibe cada ``PositionEvent``. Si se llena se descarta el más viejo."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    async def events(self) -> AsyncIterator[PositionEvent]:
+        """``async for event in book.events(): ...`` — se desuscribe al salir."""
+        queue = self.subscribe()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(queue)
+
+    def _publish(self, event: PositionEvent) -> None:
+        self.stats["events"] += 1
+        for queue in list(self._subscribers):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                    self.stats["dropped_events"] += 1
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._loaded,
+            "open_positions": self.count(),
+            "subscribers": len(self._subscribers),
+            **self.stats,
+        }
+
+
+_book = PositionBook()
+
+
+def get_position_book() -> PositionBook:
+    return _book
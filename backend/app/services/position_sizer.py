@@ -16,6 +16,8 @@ from ..config import settings
 from ..models.quant_models import PositionSizing
 from .technical_analysis import compute_indicators
 from . import binance_client
+from .account_state import get_account_state
+from .trade_stats import TradeAggregate, get_trade_stats
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +36,10 @@ def _compute_kelly(win_rate: float, avg_win: float, avg_loss: float) -> Optional
 
 
 def _get_trade_stats() -> Optional[dict]:
-    """Get historical trade stats from closed positions."""
+    """Get historical trade stats from the closed-trade aggregates (or closed positions)."""
+    store = get_trade_stats()
+    if store.loaded:
+        return store.window().kelly_stats()
     supabase = get_supabase()
     try:
         resp = (
@@ -45,38 +50,21 @@ def _get_trade_stats() -> Optional[dict]:
         )
         if not resp.data or len(resp.data) < 10:
             return None
-
-        wins = []
-        losses = []
-        for pos in resp.data:
-            pnl = float(pos.get("realized_pnl", 0) or 0)
-            notional = float(pos.get("entry_notional", 0) or 1)
-            pct = pnl / notional if notional > 0 else 0
-            if pnl > 0:
-                wins.append(pct)
-            elif pnl < 0:
-                losses.append(abs(pct))
-
-        total = len(wins) + len(losses)
-        if total < 10 or not losses:
-            return None
-
-        return {
-            "win_rate": len(wins) / total,
-            "avg_win": sum(wins) / len(wins) if wins else 0,
-            "avg_loss": sum(losses) / len(losses) if losses else 0,
-            "total_trades": total,
-        }
+        return TradeAggregate.from_trades(resp.data).kelly_stats()
     except Exception as e:
         logger.warning(f"Could not get trade stats: {e}")
         return None
 
 
-async def compute_position_size(symbol: str, interval: str = "1h") -> Optional[PositionSizing]:
-    """Compute recommended position size for a symbol."""
+async def compute_position_size(symbol: str, interval: str = "1h", ctx=None) -> Optional[PositionSizing]:
+    """Compute recommended position size for a symbol.
+
+    Con ``ctx`` (TickContext) precio y stats de trades se comparten entre
+    todos los proposals del tick; la cuenta sale de ``account_state``.
+    """
     try:
-        # Get account balance
-        account = await binance_client.get_account()
+        # Get account balance (snapshot del tick + fills propios)
+        account = await get_account_state().get_account()
         balances = {b["asset"]: float(b["free"]) for b in account.get("balances", [])}
         usdt_free = balances.get("USDT", 0.0)
     except Exception as e:
@@ -95,15 +83,18 @@ async def compute_position_size(symbol: str, interval: str = "1h") -> Optional[P
         # Actually: notional = risk_amount / (atr_stop / price) * price = risk_amount * price / atr_stop
         # Simplified: atr_size = risk_amount / (atr_stop / current_price) but as USD value
         try:
-            price_data = await binance_client.get_price(symbol)
-            current_price = float(price_data["price"])
+            if ctx is not None:
+                current_price = await ctx.price(symbol)
+            else:
+                price_data = await binance_client.get_price(symbol)
+                current_price = float(price_data["price"])
             quantity = risk_amount / atr_stop
             atr_size = quantity * current_price
         except Exception:
             atr_size = risk_amount  # Fallback
 
     # Kelly-based sizing
-    trade_stats = _get_trade_stats()
+    trade_stats = ctx.memo("trade_stats", _get_trade_stats) if ctx is not None else _get_trade_stats()
     kelly_fraction = None
     kelly_size = None
     method = "fixed_pct"
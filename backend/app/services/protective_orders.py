@@ -0,0 +1,390 @@
+"""Exchange-native SL/TP protection (OCO) for open positions.
+
+Sin esto, SL/TP viven sólo en ``positions`` y los hace cumplir el fast loop
+consultando precios cada 2s: latencia de protección = hasta 2s + varias
+llamadas HTTP, y cero protección si el proceso se cuelga.
+
+Con ``EXCHANGE_PROTECTION_ENABLED`` cada posición abierta tiene en Binance un
+OCO SELL (LIMIT_MAKER en el TP + STOP_LOSS_LIMIT en el SL); si el OCO es
+rechazado se coloca al menos un STOP_LOSS_LIMIT. El trailing stop pasa a ser
+cancel/replace y los fills se detectan por el estado de las órdenes. El
+polling de precios del fast loop queda como backstop (gaps que saltan el
+límite del stop, órdenes canceladas por fuera). Con el user data stream
+conectado los fills llegan por ``user_stream`` y el polling de estado de
+órdenes baja a ``USER_STREAM_SAFETY_POLL_SECONDS``.
+
+Los ids de las órdenes se guardan en la fila de ``positions``
+(``protection_*``), así que sobreviven a un reinicio. ``protection_quantity``
+es la cantidad neta en balance: si la comisión de la compra se cobró en el
+asset base, un OCO por ``current_quantity`` (bruta) lo rechaza el exchange.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from ..config import settings
+from ..utils.binance_utils import round_price, round_quantity
+from . import binance_client
+from .account_state import get_account_state
+from .position_book import get_position_book
+from .user_stream import get_user_stream
+
+logger = logging.getLogger(__name__)
+
+PROTECTION_FIELDS = (
+    "protection_mode",
+    "protection_order_list_id",
+    "protection_sl_order_id",
+    "protection_tp_order_id",
+)
+
+# Último intento de sync/colocación por posición (throttle del fast loop)
+_last_poll: Dict[str, float] = {}
+_last_attempt: Dict[str, float] = {}
+# Posiciones cerrándose por un fill de protección (stream y fast loop pueden detectar el mismo)
+_closing: set = set()
+
+
+def protection_enabled() -> bool:
+    return bool(settings.exchange_protection_enabled)
+
+
+def has_protection(position: Dict[str, Any]) -> bool:
+    return bool(position.get("protection_sl_order_id"))
+
+
+def no_protection() -> Dict[str, Any]:
+    return {field: None for field in PROTECTION_FIELDS}
+
+
+def protection_quantity(position: Dict[str, Any]) -> float:
+    """Cantidad a proteger: la neta guardada al abrir, acotada por lo que queda abierto."""
+    current = float(position["current_quantity"])
+    held = position.get("protection_quantity")
+    return min(float(held), current) if held else current
+
+
+def _current_protection(position: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: position.get(field) for field in PROTECTION_FIELDS}
+
+
+def _check_response(resp: Any) -> Dict[str, Any]:
+    if isinstance(resp, dict) and resp.get("code", 0) < 0:
+        raise RuntimeError(f"Binance error {resp['code']}: {resp.get('msg', 'Unknown')}")
+    return resp
+
+
+async def place_protection(symbol: str, quantity: float, sl: float, tp: float) -> Dict[str, Any]:
+    """Place the protective exit for a long position.
+
+    Returns:
+        Campos ``protection_*`` a persistir en la posición (todos None si no
+        se pudo colocar nada; el backstop del fast loop sigue activo).
+    """
+    params = _protection_params(symbol, quantity, sl, tp)
+    if params is None:
+        return no_protection()
+    qty, stop, limit, take = params
+
+    try:
+        resp = _check_response(
+            await binance_client.place_oco_order(symbol, "SELL", qty, take, stop, limit)
+        )
+        legs = {r.get("type"): r.get("orderId") for r in resp.get("orderReports", [])}
+        result = {
+            "protection_mode": "oco",
+            "protection_order_list_id": resp.get("orderListId"),
+            "protection_sl_order_id": legs.get("STOP_LOSS_LIMIT"),
+            "protection_tp_order_id": legs.get("LIMIT_MAKER"),
+        }
+        logger.info(f"OCO protection [{symbol}]: qty={qty} SL={stop}/{limit} TP={take} list={result['protection_order_list_id']}")
+        return result
+    except Exception as e:
+        logger.warning(f"OCO placement failed [{symbol}]: {e}")
+
+    if settings.protection_fallback_stop_limit:
+        try:
+            resp = _check_response(
+                await binance_client.place_stop_limit_order(symbol, "SELL", qty, stop, limit)
+            )
+            logger.info(f"Stop-limit protection [{symbol}]: qty={qty} SL={stop}/{limit} (TP por polling)")
+            return {**no_protection(), "protection_mode": "stop_limit", "protection_sl_order_id": resp.get("orderId")}
+        except Exception as e:
+            logger.error(f"Stop-limit placement failed [{symbol}]: {e}")
+
+    return no_protection()
+
+
+def _protection_params(symbol: str, quantity: float, sl: float, tp: float) -> Optional[tuple]:
+    """``(qty, stop, limit, take)`` redondeados a los filtros, o None si no se puede colocar."""
+    qty = round_quantity(symbol, quantity)
+    stop = round_price(symbol, sl)
+    limit = round_price(symbol, sl * (1 - settings.protection_stop_limit_offset_pct))
+    take = round_price(symbol, tp)
+    if qty <= 0 or not 0 < limit <= stop < take:
+        logger.warning(f"Protection skipped [{symbol}]: qty={qty} SL={stop} limit={limit} TP={take}")
+        return None
+    return qty, stop, limit, take
+
+
+async def _fill_details(symbol: str, order_id: int) -> tuple[float, str]:
+    """Comisión de los fills de una orden (monto crudo, asset)."""
+    try:
+        trades = await binance_client.get_my_trades(symbol, order_id)
+        if trades:
+            return sum(float(t.get("commission", 0)) for t in trades), trades[0].get("commissionAsset", "USDT")
+    except Exception as e:
+        logger.warning(f"Could not fetch fills for order {order_id} [{symbol}]: {e}")
+    return 0.0, "USDT"
+
+
+async def find_fill(position: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the filled protective leg, if any: ``{order_id, trigger, price, quantity, ...}``."""
+    symbol = position["symbol"]
+    legs = (
+        (position.get("protection_sl_order_id"), "stop_loss"),
+        (position.get("protection_tp_order_id"), "take_profit"),
+    )
+    for order_id, trigger in legs:
+        if not order_id:
+            continue
+        order = await binance_client.get_order(symbol, int(order_id))
+        executed = float(order.get("executedQty", 0) or 0)
+        if order.get("status") != "FILLED" or executed <= 0:
+            continue
+        quote = float(order.get("cummulativeQuoteQty", 0) or 0)
+        price = quote / executed if quote > 0 else float(order.get("price", 0) or 0)
+        commission, asset = await _fill_details(symbol, int(order_id))
+        return {
+            "order_id": int(order_id),
+            "trigger": trigger,
+            "price": price,
+            "quantity": executed,
+            "commission": commission,
+            "commission_asset": asset,
+        }
+    return None
+
+
+async def poll_protection(position: Dict[str, Any]) -> tuple[str, Optional[Dict[str, Any]]]:
+    """Estado de la protección: ``("active"|"filled"|"gone", fill)``.
+
+    Con OCO se consulta primero el order list (una llamada); las patas sólo
+    cuando la lista terminó.
+    """
+    list_id = position.get("protection_order_list_id")
+    if list_id:
+        order_list = await binance_client.get_order_list(int(list_id))
+        if order_list.get("listOrderStatus") not in ("ALL_DONE", "REJECT"):
+            return "active", None
+        fill = await find_fill(position)
+        return ("filled", fill) if fill else ("gone", None)
+
+    order = await binance_client.get_order(position["symbol"], int(position["protection_sl_order_id"]))
+    status = order.get("status")
+    if status in ("NEW", "PARTIALLY_FILLED"):
+        return "active", None
+    fill = await find_fill(position) if status == "FILLED" else None
+    return ("filled", fill) if fill else ("gone", None)
+
+
+async def cancel_protection(position: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Cancel the position's protective orders.
+
+    Si el cancel falla porque una pata ya se ejecutó, devuelve ese fill (el
+    caller debe registrarlo en vez de vender de nuevo). Cualquier otro error
+    se propaga: vender con el balance bloqueado por el OCO fallaría igual.
+    """
+    if not has_protection(position):
+        return None
+    symbol = position["symbol"]
+    try:
+        if position.get("protection_order_list_id"):
+            _check_response(await binance_client.cancel_order_list(symbol, int(position["protection_order_list_id"])))
+        else:
+            _check_response(await binance_client.cancel_order(symbol, int(position["protection_sl_order_id"])))
+        return None
+    except Exception as e:
+        fill = await find_fill(position)
+        if fill:
+            logger.info(f"Protection for {symbol} [{position['id'][:8]}] already filled ({fill['trigger']})")
+            return fill
+        raise RuntimeError(f"Could not cancel protection for {symbol}: {e}") from e
+
+
+async def protect_position(supabase, position: Dict[str, Any], quantity: float) -> Dict[str, Any]:
+    """Colocar y persistir la protección de una posición ya insertada.
+
+    Si no se puede guardar en la fila, la protección se cancela: una orden
+    viva en el exchange que ninguna posición apunta no la vigila nadie (el
+    fast loop reintenta después). ``quantity`` (neta de comisión en el asset
+    base) queda como ``protection_quantity`` para los re-placements.
+    """
+    fields = await place_protection(
+        position["symbol"], quantity, float(position["stop_loss_price"]), float(position["take_profit_price"]),
+    )
+    if not has_protection(fields):
+        try:
+            _persist(supabase, position["id"], {"protection_quantity": quantity})
+        except Exception as e:
+            logger.warning(f"Could not persist protection quantity for {position['symbol']} [{position['id'][:8]}]: {e}")
+        return fields
+    try:
+        _persist(supabase, position["id"], {**fields, "protection_quantity": quantity})
+    except Exception as e:
+        logger.error(f"Could not persist protection for {position['symbol']} [{position['id'][:8]}]: {e} — cancelling it")
+        try:
+            await cancel_protection({**position, **fields})
+        except Exception as cancel_error:
+            logger.error(f"Cancel of unpersisted protection for {position['symbol']} failed: {cancel_error}")
+        return no_protection()
+    return fields
+
+
+def _persist(supabase, position_id: str, fields: Dict[str, Any]) -> None:
+    supabase.table("positions").update(fields).eq("id", position_id).execute()
+    get_position_book().update(position_id, **fields)
+
+
+async def record_fill(supabase, position: Dict[str, Any], fill: Dict[str, Any]) -> bool:
+    """Cerrar la posición en la DB con el fill que ejecutó el exchange.
+
+    Idempotente: el user stream y el fast loop pueden ver la misma pata
+    FILLED. Devuelve False si otro camino ya la está cerrando o la cerró.
+    """
+    from .executor import _close_position, _convert_commission_to_usdt, _log_risk_event
+
+    symbol, pos_id = position["symbol"], position["id"]
+    if pos_id in _closing or not _still_open(pos_id):
+        logger.debug(f"{fill['trigger']} fill for {symbol} [{pos_id[:8]}] already being recorded")
+        return False
+    _closing.add(pos_id)
+    try:
+        if not get_user_stream().is_live():  # con stream, el balance llega por outboundAccountPosition
+            get_account_state().invalidate(f"exchange-side {fill['trigger']} fill on {symbol}")
+        commission = await _convert_commission_to_usdt(fill["commission"], fill["commission_asset"])
+        if not _still_open(pos_id):   # cerrada por otro camino mientras se convertía la comisión
+            return False
+        await _close_position(
+            supabase, symbol, fill["price"], fill["quantity"], fill["order_id"], None,
+            commission, fill["commission_asset"], position_id=pos_id,
+        )
+        trigger = fill["trigger"]
+        await _log_risk_event(
+            supabase, trigger, "warning" if trigger == "stop_loss" else "info",
+            f"{trigger.upper()} filled on exchange: SELL {fill['quantity']} {symbol} @ ${fill['price']:,.2f}",
+            {"order_id": fill["order_id"], "source": "exchange_protection", "trigger_price": fill["price"]},
+            position_id=pos_id,
+        )
+    finally:
+        _closing.discard(pos_id)
+    _last_poll.pop(pos_id, None)
+    _last_attempt.pop(pos_id, None)
+    return True
+
+
+def _still_open(position_id: str) -> bool:
+    """Sin book cargado no se sabe: ``_close_position`` filtra por status=open en la DB."""
+    book = get_position_book()
+    return not book.loaded or book.get(position_id) is not None
+
+
+async def sync_position(supabase, position: Dict[str, Any]) -> bool:
+    """Fast-loop step: detect fills and (re)place missing protection.
+
+    Throttled por posición (``protection_poll_seconds`` /
+    ``protection_retry_seconds``; ``user_stream_safety_poll_seconds`` si el
+    user data stream está conectado). Devuelve True si la posición se cerró.
+    """
+    pos_id = position["id"]
+    now = time.monotonic()
+
+    if has_protection(position):
+        poll_every = (
+            settings.user_stream_safety_poll_seconds if get_user_stream().is_live()
+            else settings.protection_poll_seconds
+        )
+        if now - _last_poll.get(pos_id, 0.0) < poll_every:
+            return False
+        _last_poll[pos_id] = now
+        state, fill = await poll_protection(position)
+        if state == "active":
+            return False
+        if state == "filled":
+            await record_fill(supabase, position, fill)
+            return True
+        logger.warning(f"Protection for {position['symbol']} [{pos_id[:8]}] is gone without a fill — re-placing")
+        _persist(supabase, pos_id, no_protection())
+        position = {**position, **no_protection()}
+
+    if not protection_enabled():
+        return False
+    if now - _last_attempt.get(pos_id, 0.0) < settings.protection_retry_seconds:
+        return False
+    _last_attempt[pos_id] = now
+    sl, tp = position.get("stop_loss_price"), position.get("take_profit_price")
+    if not sl or not tp:
+        return False
+    fields = await place_protection(position["symbol"], protection_quantity(position), float(sl), float(tp))
+    if has_protection(fields):
+        _persist(supabase, pos_id, fields)
+    return False
+
+
+async def replace_stop(supabase, position: Dict[str, Any], new_sl: float, tp: float) -> Optional[Dict[str, Any]]:
+    """Trailing stop como cancel/replace del OCO.
+
+    El OCO bloquea el balance, así que hay que cancelar antes de colocar el
+    nuevo: sólo se cancela si el reemplazo pasa los filtros, y si igual lo
+    rechaza el exchange se re-coloca el stop anterior (el fast loop hace
+    cumplir el nuevo por polling).
+
+    Returns:
+        Campos ``protection_*`` nuevos (los actuales si no se reemplazó), o
+        None si al cancelar resultó que la protección ya se había ejecutado
+        (la posición queda cerrada).
+    """
+    symbol = position["symbol"]
+    qty = protection_quantity(position)
+    if _protection_params(symbol, qty, new_sl, tp) is None:
+        logger.warning(f"Trailing replace [{symbol}]: SL={new_sl} not placeable — keeping the current protection")
+        return _current_protection(position)
+    fill = await cancel_protection(position)
+    if fill:
+        await record_fill(supabase, position, fill)
+        return None
+    fields = await place_protection(symbol, qty, new_sl, tp)
+    old_sl = position.get("stop_loss_price")
+    if not has_protection(fields) and old_sl:
+        logger.error(f"Replacement protection rejected [{symbol}] — restoring the previous stop ${float(old_sl):,.2f}")
+        fields = await place_protection(symbol, qty, float(old_sl), tp)
+    return fields
+
+
+async def release_symbol(supabase, symbol: str) -> bool:
+    """Cancel protection on a symbol's open positions before a market exit.
+
+    Devuelve True si alguna protección ya había cerrado la posición en el
+    exchange (y quedó registrada): en ese caso no hay que vender de nuevo.
+    """
+    book = get_position_book()
+    if not book.loaded:
+        if not protection_enabled():
+            return False
+        book.ensure_loaded(supabase)
+    filled = False
+    for position in book.open_positions(symbol):
+        if not has_protection(position):
+            continue
+        fill = await cancel_protection(position)
+        if fill:
+            await record_fill(supabase, position, fill)
+            filled = True
+        else:
+            _persist(supabase, position["id"], no_protection())
+            # Que el fast loop no la vuelva a colocar mientras la venta está en curso
+            _last_attempt[position["id"]] = time.monotonic()
+    return filled
@@ -2,16 +2,24 @@
 
 Central coordinator called every 60s from trading_loop.py.
 Schedules data collection and analysis at different frequencies using tick counters.
+
+Con ``CANDLE_SCHEDULER_ENABLED`` el main loop no llama a ``run_quant_tick``:
+``candle_jobs()`` registra cada computación en el ``CandleScheduler`` y corre
+cuando cierra la vela de la que depende (ver ``candle_scheduler.py``).
 """
 
 import asyncio
 import logging
+import time
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
+from typing import Any, Collection, Dict, List, Optional, Tuple
 
 from ..config import settings
 from ..models.quant_models import QuantSnapshot, QuantEngineStatus
 from .quant_cache import get_analysis_cache
+from .portfolio_risk import get_portfolio_risk
+from .latency_trace import span
+from .candle_scheduler import CandleJob, get_candle_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +27,22 @@ logger = logging.getLogger(__name__)
 _tick_count: int = 0
 _last_tick_at: Optional[datetime] = None
 _errors: List[str] = []
+_resampler = None
+_resample_stats: Dict[str, Any] = {
+    "rest_calls": 0, "rows_written": 0, "checks": 0, "mismatches": 0,
+}
+
+# Última entropía / régimen calculados por símbolo: (reading, monotonic).
+# La validación de riesgo y el generador de señales los reutilizan en vez
+# de recalcular mientras sean más nuevos que RISK_SNAPSHOT_MAX_AGE_SECONDS.
+_readings: Dict[Tuple[str, str, str], Tuple[Any, float]] = {}
+
+# Páginas máximas por símbolo al sembrar/recuperar velas base (1000 velas c/u)
+_MAX_BASE_PAGES = 3
+
+# Módulos de análisis por símbolo y cada cuántos ticks corren en modo timer
+ANALYSIS_MODULES = ("indicators", "entropy", "regime", "sr")
+_TICK_EVERY = {"indicators": 1, "entropy": 5, "regime": 15, "sr": 60}
 
 
 async def run_quant_tick() -> None:
@@ -38,7 +62,8 @@ async def run_quant_tick() -> None:
 
     try:
         # ── Kline Collection (parallel across symbols) ──
-        await _collect_klines(symbols, tick)
+        with span("klines"):
+            await _collect_klines(symbols, tick)
 
         # ── Analysis (parallel across symbols) ──
         tasks = []
@@ -51,10 +76,19 @@ async def run_quant_tick() -> None:
                 logger.error(msg)
                 _errors.append(msg)
 
+        # ── Portfolio covariance: velas cerradas nuevas (frames ya cacheados) ──
+        if settings.portfolio_var_enabled:
+            _update_portfolio_risk(symbols, interval)
+
         # ── Performance metrics (every 360 ticks = 6 hours) ──
         if tick % 360 == 0:
             await _update_performance_metrics()
 
+        # ── Kline gap scan + repair ──
+        repair_every = settings.kline_gap_repair_ticks
+        if repair_every > 0 and tick % repair_every == 0:
+            await _repair_kline_gaps(symbols)
+
     except Exception as e:
         msg = f"Quant tick {tick} error: {e}"
         logger.error(msg)
@@ -63,7 +97,9 @@ async def run_quant_tick() -> None:
 
 async def _collect_klines(symbols: List[str], tick: int) -> None:
     """Collect klines at varying intervals."""
-    from . import kline_collector
+    if settings.kline_resample_enabled:
+        await _collect_resampled(symbols, tick)
+        return
 
     # Schedule: 1m=every tick, 5m=5, 15m=15, 1h=60, 4h=240, 1d=1440
     intervals_schedule = {
@@ -85,6 +121,137 @@ async def _collect_klines(symbols: List[str], tick: int) -> None:
                 logger.warning(f"Kline collect {symbols[i]} {iv} failed: {result}")
 
 
+def _get_resampler():
+    global _resampler
+    if _resampler is None:
+        from .kline_collector import INTERVALS
+        from .kline_resampler import KlineResampler
+        _resampler = KlineResampler(settings.kline_base_interval, INTERVALS)
+    return _resampler
+
+
+async def _fetch_base(resampler, symbol: str, now_ms: int):
+    """Fetch base candles from the last buffered one (or the current day on first run).
+
+    Pedir desde la última vela conocida refresca la vela en curso y cubre
+    cualquier hueco si un tick se saltó.
+    """
+    from . import binance_client
+    from .kline_arrays import merge_batches, parse_raw_klines
+    from .kline_collector import interval_ms
+
+    base_iv = resampler.base_interval
+    start = resampler.last_open_time(symbol)
+    if start is None:
+        start = resampler.seed_start_ms(now_ms)
+
+    batches = []
+    for _ in range(_MAX_BASE_PAGES):
+        raw = await binance_client.get_klines(
+            symbol=symbol, interval=base_iv, limit=1000, start_time=start,
+        )
+        _resample_stats["rest_calls"] += 1
+        batch = parse_raw_klines(raw)
+        batches.append(batch)
+        if len(raw) < 1000:
+            break
+        start = int(batch["open_time"][-1]) + interval_ms(base_iv)
+    return merge_batches(*batches)
+
+
+async def _collect_resampled(symbols: List[str], tick: Optional[int]) -> None:
+    """Fetch only base candles and derive every higher interval locally.
+
+    Una llamada REST por símbolo (vs. hasta 6) y un único upsert con las velas
+    base + los buckets derivados que cambiaron. ``tick=None`` (scheduler de
+    velas): la verificación contra el exchange es un job aparte.
+    """
+    from . import kline_collector
+    from .kline_arrays import to_db_rows
+
+    resampler = _get_resampler()
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    results = await asyncio.gather(
+        *[_fetch_base(resampler, sym, now_ms) for sym in symbols],
+        return_exceptions=True,
+    )
+
+    rows: List[Dict[str, Any]] = []
+    for sym, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Kline base collect {sym} failed: {result}")
+            continue
+        derived = resampler.update(sym, result)
+        rows.extend(to_db_rows(sym, resampler.base_interval, result))
+        for iv, batch in derived.items():
+            rows.extend(to_db_rows(sym, iv, batch))
+
+    if rows:
+        await kline_collector.store_klines(rows)
+        _resample_stats["rows_written"] += len(rows)
+
+    check_every = settings.kline_resample_check_ticks
+    if tick is not None and check_every > 0 and tick % check_every == 0:
+        await _verify_resampled(symbols)
+
+
+async def _verify_resampled(symbols: List[str], limit: int = 5) -> int:
+    """Compare derived candles against exchange candles; exchange wins on mismatch."""
+    from . import binance_client, kline_collector
+    from .kline_arrays import parse_raw_klines, to_db_rows
+    from .kline_resampler import compare_candles
+
+    resampler = _get_resampler()
+    total = 0
+    for sym in symbols:
+        for iv in resampler.target_intervals:
+            derived = resampler.derive(sym, iv)
+            if len(derived) == 0:
+                continue
+            try:
+                raw = await binance_client.get_klines(symbol=sym, interval=iv, limit=limit)
+                _resample_stats["rest_calls"] += 1
+            except Exception as e:
+                logger.warning(f"Resample check {sym} {iv} failed: {e}")
+                continue
+            exchange = parse_raw_klines(raw)
+            mismatches = compare_candles(derived, exchange)
+            _resample_stats["checks"] += 1
+            if mismatches:
+                total += len(mismatches)
+                logger.warning(
+                    f"Resampled {sym} {iv} differs from exchange in {len(mismatches)} "
+                    f"fields (first: {mismatches[0]}); storing exchange candles"
+                )
+                await kline_collector.store_klines(to_db_rows(sym, iv, exchange[:-1]))
+    _resample_stats["mismatches"] += total
+    return total
+
+
+async def _repair_kline_gaps(symbols: List[str]) -> None:
+    """Scan recent klines for gaps and re-fetch the missing ranges."""
+    try:
+        from .kline_gaps import scan_and_repair
+        result = await scan_and_repair(symbols, days=settings.kline_backfill_days)
+        if result["gaps_found"]:
+            logger.info(
+                f"Kline gaps: {result['gaps_found']} gaps / {result['missing_candles']} "
+                f"missing candles across {result['pairs_scanned']} pairs"
+            )
+    except Exception as e:
+        logger.warning(f"Kline gap repair failed: {e}")
+
+
+def _update_portfolio_risk(symbols: List[str], interval: str) -> None:
+    try:
+        from .portfolio_risk import sync_closed_candles
+        added = sync_closed_candles(symbols, interval)
+        if added:
+            logger.debug(f"Portfolio risk: {added} closed candles incorporated")
+    except Exception as e:
+        logger.warning(f"Portfolio risk update failed: {e}")
+
+
 async def _safe_collect(symbol: str, interval: str) -> None:
     """Safely collect latest klines for a symbol/interval."""
     try:
@@ -94,136 +261,172 @@ async def _safe_collect(symbol: str, interval: str) -> None:
         logger.warning(f"Kline collect failed {symbol} {interval}: {e}")
 
 
-async def _process_symbol(symbol: str, interval: str, tick: int) -> None:
-    """Run analysis modules for a single symbol."""
-    try:
-        # Indicators: every tick (for primary interval)
-        from .technical_analysis import compute_indicators, store_indicators
-        indicators = compute_indicators(symbol, interval)
-        if indicators:
-            store_indicators(indicators)
-
-        # Entropy: every 5 ticks
-        if tick % 5 == 0:
-            from .entropy_filter import compute_entropy, store_entropy
-            entropy = compute_entropy(symbol, interval)
-            if entropy:
-                store_entropy(entropy)
-
-        # Regime: every 15 ticks
-        if tick % 15 == 0:
-            from .regime_detector import detect_regime, store_regime
-            regime = detect_regime(symbol, interval)
-            if regime:
-                store_regime(regime)
-
-        # S/R levels: every 60 ticks
-        if tick % 60 == 0:
-            from .support_resistance import compute_sr_levels, store_sr_levels
-            sr = compute_sr_levels(symbol, interval)
-            if sr:
-                store_sr_levels(sr)
+async def _process_symbol(symbol: str, interval: str, tick: int = 0,
+                          modules: Optional[Collection[str]] = None) -> None:
+    """Run analysis modules for a single symbol.
 
-    except Exception as e:
-        msg = f"Process {symbol} error: {e}"
-        logger.error(msg)
-        _errors.append(msg)
+    ``modules=None``: los que tocan en este tick (indicadores cada tick,
+    entropía cada 5, régimen cada 15, S/R cada 60).
+    """
+    if modules is None:
+        modules = [m for m in ANALYSIS_MODULES if tick % _TICK_EVERY[m] == 0]
+    with span("analysis", symbol):
+        try:
+            if "indicators" in modules:
+                from .technical_analysis import compute_indicators, store_indicators
+                indicators = compute_indicators(symbol, interval)
+                if indicators:
+                    store_indicators(indicators)
+                    if interval == settings.quant_primary_interval:
+                        # El fast loop reutiliza este ATR para el trailing stop de la vela
+                        from .trailing_engine import get_trailing_engine
+                        get_trailing_engine().atr_cache.prime(symbol, interval, indicators.atr_14)
+
+            if "entropy" in modules:
+                from .entropy_filter import compute_entropy, store_entropy
+                entropy = compute_entropy(symbol, interval)
+                if entropy:
+                    _readings[("entropy", symbol, interval)] = (entropy, time.monotonic())
+                    store_entropy(entropy)
+
+            if "regime" in modules:
+                from .regime_detector import detect_regime, store_regime
+                regime = detect_regime(symbol, interval)
+                if regime:
+                    _readings[("regime", symbol, interval)] = (regime, time.monotonic())
+                    store_regime(regime)
+
+            if "sr" in modules:
+                from .support_resistance import compute_sr_levels, store_sr_levels
+                sr = compute_sr_levels(symbol, interval)
+                if sr:
+                    store_sr_levels(sr)
+
+        except Exception as e:
+            msg = f"Process {symbol} error: {e}"
+            logger.error(msg)
+            _errors.append(msg)
+
+
+def candle_jobs(symbols: Optional[List[str]] = None) -> List[CandleJob]:
+    """Jobs del scheduler de velas: cada computación en el cierre de su vela de entrada.
+
+    - stage 0: klines. Con resample, las velas base en cada cierre base; si
+      no, cada intervalo en su propio cierre.
+    - stage 1: análisis por símbolo en el cierre del intervalo primario
+      (los insumos sólo cambian ahí: no hay nada que recalcular entre velas).
+    - stage 2: covarianza del portfolio, métricas (6h), gaps y verificación
+      del resample (cadencias en minutos de los ``*_TICKS``).
+    """
+    symbols = symbols or settings.quant_symbols.split(",")
+    interval = settings.quant_primary_interval
+    jobs: List[CandleJob] = []
+
+    if settings.kline_resample_enabled:
+        jobs.append(CandleJob("klines", settings.kline_base_interval,
+                              lambda close_ms: _collect_resampled(symbols, None)))
+        if settings.kline_resample_check_ticks > 0:
+            jobs.append(CandleJob("kline_verify", f"{settings.kline_resample_check_ticks}m",
+                                  lambda close_ms: _verify_resampled(symbols), stage=2))
+    else:
+        from .kline_collector import INTERVALS
+
+        def _collect(iv: str):
+            async def run(close_ms: int) -> None:
+                await asyncio.gather(*[_safe_collect(sym, iv) for sym in symbols])
+            return run
+
+        jobs.extend(CandleJob("klines", iv, _collect(iv)) for iv in INTERVALS)
+
+    jobs.append(CandleJob("quant_tick", interval, _mark_candle_tick))
+
+    def _analysis(sym: str):
+        async def run(close_ms: int) -> None:
+            await _process_symbol(sym, interval, modules=ANALYSIS_MODULES)
+        return run
+
+    jobs.extend(CandleJob("analysis", interval, _analysis(sym), symbol=sym, stage=1) for sym in symbols)
+
+    if settings.portfolio_var_enabled:
+        async def _portfolio(close_ms: int) -> None:
+            _update_portfolio_risk(symbols, interval)
+        jobs.append(CandleJob("portfolio_risk", interval, _portfolio, stage=2))
+
+    jobs.append(CandleJob("performance_metrics", "6h", lambda close_ms: _update_performance_metrics(), stage=2))
+    if settings.kline_gap_repair_ticks > 0:
+        jobs.append(CandleJob("kline_gaps", f"{settings.kline_gap_repair_ticks}m",
+                              lambda close_ms: _repair_kline_gaps(symbols), stage=2))
+    return jobs
+
+
+async def _mark_candle_tick(close_ms: int) -> None:
+    """Un cierre del intervalo primario cuenta como tick (status / health)."""
+    global _tick_count, _last_tick_at
+    _tick_count += 1
+    _last_tick_at = datetime.now(timezone.utc)
+    _errors.clear()
+
+
+def latest_reading(kind: str, symbol: str, interval: str, max_age: Optional[float] = None) -> Any:
+    """Entropía (``kind="entropy"``) o régimen (``"regime"``) del último quant tick, si es reciente."""
+    entry = _readings.get((kind, symbol, interval))
+    if entry is None:
+        return None
+    max_age = settings.risk_snapshot_max_age_seconds if max_age is None else max_age
+    reading, at = entry
+    return reading if time.monotonic() - at <= max_age else None
+
+
+def reset_readings() -> None:
+    _readings.clear()
 
 
 async def _update_performance_metrics() -> None:
-    """Compute and store rolling performance metrics for all_time, 30d and 7d windows."""
+    """Compute and store rolling performance metrics for all_time, 30d and 7d windows.
+
+    Con los agregados incrementales cargados (trade_stats) cada ventana es la
+    combinación de buckets diarios; si no, se leen las posiciones cerradas.
+    """
     from ..db import get_supabase
     from datetime import timedelta
-    import numpy as np
+    from .trade_stats import TradeAggregate, get_trade_stats
 
     supabase = get_supabase()
     now_dt = datetime.now(timezone.utc)
+    store = get_trade_stats()
 
     windows = {
         "all_time": None,
-        "rolling_30d": now_dt - timedelta(days=30),
-        "rolling_7d": now_dt - timedelta(days=7),
+        "rolling_30d": 30,
+        "rolling_7d": 7,
     }
 
-    for metric_type, since in windows.items():
+    for metric_type, days in windows.items():
         try:
-            query = supabase.table("positions").select(
-                "realized_pnl,entry_notional,opened_at,closed_at"
-            ).eq("status", "closed")
-            if since:
-                query = query.gte("closed_at", since.isoformat())
-            resp = query.execute()
-
-            if not resp.data or len(resp.data) < 2:
+            if store.loaded:
+                agg = store.window(days)
+            else:
+                query = supabase.table("positions").select(
+                    "realized_pnl,entry_notional,closed_at"
+                ).eq("status", "closed")
+                if days:
+                    query = query.gte("closed_at", (now_dt - timedelta(days=days)).isoformat())
+                resp = query.order("closed_at").execute()
+                agg = TradeAggregate.from_trades(resp.data or [])
+
+            if agg.trades < 2:
                 continue
 
-            positions = resp.data
-            pnls = [float(p.get("realized_pnl", 0) or 0) for p in positions]
-            notionals = [float(p.get("entry_notional", 0) or 1) for p in positions]
-            returns = [p / n if n > 0 else 0 for p, n in zip(pnls, notionals)]
-
-            wins = [r for r in returns if r > 0]
-            losses = [abs(r) for r in returns if r < 0]
-
-            total = len(returns)
-            win_rate = len(wins) / total if total > 0 else 0
-            avg_win = sum(wins) / len(wins) if wins else 0
-            avg_loss = sum(losses) / len(losses) if losses else 0
-            profit_factor = (sum(wins) / sum(losses)) if losses and sum(losses) > 0 else None
-            expectancy = sum(pnls) / total if total > 0 else 0
-
-            returns_arr = np.array(returns)
-
-            # Sharpe ratio (annualised, simplified)
-            sharpe = None
-            if len(returns_arr) > 1 and np.std(returns_arr) > 0:
-                sharpe = round(float(np.mean(returns_arr) / np.std(returns_arr) * np.sqrt(252)), 4)
-
-            # Sortino ratio
-            sortino = None
-            downside = returns_arr[returns_arr < 0]
-            if len(downside) > 0 and np.std(downside) > 0:
-                sortino = round(float(np.mean(returns_arr) / np.std(downside) * np.sqrt(252)), 4)
-
-            # Max drawdown (in USD)
-            cumulative = np.cumsum(pnls)
-            peak = np.maximum.accumulate(cumulative)
-            drawdowns = cumulative - peak
-            max_dd = round(float(np.min(drawdowns)), 4) if len(drawdowns) > 0 else 0
-
-            # Calmar ratio = annualised_return / |max_drawdown|
-            calmar = None
-            if max_dd < 0:
-                annualised_return = sum(pnls) * (252 / max(total, 1))
-                calmar = round(annualised_return / abs(max_dd), 4)
-
-            # Kelly fraction (half-Kelly)
-            kelly = None
-            if avg_loss > 0 and 0 < win_rate < 1:
-                b = avg_win / avg_loss
-                kelly = round((win_rate * b - (1 - win_rate)) / b * settings.kelly_dampener, 4)
-
-            now = datetime.now(timezone.utc).isoformat()
             metrics = {
                 "metric_type": metric_type,
-                "sharpe_ratio": sharpe,
-                "sortino_ratio": sortino,
-                "calmar_ratio": calmar,
-                "max_drawdown": max_dd,
-                "win_rate": round(win_rate, 4),
-                "profit_factor": round(profit_factor, 4) if profit_factor else None,
-                "expectancy": round(expectancy, 8),
-                "kelly_fraction": kelly,
-                "total_trades": total,
-                "avg_win": round(avg_win, 8),
-                "avg_loss": round(avg_loss, 8),
-                "calculated_at": now,
+                **agg.performance(),
+                "calculated_at": datetime.now(timezone.utc).isoformat(),
             }
 
             supabase.table("performance_metrics").upsert(
                 metrics, on_conflict="metric_type"
             ).execute()
-            logger.info(f"Performance metrics updated: {metric_type} ({total} trades)")
+            logger.info(f"Performance metrics updated: {metric_type} ({agg.trades} trades)")
 
         except Exception as e:
             logger.error(f"Performance metrics update failed for {metric_type}: {e}")
@@ -283,12 +486,22 @@ def get_engine_status() -> QuantEngineStatus:
         symbols=symbols,
         primary_interval=settings.quant_primary_interval,
         modules={
-            "kline_collector": {"status": "active"},
+            "kline_collector": {
+                "status": "active",
+                "resample": settings.kline_resample_enabled,
+                **(_resample_stats if settings.kline_resample_enabled else {}),
+            },
             "technical_analysis": {"status": "active"},
             "entropy_filter": {"status": "active", "threshold": settings.entropy_threshold_ratio},
             "regime_detector": {"status": "active"},
             "support_resistance": {"status": "active", "clusters": settings.sr_clusters},
             "position_sizer": {"status": "active", "kelly_dampener": settings.kelly_dampener},
+            "portfolio_risk": {"status": "active", **get_portfolio_risk().status()},
+            "candle_scheduler": {
+                "status": "active" if not settings.candle_scheduler_enabled or get_candle_scheduler().running else "stopped",
+                "enabled": settings.candle_scheduler_enabled,
+                **{k: v for k, v in get_candle_scheduler().status().items() if k in ("batches", "runs", "coalesced", "errors")},
+            },
         },
         errors=_errors[-10:],  # Last 10 errors
     )
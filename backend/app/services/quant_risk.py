@@ -1,183 +1,411 @@
-"""Enhanced risk middleware with quantitative checks.
+"""Enhanced risk validation: concurrent engine over the 9 risk checks.
 
-Wraps the existing risk_manager.py (5 checks) and adds 3 quant checks:
+5 base checks (risk_manager.py) + 4 quant checks:
 1. Entropy Gate: Blocks trading in noisy markets
 2. Regime Check: Blocks contra-trend trades and volatile regimes
 3. Kelly/ATR Size Validation: Validates notional does not exceed 1.2x recommended
+4. Portfolio VaR: Blocks trades that push book VaR over PORTFOLIO_VAR_LIMIT_USD
+   (portfolio_risk.py)
 
-Total: 8 risk checks.
+Antes se corría ``risk_manager.validate_proposal`` completo (5 checks en
+serie, cada uno con su I/O) y después se recalculaban entropía, régimen y
+sizing. Ahora cada check declara qué datos necesita; las cargas (cuenta,
+PnL diario, entropía, régimen, sizing) corren en paralelo y cada check se
+evalúa apenas sus datos están listos. Los checks que sólo usan memoria
+(tamaño, posiciones abiertas) van primero, y con ``RISK_SHORT_CIRCUIT`` el
+primer rechazo cancela las cargas que faltan.
+
+Entropía y régimen salen del snapshot del tick cuando existe (``TickContext``
+o el último quant tick), así el proposal se valida con la misma lectura que
+generó la señal. ``timings_ms`` del resultado trae cada carga (``load:*``),
+cada check y el total.
 """
 
+import asyncio
 import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
 
 from ..models import RiskCheck, ValidationResult
 from ..config import settings
 from .risk_manager import validate_proposal as _base_validate
+from .risk_manager import (
+    build_result,
+    check_account,
+    check_daily_loss,
+    check_open_positions,
+    check_position_size,
+    check_symbol_concentration,
+    load_daily_pnl,
+    load_open_positions,
+    load_usdt_free,
+)
 from .entropy_filter import compute_entropy
 from .regime_detector import detect_regime
 from .position_sizer import compute_position_size
+from .position_book import get_position_book
+from .portfolio_risk import get_portfolio_risk
 from .telegram_notifier import notify_entropy_blocked, notify_regime_blocked
 from ..db import get_supabase
+from . import write_behind
 
 logger = logging.getLogger(__name__)
 QUANT_SIZE_MAX_MULTIPLIER = 1.2
+QUANT_CHECKS = ("entropy_gate", "regime_check", "quant_size_validation", "portfolio_var")
 
 
-async def validate_proposal_enhanced(
-    trade_type: str,
-    symbol: str,
-    quantity: float,
-    notional: float,
-    current_price: float,
-    is_exit: bool = False,
-) -> ValidationResult:
-    """Run all 8 risk checks (5 base + 3 quant)."""
+class _LoadFailed:
+    """Carga que lanzó excepción: el check decide si es skip o rechazo."""
 
-    # Run base 5 checks first (is_exit bypasses entry-only checks)
-    base_result = await _base_validate(trade_type, symbol, quantity, notional, current_price, is_exit)
-    checks = list(base_result.checks)
+    def __init__(self, error: Exception):
+        self.error = error
 
-    if not settings.quant_enabled:
-        return base_result
 
-    interval = settings.quant_primary_interval
+class _Validation:
+    """Una corrida del motor para un proposal."""
 
-    # ── Check 6: Entropy Gate — uses LLM config threshold if available ──
-    try:
-        from .daily_analyst.config_bridge import load_active_config
-        llm_cfg = load_active_config()
-        entropy_limit = llm_cfg.buy_entropy_max if llm_cfg else settings.entropy_threshold_ratio
-    except Exception:
-        entropy_limit = settings.entropy_threshold_ratio
-    try:
-        entropy = compute_entropy(symbol, interval)
-        if entropy:
-            entropy_ok = entropy.entropy_ratio < entropy_limit
-            checks.append(RiskCheck(
-                name="entropy_gate",
-                passed=entropy_ok,
-                message=(
-                    f"Entropy ratio {entropy.entropy_ratio:.3f} "
-                    f"({'< ' if entropy_ok else '>= '}{entropy_limit})"
-                ),
-                value=entropy.entropy_ratio,
-                limit=entropy_limit,
-            ))
-            if not entropy_ok:
-                _log_risk_event("entropy_gate_blocked", "warning",
-                    f"Trading blocked: market too noisy (entropy ratio {entropy.entropy_ratio:.3f})",
-                    {"symbol": symbol, "entropy_ratio": entropy.entropy_ratio})
-                await notify_entropy_blocked(symbol, entropy.entropy_ratio)
-        else:
-            checks.append(RiskCheck(
+    def __init__(self, trade_type: str, symbol: str, notional: float, is_exit: bool, ctx):
+        self.trade_type = trade_type.lower()
+        self.symbol = symbol
+        self.notional = notional
+        self.is_exit = is_exit
+        self.ctx = ctx
+        self.interval = settings.quant_primary_interval
+        self.supabase = get_supabase()
+        self.data: Dict[str, Any] = {}
+        self.results: Dict[str, List[RiskCheck]] = {}
+        self.timings: Dict[str, float] = {}
+
+    # ── Plan: (nombre, datos que necesita, evaluador) en orden de reporte ──
+
+    def plan(self) -> List[Tuple[str, Tuple[str, ...], Callable[[], Awaitable[List[RiskCheck]]]]]:
+        plan = [
+            ("position_size", (), self._position_size),
+            ("max_open_positions", () if self.is_exit else ("positions",), self._open_positions),
+        ]
+        if self.trade_type == "buy" and not self.is_exit:
+            plan.append(("symbol_concentration", ("positions",), self._concentration))
+        plan += [
+            ("account", ("account", "positions"), self._account),
+            ("daily_loss_limit", () if self.is_exit else ("daily_pnl",), self._daily_loss),
+            ("entropy_gate", ("entropy",), self._entropy_gate),
+            ("regime_check", ("regime",), self._regime_check),
+            ("quant_size_validation", ("sizing",), self._size_check),
+        ]
+        if settings.portfolio_var_enabled:
+            plan.append(("portfolio_var", ("positions",), self._portfolio_var))
+        return plan
+
+    def loaders(self) -> Dict[str, Callable[[], Awaitable[Any]]]:
+        return {
+            "positions": lambda: asyncio.to_thread(load_open_positions, self.supabase, self.ctx),
+            "account": load_usdt_free,
+            "daily_pnl": lambda: asyncio.to_thread(load_daily_pnl, self.supabase, self.ctx),
+            "entropy": lambda: asyncio.to_thread(self._load_entropy),
+            "regime": lambda: asyncio.to_thread(self._reading, "regime", detect_regime),
+            "sizing": self._load_sizing,
+        }
+
+    # ── Ejecución ──
+
+    async def run(self) -> ValidationResult:
+        started = time.perf_counter()
+        plan = self.plan()
+        needed = {dep for _, deps, _ in plan for dep in deps}
+        if "positions" in needed and (self.ctx is not None or get_position_book().loaded):
+            self.data["positions"] = load_open_positions(self.supabase, self.ctx)  # memoria, sin I/O
+
+        pending = list(plan)
+        tasks: Dict[asyncio.Future, str] = {}
+        try:
+            rejected = await self._evaluate_ready(pending)
+            if not rejected:
+                loaders = self.loaders()
+                tasks = {
+                    asyncio.ensure_future(self._timed_load(name, loaders[name])): name
+                    for name in sorted(needed - set(self.data))
+                }
+            while tasks and not rejected:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.pop(task)
+                rejected = await self._evaluate_ready(pending)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if rejected and pending:
+            logger.debug(
+                f"Risk short-circuit [{self.symbol}]: skipped {', '.join(name for name, _, _ in pending)}"
+            )
+        self.timings["total"] = _ms(started)
+        return self._result(plan)
+
+    async def _timed_load(self, name: str, loader: Callable[[], Awaitable[Any]]) -> None:
+        t0 = time.perf_counter()
+        try:
+            self.data[name] = await loader()
+        except Exception as e:
+            self.data[name] = _LoadFailed(e)
+        self.timings[f"load:{name}"] = _ms(t0)
+
+    async def _evaluate_ready(self, pending: list) -> bool:
+        """Evaluar los checks con datos listos. True si hay que cortar."""
+        for item in list(pending):
+            name, deps, evaluate = item
+            if not all(dep in self.data for dep in deps):
+                continue
+            pending.remove(item)
+            t0 = time.perf_counter()
+            self.results[name] = await evaluate()
+            self.timings[name] = _ms(t0)
+            if settings.risk_short_circuit and not all(c.passed for c in self.results[name]):
+                return True
+        return False
+
+    def _result(self, plan) -> ValidationResult:
+        base_checks = [c for name, _, _ in plan if name not in QUANT_CHECKS for c in self.results.get(name, [])]
+        quant_checks = [c for name, _, _ in plan if name in QUANT_CHECKS for c in self.results.get(name, [])]
+        base_result = build_result(base_checks, self.notional)
+        checks = base_checks + quant_checks
+
+        # Base scoring + 15 points per quant failure
+        quant_failures = sum(1 for c in quant_checks if not c.passed)
+        score = min(base_result.risk_score + quant_failures * 15, 100.0)
+        all_passed = all(c.passed for c in checks)
+
+        return ValidationResult(
+            approved=all_passed,
+            auto_approved=all_passed and base_result.auto_approved,
+            risk_score=score,
+            checks=checks,
+            rejection_reason=next((c.message for c in checks if not c.passed), None),
+            timings_ms=self.timings,
+        )
+
+    # ── Cargas ──
+
+    def _reading(self, kind: str, compute: Callable[[str, str], Any]) -> Any:
+        if self.ctx is not None:
+            return self.ctx.reading(kind, self.symbol, self.interval, compute)
+        from .quant_orchestrator import latest_reading
+        snap = latest_reading(kind, self.symbol, self.interval)
+        return snap if snap is not None else compute(self.symbol, self.interval)
+
+    def _load_entropy(self) -> Tuple[Any, float]:
+        """Lectura de entropía + límite (config LLM si hay, si no el default)."""
+        try:
+            if self.ctx is not None:
+                llm_cfg = self.ctx.llm_config
+            else:
+                from .daily_analyst.config_bridge import load_active_config
+                llm_cfg = load_active_config()
+            entropy_limit = llm_cfg.buy_entropy_max if llm_cfg else settings.entropy_threshold_ratio
+        except Exception:
+            entropy_limit = settings.entropy_threshold_ratio
+        return self._reading("entropy", compute_entropy), entropy_limit
+
+    async def _load_sizing(self) -> Any:
+        if self.ctx is None:
+            return await compute_position_size(self.symbol, self.interval)
+        return await self.ctx.memo_async(
+            f"sizing:{self.symbol}:{self.interval}",
+            lambda: compute_position_size(self.symbol, self.interval, ctx=self.ctx),
+        )
+
+    # ── Checks base ──
+
+    async def _position_size(self) -> List[RiskCheck]:
+        return [check_position_size(self.notional, self.is_exit)]
+
+    async def _open_positions(self) -> List[RiskCheck]:
+        open_count = 0 if self.is_exit else len(self._positions())
+        return [check_open_positions(open_count, self.is_exit)]
+
+    async def _concentration(self) -> List[RiskCheck]:
+        sym_count = sum(1 for p in self._positions() if p.get("symbol") == self.symbol)
+        return [check_symbol_concentration(self.symbol, sym_count)]
+
+    async def _account(self) -> List[RiskCheck]:
+        usdt_free = self.data["account"]
+        if isinstance(usdt_free, _LoadFailed):
+            logger.warning(f"Could not fetch account: {usdt_free.error}")
+            usdt_free = None
+        positions = self.data["positions"]
+        return check_account(usdt_free, self.notional, [] if isinstance(positions, _LoadFailed) else positions, self.is_exit)
+
+    async def _daily_loss(self) -> List[RiskCheck]:
+        daily_pnl = self.data.get("daily_pnl")
+        if isinstance(daily_pnl, _LoadFailed):
+            logger.warning(f"Could not check daily loss: {daily_pnl.error}")
+            daily_pnl = None
+        return [check_daily_loss(daily_pnl, self.is_exit)]
+
+    def _positions(self) -> List[Dict[str, Any]]:
+        positions = self.data["positions"]
+        if isinstance(positions, _LoadFailed):
+            raise positions.error
+        return positions
+
+    # ── Checks quant ──
+
+    async def _entropy_gate(self) -> List[RiskCheck]:
+        loaded = self.data["entropy"]
+        if isinstance(loaded, _LoadFailed):
+            logger.error(f"Entropy check failed: {loaded.error}")
+            return [RiskCheck(name="entropy_gate", passed=False, message=f"Entropy check failed: {loaded.error}")]
+        entropy, entropy_limit = loaded
+        if not entropy:
+            return [RiskCheck(
                 name="entropy_gate", passed=True,
                 message="Entropy check skipped (insufficient data)",
-            ))
-    except Exception as e:
-        logger.error(f"Entropy check failed: {e}")
-        checks.append(RiskCheck(name="entropy_gate", passed=False, message=f"Entropy check failed: {e}"))
+            )]
+        entropy_ok = entropy.entropy_ratio < entropy_limit
+        check = RiskCheck(
+            name="entropy_gate",
+            passed=entropy_ok,
+            message=(
+                f"Entropy ratio {entropy.entropy_ratio:.3f} "
+                f"({'< ' if entropy_ok else '>= '}{entropy_limit})"
+            ),
+            value=entropy.entropy_ratio,
+            limit=entropy_limit,
+        )
+        if not entropy_ok:
+            _log_risk_event("entropy_gate_blocked", "warning",
+                f"Trading blocked: market too noisy (entropy ratio {entropy.entropy_ratio:.3f})",
+                {"symbol": self.symbol, "entropy_ratio": entropy.entropy_ratio})
+            await notify_entropy_blocked(self.symbol, entropy.entropy_ratio)
+        return [check]
 
-    # ── Check 7: Regime Check ──
-    try:
-        regime = detect_regime(symbol, interval)
-        if regime:
-            regime_ok = True
-            msg = f"Regime: {regime.regime} (confidence: {regime.confidence:.1f}%)"
-
-            # Block all trades in volatile regime
-            if regime.regime == "volatile" and regime.confidence > 60:
-                regime_ok = False
-                msg = f"Regime volatile with {regime.confidence:.1f}% confidence - trading blocked"
-
-            # Block contra-trend trades in strong trends (exits allowed)
-            elif not is_exit:
-                conf_min = settings.buy_regime_confidence_min
-                if regime.regime == "trending_up" and trade_type.lower() == "sell" and regime.confidence > conf_min:
-                    regime_ok = False
-                    msg = f"Selling against strong uptrend ({regime.confidence:.1f}%) - blocked"
-                elif regime.regime == "trending_down" and trade_type.lower() == "buy" and regime.confidence > conf_min:
-                    regime_ok = False
-                    msg = f"Buying against strong downtrend ({regime.confidence:.1f}%) - blocked"
-
-            checks.append(RiskCheck(
-                name="regime_check",
-                passed=regime_ok,
-                message=msg,
-                value=regime.confidence,
-            ))
-            if not regime_ok:
-                _log_risk_event("regime_warning", "warning", msg, {
-                    "symbol": symbol, "regime": regime.regime, "confidence": regime.confidence,
-                })
-                await notify_regime_blocked(symbol, regime.regime, regime.confidence, msg)
-        else:
-            checks.append(RiskCheck(
+    async def _regime_check(self) -> List[RiskCheck]:
+        regime = self.data["regime"]
+        if isinstance(regime, _LoadFailed):
+            logger.error(f"Regime check failed: {regime.error}")
+            return [RiskCheck(name="regime_check", passed=False, message=f"Regime check failed: {regime.error}")]
+        if not regime:
+            return [RiskCheck(
                 name="regime_check", passed=True,
                 message="Regime check skipped (insufficient data)",
-            ))
-    except Exception as e:
-        logger.error(f"Regime check failed: {e}")
-        checks.append(RiskCheck(name="regime_check", passed=False, message=f"Regime check failed: {e}"))
+            )]
 
-    # ── Check 8: Kelly/ATR Size Validation ──
-    try:
-        sizing = await compute_position_size(symbol, interval)
-        if sizing:
-            max_allowed = sizing.recommended_size_usd * QUANT_SIZE_MAX_MULTIPLIER
-            size_ok = notional <= max_allowed
-            checks.append(RiskCheck(
-                name="quant_size_validation",
-                passed=size_ok,
-                message=(
-                    f"Notional ${notional:.2f} vs recommended ${sizing.recommended_size_usd:.2f} "
-                    f"(max ${max_allowed:.2f}, method: {sizing.method})"
-                ),
-                value=notional,
-                limit=max_allowed,
-            ))
-            if not size_ok:
-                _log_risk_event("kelly_size_override", "warning",
-                    f"Position size ${notional:.2f} exceeds {QUANT_SIZE_MAX_MULTIPLIER:.1f}x recommended ${sizing.recommended_size_usd:.2f}",
-                    {"symbol": symbol, "notional": notional, "recommended": sizing.recommended_size_usd})
-        else:
-            checks.append(RiskCheck(
+        regime_ok = True
+        msg = f"Regime: {regime.regime} (confidence: {regime.confidence:.1f}%)"
+
+        # Block all trades in volatile regime
+        if regime.regime == "volatile" and regime.confidence > 60:
+            regime_ok = False
+            msg = f"Regime volatile with {regime.confidence:.1f}% confidence - trading blocked"
+
+        # Block contra-trend trades in strong trends (exits allowed)
+        elif not self.is_exit:
+            conf_min = settings.buy_regime_confidence_min
+            if regime.regime == "trending_up" and self.trade_type == "sell" and regime.confidence > conf_min:
+                regime_ok = False
+                msg = f"Selling against strong uptrend ({regime.confidence:.1f}%) - blocked"
+            elif regime.regime == "trending_down" and self.trade_type == "buy" and regime.confidence > conf_min:
+                regime_ok = False
+                msg = f"Buying against strong downtrend ({regime.confidence:.1f}%) - blocked"
+
+        if not regime_ok:
+            _log_risk_event("regime_warning", "warning", msg, {
+                "symbol": self.symbol, "regime": regime.regime, "confidence": regime.confidence,
+            })
+            await notify_regime_blocked(self.symbol, regime.regime, regime.confidence, msg)
+        return [RiskCheck(name="regime_check", passed=regime_ok, message=msg, value=regime.confidence)]
+
+    async def _size_check(self) -> List[RiskCheck]:
+        sizing = self.data["sizing"]
+        if isinstance(sizing, _LoadFailed):
+            logger.error(f"Size validation failed: {sizing.error}")
+            return [RiskCheck(name="quant_size_validation", passed=False, message=f"Size validation failed: {sizing.error}")]
+        if not sizing:
+            return [RiskCheck(
                 name="quant_size_validation", passed=True,
                 message="Size validation skipped (no sizing data)",
-            ))
-    except Exception as e:
-        logger.error(f"Size validation failed: {e}")
-        checks.append(RiskCheck(name="quant_size_validation", passed=False, message=f"Size validation failed: {e}"))
+            )]
+        notional = self.notional
+        max_allowed = sizing.recommended_size_usd * QUANT_SIZE_MAX_MULTIPLIER
+        size_ok = notional <= max_allowed
+        if not size_ok:
+            _log_risk_event("kelly_size_override", "warning",
+                f"Position size ${notional:.2f} exceeds {QUANT_SIZE_MAX_MULTIPLIER:.1f}x recommended ${sizing.recommended_size_usd:.2f}",
+                {"symbol": self.symbol, "notional": notional, "recommended": sizing.recommended_size_usd})
+        return [RiskCheck(
+            name="quant_size_validation",
+            passed=size_ok,
+            message=(
+                f"Notional ${notional:.2f} vs recommended ${sizing.recommended_size_usd:.2f} "
+                f"(max ${max_allowed:.2f}, method: {sizing.method})"
+            ),
+            value=notional,
+            limit=max_allowed,
+        )]
 
-    # Recalculate overall result
-    all_passed = all(c.passed for c in checks)
-    rejection_reason = next((c.message for c in checks if not c.passed), None)
+    async def _portfolio_var(self) -> List[RiskCheck]:
+        """Book VaR after the trade; trades that reduce VaR always pass."""
+        model = get_portfolio_risk()
+        if not model.ready:
+            return [RiskCheck(
+                name="portfolio_var", passed=True,
+                message=f"Portfolio VaR skipped (model warming up: {model.observations} candles)",
+            )]
+        prices = dict(self.ctx.prices) if self.ctx is not None else {}
+        impact = model.impact(self._positions(), self.symbol, self.trade_type, self.notional, prices)
+        limit = settings.portfolio_var_limit_usd
+        book_var = impact.after.worst
+        var_ok = book_var <= limit or impact.marginal <= 0
+        msg = (
+            f"Book VaR ${book_var:.2f} (limit ${limit:.2f}, marginal {impact.marginal:+.2f}, "
+            f"CVaR ${max(impact.after.parametric_cvar, impact.after.historical_cvar):.2f})"
+        )
+        if impact.uncovered_exposure:
+            msg += f", ${impact.uncovered_exposure:.2f} outside model"
+        if not var_ok:
+            _log_risk_event("portfolio_var_limit", "warning", msg, {
+                "symbol": self.symbol, "marginal": impact.marginal, **impact.after.as_dict(),
+            })
+        return [RiskCheck(name="portfolio_var", passed=var_ok, message=msg, value=book_var, limit=limit)]
 
-    # Recalculate risk score (keep base scoring + penalty for quant failures)
-    score = base_result.risk_score
-    quant_failures = sum(1 for c in checks[len(base_result.checks):] if not c.passed)
-    score += quant_failures * 15  # 15 points per quant failure
-    score = min(score, 100.0)
 
-    auto_approved = all_passed and base_result.auto_approved
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 3)
 
-    return ValidationResult(
-        approved=all_passed,
-        auto_approved=auto_approved,
-        risk_score=score,
-        checks=checks,
-        rejection_reason=rejection_reason,
-    )
+
+async def validate_proposal_enhanced(
+    trade_type: str,
+    symbol: str,
+    quantity: float,
+    notional: float,
+    current_price: float,
+    is_exit: bool = False,
+    ctx=None,
+) -> ValidationResult:
+    """Run all 9 risk checks (5 base + 4 quant) with concurrent data loads.
+
+    ``ctx`` (TickContext) aporta posiciones, config LLM, snapshot diario y las
+    lecturas de entropía/régimen del tick. Con ``RISK_SHORT_CIRCUIT`` un
+    rechazo devuelve sólo los checks evaluados hasta ese momento.
+    """
+    if not settings.quant_enabled:
+        return await _base_validate(trade_type, symbol, quantity, notional, current_price, is_exit, ctx=ctx)
+    return await _Validation(trade_type, symbol, notional, is_exit, ctx).run()
 
 
 def _log_risk_event(event_type: str, severity: str, message: str, details: dict) -> None:
-    """Log a quant risk event to DB."""
+    """Log a quant risk event to DB (write-behind: no bloquea la validación)."""
+    row = {
+        "event_type": event_type,
+        "severity": severity,
+        "message": message,
+        "details": details,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if write_behind.enqueue("risk_events", row):
+        return
     try:
         supabase = get_supabase()
-        supabase.table("risk_events").insert({
-            "event_type": event_type,
-            "severity": severity,
-            "message": message,
-            "details": details,
-        }).execute()
+        supabase.table("risk_events").insert(row).execute()
     except Exception as e:
         logger.warning(f"Failed to log risk event: {e}")
@@ -0,0 +1,302 @@
+"""Per-tick / per-request accounting of PostgREST queries.
+
+No había forma de saber cuántas llamadas a Supabase hace una iteración de
+``_main_loop`` (señales, validación, portfolio, reconciliación...).
+
+``instrument(client)`` envuelve el cliente de Supabase: cada ``execute()``
+dentro de un ``query_scope`` registra tabla, función llamadora, latencia,
+filas devueltas y bytes (``Content-Length`` de la respuesta HTTP de PostgREST,
+anotado por un event hook de httpx: no se serializa ni se lee el body). Al cerrar el scope:
+
+- las "formas" de query (tabla + operación + columnas filtradas, sin
+  valores) repetidas ``DB_N_PLUS_ONE_THRESHOLD`` veces o más se reportan
+  como sospecha de N+1;
+- si hay presupuesto (``budget``) y se excedió, se loguea; con
+  ``strict=True`` (tests) se levanta ``QueryBudgetExceeded`` en la query que
+  lo excede.
+
+El scope vive en un ``ContextVar``: lo heredan las tareas y threads
+(``asyncio.to_thread``) lanzados dentro. Fuera de un scope el wrapper no
+mide nada.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import sys
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import CodeType
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Filtros/modificadores cuyo primer argumento es una columna (entra en la forma)
+_COLUMN_OPS = {
+    "select", "eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike", "is_", "in_",
+    "contains", "contained_by", "order", "filter", "match",
+}
+# Entry points del cliente que abren una query
+_ENTRY_POINTS = {"table", "from_", "rpc"}
+# Frames que no cuentan como "caller" (librerías entre la app y el wrapper)
+_LIBRARY_PREFIXES = ("postgrest", "supabase", "httpx", "unittest", "asyncio", "concurrent", "threading", "contextlib")
+
+_current: contextvars.ContextVar[Optional["QueryScope"]] = contextvars.ContextVar("query_scope", default=None)
+# Content-Length de la última respuesta HTTP en este contexto (lo escribe el hook de httpx)
+_response_bytes: contextvars.ContextVar[int] = contextvars.ContextVar("query_response_bytes", default=0)
+_recent: Deque[Dict[str, Any]] = deque(maxlen=20)
+# code object → "module.function" ("" si es librería o este módulo): el walk no re-formatea por query
+_caller_names: Dict[CodeType, str] = {}
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Un scope estricto hizo más queries que su presupuesto."""
+
+
+@dataclass
+class QueryStat:
+    count: int = 0
+    ms: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+
+    def add(self, ms: float, nrows: int, nbytes: int) -> None:
+        self.count += 1
+        self.ms += ms
+        self.rows += nrows
+        self.bytes += nbytes
+
+
+@dataclass
+class QueryScope:
+    """Counters for one tick or request."""
+
+    name: str
+    budget: Optional[int] = None
+    strict: bool = False
+    parent: Optional["QueryScope"] = None
+    total: QueryStat = field(default_factory=QueryStat)
+    by_table: Dict[str, QueryStat] = field(default_factory=dict)
+    by_caller: Dict[str, QueryStat] = field(default_factory=dict)
+    shapes: Counter = field(default_factory=Counter)
+    shape_callers: Dict[str, set] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    closed: bool = False
+
+    def record(self, table: str, shape: str, caller: str, ms: float, nrows: int, nbytes: int = 0) -> None:
+        if self.closed:
+            return  # tarea lanzada dentro del scope que sigue viva después
+        self.total.add(ms, nrows, nbytes)
+        self.by_table.setdefault(table, QueryStat()).add(ms, nrows, nbytes)
+        self.by_caller.setdefault(caller, QueryStat()).add(ms, nrows, nbytes)
+        self.shapes[shape] += 1
+        self.shape_callers.setdefault(shape, set()).add(caller)
+        if self.strict and self.budget is not None and self.total.count > self.budget:
+            raise QueryBudgetExceeded(
+                f"{self.name}: {self.total.count} queries > budget {self.budget} "
+                f"(last: {shape} from {caller})"
+            )
+
+    def n_plus_one(self, threshold: Optional[int] = None) -> List[Tuple[str, int, List[str]]]:
+        """Formas repetidas ``threshold`` veces o más: ``(shape, count, callers)``."""
+        threshold = threshold or settings.db_n_plus_one_threshold
+        return [
+            (shape, n, sorted(self.shape_callers[shape]))
+            for shape, n in self.shapes.most_common()
+            if n >= threshold
+        ]
+
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.total.count > self.budget
+
+    def report(self) -> Dict[str, Any]:
+        def _rows(stats: Dict[str, QueryStat]) -> Dict[str, Dict[str, Any]]:
+            ordered = sorted(stats.items(), key=lambda kv: kv[1].count, reverse=True)
+            return {k: {"count": s.count, "ms": round(s.ms, 1), "rows": s.rows, "bytes": s.bytes} for k, s in ordered}
+
+        return {
+            "scope": self.name,
+            "queries": self.total.count,
+            "db_ms": round(self.total.ms, 1),
+            "rows": self.total.rows,
+            "bytes": self.total.bytes,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "budget": self.budget,
+            "over_budget": self.over_budget(),
+            "by_table": _rows(self.by_table),
+            "by_caller": _rows(self.by_caller),
+            "n_plus_one": [
+                {"shape": s, "count": n, "callers": c} for s, n, c in self.n_plus_one()
+            ],
+        }
+
+
+@contextmanager
+def query_scope(name: str, budget: Optional[int] = None, strict: bool = False) -> Iterator[QueryScope]:
+    """Contar las queries ejecutadas dentro del bloque (tick del loop, request HTTP)."""
+    parent = _current.get()
+    scope = QueryScope(name=name, budget=budget or None, strict=strict, parent=parent)
+    token = _current.set(scope)
+    try:
+        yield scope
+    finally:
+        _current.reset(token)
+        scope.closed = True
+        _finish(scope)
+
+
+def _finish(scope: QueryScope) -> None:
+    report = scope.report()
+    _recent.append(report)
+    if report["over_budget"]:
+        logger.warning(
+            f"DB query budget exceeded [{scope.name}]: {report['queries']} queries "
+            f"(budget {scope.budget}), {report['db_ms']:.0f}ms — top callers: "
+            f"{list(report['by_caller'].items())[:5]}"
+        )
+    for item in report["n_plus_one"]:
+        logger.warning(
+            f"Possible N+1 [{scope.name}]: {item['shape']} x{item['count']} from {', '.join(item['callers'])}"
+        )
+    logger.debug(
+        f"DB queries [{scope.name}]: {report['queries']} in {report['db_ms']:.0f}ms, "
+        f"{report['rows']} rows, {report['bytes']} bytes"
+    )
+
+
+def current_scope() -> Optional[QueryScope]:
+    return _current.get()
+
+
+def recent_reports() -> List[Dict[str, Any]]:
+    """Reportes de los últimos scopes cerrados (más reciente al final)."""
+    return list(_recent)
+
+
+# ── Wrapper del cliente ────────────────────────────────────────────────
+
+
+def _caller() -> str:
+    """Primer frame fuera de este módulo y de las librerías: ``module.function``."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        name = _caller_names.get(code)
+        if name is None:
+            module = frame.f_globals.get("__name__", "")
+            lib = module == __name__ or module.startswith(_LIBRARY_PREFIXES)
+            name = _caller_names[code] = "" if lib else f"{module.removeprefix('app.')}.{code.co_name}"
+        if name:
+            return name
+        frame = frame.f_back
+    return "?"
+
+
+def _payload_rows(resp: Any) -> int:
+    """Filas devueltas (sin serializar la respuesta: eso costaba más que medirla)."""
+    data = getattr(resp, "data", None)
+    if isinstance(data, list):
+        return len(data)
+    return 0 if data is None else 1
+
+
+def _on_response(response: Any) -> None:
+    """Event hook de httpx: tamaño de la respuesta según el header, sin tocar el body."""
+    try:
+        _response_bytes.set(int(response.headers.get("content-length") or 0))
+    except (TypeError, ValueError):
+        _response_bytes.set(0)
+
+
+def _install_size_hook(client: Any) -> None:
+    """Registrar ``_on_response`` en la sesión httpx de PostgREST (idempotente).
+
+    Se re-chequea en cada entry point: supabase-py recrea el cliente de
+    PostgREST cuando cambia la sesión de auth. Clientes sin sesión httpx
+    (store local, mocks) reportan 0 bytes.
+    """
+    session = getattr(getattr(client, "postgrest", None), "session", None)
+    hooks = getattr(session, "event_hooks", None)
+    if isinstance(hooks, dict):
+        response_hooks = hooks.setdefault("response", [])
+        if _on_response not in response_hooks:
+            response_hooks.append(_on_response)
+
+
+def _shape_part(name: str, args: tuple) -> str:
+    if name in _COLUMN_OPS and args and isinstance(args[0], str):
+        return f"{name}({args[0]})"
+    return name
+
+
+class _InstrumentedQuery:
+    """Proxy de un request builder de postgrest que acumula la forma de la query."""
+
+    __slots__ = ("_target", "_table", "_shape")
+
+    def __init__(self, target: Any, table: str, shape: Tuple[str, ...]):
+        self._target = target
+        self._table = table
+        self._shape = shape
+
+    def _wrap(self, value: Any, part: str) -> Any:
+        if hasattr(value, "execute"):
+            return _InstrumentedQuery(value, self._table, self._shape + (part,))
+        return value
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if name == "execute":
+            return self._execute(attr)
+        if callable(attr):
+            def call(*args, **kwargs):
+                return self._wrap(attr(*args, **kwargs), _shape_part(name, args))
+            return call
+        return self._wrap(attr, name)  # ej. ``.not_``
+
+    def _execute(self, execute):
+        def run(*args, **kwargs):
+            scope = _current.get()
+            if scope is None:
+                return execute(*args, **kwargs)
+            _response_bytes.set(0)
+            t0 = time.perf_counter()
+            resp = execute(*args, **kwargs)
+            ms = (time.perf_counter() - t0) * 1000
+            shape = f"{self._table}:{'.'.join(self._shape)}"
+            caller, nrows, nbytes = _caller(), _payload_rows(resp), _response_bytes.get()
+            while scope is not None:
+                scope.record(self._table, shape, caller, ms, nrows, nbytes)
+                scope = scope.parent
+            return resp
+        return run
+
+
+class InstrumentedClient:
+    """Supabase client wrapper: ``table()/from_()/rpc()`` devuelven builders medidos."""
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if name not in _ENTRY_POINTS:
+            return attr
+
+        def entry(*args, **kwargs):
+            _install_size_hook(self._client)
+            target = args[0] if args else kwargs.get("table_name") or kwargs.get("fn") or "?"
+            table = f"rpc:{target}" if name == "rpc" else str(target)
+            return _InstrumentedQuery(attr(*args, **kwargs), table, ())
+        return entry
+
+
+def instrument(client: Any) -> Any:
+    if isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
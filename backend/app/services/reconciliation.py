@@ -1,260 +1,521 @@
 """Reconciliation service — compares DB state vs Binance exchange state.
 
-Runs every tick (60s) to detect divergences:
+Detecta divergencias:
 - Orphan orders: on exchange but not tracked in DB
 - Stale proposals: DB says pending but exchange says filled/cancelled
+- Balance mismatch: DB positions vs Binance balances
+
+Incremental y adaptativo (antes corría completo cada 60s, con un
+``get_order`` por orden y un UPDATE por propuesta vencida):
+
+- las propuestas activas se mantienen en memoria; cada corrida lee sólo las
+  filas con ``updated_at`` posterior al último watermark (lo mantiene un
+  trigger en la DB);
+- el exchange (open orders, ``get_order``, cuenta) se consulta en corridas
+  completas (cada ``RECONCILIATION_FULL_SECONDS``) o cuando hubo actividad:
+  posiciones abiertas/cerradas en el book, propuestas que cambiaron o
+  ``note_activity()``. Una orden ya verificada no se vuelve a pedir hasta
+  ``RECONCILIATION_ORDER_RECHECK_SECONDS`` (los estados terminales no se
+  vuelven a pedir);
+- la cadencia va de ``RECONCILIATION_FAST_SECONDS`` después de actividad a
+  ``RECONCILIATION_IDLE_SECONDS`` sin actividad (se duplica en cada corrida
+  tranquila);
+- con el user data stream conectado, el estado de una orden se toma del
+  stream (``user_stream``) antes de pedirlo al exchange;
+- el vencimiento de propuestas es un único UPDATE;
+- cada corrida registra su costo (queries, llamadas al exchange, órdenes
+  verificadas/en caché) en ``reconciliation_runs.cost``.
 """
 
+import asyncio
 import time
 import logging
-from datetime import datetime, timezone
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
 
 from ..db import get_supabase
 from ..config import settings
 from . import binance_client
+from .account_state import get_account_state
+from .position_book import get_position_book
+from .user_stream import get_user_stream
+from .query_budget import query_scope
 from .telegram_notifier import escape_html, send_telegram
 
 logger = logging.getLogger(__name__)
 
+ACTIVE_STATUSES = ["executed", "approved"]
+STALE_STATUSES = ["draft", "validated", "approved"]
+TERMINAL_ORDER_STATUSES = ("FILLED", "CANCELED", "EXPIRED", "REJECTED")
+PROPOSAL_COLUMNS = "id, symbol, binance_order_id, status, type, quantity, updated_at"
+# Re-leer un margen antes del watermark: una transacción que empezó antes
+# puede commitear con un updated_at anterior al máximo ya visto
+WATERMARK_OVERLAP = timedelta(seconds=5)
+# Eventos del book que cuentan como actividad ("updated" = trailing stop, no)
+_ACTIVITY_EVENTS = {"opened", "closed", "resync"}
 
-async def run_reconciliation() -> dict:
-    """Compare DB vs Binance and log divergences."""
+
+@dataclass
+class ReconciliationState:
+    """What previous runs already verified (in-process)."""
+
+    interval: float = 0.0                 # segundos hasta la próxima corrida
+    last_run: float = 0.0                 # monotonic
+    last_full: float = 0.0
+    proposals: Dict[str, Dict[str, Any]] = field(default_factory=dict)   # activas con binance_order_id
+    watermark: Optional[datetime] = None  # max(updated_at) leído de trade_proposals
+    verified_orders: Dict[int, Tuple[float, str]] = field(default_factory=dict)  # oid -> (monotonic, status)
+    pending: List[str] = field(default_factory=list)  # motivos de actividad desde la última corrida
+    book_queue: Optional[asyncio.Queue] = None
+    history: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=50))
+    cost_columns: bool = True             # reconciliation_runs tiene mode/cost (migración aplicada)
+
+
+_state = ReconciliationState()
+
+
+def get_reconciliation_state() -> ReconciliationState:
+    return _state
+
+
+def reset_reconciliation_state() -> None:
+    global _state
+    book_queue = _state.book_queue
+    if book_queue is not None:
+        get_position_book().unsubscribe(book_queue)
+    _state = ReconciliationState()
+
+
+def note_activity(reason: str) -> None:
+    """Pedir una corrida con chequeo del exchange en el próximo tick (ej. fill)."""
+    _state.pending.append(reason)
+
+
+def _drain_book_events() -> None:
+    book = get_position_book()
+    if _state.book_queue is None:
+        _state.book_queue = book.subscribe()
+        return
+    while True:
+        try:
+            event = _state.book_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        if event.kind in _ACTIVITY_EVENTS:
+            note_activity(f"position_{event.kind}")
+
+
+def reconciliation_due() -> bool:
+    _drain_book_events()
+    if _state.last_run == 0.0 or _state.pending:
+        return True
+    return time.monotonic() - _state.last_run >= _state.interval
+
+
+async def maybe_run_reconciliation() -> Optional[dict]:
+    """Main-loop entry point: run only when due (activity or cadence elapsed)."""
+    if not reconciliation_due():
+        return None
+    return await run_reconciliation()
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _refresh_proposals(supabase, full: bool, cost: Dict[str, int]) -> bool:
+    """Actualizar las propuestas activas en memoria; True si alguna cambió."""
+    changed = False
+    if full or _state.watermark is None:
+        rows = (
+            supabase.table("trade_proposals").select(PROPOSAL_COLUMNS)
+            .not_.is_("binance_order_id", "null").in_("status", ACTIVE_STATUSES)
+            .execute()
+        ).data or []
+        fresh = {r["id"]: r for r in rows}
+        changed = fresh.keys() != _state.proposals.keys()
+        _state.proposals = fresh
+    else:
+        since = _state.watermark - WATERMARK_OVERLAP
+        rows = (
+            supabase.table("trade_proposals").select(PROPOSAL_COLUMNS)
+            .gte("updated_at", since.isoformat())
+            .execute()
+        ).data or []
+        for row in rows:
+            active = row.get("status") in ACTIVE_STATUSES and row.get("binance_order_id")
+            previous = _state.proposals.get(row["id"])
+            if active:
+                changed |= previous != row
+                _state.proposals[row["id"]] = row
+            elif previous is not None:
+                changed = True
+                del _state.proposals[row["id"]]
+    cost["proposals_read"] += len(rows)
+    for row in rows:
+        ts = _parse_ts(row.get("updated_at"))
+        if ts is not None and (_state.watermark is None or ts > _state.watermark):
+            _state.watermark = ts
+    if _state.watermark is None:
+        _state.watermark = datetime.now(timezone.utc)  # sin filas: desde ahora (con el margen de overlap)
+    return changed
+
+
+async def _order_status(symbol: str, oid: int, cost: Dict[str, int]) -> str:
+    """Estado de una orden que ya no está abierta, con caché por antigüedad."""
+    now = time.monotonic()
+    cached = _state.verified_orders.get(oid)
+    if cached is not None and (
+        cached[1] in TERMINAL_ORDER_STATUSES
+        or now - cached[0] < settings.reconciliation_order_recheck_seconds
+    ):
+        cost["orders_cached"] += 1
+        return cached[1]
+    stream = get_user_stream()
+    record = stream.order(oid) if stream.is_live() else None
+    if record is not None:
+        cost["orders_cached"] += 1
+        _state.verified_orders[oid] = (now, record.status)
+        return record.status
+    order_status = await binance_client.get_order(symbol, oid)
+    cost["exchange_calls"] += 1
+    cost["orders_checked"] += 1
+    status = order_status.get("status", "UNKNOWN")
+    _state.verified_orders[oid] = (now, status)
+    return status
+
+
+def _next_interval(active: bool) -> float:
+    fast = float(settings.reconciliation_fast_seconds)
+    if active:
+        return fast
+    return min(max(_state.interval, fast) * 2, float(settings.reconciliation_idle_seconds))
+
+
+def _insert_run(supabase, record: Dict[str, Any]) -> Optional[str]:
+    if not _state.cost_columns:
+        record = {k: v for k, v in record.items() if k not in ("mode", "cost")}
+    try:
+        resp = supabase.table("reconciliation_runs").insert(record).execute()
+    except Exception as e:
+        if not _state.cost_columns or "mode" not in record:
+            raise
+        logger.warning(f"reconciliation_runs without mode/cost columns, storing run without cost: {e}")
+        _state.cost_columns = False
+        return _insert_run(supabase, record)
+    return resp.data[0]["id"] if resp.data else None
+
+
+async def run_reconciliation(full: Optional[bool] = None) -> dict:
+    """Compare DB vs Binance and log divergences.
+
+    Args:
+        full: True fuerza una corrida completa (endpoint manual), False una
+            incremental; None decide por ``RECONCILIATION_FULL_SECONDS``.
+    """
     start = time.time()
+    now = time.monotonic()
     supabase = get_supabase()
 
-    # 1. Create run record
-    run_resp = supabase.table("reconciliation_runs").insert({
-        "broker_adapter": f"spot_{settings.binance_env}",
-        "status": "running",
-    }).execute()
-    run_id = run_resp.data[0]["id"] if run_resp.data else None
+    activity = list(_state.pending)
+    _state.pending.clear()
+    if full is None:
+        full = _state.last_full == 0.0 or now - _state.last_full >= settings.reconciliation_full_seconds
+    mode = "full" if full else "incremental"
+    cost = {"exchange_calls": 0, "orders_checked": 0, "orders_cached": 0, "proposals_read": 0}
 
     divergences = []
     actions = []
     orders_synced = 0
     positions_synced = 0
+    minimal_balance: dict = {}
 
-    try:
-        # 2. Fetch open orders from Binance
-        exchange_orders = await binance_client.get_open_orders()
-        exchange_order_ids = {o["orderId"] for o in exchange_orders}
-
-        # 3. Fetch proposals that have a binance_order_id and are in active states
-        active_resp = supabase.table("trade_proposals").select(
-            "id, symbol, binance_order_id, status, type, quantity"
-        ).not_.is_("binance_order_id", "null").in_(
-            "status", ["executed", "approved"]
-        ).execute()
-        db_proposals = active_resp.data or []
-
-        db_order_ids = {}
-        for p in db_proposals:
-            oid = p.get("binance_order_id")
-            if oid:
-                try:
-                    db_order_ids[int(oid)] = p
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid binance_order_id '{oid}' in proposal {p.get('id')}")
-
-        # 4a. Detect orphan orders (on exchange but not in DB)
-        for eo in exchange_orders:
-            oid = eo.get("orderId")
-            if not oid:
-                logger.warning(f"Exchange order missing orderId: {eo}")
-                continue
-            if oid not in db_order_ids:
-                divergences.append({
-                    "type": "orphan",
-                    "order_id": oid,
-                    "symbol": eo.get("symbol"),
-                    "side": eo.get("side"),
-                    "status": eo.get("status"),
-                    "detail": "Order exists on exchange but has no matching proposal in DB",
-                })
-
-        # 4b. Detect stale proposals (DB has order_id but exchange shows filled/cancelled)
-        for oid, proposal in db_order_ids.items():
-            if oid not in exchange_order_ids and proposal["status"] == "approved":
-                # Order not open anymore — check actual status
-                try:
-                    order_status = await binance_client.get_order(
-                        proposal["symbol"], oid
-                    )
-                    exchange_status = order_status.get("status", "UNKNOWN")
-                    if exchange_status in ("FILLED", "CANCELED", "EXPIRED", "REJECTED"):
-                        divergences.append({
-                            "type": "stale",
-                            "proposal_id": proposal["id"],
-                            "order_id": oid,
-                            "symbol": proposal["symbol"],
-                            "db_status": proposal["status"],
-                            "exchange_status": exchange_status,
-                            "detail": f"Proposal approved but exchange order is {exchange_status}",
-                        })
-                except Exception as e:
-                    logger.warning(f"Could not check order {oid}: {e}")
-
-            orders_synced += 1
-
-        # 5. Count open positions synced
-        pos_resp = supabase.table("positions").select("id, symbol, current_quantity").eq("status", "open").execute()
-        open_positions = pos_resp.data or []
-        positions_synced = len(open_positions)
-
-        # 5b. Expire stale proposals (TTL >1h)
+    with query_scope("reconciliation") as scope:
         try:
-            expired = await _expire_stale_proposals(supabase)
-            if expired > 0:
-                actions.append({"type": "proposals_expired", "count": expired})
-        except Exception as e:
-            logger.warning("Proposal TTL cleanup failed: %s", e)
+            # 1. Propuestas activas con orden en el exchange (delta por watermark)
+            if _refresh_proposals(supabase, full, cost):
+                activity.append("proposals_changed")
+            check_exchange = full or bool(activity)
+
+            db_order_ids = {}
+            for p in _state.proposals.values():
+                oid = p.get("binance_order_id")
+                if oid:
+                    try:
+                        db_order_ids[int(oid)] = p
+                    except (ValueError, TypeError):
+                        logger.warning(f"Invalid binance_order_id '{oid}' in proposal {p.get('id')}")
+            for oid in list(_state.verified_orders):
+                if oid not in db_order_ids:
+                    del _state.verified_orders[oid]
+
+            # Open positions (también para reconocer sus órdenes de protección OCO)
+            book = get_position_book()
+            if book.loaded:
+                open_positions = book.open_positions()
+            else:
+                pos_resp = supabase.table("positions").select("*").eq("status", "open").execute()
+                open_positions = pos_resp.data or []
+            positions_synced = len(open_positions)
+
+            if check_exchange:
+                divergences.extend(await _check_exchange(db_order_ids, open_positions, cost, minimal_balance))
+                orders_synced = len(db_order_ids)
+
+            # 2. Expire stale proposals (TTL >1h) — un solo UPDATE
+            try:
+                expired = await _expire_stale_proposals(supabase)
+                if expired > 0:
+                    actions.append({"type": "proposals_expired", "count": expired})
+            except Exception as e:
+                logger.warning("Proposal TTL cleanup failed: %s", e)
 
-        # 6. Get balance snapshot
-        balance_snapshot = {}
-        try:
-            account = await binance_client.get_account()
-            balance_snapshot = {
-                b["asset"]: {
-                    "free": float(b["free"]),
-                    "locked": float(b["locked"]),
-                }
-                for b in account.get("balances", [])
-                if float(b["free"]) > 0 or float(b["locked"]) > 0
-            }
         except Exception as e:
-            logger.warning(f"Could not fetch balance snapshot: {e}")
-
-        # 6b. Cross-check DB positions vs Binance balances
-        if balance_snapshot and open_positions:
-            db_asset_qty = {}
-            for p in open_positions:
-                base = p["symbol"].replace("USDT", "").replace("BUSD", "")
-                db_asset_qty[base] = db_asset_qty.get(base, 0) + float(p["current_quantity"])
-
-            for asset, db_qty in db_asset_qty.items():
-                binance_bal = balance_snapshot.get(asset, {})
-                exchange_qty = binance_bal.get("free", 0) + binance_bal.get("locked", 0)
-                diff = abs(db_qty - exchange_qty)
-                tolerance = max(db_qty * 0.05, 0.0001)
-                if diff > tolerance:
-                    divergences.append({
-                        "type": "balance_mismatch",
-                        "symbol": f"{asset}USDT",
-                        "detail": f"DB={db_qty:.6f} vs Exchange={exchange_qty:.6f} (diff={diff:.6f})",
-                    })
-
-        duration_ms = int((time.time() - start) * 1000)
-
-        # Minimal balance snapshot for audit: USDT + active trading symbols only.
-        # Audit 2026-04-12: full balances (~320 assets) × 1440 runs/day × 7d =
-        # reconciliation_runs consumed 210 MB (44% of Supabase free tier).
-        # Keep only what's useful for diagnostics.
-        minimal_balance: dict = {}
-        if balance_snapshot:
+            duration_ms = int((time.time() - start) * 1000)
+            logger.error(f"Reconciliation error: {e}")
+            _state.last_run = time.monotonic()
+            _state.interval = float(settings.reconciliation_fast_seconds)
+            _state.pending.extend(activity)  # reintentar el chequeo en la próxima corrida
+            run_id = None
             try:
-                active_bases = {
-                    s.strip().replace("USDT", "").replace("BUSD", "")
-                    for s in settings.quant_symbols.split(",") if s.strip()
-                }
-                keep = active_bases | {"USDT", "BUSD"}
-                minimal_balance = {k: v for k, v in balance_snapshot.items() if k in keep}
-            except Exception:
-                minimal_balance = {}
-
-        # 7. Update run record
-        if run_id:
-            supabase.table("reconciliation_runs").update({
-                "orders_synced": orders_synced,
-                "positions_synced": positions_synced,
-                "divergences_found": len(divergences),
-                # Only persist divergence_details when non-empty (most runs have 0)
-                "divergence_details": divergences if divergences else None,
-                "actions_taken": actions if actions else None,
-                "balance_snapshot": minimal_balance,
-                "status": "success",
+                run_id = _insert_run(supabase, {
+                    "broker_adapter": f"spot_{settings.binance_env}",
+                    "status": "error",
+                    "error_message": str(e),
+                    "duration_ms": duration_ms,
+                    "mode": mode,
+                    "cost": {**cost, "db_queries": scope.total.count},
+                })
+            except Exception as insert_err:
+                logger.error(f"Could not record reconciliation error: {insert_err}")
+            return {
+                "run_id": run_id,
+                "status": "error",
+                "error": str(e),
                 "duration_ms": duration_ms,
-            }).eq("id", run_id).execute()
-
-        # 8. Alert on divergences (max 1 Telegram alert per 30 min)
-        if divergences:
-            from .telegram_notifier import _is_on_cooldown, _mark_sent
-            cooldown_key = "reconciliation_alert"
-            if not _is_on_cooldown(cooldown_key):
-                msg = (
-                    f"<b>RECONCILIATION ALERT</b>\n"
-                    f"Divergences found: <b>{len(divergences)}</b>\n\n"
-                )
-                for d in divergences[:5]:
-                    msg += (
-                        f"- [{escape_html(d['type'].upper())}] "
-                        f"{escape_html(d.get('symbol', '?'))}: "
-                        f"{escape_html(d.get('detail', ''))}\n"
-                    )
-                if len(divergences) > 5:
-                    msg += f"\n... and {len(divergences) - 5} more"
-                sent = await send_telegram(msg)
-                if sent:
-                    _mark_sent(cooldown_key)
-                elif not sent:
-                    logger.warning("Failed to send Telegram reconciliation alert")
-
-        result = {
-            "run_id": run_id,
+            }
+
+        cost["db_queries"] = scope.total.count
+        cost["db_ms"] = round(scope.total.ms, 1)
+
+    _state.last_run = time.monotonic()
+    if full:
+        _state.last_full = _state.last_run
+    _state.interval = _next_interval(bool(activity))
+    duration_ms = int((time.time() - start) * 1000)
+    cost["duration_ms"] = duration_ms
+
+    # 3. Run record (una sola escritura por corrida)
+    run_id = None
+    try:
+        run_id = _insert_run(supabase, {
+            "broker_adapter": f"spot_{settings.binance_env}",
             "orders_synced": orders_synced,
             "positions_synced": positions_synced,
             "divergences_found": len(divergences),
-            "divergences": divergences,
-            "duration_ms": duration_ms,
+            # Only persist divergence_details when non-empty (most runs have 0)
+            "divergence_details": divergences if divergences else None,
+            "actions_taken": actions if actions else None,
+            "balance_snapshot": minimal_balance,
             "status": "success",
+            "duration_ms": duration_ms,
+            "mode": mode,
+            "cost": cost,
+        })
+    except Exception as e:
+        logger.error(f"Could not record reconciliation run: {e}")
+
+    # 4. Alert on divergences (max 1 Telegram alert per 30 min)
+    if divergences:
+        from .telegram_notifier import _is_on_cooldown, _mark_sent
+        cooldown_key = "reconciliation_alert"
+        if not _is_on_cooldown(cooldown_key):
+            msg = (
+                f"<b>RECONCILIATION ALERT</b>\n"
+                f"Divergences found: <b>{len(divergences)}</b>\n\n"
+            )
+            for d in divergences[:5]:
+                msg += (
+                    f"- [{escape_html(d['type'].upper())}] "
+                    f"{escape_html(d.get('symbol', '?'))}: "
+                    f"{escape_html(d.get('detail', ''))}\n"
+                )
+            if len(divergences) > 5:
+                msg += f"\n... and {len(divergences) - 5} more"
+            sent = await send_telegram(msg)
+            if sent:
+                _mark_sent(cooldown_key)
+            elif not sent:
+                logger.warning("Failed to send Telegram reconciliation alert")
+
+    result = {
+        "run_id": run_id,
+        "mode": mode,
+        "orders_synced": orders_synced,
+        "positions_synced": positions_synced,
+        "divergences_found": len(divergences),
+        "divergences": divergences,
+        "duration_ms": duration_ms,
+        "activity": activity,
+        "cost": cost,
+        "next_run_seconds": _state.interval,
+        "status": "success",
+    }
+    _state.history.append({k: v for k, v in result.items() if k != "divergences"})
+    if divergences:
+        logger.warning(f"Reconciliation found {len(divergences)} divergences")
+    else:
+        logger.info(
+            f"Reconciliation OK [{mode}] ({duration_ms}ms, {orders_synced} orders, {positions_synced} positions, "
+            f"{cost['db_queries']} queries, {cost['exchange_calls']} exchange calls, next in {_state.interval:.0f}s)"
+        )
+    return result
+
+
+async def _check_exchange(
+    db_order_ids: Dict[int, Dict[str, Any]],
+    open_positions: List[Dict[str, Any]],
+    cost: Dict[str, int],
+    minimal_balance: dict,
+) -> List[Dict[str, Any]]:
+    """Open orders, stale proposals and balances vs the exchange."""
+    divergences = []
+
+    exchange_orders = await binance_client.get_open_orders()
+    cost["exchange_calls"] += 1
+    exchange_order_ids = {o["orderId"] for o in exchange_orders}
+
+    protection_ids: Set[int] = set()
+    for p in open_positions:
+        for field_name in ("protection_sl_order_id", "protection_tp_order_id"):
+            if p.get(field_name):
+                protection_ids.add(int(p[field_name]))
+
+    # Orphan orders (on exchange but not in DB)
+    for eo in exchange_orders:
+        oid = eo.get("orderId")
+        if not oid:
+            logger.warning(f"Exchange order missing orderId: {eo}")
+            continue
+        if oid not in db_order_ids and oid not in protection_ids:
+            divergences.append({
+                "type": "orphan",
+                "order_id": oid,
+                "symbol": eo.get("symbol"),
+                "side": eo.get("side"),
+                "status": eo.get("status"),
+                "detail": "Order exists on exchange but has no matching proposal in DB",
+            })
+
+    # Stale proposals (DB has order_id but exchange shows filled/cancelled)
+    for oid, proposal in db_order_ids.items():
+        if oid in exchange_order_ids or proposal["status"] != "approved":
+            continue
+        try:
+            exchange_status = await _order_status(proposal["symbol"], oid, cost)
+        except Exception as e:
+            logger.warning(f"Could not check order {oid}: {e}")
+            continue
+        if exchange_status in TERMINAL_ORDER_STATUSES:
+            divergences.append({
+                "type": "stale",
+                "proposal_id": proposal["id"],
+                "order_id": oid,
+                "symbol": proposal["symbol"],
+                "db_status": proposal["status"],
+                "exchange_status": exchange_status,
+                "detail": f"Proposal approved but exchange order is {exchange_status}",
+            })
+
+    # Balance snapshot
+    balance_snapshot = {}
+    try:
+        account = await binance_client.get_account()
+        cost["exchange_calls"] += 1
+        get_account_state().observe(account)  # lectura fresca: sirve también como refresh del tick
+        balance_snapshot = {
+            b["asset"]: {
+                "free": float(b["free"]),
+                "locked": float(b["locked"]),
+            }
+            for b in account.get("balances", [])
+            if float(b["free"]) > 0 or float(b["locked"]) > 0
         }
-        if divergences:
-            logger.warning(f"Reconciliation found {len(divergences)} divergences")
-        else:
-            logger.info(f"Reconciliation OK ({duration_ms}ms, {orders_synced} orders, {positions_synced} positions)")
+    except Exception as e:
+        logger.warning(f"Could not fetch balance snapshot: {e}")
+
+    # Cross-check DB positions vs Binance balances
+    if balance_snapshot and open_positions:
+        db_asset_qty = {}
+        for p in open_positions:
+            base = p["symbol"].replace("USDT", "").replace("BUSD", "")
+            db_asset_qty[base] = db_asset_qty.get(base, 0) + float(p["current_quantity"])
+
+        for asset, db_qty in db_asset_qty.items():
+            binance_bal = balance_snapshot.get(asset, {})
+            exchange_qty = binance_bal.get("free", 0) + binance_bal.get("locked", 0)
+            diff = abs(db_qty - exchange_qty)
+            tolerance = max(db_qty * 0.05, 0.0001)
+            if diff > tolerance:
+                divergences.append({
+                    "type": "balance_mismatch",
+                    "symbol": f"{asset}USDT",
+                    "detail": f"DB={db_qty:.6f} vs Exchange={exchange_qty:.6f} (diff={diff:.6f})",
+                })
 
-        return result
+    # Minimal balance snapshot for audit: USDT + active trading symbols only.
+    # Audit 2026-04-12: full balances (~320 assets) × 1440 runs/day × 7d =
+    # reconciliation_runs consumed 210 MB (44% of Supabase free tier).
+    # Keep only what's useful for diagnostics.
+    if balance_snapshot:
+        try:
+            active_bases = {
+                s.strip().replace("USDT", "").replace("BUSD", "")
+                for s in settings.quant_symbols.split(",") if s.strip()
+            }
+            keep = active_bases | {"USDT", "BUSD"}
+            minimal_balance.update({k: v for k, v in balance_snapshot.items() if k in keep})
+        except Exception:
+            pass
 
-    except Exception as e:
-        duration_ms = int((time.time() - start) * 1000)
-        logger.error(f"Reconciliation error: {e}")
-        if run_id:
-            supabase.table("reconciliation_runs").update({
-                "status": "error",
-                "error_message": str(e),
-                "duration_ms": duration_ms,
-            }).eq("id", run_id).execute()
-        return {
-            "run_id": run_id,
-            "status": "error",
-            "error": str(e),
-            "duration_ms": duration_ms,
-        }
+    return divergences
 
 
 async def _expire_stale_proposals(supabase) -> int:
-    """Expire proposals older than 1 hour stuck in draft/validated/approved."""
-    from datetime import timedelta
+    """Expire proposals older than 1 hour stuck in draft/validated/approved (one UPDATE)."""
     cutoff = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
-
-    stale_statuses = ["draft", "validated", "approved"]
-    expired_count = 0
-
-    for status in stale_statuses:
-        resp = supabase.table("trade_proposals").select("id, symbol, type, status").eq(
-            "status", status
-        ).lt("created_at", cutoff).execute()
-
-        for proposal in (resp.data or []):
-            supabase.table("trade_proposals").update({
-                "status": "rejected",
-                "error_message": f"TTL expired: stuck in '{status}' for >1 hour",
-                "updated_at": datetime.now(timezone.utc).isoformat(),
-            }).eq("id", proposal["id"]).eq("status", status).execute()
-            expired_count += 1
-            logger.warning("Expired stale proposal %s (%s %s, was %s)",
-                           proposal["id"][:8], proposal["type"], proposal["symbol"], status)
-
-    return expired_count
+    resp = supabase.table("trade_proposals").update({
+        "status": "rejected",
+        "error_message": "TTL expired: stuck in draft/validated/approved for >1 hour",
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }).in_("status", STALE_STATUSES).lt("created_at", cutoff).execute()
+
+    expired = resp.data or []
+    for proposal in expired:
+        logger.warning("Expired stale proposal %s (%s %s)",
+                       str(proposal.get("id", ""))[:8], proposal.get("type"), proposal.get("symbol"))
+    return len(expired)
+
+
+def reconciliation_status() -> dict:
+    """Estado incremental + costo de las últimas corridas."""
+    return {
+        "interval_seconds": _state.interval,
+        "seconds_since_run": round(time.monotonic() - _state.last_run, 1) if _state.last_run else None,
+        "seconds_since_full": round(time.monotonic() - _state.last_full, 1) if _state.last_full else None,
+        "tracked_proposals": len(_state.proposals),
+        "verified_orders": len(_state.verified_orders),
+        "watermark": _state.watermark.isoformat() if _state.watermark else None,
+        "pending_activity": list(_state.pending),
+        "recent_runs": list(_state.history),
+    }
 
 
 async def get_latest_reconciliation() -> dict | None:
@@ -19,6 +19,7 @@ from ..db import get_supabase
 from ..config import settings
 from ..models.quant_models import MarketRegime
 from .technical_analysis import compute_indicators, _load_klines_df
+from . import write_behind
 
 logger = logging.getLogger(__name__)
 
@@ -147,11 +148,13 @@ def detect_regime(symbol: str, interval: str = "1h") -> Optional[MarketRegime]:
 
 
 def store_regime(regime: MarketRegime) -> None:
-    """Store/update regime in DB."""
-    supabase = get_supabase()
+    """Store/update regime in DB (vía write-behind si está corriendo)."""
     data = regime.model_dump()
     data["detected_at"] = datetime.now(timezone.utc).isoformat()
+    if write_behind.enqueue("market_regimes", data, on_conflict="symbol,interval"):
+        return
 
+    supabase = get_supabase()
     try:
         supabase.table("market_regimes").upsert(
             data, on_conflict="symbol,interval"
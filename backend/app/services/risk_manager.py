@@ -1,7 +1,8 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from ..models import RiskCheck, ValidationResult
 from ..db import get_supabase
 from ..config import settings
+from .position_book import get_position_book
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,150 +18,206 @@ def _risk_score(checks: List[RiskCheck], notional: float) -> float:
     return min(score, 100.0)
 
 
-async def validate_proposal(
-    trade_type: str,
-    symbol: str,
-    quantity: float,
-    notional: float,
-    current_price: float,
-    is_exit: bool = False,
-) -> ValidationResult:
-    """Run 5 base risk checks. is_exit=True bypasses entry-only checks (balance, positions, daily loss)."""
-    checks: List[RiskCheck] = []
-    supabase = get_supabase()
+# ── Checks puros (sin I/O) ──
+# validate_proposal y el motor de quant_risk evalúan los mismos checks sobre
+# los datos que cada uno cargó.
 
-    # 1. Position size — para exits solo verificamos que notional > 0 (sin límite superior)
+def check_position_size(notional: float, is_exit: bool) -> RiskCheck:
+    """Para exits solo verificamos que notional > 0 (sin límite superior)."""
     if is_exit:
         size_ok = notional > 0
-        checks.append(RiskCheck(
+        return RiskCheck(
             name="position_size",
             passed=size_ok,
             message=f"Exit size ${notional:.2f} {'ok' if size_ok else 'invalid (zero quantity)'}",
             value=notional,
             limit=0.0,
-        ))
-    else:
-        size_ok = settings.risk_min_position_size <= notional <= settings.risk_max_position_size
-        checks.append(RiskCheck(
-            name="position_size",
-            passed=size_ok,
-            message=f"Position size ${notional:.2f} {'ok' if size_ok else f'must be ${settings.risk_min_position_size}-${settings.risk_max_position_size}'}",
-            value=notional,
-            limit=settings.risk_max_position_size,
-        ))
+        )
+    size_ok = settings.risk_min_position_size <= notional <= settings.risk_max_position_size
+    return RiskCheck(
+        name="position_size",
+        passed=size_ok,
+        message=f"Position size ${notional:.2f} {'ok' if size_ok else f'must be ${settings.risk_min_position_size}-${settings.risk_max_position_size}'}",
+        value=notional,
+        limit=settings.risk_max_position_size,
+    )
 
-    # 2. Open positions count — no aplica para exits (están cerrando, no abriendo)
-    if not is_exit:
-        open_resp = supabase.table("positions").select("id").eq("status", "open").execute()
-        open_count = len(open_resp.data) if open_resp.data else 0
-        positions_ok = open_count < settings.risk_max_open_positions
-        checks.append(RiskCheck(
-            name="max_open_positions",
-            passed=positions_ok,
-            message=f"{open_count}/{settings.risk_max_open_positions} open positions",
-            value=float(open_count),
-            limit=float(settings.risk_max_open_positions),
-        ))
-    else:
-        checks.append(RiskCheck(
+
+def check_open_positions(open_count: int, is_exit: bool) -> RiskCheck:
+    """No aplica para exits (están cerrando, no abriendo)."""
+    if is_exit:
+        return RiskCheck(
             name="max_open_positions",
             passed=True,
             message="Exit: positions count check skipped",
-        ))
+        )
+    positions_ok = open_count < settings.risk_max_open_positions
+    return RiskCheck(
+        name="max_open_positions",
+        passed=positions_ok,
+        message=f"{open_count}/{settings.risk_max_open_positions} open positions",
+        value=float(open_count),
+        limit=float(settings.risk_max_open_positions),
+    )
 
-    # 3. Symbol concentration — solo para nuevas entradas
-    if trade_type.lower() == "buy" and not is_exit:
-        sym_resp = supabase.table("positions").select("id").eq("symbol", symbol).eq("status", "open").execute()
-        sym_count = len(sym_resp.data) if sym_resp.data else 0
-        sym_ok = sym_count < settings.risk_max_positions_per_symbol
+
+def check_symbol_concentration(symbol: str, sym_count: int) -> RiskCheck:
+    sym_ok = sym_count < settings.risk_max_positions_per_symbol
+    return RiskCheck(
+        name="symbol_concentration",
+        passed=sym_ok,
+        message=f"{'No existing' if sym_ok else 'Already have'} position in {symbol}",
+        value=float(sym_count),
+        limit=float(settings.risk_max_positions_per_symbol),
+    )
+
+
+def check_account(
+    usdt_free: Optional[float],
+    notional: float,
+    open_rows: List[Dict[str, Any]],
+    is_exit: bool,
+) -> List[RiskCheck]:
+    """Balance + utilization. ``usdt_free=None``: la cuenta no se pudo leer."""
+    if usdt_free is None:
+        return [RiskCheck(name="account_balance", passed=True, message="Balance check skipped (proxy unavailable)")]
+
+    checks: List[RiskCheck] = []
+    if is_exit:
+        # No necesitamos USDT para vender — solo skip
         checks.append(RiskCheck(
-            name="symbol_concentration",
-            passed=sym_ok,
-            message=f"{'No existing' if sym_ok else 'Already have'} position in {symbol}",
-            value=float(sym_count),
-            limit=float(settings.risk_max_positions_per_symbol),
+            name="account_balance",
+            passed=True,
+            message=f"Exit: balance check skipped (USDT free: ${usdt_free:.2f})",
+            value=usdt_free,
+            limit=0.0,
         ))
-
-    # 4. Account balance & utilization — para exits no se necesita USDT libre
-    try:
-        from . import binance_client
-        account = await binance_client.get_account()
-        balances = {b["asset"]: float(b["free"]) for b in account.get("balances", [])}
-        usdt_free = balances.get("USDT", 0.0)
-
-        if is_exit:
-            # No necesitamos USDT para vender — solo skip
-            checks.append(RiskCheck(
-                name="account_balance",
-                passed=True,
-                message=f"Exit: balance check skipped (USDT free: ${usdt_free:.2f})",
-                value=usdt_free,
-                limit=0.0,
-            ))
-        else:
-            balance_ok = usdt_free >= notional
-            checks.append(RiskCheck(
-                name="account_balance",
-                passed=balance_ok,
-                message=f"USDT available: ${usdt_free:.2f}, need ${notional:.2f}",
-                value=usdt_free,
-                limit=notional,
-            ))
-
-        # Utilization
-        total_in_positions = sum(
-            float(p.get("entry_notional", 0)) for p in (
-                supabase.table("positions").select("entry_notional").eq("status", "open").execute().data or []
-            )
-        )
-        total_balance = usdt_free + total_in_positions
-        utilization = total_in_positions / total_balance if total_balance > 0 else 0
-        util_ok = utilization < settings.risk_max_account_utilization
+    else:
+        balance_ok = usdt_free >= notional
         checks.append(RiskCheck(
-            name="account_utilization",
-            passed=util_ok,
-            message=f"Utilization {utilization*100:.1f}% (max {settings.risk_max_account_utilization*100:.0f}%)",
-            value=utilization,
-            limit=settings.risk_max_account_utilization,
+            name="account_balance",
+            passed=balance_ok,
+            message=f"USDT available: ${usdt_free:.2f}, need ${notional:.2f}",
+            value=usdt_free,
+            limit=notional,
         ))
-    except Exception as e:
-        logger.warning(f"Could not fetch account: {e}")
-        checks.append(RiskCheck(name="account_balance", passed=True, message="Balance check skipped (proxy unavailable)"))
 
-    # 5. Daily loss — exits deben poder cerrarse aunque se exceda el límite diario
+    total_in_positions = sum(float(p.get("entry_notional") or 0) for p in open_rows)
+    total_balance = usdt_free + total_in_positions
+    utilization = total_in_positions / total_balance if total_balance > 0 else 0
+    util_ok = utilization < settings.risk_max_account_utilization
+    checks.append(RiskCheck(
+        name="account_utilization",
+        passed=util_ok,
+        message=f"Utilization {utilization*100:.1f}% (max {settings.risk_max_account_utilization*100:.0f}%)",
+        value=utilization,
+        limit=settings.risk_max_account_utilization,
+    ))
+    return checks
+
+
+def check_daily_loss(daily_pnl: Optional[float], is_exit: bool) -> RiskCheck:
+    """Exits deben poder cerrarse aunque se exceda el límite diario."""
     if is_exit:
-        checks.append(RiskCheck(
+        return RiskCheck(
             name="daily_loss_limit",
             passed=True,
             message="Exit: daily loss check skipped (priority: close risk)",
-        ))
-    else:
-        try:
-            from datetime import date
-            today = date.today().isoformat()
-            snap_resp = supabase.table("account_snapshots").select("daily_pnl").eq("snapshot_date", today).execute()
-            daily_pnl = float(snap_resp.data[0]["daily_pnl"]) if snap_resp.data else 0.0
-            loss_ok = daily_pnl > -settings.risk_max_daily_loss
-            checks.append(RiskCheck(
-                name="daily_loss_limit",
-                passed=loss_ok,
-                message=f"Daily PnL: ${daily_pnl:.2f} (limit: -${settings.risk_max_daily_loss})",
-                value=daily_pnl,
-                limit=-settings.risk_max_daily_loss,
-            ))
-        except Exception as e:
-            logger.warning(f"Could not check daily loss: {e}")
-            checks.append(RiskCheck(name="daily_loss_limit", passed=True, message="Daily loss check skipped"))
+        )
+    if daily_pnl is None:
+        return RiskCheck(name="daily_loss_limit", passed=True, message="Daily loss check skipped")
+    return RiskCheck(
+        name="daily_loss_limit",
+        passed=daily_pnl > -settings.risk_max_daily_loss,
+        message=f"Daily PnL: ${daily_pnl:.2f} (limit: -${settings.risk_max_daily_loss})",
+        value=daily_pnl,
+        limit=-settings.risk_max_daily_loss,
+    )
 
-    all_passed = all(c.passed for c in checks)
-    rejection_reason = next((c.message for c in checks if not c.passed), None)
-    score = _risk_score(checks, notional)
-    auto_approved = all_passed and notional < settings.risk_auto_approval_threshold
 
+# ── Loaders ──
+
+def load_open_positions(supabase=None, ctx=None) -> List[Dict[str, Any]]:
+    """Posiciones abiertas: del tick, del book, o una sola query a la DB."""
+    if ctx is not None:
+        return ctx.open_positions
+    book = get_position_book()
+    if book.loaded:
+        return book.open_positions()
+    supabase = supabase or get_supabase()
+    return supabase.table("positions").select("id,symbol,entry_notional").eq("status", "open").execute().data or []
+
+
+def load_daily_pnl(supabase=None, ctx=None) -> float:
+    """PnL del día según ``account_snapshots`` (memoizado por tick con ``ctx``)."""
+    from datetime import date
+    today = date.today().isoformat()
+    supabase = supabase or get_supabase()
+
+    def _load_snapshot():
+        return supabase.table("account_snapshots").select("daily_pnl").eq("snapshot_date", today).execute().data
+
+    snap_rows = ctx.memo("daily_snapshot", _load_snapshot) if ctx is not None else _load_snapshot()
+    return float(snap_rows[0]["daily_pnl"]) if snap_rows else 0.0
+
+
+async def load_usdt_free() -> float:
+    from .account_state import get_account_state
+    account = await get_account_state().get_account()
+    balances = {b["asset"]: float(b["free"]) for b in account.get("balances", [])}
+    return balances.get("USDT", 0.0)
+
+
+def build_result(checks: List[RiskCheck], notional: float, extra_score: float = 0.0, **extra) -> ValidationResult:
+    all_passed = all(c.passed for c in checks)
     return ValidationResult(
         approved=all_passed,
-        auto_approved=auto_approved,
-        risk_score=score,
+        auto_approved=all_passed and notional < settings.risk_auto_approval_threshold,
+        risk_score=min(_risk_score(checks, notional) + extra_score, 100.0),
         checks=checks,
-        rejection_reason=rejection_reason,
+        rejection_reason=next((c.message for c in checks if not c.passed), None),
+        **extra,
     )
+
+
+async def validate_proposal(
+    trade_type: str,
+    symbol: str,
+    quantity: float,
+    notional: float,
+    current_price: float,
+    is_exit: bool = False,
+    ctx=None,
+) -> ValidationResult:
+    """Run 5 base risk checks. is_exit=True bypasses entry-only checks (balance, positions, daily loss).
+
+    Con ``ctx`` (TickContext) posiciones y snapshot diario salen del
+    contexto del tick: se consultan a lo sumo una vez por tick. La cuenta
+    sale de ``account_state`` (un refresh por tick + fills propios).
+    """
+    supabase = get_supabase()
+    checks: List[RiskCheck] = [check_position_size(notional, is_exit)]
+
+    open_rows = load_open_positions(supabase, ctx)
+    checks.append(check_open_positions(len(open_rows), is_exit))
+
+    if trade_type.lower() == "buy" and not is_exit:
+        sym_count = sum(1 for p in open_rows if p.get("symbol") == symbol)
+        checks.append(check_symbol_concentration(symbol, sym_count))
+
+    try:
+        usdt_free = await load_usdt_free()
+    except Exception as e:
+        logger.warning(f"Could not fetch account: {e}")
+        usdt_free = None
+    checks.extend(check_account(usdt_free, notional, open_rows, is_exit))
+
+    daily_pnl = None
+    if not is_exit:
+        try:
+            daily_pnl = load_daily_pnl(supabase, ctx)
+        except Exception as e:
+            logger.warning(f"Could not check daily loss: {e}")
+    checks.append(check_daily_loss(daily_pnl, is_exit))
+
+    return build_result(checks, notional)
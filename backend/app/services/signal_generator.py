@@ -31,8 +31,11 @@ from ..config import settings
 from ..db import get_supabase
 from . import binance_client
 from .entropy_filter import compute_entropy
+from . import latency_trace
+from .position_book import get_position_book
 from .regime_detector import detect_regime
 from .technical_analysis import compute_indicators
+from .tick_context import TickContext
 from ..utils.binance_utils import round_quantity as _round_quantity
 
 logger = logging.getLogger(__name__)
@@ -139,7 +142,7 @@ SELL_RSI_MIN = 65.0
 MAX_OPEN_POSITIONS = settings.risk_max_open_positions
 SIGNAL_COOLDOWN_MINUTES = 180
 
-def _cooled_down(symbol: str, signal_type: str, supabase=None) -> bool:
+def _cooled_down(symbol: str, signal_type: str, supabase=None, ctx: TickContext | None = None) -> bool:
     """Verifica cooldown consultando DB (sobrevive reinicios del proceso).
 
     Para señales BUY aplica dos checks:
@@ -147,7 +150,11 @@ def _cooled_down(symbol: str, signal_type: str, supabase=None) -> bool:
     2. Posiciones cerradas recientemente (POST_CLOSE_COOLDOWN_MINUTES, no overrideable).
        Esto previene re-entrada inmediata tras SL/TP cuando la posición lleva horas abierta
        y el cooldown de propuestas ya venció.
+
+    Con ``ctx`` se resuelve contra los proposals/cierres precargados del tick.
     """
+    if ctx is not None:
+        return ctx.cooled_down(symbol, signal_type)
     if supabase is None:
         return True
     try:
@@ -190,6 +197,15 @@ def _cooled_down(symbol: str, signal_type: str, supabase=None) -> bool:
         return True
 
 
+def _open_positions(supabase) -> list[dict]:
+    """Posiciones abiertas desde el position book; la DB sólo si el book no está cargado."""
+    book = get_position_book()
+    if book.loaded:
+        return book.open_positions()
+    resp = supabase.table("positions").select("id, symbol").eq("status", "open").execute()
+    return resp.data or []
+
+
 def _mark_signal(symbol: str, signal_type: str) -> None:
     pass  # El cooldown se lee desde DB; insertar el proposal ya actúa como marca
 
@@ -207,37 +223,40 @@ async def generate_signals() -> None:
     supabase = get_supabase()
     thresholds = _get_thresholds()
     # Use LLM-configured symbols if available, else settings default
+    override = None
     try:
         from .daily_analyst.config_bridge import load_active_config
         override = load_active_config()
         symbols_str = override.quant_symbols if override else settings.quant_symbols
     except Exception:
         symbols_str = settings.quant_symbols
-    symbols = symbols_str.split(",")
+    symbols = [s.strip().upper() for s in symbols_str.split(",") if s.strip()]
 
-    # ── ML signals (adicionales a las reglas técnicas) ──
-    await _generate_ml_signals(supabase)
+    # Posiciones, cooldowns y precios de todos los símbolos: una query por tabla
+    with latency_trace.span("tick_context"):
+        ctx = await TickContext.load(
+            supabase, symbols, thresholds, POST_CLOSE_COOLDOWN_MINUTES, llm_config=override,
+        )
 
-    for raw_symbol in symbols:
-        symbol = raw_symbol.strip().upper()
-        if not symbol:
-            continue
+    # ── ML signals (adicionales a las reglas técnicas) ──
+    await _generate_ml_signals(supabase, ctx=ctx)
 
-        # Refresh each symbol to keep position limits strict after auto-execution.
-        resp = supabase.table("positions").select("id, symbol").eq("status", "open").execute()
-        open_positions = resp.data or []
-        open_symbols = {p["symbol"] for p in open_positions}
-        open_count = len(open_positions)  # Total positions, NOT unique symbols
+    for symbol in symbols:
+        # El contexto refleja las ejecuciones de este mismo tick (límites estrictos).
+        open_symbols = ctx.open_symbols()
+        open_count = ctx.open_count()  # Total positions, NOT unique symbols
 
         try:
-            await _evaluate_symbol(supabase, symbol, open_symbols, open_count)
+            await _evaluate_symbol(supabase, symbol, open_symbols, open_count, ctx=ctx)
         except Exception as exc:
             logger.error("Signal generation error [%s]: %s", symbol, exc)
 
 
-async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_count: int) -> None:
+async def _evaluate_symbol(
+    supabase, symbol: str, open_symbols: set[str], open_count: int, ctx: TickContext | None = None
+) -> None:
     interval = settings.quant_primary_interval
-    t = _get_thresholds()  # Dynamic: LLM override or defaults
+    t = ctx.thresholds if ctx else _get_thresholds()  # Dynamic: LLM override or defaults
 
     indicators = compute_indicators(symbol, interval)
     if not indicators:
@@ -252,12 +271,15 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
     if rsi is None or macd_hist is None or adx is None:
         return
 
-    entropy_obj = compute_entropy(symbol, interval)
+    entropy_obj = ctx.reading("entropy", symbol, interval, compute_entropy) if ctx else compute_entropy(symbol, interval)
     entropy_ratio = entropy_obj.entropy_ratio if entropy_obj else 0.7
 
     try:
-        ticker = await binance_client.get_price(symbol)
-        current_price = float(ticker["price"])
+        if ctx:
+            current_price = await ctx.price(symbol)
+        else:
+            ticker = await binance_client.get_price(symbol)
+            current_price = float(ticker["price"])
     except Exception as exc:
         logger.warning("Price fetch failed [%s]: %s", symbol, exc)
         return
@@ -269,18 +291,24 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
         # ── Protection 1: Minimum hold time ──
         # Signal-based exits suppressed until position matures (SL/TP in fast_loop exempt)
         try:
-            pos_resp = (
-                supabase.table("positions")
-                .select("opened_at, entry_price")
-                .eq("symbol", symbol)
-                .eq("status", "open")
-                .order("opened_at", desc=True)
-                .limit(1)
-                .execute()
-            )
-            if pos_resp.data:
-                opened_at = datetime.fromisoformat(pos_resp.data[0]["opened_at"].replace("Z", "+00:00"))
-                entry_price = float(pos_resp.data[0]["entry_price"])
+            book = get_position_book()
+            if ctx:
+                latest = ctx.positions_for(symbol)[-1:]
+            elif book.loaded:
+                latest = book.open_positions(symbol)[-1:]
+            else:
+                latest = (
+                    supabase.table("positions")
+                    .select("opened_at, entry_price")
+                    .eq("symbol", symbol)
+                    .eq("status", "open")
+                    .order("opened_at", desc=True)
+                    .limit(1)
+                    .execute()
+                ).data
+            if latest:
+                opened_at = datetime.fromisoformat(latest[0]["opened_at"].replace("Z", "+00:00"))
+                entry_price = float(latest[0]["entry_price"])
                 hold_minutes = (datetime.now(timezone.utc) - opened_at).total_seconds() / 60
                 if hold_minutes < MIN_HOLD_MINUTES:
                     logger.debug("SELL suppressed [%s]: hold %.0fmin < %dmin minimum",
@@ -306,7 +334,7 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
         if pnl_pct < breakeven_gate:
             # Allow exit only if there's a STRONG regime reason (emergency protection)
             try:
-                regime = detect_regime(symbol, interval)
+                regime = _regime(symbol, interval, ctx)
             except Exception:
                 regime = None
             strong_regime_exit = (regime and regime.regime == "trending_down"
@@ -317,7 +345,7 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
                 return
         else:
             try:
-                regime = detect_regime(symbol, interval)
+                regime = _regime(symbol, interval, ctx)
             except Exception:
                 regime = None
 
@@ -335,7 +363,7 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
         hurst = float(hurst_raw) if isinstance(hurst_raw, (int, float)) else None
         hurst_exit = hurst is not None and hurst < 0.40 and rsi > 55
 
-        if (rsi_exit or regime_exit or hurst_exit) and _cooled_down(symbol, "sell", supabase):
+        if (rsi_exit or regime_exit or hurst_exit) and _cooled_down(symbol, "sell", supabase, ctx=ctx):
             trigger = "RSI-overbought" if rsi_exit else ("regime-flip" if regime_exit else "hurst-mean-revert")
             regime_str = f"{regime.regime}({regime.confidence:.0f}%)" if regime else "?"
             hurst_str = f", Hurst={hurst:.2f}" if hurst else ""
@@ -345,7 +373,7 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
                 f"PnL={pnl_pct*100:+.2f}%, Hold={hold_minutes:.0f}min"
             )
             logger.info("SELL signal [%s] %s", symbol, reasoning)
-            await _submit_proposal(supabase, "sell", symbol, current_price, reasoning)
+            await _submit_proposal(supabase, "sell", symbol, current_price, reasoning, ctx=ctx)
             _mark_signal(symbol, "sell")
         return
 
@@ -355,7 +383,7 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
 
     # Regime filter: DESACTIVADO para testing agresivo en testnet
     # En producción, descomentar para bloquear BUY en downtrend fuerte
-    regime = detect_regime(symbol, interval)
+    regime = _regime(symbol, interval, ctx)
     if regime and regime.regime == "trending_down" and regime.confidence > settings.buy_regime_confidence_min:
         logger.info("BUY blocked [%s]: downtrend (confidence=%.1f%% > %.0f%%)", symbol, regime.confidence, settings.buy_regime_confidence_min)
         return
@@ -398,7 +426,7 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
         and adx > t["buy_adx_min"]
         and entropy_ratio < t["buy_entropy_max"]
         and vol_ok
-        and _cooled_down(symbol, "buy", supabase)
+        and _cooled_down(symbol, "buy", supabase, ctx=ctx)
     ):
         regime_str = f"{regime.regime}({regime.confidence:.0f}%)" if regime else "unknown"
         reasoning = (
@@ -408,14 +436,28 @@ async def _evaluate_symbol(supabase, symbol: str, open_symbols: set[str], open_c
             f"{autocorr_info}, {sma_info}, Regime={regime_str}"
         )
         logger.info("BUY signal [%s] %s", symbol, reasoning)
-        await _submit_proposal(supabase, "buy", symbol, current_price, reasoning)
+        await _submit_proposal(supabase, "buy", symbol, current_price, reasoning, ctx=ctx)
         _mark_signal(symbol, "buy")
 
 
+def _regime(symbol: str, interval: str, ctx: TickContext | None):
+    """Régimen del tick (compartido con la validación de riesgo) o recalculado sin ctx."""
+    return ctx.reading("regime", symbol, interval, detect_regime) if ctx else detect_regime(symbol, interval)
+
+
 async def _submit_proposal(
-    supabase, trade_type: str, symbol: str, price: float, reasoning: str
+    supabase, trade_type: str, symbol: str, price: float, reasoning: str,
+    ctx: TickContext | None = None,
+) -> None:
+    """Create, validate, and optionally execute a proposal (traced from candle close to fill)."""
+    with latency_trace.proposal_trace(symbol) as trace:
+        await _create_proposal(supabase, trade_type, symbol, price, reasoning, ctx=ctx, trace=trace)
+
+
+async def _create_proposal(
+    supabase, trade_type: str, symbol: str, price: float, reasoning: str,
+    ctx: TickContext | None = None, trace: latency_trace.Trace | None = None,
 ) -> None:
-    """Create, validate, and optionally execute a proposal."""
     from .quant_risk import validate_proposal_enhanced
 
     if trade_type == "buy":
@@ -424,17 +466,23 @@ async def _submit_proposal(
         notional = max(symbol_notional, 10.0)
         quantity = _round_quantity(symbol, notional / price)
     else:
-        resp = (
-            supabase.table("positions")
-            .select("current_quantity")
-            .eq("symbol", symbol)
-            .eq("status", "open")
-            .order("opened_at")
-            .execute()
-        )
-        if not resp.data:
+        book = get_position_book()
+        if ctx:
+            held = ctx.positions_for(symbol)
+        elif book.loaded:
+            held = book.open_positions(symbol)
+        else:
+            held = (
+                supabase.table("positions")
+                .select("current_quantity")
+                .eq("symbol", symbol)
+                .eq("status", "open")
+                .order("opened_at")
+                .execute()
+            ).data
+        if not held:
             return
-        quantity = _round_quantity(symbol, float(resp.data[0]["current_quantity"]))
+        quantity = _round_quantity(symbol, float(held[0]["current_quantity"]))
 
     notional_val = quantity * price
     now = datetime.now(timezone.utc).isoformat()
@@ -455,21 +503,25 @@ async def _submit_proposal(
         "created_at": now,
         "updated_at": now,
     }
-    resp = supabase.table("trade_proposals").insert(insert).execute()
+    with latency_trace.span("insert"):
+        resp = supabase.table("trade_proposals").insert(insert).execute()
     if not resp.data:
         logger.error("Failed to insert %s proposal for %s", trade_type, symbol)
         return
 
     proposal_id = resp.data[0]["id"]
-
-    validation = await validate_proposal_enhanced(
-        trade_type=trade_type,
-        symbol=symbol,
-        quantity=quantity,
-        notional=notional_val,
-        current_price=price,
-        is_exit=(trade_type == "sell"),
-    )
+    latency_trace.attach(trace, proposal_id)
+
+    with latency_trace.span("validate"):
+        validation = await validate_proposal_enhanced(
+            trade_type=trade_type,
+            symbol=symbol,
+            quantity=quantity,
+            notional=notional_val,
+            current_price=price,
+            is_exit=(trade_type == "sell"),
+            ctx=ctx,
+        )
 
     if not validation.approved:
         new_status = "rejected"
@@ -478,18 +530,20 @@ async def _submit_proposal(
     else:
         new_status = "validated"
 
-    supabase.table("trade_proposals").update(
-        {
-            "status": new_status,
-            "risk_score": validation.risk_score,
-            "risk_checks": [c.model_dump() for c in validation.checks],
-            "auto_approved": validation.auto_approved,
-            "validated_at": now,
-            "updated_at": now,
-            **({"approved_at": now} if new_status == "approved" else {}),
-            **({"rejected_at": now} if new_status == "rejected" else {}),
-        }
-    ).eq("id", proposal_id).execute()
+    with latency_trace.span("persist_validation"):
+        supabase.table("trade_proposals").update(
+            {
+                "status": new_status,
+                "risk_score": validation.risk_score,
+                "risk_checks": [c.model_dump() for c in validation.checks],
+                "auto_approved": validation.auto_approved,
+                "validated_at": now,
+                "updated_at": now,
+                **({"approved_at": now} if new_status == "approved" else {}),
+                **({"rejected_at": now} if new_status == "rejected" else {}),
+            }
+        ).eq("id", proposal_id).execute()
+        latency_trace.persist_trace(supabase, "trade_proposals", proposal_id)
 
     logger.info(
         "Auto-proposal [%s %s] qty=%s @ $%0.2f -> %s (risk=%0.1f)",
@@ -509,13 +563,14 @@ async def _submit_proposal(
             "validated": "[REVIEW]",
             "rejected": "[BLOCK]",
         }.get(new_status, "[INFO]")
-        sent = await send_telegram(
-            f"{status_icon} <b>AUTO-SIGNAL: {escape_html(trade_type.upper())} {escape_html(symbol)}</b>\n"
-            f"Price: ${price:,.2f}\n"
-            f"Quantity: {quantity} | Notional: ${notional_val:.2f}\n"
-            f"Status: <b>{escape_html(new_status)}</b> | Risk: {validation.risk_score:.1f}\n"
-            f"Reason: {escape_html(reasoning)}"
-        )
+        with latency_trace.span("notify"):
+            sent = await send_telegram(
+                f"{status_icon} <b>AUTO-SIGNAL: {escape_html(trade_type.upper())} {escape_html(symbol)}</b>\n"
+                f"Price: ${price:,.2f}\n"
+                f"Quantity: {quantity} | Notional: ${notional_val:.2f}\n"
+                f"Status: <b>{escape_html(new_status)}</b> | Risk: {validation.risk_score:.1f}\n"
+                f"Reason: {escape_html(reasoning)}"
+            )
         if not sent:
             logger.warning(
                 "Failed to send Telegram AUTO-SIGNAL for %s %s (proposal %s)",
@@ -526,14 +581,23 @@ async def _submit_proposal(
     except Exception:
         logger.exception("Unexpected error sending Telegram AUTO-SIGNAL")
 
+    executed = False
     if new_status == "approved" and settings.trading_enabled:
         from .executor import execute_proposal
 
         result = await execute_proposal(proposal_id)
         logger.info("Auto-execute result: %s", result)
+        executed = bool(result.get("success")) if isinstance(result, dict) else bool(result)
 
+    if ctx:
+        ctx.note_proposal(
+            {"id": proposal_id, "symbol": symbol, "type": trade_type, "status": new_status, "created_at": now,
+             "quantity": quantity, "price": price, "notional": notional_val},
+            executed=executed,
+        )
 
-async def _generate_ml_signals(supabase) -> None:
+
+async def _generate_ml_signals(supabase, ctx: TickContext | None = None) -> None:
     """Genera señales adicionales usando el modelo ML (LightGBM).
 
     Las señales ML complementan las reglas técnicas. Se aplican los mismos
@@ -554,8 +618,7 @@ async def _generate_ml_signals(supabase) -> None:
         return
 
     # Verificar estado de posiciones — total positions, NOT unique symbols
-    resp = supabase.table("positions").select("id, symbol").eq("status", "open").execute()
-    open_positions = resp.data or []
+    open_positions = ctx.open_positions if ctx else _open_positions(supabase)
     open_symbols = {p["symbol"] for p in open_positions}
     open_count = len(open_positions)
 
@@ -571,19 +634,22 @@ async def _generate_ml_signals(supabase) -> None:
                 continue
             if open_count >= MAX_OPEN_POSITIONS:
                 continue
-            if not _cooled_down(symbol, "buy", supabase):
+            if not _cooled_down(symbol, "buy", supabase, ctx=ctx):
                 continue
         elif signal_type == "sell":
             if symbol not in open_symbols:
                 continue
-            if not _cooled_down(symbol, "sell", supabase):
+            if not _cooled_down(symbol, "sell", supabase, ctx=ctx):
                 continue
         else:
             continue
 
         try:
-            ticker = await binance_client.get_price(symbol)
-            current_price = float(ticker["price"])
+            if ctx:
+                current_price = await ctx.price(symbol)
+            else:
+                ticker = await binance_client.get_price(symbol)
+                current_price = float(ticker["price"])
         except Exception:
             continue
 
@@ -593,7 +659,7 @@ async def _generate_ml_signals(supabase) -> None:
         )
         logger.info("ML %s signal [%s] %s", signal_type.upper(), symbol, reasoning)
 
-        await _submit_proposal(supabase, signal_type, symbol, current_price, reasoning)
+        await _submit_proposal(supabase, signal_type, symbol, current_price, reasoning, ctx=ctx)
 
         if signal_type == "buy":
             open_count += 1
@@ -27,7 +27,6 @@ import pandas as pd
 import pandas_ta_classic as ta
 
 from ..config import settings
-from ..db import get_supabase
 
 logger = logging.getLogger(__name__)
 
@@ -194,45 +193,20 @@ def _apply_fees(entry: float, exit_price: float) -> float:
 
 # ── Carga de datos ──────────────────────────────────────────────────
 async def _load_klines(symbol: str, interval: str = "1h", days: int = 365) -> pd.DataFrame:
-    """Cargar klines históricas de Supabase."""
-    supabase = get_supabase()
-    limit = days * 24 if interval == "1h" else days * 24 * 60
-
-    # Paginar: Supabase tiene límite de 1000 por request
-    all_data = []
-    offset = 0
-    page_size = 1000
-
-    while True:
-        resp = (
-            supabase.table("klines_ohlcv")
-            .select("open_time, open, high, low, close, volume, quote_volume")
-            .eq("symbol", symbol)
-            .eq("interval", interval)
-            .order("open_time", desc=False)
-            .range(offset, offset + page_size - 1)
-            .execute()
-        )
-        if not resp.data:
-            break
-        all_data.extend(resp.data)
-        if len(resp.data) < page_size:
-            break
-        offset += page_size
-
-    if not all_data:
+    """Cargar klines históricas de Supabase (últimas ``days * 24`` velas, paginación keyset)."""
+    from .bulk_reader import read_klines
+    from .kline_arrays import to_frame
+
+    batch = read_klines(
+        symbol, interval,
+        columns=["open_time", "open", "high", "low", "close", "volume", "quote_volume"],
+        limit=days * 24 if days else None,
+        descending=True,
+    )
+    if len(batch) == 0:
         raise ValueError(f"No klines data for {symbol} {interval}")
 
-    df = pd.DataFrame(all_data)
-    for col in ["open", "high", "low", "close", "volume", "quote_volume"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    df["open_time"] = pd.to_datetime(df["open_time"])
-    df.set_index("open_time", inplace=True)
-    df.sort_index(inplace=True)
-
-    # Limitar a los últimos N días
-    if days and len(df) > days * 24:
-        df = df.iloc[-(days * 24):]
+    df = to_frame(batch, ["open", "high", "low", "close", "volume", "quote_volume"])
 
     logger.info("Loaded %d klines for %s %s (%s → %s)",
                 len(df), symbol, interval,
@@ -13,10 +13,14 @@ import pandas_ta_classic as ta
 from ..db import get_supabase
 from ..config import settings
 from ..models.quant_models import TechnicalIndicators
+from .kline_arrays import from_db_rows, to_frame
 from .quant_cache import get_kline_cache, get_indicator_cache
+from . import write_behind
 
 logger = logging.getLogger(__name__)
 
+_OHLCV_COLUMNS = ["open", "high", "low", "close", "volume", "quote_volume"]
+
 
 def _load_klines_df(symbol: str, interval: str, limit: int = 500) -> Optional[pd.DataFrame]:
     """Load klines from DB into a pandas DataFrame. Uses cache."""
@@ -29,7 +33,7 @@ def _load_klines_df(symbol: str, interval: str, limit: int = 500) -> Optional[pd
     supabase = get_supabase()
     resp = (
         supabase.table("klines_ohlcv")
-        .select("open_time,open,high,low,close,volume,quote_volume")
+        .select("open_time," + ",".join(_OHLCV_COLUMNS))
         .eq("symbol", symbol)
         .eq("interval", interval)
         .order("open_time", desc=True)
@@ -42,11 +46,7 @@ def _load_klines_df(symbol: str, interval: str, limit: int = 500) -> Optional[pd
     data = resp.data
     data.reverse()  # Oldest first
 
-    df = pd.DataFrame(data)
-    df["open_time"] = pd.to_datetime(df["open_time"])
-    for col in ["open", "high", "low", "close", "volume", "quote_volume"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    df.set_index("open_time", inplace=True)
+    df = to_frame(from_db_rows(data), _OHLCV_COLUMNS)
 
     cache.set(cache_key, df, ttl=60)
     return df
@@ -160,12 +160,14 @@ def compute_indicators(symbol: str, interval: str = "1h") -> Optional[TechnicalI
 
 
 def store_indicators(indicators: TechnicalIndicators) -> None:
-    """Store the latest indicator snapshot in DB."""
-    supabase = get_supabase()
+    """Store the latest indicator snapshot in DB (vía write-behind si está corriendo)."""
     data = indicators.model_dump(exclude_none=False)
     data["candle_time"] = indicators.candle_time.isoformat()
     data["calculated_at"] = datetime.now(timezone.utc).isoformat()
+    if write_behind.enqueue("technical_indicators", data, on_conflict="symbol,interval,candle_time"):
+        return
 
+    supabase = get_supabase()
     try:
         supabase.table("technical_indicators").upsert(
             data, on_conflict="symbol,interval,candle_time"
@@ -0,0 +1,231 @@
+"""Per-tick context for signal generation.
+
+``generate_signals`` evaluaba cada símbolo por separado: posiciones
+abiertas, dos queries de cooldown, precio de Binance, config LLM, y después
+``validate_proposal`` pedía cuenta, PnL diario y estadísticas de trades por
+cada proposal. El costo en round trips crecía con la cantidad de símbolos.
+
+``TickContext`` carga al inicio del tick, con una query por tabla, todo lo
+que la generación de señales necesita:
+
+- posiciones abiertas (del position book, sin DB si está cargado),
+- posiciones cerradas dentro de la ventana post-close,
+- proposals creados dentro de la ventana de cooldown,
+- precios de todos los símbolos en un solo request a Binance.
+
+Lo demás (snapshot diario, stats de trades, entropía/régimen, sizing) se
+memoiza la primera vez que alguien lo pide dentro del tick; la cuenta sale
+de ``account_state``. Los proposals creados durante el tick se registran en
+el contexto para que los cooldowns los vean sin volver a consultar.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from . import binance_client
+from .position_book import get_position_book
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_ts(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class TickContext:
+    """Snapshot de estado compartido por todos los símbolos de un tick."""
+
+    now: datetime
+    symbols: List[str]
+    thresholds: Dict[str, Any]
+    closed_window_minutes: int
+    llm_config: Any = None
+    recent_proposals: List[Dict[str, Any]] = field(default_factory=list)
+    recently_closed: List[Dict[str, Any]] = field(default_factory=list)
+    prices: Dict[str, float] = field(default_factory=dict)
+    _positions: Optional[List[Dict[str, Any]]] = None
+    _memo: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    async def load(
+        cls,
+        supabase,
+        symbols: List[str],
+        thresholds: Dict[str, Any],
+        closed_window_minutes: int,
+        llm_config: Any = None,
+    ) -> "TickContext":
+        now = datetime.now(timezone.utc)
+        ctx = cls(
+            now=now,
+            symbols=symbols,
+            thresholds=thresholds,
+            closed_window_minutes=closed_window_minutes,
+            llm_config=llm_config,
+        )
+
+        book = get_position_book()
+        if not book.loaded:
+            resp = supabase.table("positions").select("*").eq("status", "open").execute()
+            ctx._positions = resp.data or []
+
+        # Cooldowns: si la DB falla se permite la señal (como el check por símbolo anterior)
+        proposal_cutoff = (now - timedelta(minutes=thresholds["signal_cooldown_minutes"])).isoformat()
+        try:
+            ctx.recent_proposals = (
+                supabase.table("trade_proposals")
+                .select("id, symbol, type, status, created_at")
+                .gte("created_at", proposal_cutoff)
+                .execute()
+            ).data or []
+        except Exception as e:
+            logger.warning(f"Cooldown prefetch (proposals) failed: {e} — permitiendo señales")
+
+        closed_cutoff = (now - timedelta(minutes=closed_window_minutes)).isoformat()
+        try:
+            ctx.recently_closed = (
+                supabase.table("positions")
+                .select("id, symbol, closed_at")
+                .eq("status", "closed")
+                .gte("closed_at", closed_cutoff)
+                .execute()
+            ).data or []
+        except Exception as e:
+            logger.warning(f"Cooldown prefetch (closed positions) failed: {e} — permitiendo señales")
+
+        if symbols:
+            try:
+                tickers = await binance_client.get_prices(symbols)
+                ctx.prices = {t["symbol"]: float(t["price"]) for t in tickers}
+            except Exception as e:
+                logger.warning(f"Bulk price fetch failed, falling back to per-symbol: {e}")
+        return ctx
+
+    # ── Posiciones ─────────────────────────────────────────────────────
+
+    @property
+    def open_positions(self) -> List[Dict[str, Any]]:
+        """Posiciones abiertas al momento (el book refleja lo ejecutado en este tick)."""
+        if self._positions is None:
+            return get_position_book().open_positions()
+        return list(self._positions)
+
+    def open_symbols(self) -> set[str]:
+        return {p["symbol"] for p in self.open_positions}
+
+    def open_count(self) -> int:
+        return len(self.open_positions)
+
+    def positions_for(self, symbol: str) -> List[Dict[str, Any]]:
+        """Posiciones abiertas de un símbolo, la más vieja primero."""
+        rows = [p for p in self.open_positions if p.get("symbol") == symbol]
+        rows.sort(key=lambda p: p.get("opened_at") or "")
+        return rows
+
+    # ── Cooldowns ──────────────────────────────────────────────────────
+
+    def cooled_down(self, symbol: str, signal_type: str) -> bool:
+        """Misma semántica que ``signal_generator._cooled_down`` sin ir a la DB."""
+        cutoff = self.now - timedelta(minutes=self.thresholds["signal_cooldown_minutes"])
+        for p in self.recent_proposals:
+            if p.get("symbol") != symbol or p.get("type") != signal_type:
+                continue
+            created = _parse_ts(p.get("created_at"))
+            if created is None or created >= cutoff:
+                return False
+
+        if signal_type == "buy":
+            close_cutoff = self.now - timedelta(minutes=self.closed_window_minutes)
+            for p in self.recently_closed:
+                closed = _parse_ts(p.get("closed_at"))
+                if p.get("symbol") == symbol and (closed is None or closed >= close_cutoff):
+                    return False
+        return True
+
+    def note_proposal(self, proposal: Dict[str, Any], executed: bool = False) -> None:
+        """Registrar un proposal creado en este tick (cooldowns / posiciones / cuenta)."""
+        self.recent_proposals.append(proposal)
+        if not executed:
+            return
+        # el balance cambió: el sizing recomendado también
+        for key in [k for k in self._memo if k == "account" or k.startswith("sizing:")]:
+            del self._memo[key]
+        symbol = proposal["symbol"]
+        if proposal.get("type") != "buy":
+            # cooldown post-cierre: un BUY del mismo símbolo en este tick no pasa
+            self.recently_closed.append({"symbol": symbol, "closed_at": self.now.isoformat()})
+        if self._positions is not None:
+            if proposal.get("type") == "buy":
+                # exposición real: la cuentan la utilización de check_account y el VaR del portfolio
+                self._positions.append(_executed_position(proposal))
+            else:
+                held = self.positions_for(symbol)[:1]
+                self._positions = [p for p in self._positions if not held or p is not held[0]]
+
+    # ── Datos de mercado / cuenta ──────────────────────────────────────
+
+    async def price(self, symbol: str) -> float:
+        if symbol not in self.prices:
+            ticker = await binance_client.get_price(symbol)
+            self.prices[symbol] = float(ticker["price"])
+        return self.prices[symbol]
+
+    def reading(self, kind: str, symbol: str, interval: str, compute: Callable[[str, str], Any]) -> Any:
+        """Entropía / régimen de un símbolo: una vez por tick.
+
+        Si el quant tick ya lo calculó hace poco se usa ese snapshot; si no,
+        ``compute(symbol, interval)``. Señales y validación de riesgo ven la
+        misma lectura.
+        """
+        key = f"{kind}:{symbol}:{interval}"
+        if key not in self._memo:
+            from .quant_orchestrator import latest_reading
+            snap = latest_reading(kind, symbol, interval)
+            self._memo[key] = snap if snap is not None else compute(symbol, interval)
+        return self._memo[key]
+
+    def memo(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Valor cargado una sola vez por tick (ej. snapshot diario, stats de trades)."""
+        if key not in self._memo:
+            self._memo[key] = loader()
+        return self._memo[key]
+
+    async def memo_async(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if key not in self._memo:
+            self._memo[key] = await loader()
+        return self._memo[key]
+
+
+def _executed_position(proposal: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de la posición abierta por un BUY de este tick.
+
+    La que insertó el executor (el book la registra aunque no esté cargado);
+    si no aparece, una equivalente armada con la cantidad y el precio del proposal.
+    """
+    proposal_id = str(proposal.get("id"))
+    for row in get_position_book().open_positions(proposal["symbol"]):
+        if str(row.get("entry_proposal_id")) == proposal_id:
+            return row
+    qty = float(proposal.get("quantity") or 0)
+    price = float(proposal.get("price") or 0)
+    return {
+        "id": proposal.get("id"),
+        "symbol": proposal["symbol"],
+        "entry_proposal_id": proposal_id,
+        "entry_price": price,
+        "entry_quantity": qty,
+        "current_quantity": qty,
+        "entry_notional": float(proposal.get("notional") or qty * price),
+        "opened_at": proposal.get("created_at"),
+    }
@@ -0,0 +1,424 @@
+"""Incrementally maintained trade statistics.
+
+``position_sizer._get_trade_stats``, ``portfolio.get_portfolio_state`` y
+``_update_performance_metrics`` leían todas las posiciones cerradas para
+calcular win rate, promedios y PnL: el costo crecía con la historia.
+
+Acá cada cierre actualiza agregados en memoria y en ``trade_aggregates``:
+
+- scopes: total (``all/*``), por símbolo y por estrategia;
+- buckets: ``all`` (toda la historia) y uno por día UTC de cierre. Las
+  ventanas rolling (7d/30d) son la combinación de a lo sumo 30 buckets
+  diarios, así que leer cualquier métrica es O(1) respecto a la historia.
+
+``TradeAggregate`` guarda sumas (PnL, retornos, cuadrados) y los prefijos
+de PnL acumulado (pico, valle, drawdown), que se pueden combinar en orden:
+agregar un trade o fusionar dos períodos da exactamente lo mismo que
+recalcular desde las filas. ``rebuild()`` recalcula todo desde ``positions``
+y reporta diferencias (``python rebuild_trade_stats.py``).
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..config import settings
+from ..db import get_supabase
+
+logger = logging.getLogger(__name__)
+
+TABLE = "trade_aggregates"
+CONFLICT = ("scope", "scope_key", "bucket")
+ALL = "all"
+ROLLING_DAYS = 30            # buckets diarios que se mantienen en memoria
+RETRY_SECONDS = 600          # espera entre intentos de carga fallidos
+ANNUALIZATION = 252
+_EPS = 1e-12
+
+ScopeKey = Tuple[str, str]   # (scope, scope_key)
+
+
+def _trade_return(pnl: float, notional: Any) -> float:
+    n = float(notional or 0) or 1.0
+    return pnl / n if n > 0 else 0.0
+
+
+def _bucket_for(closed_at: Optional[str]) -> Optional[str]:
+    if not closed_at:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(closed_at).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.date().isoformat()
+
+
+def scopes_for(position: Dict[str, Any]) -> List[ScopeKey]:
+    keys: List[ScopeKey] = [(ALL, "*")]
+    if position.get("symbol"):
+        keys.append(("symbol", position["symbol"]))
+    if position.get("strategy_id"):
+        keys.append(("strategy", str(position["strategy_id"])))
+    return keys
+
+
+@dataclass
+class TradeAggregate:
+    """Sufficient statistics of a sequence of closed trades (in close order)."""
+
+    trades: int = 0
+    wins: int = 0
+    losses: int = 0
+    pnl_sum: float = 0.0
+    return_sum: float = 0.0
+    return_sq_sum: float = 0.0
+    win_return_sum: float = 0.0
+    loss_return_sum: float = 0.0      # suma de |r| de los trades perdedores
+    loss_return_sq_sum: float = 0.0
+    # Prefijos de PnL acumulado sobre prefijos no vacíos (misma semántica que
+    # np.maximum.accumulate(np.cumsum(pnls)))
+    pnl_peak: float = 0.0
+    pnl_trough: float = 0.0
+    max_drawdown: float = 0.0         # <= 0
+    last_closed_at: Optional[str] = None
+
+    @classmethod
+    def single(cls, pnl: float, notional: Any, closed_at: Optional[str] = None) -> "TradeAggregate":
+        r = _trade_return(pnl, notional)
+        return cls(
+            trades=1,
+            wins=int(r > 0),
+            losses=int(r < 0),
+            pnl_sum=pnl,
+            return_sum=r,
+            return_sq_sum=r * r,
+            win_return_sum=r if r > 0 else 0.0,
+            loss_return_sum=-r if r < 0 else 0.0,
+            loss_return_sq_sum=r * r if r < 0 else 0.0,
+            pnl_peak=pnl,
+            pnl_trough=pnl,
+            max_drawdown=0.0,
+            last_closed_at=closed_at,
+        )
+
+    @classmethod
+    def from_trades(cls, rows: Iterable[Dict[str, Any]]) -> "TradeAggregate":
+        """Agregado de filas de ``positions`` (ya ordenadas por cierre)."""
+        agg = cls()
+        for row in rows:
+            agg.add(float(row.get("realized_pnl", 0) or 0), row.get("entry_notional"), row.get("closed_at"))
+        return agg
+
+    def add(self, pnl: float, notional: Any, closed_at: Optional[str] = None) -> None:
+        self.merge(TradeAggregate.single(pnl, notional, closed_at))
+
+    def merge(self, other: "TradeAggregate") -> None:
+        """Append ``other`` (later trades) to this aggregate, in place."""
+        if other.trades == 0:
+            return
+        if self.trades == 0:
+            for f in fields(self):
+                setattr(self, f.name, getattr(other, f.name))
+            return
+        offset = self.pnl_sum
+        self.max_drawdown = min(self.max_drawdown, other.max_drawdown, offset + other.pnl_trough - self.pnl_peak)
+        self.pnl_peak = max(self.pnl_peak, offset + other.pnl_peak)
+        self.pnl_trough = min(self.pnl_trough, offset + other.pnl_trough)
+        for name in ("trades", "wins", "losses", "pnl_sum", "return_sum", "return_sq_sum",
+                     "win_return_sum", "loss_return_sum", "loss_return_sq_sum"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        if other.last_closed_at:
+            self.last_closed_at = other.last_closed_at
+
+    def copy(self) -> "TradeAggregate":
+        return TradeAggregate(**{f.name: getattr(self, f.name) for f in fields(self)})
+
+    # ── Métricas derivadas ─────────────────────────────────────────────
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.trades if self.trades else 0.0
+
+    def kelly_stats(self) -> Optional[Dict[str, Any]]:
+        """Mismo contrato que ``position_sizer._get_trade_stats`` (None con < 10 trades o sin pérdidas)."""
+        decided = self.wins + self.losses
+        if decided < 10 or not self.losses:
+            return None
+        return {
+            "win_rate": self.wins / decided,
+            "avg_win": self.win_return_sum / self.wins if self.wins else 0,
+            "avg_loss": self.loss_return_sum / self.losses,
+            "total_trades": decided,
+        }
+
+    def performance(self) -> Dict[str, Any]:
+        """Métricas de ``performance_metrics`` (mismas fórmulas que el cálculo sobre filas)."""
+        total = self.trades
+        win_rate = self.wins / total if total else 0
+        avg_win = self.win_return_sum / self.wins if self.wins else 0
+        avg_loss = self.loss_return_sum / self.losses if self.losses else 0
+        profit_factor = (
+            self.win_return_sum / self.loss_return_sum
+            if self.losses and self.loss_return_sum > 0 else None
+        )
+        expectancy = self.pnl_sum / total if total else 0
+
+        mean = self.return_sum / total if total else 0.0
+        std = math.sqrt(max(self.return_sq_sum / total - mean * mean, 0.0)) if total else 0.0
+        sharpe = round(mean / std * math.sqrt(ANNUALIZATION), 4) if total > 1 and std > _EPS else None
+
+        sortino = None
+        if self.losses:
+            d_mean = -self.loss_return_sum / self.losses
+            d_std = math.sqrt(max(self.loss_return_sq_sum / self.losses - d_mean * d_mean, 0.0))
+            if d_std > _EPS:
+                sortino = round(mean / d_std * math.sqrt(ANNUALIZATION), 4)
+
+        max_dd = round(self.max_drawdown, 4)
+        calmar = None
+        if max_dd < 0:
+            annualised_return = self.pnl_sum * (ANNUALIZATION / max(total, 1))
+            calmar = round(annualised_return / abs(max_dd), 4)
+
+        kelly = None
+        if avg_loss > 0 and 0 < win_rate < 1:
+            b = avg_win / avg_loss
+            kelly = round((win_rate * b - (1 - win_rate)) / b * settings.kelly_dampener, 4)
+
+        return {
+            "sharpe_ratio": sharpe,
+            "sortino_ratio": sortino,
+            "calmar_ratio": calmar,
+            "max_drawdown": max_dd,
+            "win_rate": round(win_rate, 4),
+            "profit_factor": round(profit_factor, 4) if profit_factor else None,
+            "expectancy": round(expectancy, 8),
+            "kelly_fraction": kelly,
+            "total_trades": total,
+            "avg_win": round(avg_win, 8),
+            "avg_loss": round(avg_loss, 8),
+        }
+
+    # ── Persistencia ───────────────────────────────────────────────────
+
+    def to_row(self, scope: str, scope_key: str, bucket: str) -> Dict[str, Any]:
+        row = {f.name: getattr(self, f.name) for f in fields(self)}
+        row.update(scope=scope, scope_key=scope_key, bucket=bucket,
+                   updated_at=datetime.now(timezone.utc).isoformat())
+        return row
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "TradeAggregate":
+        kwargs: Dict[str, Any] = {}
+        for f in fields(cls):
+            value = row.get(f.name)
+            if f.name == "last_closed_at":
+                kwargs[f.name] = value
+            elif f.name in ("trades", "wins", "losses"):
+                kwargs[f.name] = int(value or 0)
+            else:
+                kwargs[f.name] = float(value or 0)
+        return cls(**kwargs)
+
+
+class TradeStatsStore:
+    """In-memory aggregates mirrored in ``trade_aggregates``."""
+
+    def __init__(self):
+        # (scope, scope_key) -> bucket -> agregado
+        self._aggs: Dict[ScopeKey, Dict[str, TradeAggregate]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        # Hubo cierres que no se pudieron sumar (store sin cargar o upsert fallido):
+        # la próxima carga reconstruye desde positions en vez de confiar en la tabla
+        self._stale = False
+        self._retry_at = 0.0
+        self.stats: Dict[str, Any] = {"loads": 0, "records": 0, "rebuilds": 0, "errors": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, supabase=None, rebuild_if_empty: bool = True) -> None:
+        """Cargar el bucket ``all`` y los últimos ``ROLLING_DAYS`` días; sin datos, reconstruir."""
+        supabase = supabase or get_supabase()
+        cutoff = (datetime.now(timezone.utc).date() - timedelta(days=ROLLING_DAYS)).isoformat()
+        rows = (
+            supabase.table(TABLE).select("*")
+            .or_(f"bucket.eq.{ALL},bucket.gte.{cutoff}")
+            .execute()
+        ).data or []
+        aggs: Dict[ScopeKey, Dict[str, TradeAggregate]] = {}
+        for row in rows:
+            aggs.setdefault((row["scope"], row["scope_key"]), {})[row["bucket"]] = TradeAggregate.from_row(row)
+        with self._lock:
+            self._aggs = aggs
+            self._loaded = True
+        self.stats["loads"] += 1
+        if rebuild_if_empty and ALL not in aggs.get((ALL, "*"), {}):
+            logger.info("Trade aggregates empty — rebuilding from closed positions")
+            self.rebuild(supabase)
+
+    def ensure_loaded(self, supabase=None) -> bool:
+        """Cargar (o reconstruir si quedó desfasado); True si los agregados están disponibles.
+
+        Los reintentos tras un fallo (ej. la tabla no existe) se espacian
+        ``RETRY_SECONDS``; mientras tanto los consumidores leen ``positions``.
+        """
+        if self._loaded and not self._stale:
+            return True
+        if time.monotonic() < self._retry_at:
+            return self._loaded
+        try:
+            if self._stale:
+                self.rebuild(supabase)
+                self._stale = False
+            else:
+                self.load(supabase)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+            logger.warning(f"Trade aggregates unavailable, using closed positions: {e}")
+            return self._loaded
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._aggs = {}
+            self._loaded = False
+            self._stale = False
+            self._retry_at = 0.0
+
+    # ── Escritura ──────────────────────────────────────────────────────
+
+    def record_close(self, supabase, position: Dict[str, Any]) -> None:
+        """Sumar una posición recién cerrada (fila con ``realized_pnl``/``closed_at``).
+
+        No consulta la DB: sin agregados cargados sólo marca el store como
+        desfasado y ``ensure_loaded`` lo reconstruye después.
+        """
+        if not self._loaded:
+            self._stale = True
+            return
+        pnl = float(position.get("realized_pnl", 0) or 0)
+        closed_at = position.get("closed_at")
+        trade = TradeAggregate.single(pnl, position.get("entry_notional"), closed_at)
+        day = _bucket_for(closed_at) or datetime.now(timezone.utc).date().isoformat()
+        oldest = (date.fromisoformat(day) - timedelta(days=ROLLING_DAYS)).isoformat()
+
+        rows = []
+        with self._lock:
+            for scope, key in scopes_for(position):
+                buckets = self._aggs.setdefault((scope, key), {})
+                for bucket in (ALL, day):
+                    agg = buckets.setdefault(bucket, TradeAggregate())
+                    agg.merge(trade)
+                    rows.append(agg.to_row(scope, key, bucket))
+                for old in [b for b in buckets if b != ALL and b < oldest]:
+                    del buckets[old]
+        try:
+            supabase.table(TABLE).upsert(rows, on_conflict=",".join(CONFLICT)).execute()
+        except Exception:
+            self._stale = True  # memoria adelantada respecto a la tabla
+            raise
+        self.stats["records"] += 1
+
+    # ── Lectura ────────────────────────────────────────────────────────
+
+    def window(self, days: Optional[int] = None, scope: str = ALL, key: str = "*",
+               today: Optional[date] = None) -> TradeAggregate:
+        """Agregado de toda la historia (``days=None``) o de los últimos ``days`` días UTC."""
+        with self._lock:
+            buckets = self._aggs.get((scope, key), {})
+            if days is None:
+                return (buckets.get(ALL) or TradeAggregate()).copy()
+            today = today or datetime.now(timezone.utc).date()
+            first, last = (today - timedelta(days=days - 1)).isoformat(), today.isoformat()
+            result = TradeAggregate()
+            for bucket in sorted(b for b in buckets if b != ALL and first <= b <= last):
+                result.merge(buckets[bucket])
+            return result
+
+    def status(self) -> Dict[str, Any]:
+        total = self.window() if self._loaded else TradeAggregate()
+        return {"loaded": self._loaded, "stale": self._stale, "scopes": len(self._aggs), "trades": total.trades, **self.stats}
+
+    # ── Rebuild / verificación ─────────────────────────────────────────
+
+    def rebuild(self, supabase=None, persist: bool = True) -> Dict[str, Any]:
+        """Recalcular todo desde ``positions`` y comparar con lo almacenado.
+
+        Returns:
+            ``{"trades", "rows", "mismatches": [{scope, scope_key, bucket, field, stored, rebuilt}]}``.
+        """
+        from .bulk_reader import BulkReader
+
+        supabase = supabase or get_supabase()
+        fresh: Dict[ScopeKey, Dict[str, TradeAggregate]] = {}
+        reader = BulkReader(
+            "positions",
+            select="id,symbol,strategy_id,realized_pnl,entry_notional,closed_at",
+            keys=("closed_at", "id"),
+            filters=[("eq", "status", "closed")],
+            client=supabase,
+        )
+        trades = 0
+        for row in reader.rows():
+            trades += 1
+            trade = TradeAggregate.single(float(row.get("realized_pnl", 0) or 0),
+                                          row.get("entry_notional"), row.get("closed_at"))
+            day = _bucket_for(row.get("closed_at"))
+            for scope_key in scopes_for(row):
+                buckets = fresh.setdefault(scope_key, {})
+                for bucket in (ALL, day) if day else (ALL,):
+                    buckets.setdefault(bucket, TradeAggregate()).merge(trade)
+
+        with self._lock:
+            stored = self._aggs
+        mismatches = []
+        for (scope, key), buckets in fresh.items():
+            for bucket, agg in buckets.items():
+                if bucket not in stored.get((scope, key), {}):
+                    continue  # sin fila previa (bucket viejo o primera construcción)
+                old = stored[(scope, key)][bucket]
+                for f in fields(agg):
+                    a, b = getattr(old, f.name), getattr(agg, f.name)
+                    if isinstance(b, float) and abs((a or 0) - b) <= 1e-6 * max(1.0, abs(b)):
+                        continue
+                    if f.name != "last_closed_at" and a != b:
+                        mismatches.append({"scope": scope, "scope_key": key, "bucket": bucket,
+                                           "field": f.name, "stored": a, "rebuilt": b})
+
+        rows = [agg.to_row(scope, key, bucket)
+                for (scope, key), buckets in fresh.items() for bucket, agg in buckets.items()]
+        if persist:
+            from .bulk_writer import bulk_write_records
+            if rows:
+                bulk_write_records(TABLE, rows, conflict=CONFLICT)
+            cutoff = (datetime.now(timezone.utc).date() - timedelta(days=ROLLING_DAYS)).isoformat()
+            with self._lock:
+                self._aggs = {
+                    sk: {b: a for b, a in buckets.items() if b == ALL or b >= cutoff}
+                    for sk, buckets in fresh.items()
+                }
+                self._loaded = True
+        self.stats["rebuilds"] += 1
+        if mismatches:
+            logger.warning(f"Trade aggregates rebuild: {len(mismatches)} mismatched fields (stored vs rebuilt)")
+        logger.info(f"Trade aggregates rebuilt from {trades} closed positions ({len(rows)} rows)")
+        return {"trades": trades, "rows": len(rows), "mismatches": mismatches}
+
+
+_store = TradeStatsStore()
+
+
+def get_trade_stats() -> TradeStatsStore:
+    return _store
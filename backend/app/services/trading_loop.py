@@ -1,8 +1,18 @@
 import asyncio
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from .executor import execute_all_approved, _compute_sl_tp
 from .portfolio import get_portfolio_state
+from .position_book import get_position_book
+from .trade_stats import get_trade_stats
+from . import protective_orders
+from .trailing_engine import compute_chandelier_sl, get_trailing_engine  # noqa: F401 (re-export)
+from .query_budget import query_scope
+from .latency_trace import span, tick_trace
+from .exchange_filters import get_exchange_filters
+from .candle_scheduler import CandleJob, get_candle_scheduler
 from ..db import get_supabase
 from ..config import settings
 from . import binance_client
@@ -23,14 +33,30 @@ async def run_loop(interval_seconds: int = MAIN_INTERVAL):
     _running = True
     logger.info(f"Trading loop started — fast={FAST_INTERVAL}s / main={interval_seconds}s")
 
+    # Book de posiciones abiertas: una lectura al arrancar, luego se mantiene en memoria
+    try:
+        get_position_book().load()
+    except Exception as e:
+        logger.error(f"Position book load failed (will retry on first fast tick): {e}")
+
+    # Agregados de trades cerrados (Kelly, portfolio, performance_metrics)
+    get_trade_stats().ensure_loaded()
+
     # Emergency SL check: close positions that breached SL while backend was down
     if settings.trading_enabled:
         await _emergency_sl_check()
 
-    await asyncio.gather(
-        _fast_loop(),
-        _main_loop(interval_seconds),
-    )
+    loops = [_fast_loop(), _main_loop(interval_seconds)]
+    if settings.candle_scheduler_enabled:
+        loops.append(_candle_loop())
+    try:
+        await asyncio.gather(*loops)
+    finally:
+        # No perder stops que subieron en memoria y aún no se escribieron
+        try:
+            await _flush_trailing_stops(get_supabase(), force=True)
+        except Exception as e:
+            logger.error(f"Trailing stop flush on shutdown failed: {e}")
 
 
 async def _emergency_sl_check() -> None:
@@ -39,8 +65,9 @@ async def _emergency_sl_check() -> None:
     Prevents holding losers indefinitely when backend was down during a price drop.
     """
     supabase = get_supabase()
-    resp = supabase.table("positions").select("*").eq("status", "open").execute()
-    positions = resp.data or []
+    book = get_position_book()
+    book.ensure_loaded(supabase)
+    positions = book.open_positions()
     if not positions:
         return
 
@@ -73,88 +100,103 @@ async def _fast_loop():
     while _running:
         try:
             if settings.trading_enabled:
-                await _check_stop_losses()
+                with query_scope("fast_tick"):
+                    await _check_stop_losses()
         except Exception as e:
             logger.error(f"Fast loop error: {e}")
         await asyncio.sleep(FAST_INTERVAL)
 
 
 async def _main_loop(interval_seconds: int):
-    """60-second loop: quant tick + signals + execution + portfolio + reconciliation."""
+    """60-second loop: quant tick + signals + execution + portfolio + reconciliation.
+
+    Con el scheduler de velas (CANDLE_SCHEDULER_ENABLED) quant y señales corren
+    en ``_candle_loop``; acá queda la ejecución de aprobados y el housekeeping.
+    """
+    last_book_verify = time.monotonic()
+    candle_driven = settings.candle_scheduler_enabled
     while _running:
         try:
-            # 1. Quant engine tick (klines + indicators)
-            if settings.quant_enabled:
+            # Presupuesto de queries por tick (DB_TICK_QUERY_BUDGET) + detección de N+1
+            # + traza de latencia vela → señal → fill (LATENCY_TRACE_ENABLED)
+            with query_scope("main_tick", budget=settings.db_tick_query_budget), tick_trace():
+                # 1. Quant engine tick (klines + indicators)
+                if settings.quant_enabled and not candle_driven:
+                    try:
+                        from .quant_orchestrator import run_quant_tick
+                        with span("quant_tick"):
+                            await run_quant_tick()
+                    except Exception as e:
+                        logger.error(f"Quant tick error: {e}")
+
+                supabase = get_supabase()
+
+                if not settings.trading_enabled:
+                    logger.debug("Trading disabled (kill switch)")
+                else:
+                    # 2. Signal generation (quant -> proposals)
+                    if not candle_driven:
+                        await _generate_signals()
+
+                    # 3. Execute approved proposals (también los aprobados a mano)
+                    await _execute_approved(supabase)
+
+                # 4. Mark-to-market + snapshot de la cuenta (agregados de trades: reintento/rebuild si hace falta)
+                get_trade_stats().ensure_loaded(supabase)
+                await get_portfolio_state(persist=True)
+
+                # 5. Reconciliation (incremental; corre sólo si hubo actividad o venció la cadencia)
                 try:
-                    from .quant_orchestrator import run_quant_tick
-                    await run_quant_tick()
+                    from .reconciliation import maybe_run_reconciliation
+                    await maybe_run_reconciliation()
                 except Exception as e:
-                    logger.error(f"Quant tick error: {e}")
+                    logger.error(f"Reconciliation error: {e}")
 
-            supabase = get_supabase()
+                # 5b. Verificar el book de posiciones contra la DB (la DB gana si hay drift)
+                if time.monotonic() - last_book_verify >= settings.position_book_verify_seconds:
+                    try:
+                        get_position_book().verify(supabase)
+                    except Exception as e:
+                        logger.error(f"Position book verification error: {e}")
+                    last_book_verify = time.monotonic()
 
-            if not settings.trading_enabled:
-                logger.debug("Trading disabled (kill switch)")
-            else:
-                # 2. Signal generation (quant -> proposals)
+                # 6. Daily report
                 try:
-                    from .signal_generator import generate_signals
-                    await generate_signals()
+                    now = datetime.now(timezone.utc)
+                    if now.hour == 0 and now.minute < 2:
+                        from .daily_report import already_sent_today, send_daily_report
+                        if not already_sent_today():
+                            await send_daily_report()
+                            logger.info("Daily report sent")
                 except Exception as e:
-                    logger.error(f"Signal generation error: {e}")
-
-                # 3. Execute approved proposals
-                result = await execute_all_approved(supabase)
-                if result["executed"] > 0:
-                    logger.info(f"Executed {result['executed']} proposals")
-
-            # 4. Update portfolio state
-            await get_portfolio_state()
-
-            # 5. Reconciliation
-            try:
-                from .reconciliation import run_reconciliation
-                await run_reconciliation()
-            except Exception as e:
-                logger.error(f"Reconciliation error: {e}")
-
-            # 6. Daily report
-            try:
-                now = datetime.now(timezone.utc)
-                if now.hour == 0 and now.minute < 2:
-                    from .daily_report import already_sent_today, send_daily_report
-                    if not already_sent_today():
-                        await send_daily_report()
-                        logger.info("Daily report sent")
-            except Exception as e:
-                logger.error(f"Daily report error: {e}")
-
-            # 7. Data retention (02:00 UTC daily — limpieza de tablas grandes)
-            try:
-                now = datetime.now(timezone.utc)
-                from .data_retention import should_run_retention, run_data_retention
-                if should_run_retention(now):
-                    summary = await run_data_retention()
-                    logger.info("Data retention: %s", summary)
-            except Exception as e:
-                logger.error(f"Data retention error: {e}")
-
-            # 8. LLM Daily Analyst (pre-market 23:00, post-market 00:05)
-            if settings.analyst_enabled:
+                    logger.error(f"Daily report error: {e}")
+
+                # 7. Data retention (02:00 UTC daily — limpieza de tablas grandes)
                 try:
                     now = datetime.now(timezone.utc)
-                    from .daily_analyst.scheduler import (
-                        should_run_pre_market, should_run_post_market,
-                        run_pre_market_analysis, run_post_market_audit,
-                    )
-                    if should_run_pre_market(now):
-                        asyncio.create_task(run_pre_market_analysis())
-                        logger.info("LLM pre-market analysis launched")
-                    if should_run_post_market(now):
-                        asyncio.create_task(run_post_market_audit())
-                        logger.info("LLM post-market audit launched")
+                    from .data_retention import should_run_retention, run_data_retention
+                    if should_run_retention(now):
+                        summary = await run_data_retention()
+                        logger.info("Data retention: %s", summary)
                 except Exception as e:
-                    logger.error(f"LLM analyst error: {e}")
+                    logger.error(f"Data retention error: {e}")
+
+                # 8. LLM Daily Analyst (pre-market 23:00, post-market 00:05)
+                if settings.analyst_enabled:
+                    try:
+                        now = datetime.now(timezone.utc)
+                        from .daily_analyst.scheduler import (
+                            should_run_pre_market, should_run_post_market,
+                            run_pre_market_analysis, run_post_market_audit,
+                        )
+                        if should_run_pre_market(now):
+                            asyncio.create_task(run_pre_market_analysis())
+                            logger.info("LLM pre-market analysis launched")
+                        if should_run_post_market(now):
+                            asyncio.create_task(run_post_market_audit())
+                            logger.info("LLM post-market audit launched")
+                    except Exception as e:
+                        logger.error(f"LLM analyst error: {e}")
 
         except Exception as e:
             logger.error(f"Main loop error: {e}")
@@ -162,11 +204,68 @@ async def _main_loop(interval_seconds: int):
         await asyncio.sleep(interval_seconds)
 
 
+async def _generate_signals() -> None:
+    try:
+        from .signal_generator import generate_signals
+        with span("signals"):
+            await generate_signals()
+    except Exception as e:
+        logger.error(f"Signal generation error: {e}")
+
+
+async def _execute_approved(supabase) -> None:
+    # Filtros del exchange frescos: fuera del camino de la orden
+    await get_exchange_filters().maybe_refresh()
+    with span("execute_approved"):
+        result = await execute_all_approved(supabase)
+    if result["executed"] > 0:
+        logger.info(f"Executed {result['executed']} proposals")
+
+
+async def _on_primary_close(close_ms: int) -> None:
+    """Cierre del intervalo primario: señales sobre el análisis recién hecho + ejecución inmediata."""
+    if not settings.trading_enabled:
+        return
+    await _generate_signals()
+    await _execute_approved(get_supabase())
+
+
+def _candle_jobs():
+    """Jobs del quant engine + el job de señales (último stage del batch)."""
+    jobs = []
+    if settings.quant_enabled:
+        from .quant_orchestrator import candle_jobs as quant_jobs
+        jobs.extend(quant_jobs())
+    jobs.append(CandleJob("signals", settings.quant_primary_interval, _on_primary_close, stage=3))
+    return jobs
+
+
+@contextmanager
+def _candle_scope(close_ms: int):
+    """Cada batch de cierres: presupuesto de queries + traza con origen en el cierre."""
+    with query_scope("candle_tick", budget=settings.db_tick_query_budget), tick_trace(origin_ms=close_ms):
+        yield
+
+
+async def _candle_loop() -> None:
+    """Quant + señales disparados por cierre de vela (ver candle_scheduler.py)."""
+    scheduler = get_candle_scheduler()
+    scheduler.set_jobs(_candle_jobs())
+    try:
+        await scheduler.run(scope=_candle_scope)
+    except Exception as e:
+        logger.error(f"Candle scheduler error: {e}")
+
+
 async def _check_stop_losses() -> None:
-    """Check open positions for SL/TP triggers. Repairs missing SL/TP. Called every 5s."""
+    """Check open positions for SL/TP triggers. Repairs missing SL/TP. Called every 2s.
+
+    Lee del position book: sin lecturas a la DB en régimen estable.
+    """
     supabase = get_supabase()
-    resp = supabase.table("positions").select("*").eq("status", "open").execute()
-    positions = resp.data or []
+    book = get_position_book()
+    book.ensure_loaded(supabase)
+    positions = book.open_positions()
     if not positions:
         return
 
@@ -176,6 +275,13 @@ async def _check_stop_losses() -> None:
             await _repair_missing_sl_tp(supabase, pos)
             continue
         try:
+            # Protección en el exchange (OCO): detectar fills / recolocar.
+            # El chequeo de precio de abajo queda como backstop.
+            if protective_orders.protection_enabled() or protective_orders.has_protection(pos):
+                if await protective_orders.sync_position(supabase, pos):
+                    continue
+                pos = book.get(pos["id"]) or pos
+
             # Safety-critical: fetch price DIRECT from testnet (not proxy).
             # Audit 2026-04-12 found 8/13 recent SL were false triggers because
             # proxy binance.italicia.com served prices delayed ~5% during rallies.
@@ -184,6 +290,8 @@ async def _check_stop_losses() -> None:
 
             sl = float(pos["stop_loss_price"]) if pos.get("stop_loss_price") else None
             tp = float(pos["take_profit_price"]) if pos.get("take_profit_price") else None
+            # Un trailing stop más alto aún no persistido también dispara
+            sl = get_trailing_engine().effective_stop(pos["id"], sl)
 
             triggered = None
             if sl and current_price <= sl:
@@ -219,6 +327,8 @@ async def _check_stop_losses() -> None:
         except Exception as e:
             logger.error(f"SL/TP check [{pos.get('symbol', '?')}]: {e}")
 
+    await _flush_trailing_stops(supabase)
+
 
 async def _execute_sl_tp(supabase, position: dict, current_price: float, trigger_type: str) -> None:
     """Auto-approve and execute a market sell for SL/TP.
@@ -295,67 +405,66 @@ async def _execute_sl_tp(supabase, position: dict, current_price: float, trigger
 
 
 async def _update_trailing_stop(supabase, position: dict, current_price: float, sl: float, tp: float) -> None:
-    """Trailing stop con Chandelier Exit (QS).
+    """Trailing stop con Chandelier Exit (QS), estado en memoria (trailing_engine).
 
-    Usa highest_high - k*ATR cuando ATR disponible (más adaptativo).
-    Fallback: progress-based trailing si ATR no disponible.
-    Solo activa cuando precio avanzó >30% hacia TP.
+    Chandelier sobre el high-water mark de la posición con ATR cacheado por vela;
+    fallback progress-based. Solo activa cuando precio avanzó >30% hacia TP.
+    El SL sube en memoria en cada tick; la escritura a la DB se coalesce
+    (ver _flush_trailing_stops).
     """
-    entry_price = float(position["entry_price"])
-    if current_price <= entry_price or not sl or not tp:
-        return
-
-    # Distancia original: entry → TP
-    original_tp_distance = tp - entry_price
-    if original_tp_distance <= 0:
-        return
-
-    # Progreso: qué % del camino al TP hemos recorrido
-    progress = (current_price - entry_price) / original_tp_distance
-
-    # Activar trailing cuando avanzamos >30% hacia el TP (era 40%, antes 65%)
-    # Análisis 2026-04-11: winners ETH promedian +2-3%, trailing más temprano
-    # captura ganancias antes de reversión hacia breakeven.
-    if progress < 0.30:
+    engine = get_trailing_engine()
+    new_sl = engine.evaluate(position, current_price, sl, tp)
+    if new_sl is None:
         return
-
-    # QS: Chandelier Exit — usa current_price como proxy de highest_high
-    # (en polling cada 2s, current_price ≈ highest recent high)
-    chandelier_sl = None
-    try:
-        from .technical_analysis import compute_indicators
-        from ..config import settings
-        ind = compute_indicators(position["symbol"], settings.quant_primary_interval)
-        if ind and ind.atr_14 and ind.atr_14 > 0:
-            chandelier_sl = compute_chandelier_sl(current_price, ind.atr_14, 2.0)
-    except Exception:
-        pass
-
-    # Fallback: progress-based trailing
-    trail_pct = max(0, progress - 0.30)
-    progress_sl = round(entry_price + trail_pct * original_tp_distance, 2)
-
-    # Elegir el mejor SL: el más alto (más protector) entre Chandelier y progress
-    if chandelier_sl and chandelier_sl > entry_price:
-        new_sl = max(chandelier_sl, progress_sl)
+    if engine.should_persist(position["id"]):
+        await _persist_trailing_stop(supabase, position, new_sl, tp)
     else:
-        new_sl = progress_sl
+        logger.debug("TRAILING SL [%s] → $%.2f (en memoria, persistencia diferida)", position["symbol"], new_sl)
 
-    # Solo subir el SL, nunca bajarlo
-    if new_sl <= sl:
-        return
 
-    supabase.table("positions").update({
+async def _persist_trailing_stop(supabase, position: dict, new_sl: float, tp: float) -> None:
+    """Escribir el stop en la DB/book (y cancel/replace del OCO si hay protección)."""
+    changes = {
         "stop_loss_price": new_sl,
         "updated_at": datetime.now(timezone.utc).isoformat(),
-    }).eq("id", position["id"]).execute()
+    }
+    if protective_orders.has_protection(position):
+        # Cancel/replace del OCO con el nuevo stop; None = la protección ya cerró la posición
+        protection = await protective_orders.replace_stop(supabase, position, new_sl, tp)
+        if protection is None:
+            return
+        changes.update(protection)
+    supabase.table("positions").update(changes).eq("id", position["id"]).execute()
+    get_position_book().update(position["id"], **changes)
+    get_trailing_engine().mark_persisted(position["id"], new_sl)
 
     logger.info(
-        "TRAILING SL [%s] moved: $%.2f → $%.2f (price=$%.2f, progress=%.0f%%)",
-        position["symbol"], sl, new_sl, current_price, progress * 100
+        "TRAILING SL [%s] moved: $%.2f → $%.2f",
+        position["symbol"], float(position.get("stop_loss_price") or 0), new_sl,
     )
 
 
+async def _flush_trailing_stops(supabase, force: bool = False) -> int:
+    """Persistir stops que subieron en memoria y cuyo intervalo de escritura venció.
+
+    force=True persiste todo lo pendiente (shutdown).
+    """
+    engine = get_trailing_engine()
+    book = get_position_book()
+    engine.prune(p["id"] for p in book.open_positions())
+    flushed = 0
+    for pos_id, stop in (engine.unpersisted() if force else engine.pending()):
+        position = book.get(pos_id)
+        if position is None or not position.get("take_profit_price"):
+            continue
+        try:
+            await _persist_trailing_stop(supabase, position, stop, float(position["take_profit_price"]))
+            flushed += 1
+        except Exception as e:
+            logger.error(f"Trailing stop flush [{position.get('symbol', '?')}]: {e}")
+    return flushed
+
+
 async def _repair_missing_sl_tp(supabase, position: dict) -> None:
     """Computa SL/TP via ATR para posiciones que no los tienen."""
     symbol = position["symbol"]
@@ -363,11 +472,13 @@ async def _repair_missing_sl_tp(supabase, position: dict) -> None:
 
     sl_price, tp_price = _compute_sl_tp(symbol, entry_price)
 
-    supabase.table("positions").update({
+    changes = {
         "stop_loss_price": sl_price,
         "take_profit_price": tp_price,
         "updated_at": datetime.now(timezone.utc).isoformat(),
-    }).eq("id", position["id"]).execute()
+    }
+    supabase.table("positions").update(changes).eq("id", position["id"]).execute()
+    get_position_book().update(position["id"], **changes)
 
     logger.warning("Repaired SL/TP for %s [%s]: SL=$%.2f TP=$%.2f",
                     symbol, position["id"], sl_price, tp_price)
@@ -384,16 +495,8 @@ async def _repair_missing_sl_tp(supabase, position: dict) -> None:
         pass
 
 
-def compute_chandelier_sl(highest_high: float, atr: float, multiplier: float = 2.0) -> float | None:
-    """Chandelier Exit: SL = highest_high - k * ATR. Más adaptativo que trailing fijo."""
-    if not highest_high or highest_high <= 0:
-        return None
-    if not atr or atr <= 0:
-        return None
-    return round(highest_high - multiplier * atr, 2)
-
-
 def stop_loop():
     global _running
     _running = False
+    get_candle_scheduler().stop()
     logger.info("Trading loop stopped")
@@ -0,0 +1,235 @@
+"""Trailing-stop engine for the fast loop.
+
+``_update_trailing_stop`` llamaba a ``compute_indicators`` por posición en
+cada ciclo de 2s sólo para leer ``atr_14`` (en un miss: carga de klines +
+pandas-ta dentro del loop crítico) y escribía el SL en la DB en cada subida.
+
+Acá el estado vive en memoria:
+
+- ATR por (symbol, vela): se calcula una vez por vela del intervalo primario
+  y se reutiliza hasta que abre la siguiente.
+- High-water mark por posición: el Chandelier Exit usa el máximo observado
+  desde la apertura, no el precio del tick.
+- El stop efectivo sube en memoria en cada tick; la escritura a la DB (y el
+  cancel/replace del OCO, si hay protección en el exchange) se coalesce a
+  una cada ``TRAILING_PERSIST_SECONDS`` por posición.
+
+En régimen estable, el costo por posición y tick son unas pocas operaciones
+aritméticas.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from ..config import settings
+from . import technical_analysis
+from .kline_collector import interval_ms
+
+logger = logging.getLogger(__name__)
+
+ACTIVATION_PROGRESS = 0.30   # trailing desde 30% del camino al TP
+CHANDELIER_MULTIPLIER = 2.0
+_ATR_RETRY_SECONDS = 60      # reintento si el cálculo de ATR falló en esta vela
+
+
+def compute_chandelier_sl(highest_high: float, atr: float, multiplier: float = 2.0) -> float | None:
+    """Chandelier Exit: SL = highest_high - k * ATR. Más adaptativo que trailing fijo."""
+    if not highest_high or highest_high <= 0:
+        return None
+    if not atr or atr <= 0:
+        return None
+    return round(highest_high - multiplier * atr, 2)
+
+
+def trailing_stop_level(
+    entry_price: float,
+    high_water: float,
+    sl: Optional[float],
+    tp: Optional[float],
+    atr: Optional[float],
+) -> Optional[float]:
+    """New stop for a long position, or None if it should not move.
+
+    Chandelier (high_water - 2·ATR) vs. progress-based (entry + (progress-30%)
+    de la distancia al TP): se toma el más protector; nunca baja el SL.
+    """
+    if high_water <= entry_price or not sl or not tp:
+        return None
+    original_tp_distance = tp - entry_price
+    if original_tp_distance <= 0:
+        return None
+
+    progress = (high_water - entry_price) / original_tp_distance
+    if progress < ACTIVATION_PROGRESS:
+        return None
+
+    chandelier_sl = compute_chandelier_sl(high_water, atr, CHANDELIER_MULTIPLIER) if atr else None
+    trail_pct = max(0, progress - ACTIVATION_PROGRESS)
+    progress_sl = round(entry_price + trail_pct * original_tp_distance, 2)
+
+    if chandelier_sl and chandelier_sl > entry_price:
+        new_sl = max(chandelier_sl, progress_sl)
+    else:
+        new_sl = progress_sl
+    return new_sl if new_sl > sl else None
+
+
+class AtrCache:
+    """ATR-14 per (symbol, interval), recomputed once per candle."""
+
+    def __init__(self):
+        # (symbol, interval) -> (candle_open_ms, atr, computed_at)
+        self._values: Dict[Tuple[str, str], Tuple[int, Optional[float], float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, symbol: str, interval: str, now_ms: Optional[int] = None) -> Optional[float]:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        candle = now_ms - now_ms % interval_ms(interval)
+        cached = self._values.get((symbol, interval))
+        if cached is not None and cached[0] == candle:
+            if cached[1] is not None or time.monotonic() - cached[2] < _ATR_RETRY_SECONDS:
+                self.hits += 1
+                return cached[1]
+
+        self.misses += 1
+        atr = None
+        try:
+            ind = technical_analysis.compute_indicators(symbol, interval)
+            if ind and ind.atr_14 and ind.atr_14 > 0:
+                atr = float(ind.atr_14)
+        except Exception as e:
+            logger.debug(f"ATR unavailable for {symbol} {interval}: {e}")
+        self._values[(symbol, interval)] = (candle, atr, time.monotonic())
+        return atr
+
+    def prime(self, symbol: str, interval: str, atr: Optional[float], now_ms: Optional[int] = None) -> None:
+        """Cargar un ATR ya calculado (ej. por el quant tick) si la vela actual aún no tiene uno."""
+        if not atr or atr <= 0:
+            return
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        candle = now_ms - now_ms % interval_ms(interval)
+        cached = self._values.get((symbol, interval))
+        if cached is None or cached[0] != candle or cached[1] is None:
+            self._values[(symbol, interval)] = (candle, float(atr), time.monotonic())
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+@dataclass
+class TrailingState:
+    high_water: float
+    stop: Optional[float] = None          # stop efectivo (en memoria)
+    persisted_stop: Optional[float] = None
+    last_persist: Optional[float] = None  # monotonic
+
+
+class TrailingEngine:
+    """High-water marks, in-memory stops and coalesced persistence per position."""
+
+    def __init__(self):
+        self.atr_cache = AtrCache()
+        self._states: Dict[str, TrailingState] = {}
+        self.stats: Dict[str, int] = {"evaluations": 0, "moves": 0, "persisted": 0, "coalesced": 0}
+
+    def _state(self, position: Dict[str, Any], price: float) -> TrailingState:
+        state = self._states.get(position["id"])
+        if state is None:
+            state = TrailingState(high_water=max(price, float(position["entry_price"])))
+            self._states[position["id"]] = state
+        return state
+
+    def evaluate(
+        self,
+        position: Dict[str, Any],
+        price: float,
+        sl: Optional[float],
+        tp: Optional[float],
+    ) -> Optional[float]:
+        """Update the high-water mark and return the new stop if it moved up."""
+        self.stats["evaluations"] += 1
+        state = self._state(position, price)
+        if price > state.high_water:
+            state.high_water = price
+        current = max(sl or 0.0, state.stop or 0.0) or None
+        atr = self.atr_cache.get(position["symbol"], settings.quant_primary_interval)
+        new_sl = trailing_stop_level(float(position["entry_price"]), state.high_water, current, tp, atr)
+        if new_sl is None:
+            return None
+        state.stop = new_sl
+        self.stats["moves"] += 1
+        return new_sl
+
+    def effective_stop(self, position_id: str, sl: Optional[float]) -> Optional[float]:
+        """Stop a usar para el trigger: el de la DB o uno más alto aún no persistido."""
+        state = self._states.get(position_id)
+        if state is None or state.stop is None:
+            return sl
+        return max(sl or 0.0, state.stop)
+
+    def should_persist(self, position_id: str, now: Optional[float] = None) -> bool:
+        state = self._states.get(position_id)
+        if state is None or state.stop is None or state.stop == state.persisted_stop:
+            return False
+        now = time.monotonic() if now is None else now
+        if state.last_persist is None or now - state.last_persist >= settings.trailing_persist_seconds:
+            return True
+        self.stats["coalesced"] += 1
+        return False
+
+    def mark_persisted(self, position_id: str, stop: float, now: Optional[float] = None) -> None:
+        state = self._states.get(position_id)
+        if state is None:
+            return
+        state.persisted_stop = stop
+        state.last_persist = time.monotonic() if now is None else now
+        self.stats["persisted"] += 1
+
+    def pending(self, now: Optional[float] = None) -> Iterable[Tuple[str, float]]:
+        """(position_id, stop) con un stop sin persistir cuyo intervalo ya venció."""
+        now = time.monotonic() if now is None else now
+        due = []
+        for pos_id, state in self._states.items():
+            if state.stop is None or state.stop == state.persisted_stop:
+                continue
+            if state.last_persist is None or now - state.last_persist >= settings.trailing_persist_seconds:
+                due.append((pos_id, state.stop))
+        return due
+
+    def unpersisted(self) -> Iterable[Tuple[str, float]]:
+        return [
+            (pos_id, s.stop) for pos_id, s in self._states.items()
+            if s.stop is not None and s.stop != s.persisted_stop
+        ]
+
+    def prune(self, open_ids: Iterable[str]) -> None:
+        keep = set(open_ids)
+        for pos_id in [p for p in self._states if p not in keep]:
+            del self._states[pos_id]
+
+    def reset(self) -> None:
+        self._states.clear()
+        self.atr_cache.clear()
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "positions": len(self._states),
+            "unpersisted": len(self.unpersisted()),
+            "atr_hits": self.atr_cache.hits,
+            "atr_misses": self.atr_cache.misses,
+            **self.stats,
+        }
+
+
+_engine = TrailingEngine()
+
+
+def get_trailing_engine() -> TrailingEngine:
+    return _engine
@@ -0,0 +1,335 @@
+"""Binance user data stream: order and balance state pushed by the exchange.
+
+El resultado de una orden se conocía por la respuesta síncrona de
+``place_order`` y, para todo lo que pasa después en el exchange (patas del
+OCO, órdenes canceladas por fuera), por polling: ``poll_protection`` cada
+``PROTECTION_POLL_SECONDS`` por posición y ``get_open_orders`` /
+``get_order`` en la reconciliación.
+
+``UserStream`` mantiene un listenKey (keep-alive cada
+``USER_STREAM_KEEPALIVE_SECONDS``), consume el websocket y guarda en memoria:
+
+- ``executionReport`` → estado de cada orden (status, cantidades
+  acumuladas, fills con comisión). Cuando termina (FILLED) una pata de
+  protección de una posición abierta, la posición se cierra en el momento
+  con ``protective_orders.record_fill``; los fills parciales quedan
+  registrados en la orden (la otra pata del OCO sigue cubriendo el resto).
+- ``outboundAccountPosition`` → balances absolutos de los assets que
+  cambiaron, aplicados a ``account_state``.
+
+Mientras el stream está conectado, el polling de protecciones baja a
+``USER_STREAM_SAFETY_POLL_SECONDS`` y la reconciliación usa el estado de
+órdenes del stream antes de consultar el exchange: quedan como red de
+seguridad. Si el stream se cae, vuelven solos a su cadencia normal.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ..config import settings
+from . import binance_client
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("FILLED", "CANCELED", "REJECTED", "EXPIRED", "EXPIRED_IN_MATCH")
+_MAX_ORDERS = 2000          # órdenes recordadas (las terminales más viejas se descartan)
+_RECONNECT_MAX_SECONDS = 60
+
+
+@dataclass
+class OrderRecord:
+    """Estado de una orden según el stream."""
+
+    order_id: int
+    symbol: str
+    side: str
+    order_type: str
+    status: str
+    order_list_id: Optional[int] = None
+    client_order_id: Optional[str] = None
+    orig_qty: float = 0.0
+    executed_qty: float = 0.0
+    cum_quote: float = 0.0
+    fills: List[Dict[str, Any]] = field(default_factory=list)
+    updated_ms: int = 0
+
+    @property
+    def terminal(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    @property
+    def avg_price(self) -> float:
+        return self.cum_quote / self.executed_qty if self.executed_qty > 0 else 0.0
+
+    def commission(self) -> tuple[float, str]:
+        """Comisión total (monto crudo, asset del último fill)."""
+        if not self.fills:
+            return 0.0, "USDT"
+        return sum(f["commission"] for f in self.fills), self.fills[-1]["commission_asset"]
+
+
+class UserStream:
+    """listenKey + websocket consumer + in-memory order state."""
+
+    def __init__(self):
+        self._orders: "OrderedDict[int, OrderRecord]" = OrderedDict()
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._fill_tasks: set = set()
+        self._connected = False
+        self._listen_key: Optional[str] = None
+        self._last_event_at: Optional[float] = None
+        self.stats: Dict[str, Any] = {
+            "events": 0, "fills": 0, "partial_fills": 0, "protective_fills": 0,
+            "balance_updates": 0, "keepalives": 0, "reconnects": 0, "errors": 0,
+        }
+
+    # ── Estado ──
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def is_live(self) -> bool:
+        """Conectado: los eventos de órdenes llegan en el momento."""
+        return self._connected
+
+    def order(self, order_id: int) -> Optional[OrderRecord]:
+        return self._orders.get(int(order_id))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.user_stream_enabled,
+            "running": self.running,
+            "connected": self._connected,
+            "last_event_age_seconds": (
+                round(time.monotonic() - self._last_event_at, 1) if self._last_event_at else None
+            ),
+            "orders_tracked": len(self._orders),
+            **self.stats,
+        }
+
+    def reset(self) -> None:
+        self.__init__()
+
+    async def wait_for(self, order_id: int, timeout: float) -> Optional[OrderRecord]:
+        """Esperar a que la orden llegue a un estado terminal (None si vence el timeout)."""
+        record = self.order(order_id)
+        if record is not None and record.terminal:
+            return record
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(int(order_id), []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(int(order_id), [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(int(order_id), None)
+
+    # ── Eventos ──
+
+    async def handle(self, event: Dict[str, Any]) -> None:
+        """Procesar un evento del stream (ya decodificado)."""
+        self.stats["events"] += 1
+        self._last_event_at = time.monotonic()
+        kind = event.get("e")
+        if kind == "executionReport":
+            record = self._on_execution_report(event)
+            if record.terminal:
+                for future in self._waiters.pop(record.order_id, []):
+                    if not future.done():
+                        future.set_result(record)
+                if record.status == "FILLED" and record.side == "SELL":
+                    # DB / exchange fuera del loop de lectura: el stream sigue drenando
+                    task = asyncio.create_task(self._on_filled(record))
+                    self._fill_tasks.add(task)
+                    task.add_done_callback(self._fill_done)
+        elif kind == "outboundAccountPosition":
+            from .account_state import get_account_state
+            get_account_state().apply_stream_balances(event.get("B", []))
+            self.stats["balance_updates"] += 1
+        elif kind == "listenKeyExpired":
+            raise ConnectionError("listenKey expired")
+
+    def _on_execution_report(self, e: Dict[str, Any]) -> OrderRecord:
+        order_id = int(e["i"])
+        record = self._orders.get(order_id)
+        if record is None:
+            record = OrderRecord(
+                order_id=order_id,
+                symbol=e.get("s", ""),
+                side=e.get("S", ""),
+                order_type=e.get("o", ""),
+                status=e.get("X", "NEW"),
+                order_list_id=int(e["g"]) if int(e.get("g", -1)) >= 0 else None,
+                client_order_id=e.get("c"),
+                orig_qty=float(e.get("q", 0) or 0),
+            )
+            self._orders[order_id] = record
+            self._prune()
+        record.status = e.get("X", record.status)
+        record.executed_qty = float(e.get("z", record.executed_qty) or 0)
+        record.cum_quote = float(e.get("Z", record.cum_quote) or 0)
+        record.updated_ms = int(e.get("E", 0) or 0)
+
+        if e.get("x") == "TRADE":
+            record.fills.append({
+                "trade_id": e.get("t"),
+                "price": float(e.get("L", 0) or 0),
+                "qty": float(e.get("l", 0) or 0),
+                "commission": float(e.get("n", 0) or 0),
+                "commission_asset": e.get("N") or "USDT",
+            })
+            self.stats["fills"] += 1
+            if record.status == "PARTIALLY_FILLED":
+                self.stats["partial_fills"] += 1
+                logger.info(
+                    f"Partial fill {record.symbol} #{order_id}: {record.executed_qty}/{record.orig_qty} "
+                    f"@ {record.avg_price:.8f}"
+                )
+            # el balance de este fill llega por outboundAccountPosition: que el ledger no lo aplique dos veces
+            from .account_state import get_account_state
+            get_account_state().note_stream_fill(order_id)
+        return record
+
+    def _fill_done(self, task: asyncio.Task) -> None:
+        self._fill_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+            logger.error(f"User stream fill handling failed: {task.exception()}")
+
+    async def _on_filled(self, record: OrderRecord) -> None:
+        """Si la orden es una pata de protección (siempre SELL) de una posición abierta, cerrarla ya."""
+        from ..db import get_supabase
+        from . import protective_orders
+        from .position_book import get_position_book
+
+        supabase = get_supabase()
+        book = get_position_book()
+        if not book.loaded:
+            await asyncio.to_thread(book.ensure_loaded, supabase)
+        for position in book.open_positions(record.symbol):
+            if record.order_id == _as_int(position.get("protection_sl_order_id")):
+                trigger = "stop_loss"
+            elif record.order_id == _as_int(position.get("protection_tp_order_id")):
+                trigger = "take_profit"
+            else:
+                continue
+            commission, asset = record.commission()
+            fill = {
+                "order_id": record.order_id,
+                "trigger": trigger,
+                "price": record.avg_price,
+                "quantity": record.executed_qty,
+                "commission": commission,
+                "commission_asset": asset,
+            }
+            if not await protective_orders.record_fill(supabase, position, fill):
+                return
+            self.stats["protective_fills"] += 1
+            logger.info(f"{trigger} fill for {record.symbol} [{position['id'][:8]}] resolved from user stream")
+            return
+
+    def _prune(self) -> None:
+        excess = len(self._orders) - _MAX_ORDERS
+        if excess <= 0:
+            return
+        for order_id in [oid for oid, r in self._orders.items() if r.terminal][:excess]:
+            del self._orders[order_id]
+
+    # ── Conexión ──
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._fill_tasks:   # cierres de posiciones en curso: dejarlos terminar
+            await asyncio.gather(*self._fill_tasks, return_exceptions=True)
+        self._connected = False
+        if self._listen_key:
+            try:
+                await binance_client.close_listen_key(self._listen_key)
+            except Exception as e:
+                logger.debug(f"Could not close listenKey: {e}")
+            self._listen_key = None
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                await self._connect_once()
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"User data stream disconnected: {e} (retry in {backoff:.0f}s)")
+            self._connected = False
+            self.stats["reconnects"] += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, _RECONNECT_MAX_SECONDS)
+
+    async def _connect_once(self) -> None:
+        import websockets
+
+        resp = await binance_client.create_listen_key()
+        self._listen_key = resp["listenKey"]
+        url = f"{settings.user_stream_ws_url.rstrip('/')}/{self._listen_key}"
+        async with websockets.connect(url, ping_interval=60) as ws:
+            self._connected = True
+            logger.info("User data stream connected")
+            keepalive = asyncio.create_task(self._keepalive(self._listen_key))
+            try:
+                async for message in ws:
+                    try:
+                        await self.handle(json.loads(message))
+                    except ConnectionError:
+                        raise
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        logger.error(f"User stream event failed: {e}")
+            finally:
+                keepalive.cancel()
+                self._connected = False
+
+    async def _keepalive(self, listen_key: str) -> None:
+        while True:
+            await asyncio.sleep(settings.user_stream_keepalive_seconds)
+            try:
+                await binance_client.keepalive_listen_key(listen_key)
+                self.stats["keepalives"] += 1
+            except Exception as e:
+                logger.warning(f"listenKey keep-alive failed: {e}")
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+_stream = UserStream()
+
+
+def get_user_stream() -> UserStream:
+    return _stream
@@ -0,0 +1,324 @@
+"""Write-behind buffer for non-critical telemetry rows.
+
+``risk_events`` de los checks de riesgo (``quant_risk``), ``technical_indicators``,
+``entropy_readings`` y ``market_regimes`` se escribían con un INSERT/UPSERT
+síncrono por fila, en el medio del camino de trading. La auditoría del ciclo
+de vida de un trade (órdenes, posiciones, SL/TP, errores, dead letters) no
+pasa por acá: el buffer descarta filas cuando se llena y pierde lo encolado
+si el proceso muere, así que esos eventos se siguen escribiendo síncronos.
+
+Con el buffer corriendo (lo arranca el lifespan), esas filas se encolan en
+memoria y se escriben en batches:
+
+- por tamaño: un grupo que llega a ``WRITE_BEHIND_BATCH_SIZE`` despierta al
+  flusher; por tiempo: flush cada ``WRITE_BEHIND_FLUSH_SECONDS``;
+- upserts con la misma clave de conflicto se coalescen (gana la última
+  fila), así un batch nunca toca la misma fila dos veces;
+- back-pressure: con ``WRITE_BEHIND_MAX_PENDING`` filas pendientes se
+  descarta la fila más vieja del grupo más grande y se despierta al
+  flusher; ``enqueue`` nunca hace I/O (corre en el event loop, en el
+  camino del fast loop de SL/TP);
+- si la DB no responde, las filas van a un archivo JSONL acotado
+  (``WRITE_BEHIND_SPILL_MAX_BYTES``; lo que no entra se descarta y se cuenta)
+  que se reintenta tras el siguiente flush exitoso;
+- el lifespan hace un flush final al apagar.
+
+Sin el buffer corriendo (tests, scripts, ``WRITE_BEHIND_ENABLED=false``)
+``enqueue`` devuelve False y el caller escribe directo como antes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..db import get_supabase
+
+logger = logging.getLogger(__name__)
+
+# Fallos consecutivos (sin ningún éxito) que se interpretan como caída de la DB
+_OUTAGE_FAILURES = 3
+
+GroupKey = Tuple[str, Optional[str]]  # (table, on_conflict)
+
+
+class WriteBehindBuffer:
+    """Batches telemetry rows per (table, on_conflict) and flushes them off the hot path."""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        flush_seconds: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        spill_path: Optional[str] = None,
+        spill_max_bytes: Optional[int] = None,
+    ):
+        self.batch_size = batch_size or settings.write_behind_batch_size
+        self.flush_seconds = flush_seconds or settings.write_behind_flush_seconds
+        self.max_pending = max_pending or settings.write_behind_max_pending
+        self.spill_path = spill_path or settings.write_behind_spill_path
+        self.spill_max_bytes = spill_max_bytes or settings.write_behind_spill_max_bytes
+
+        self._pending: Dict[GroupKey, Dict[Any, Dict[str, Any]]] = {}
+        self._count = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()        # protege _pending
+        self._flush_lock = threading.Lock()  # un flush a la vez
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.stats: Dict[str, Any] = {
+            "enqueued": 0, "coalesced": 0, "written": 0, "batches": 0, "flushes": 0,
+            "backpressure": 0, "rejected": 0, "spilled": 0, "replayed": 0, "dropped": 0,
+            "last_flush": None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    # ── Productores ────────────────────────────────────────────────────
+
+    def enqueue(self, table: str, row: Dict[str, Any], on_conflict: Optional[str] = None) -> bool:
+        """Encolar una fila. False si el buffer no está corriendo (escribir directo)."""
+        if not self._running:
+            return False
+        group: GroupKey = (table, on_conflict)
+        if on_conflict:
+            key: Any = tuple(row.get(c.strip()) for c in on_conflict.split(","))
+        else:
+            key = next(self._seq)
+        shed = False
+        with self._lock:
+            rows = self._pending.setdefault(group, {})
+            if key in rows:
+                self.stats["coalesced"] += 1
+            else:
+                if self._count >= self.max_pending:
+                    # Back-pressure: telemetría, se pierde la fila más vieja en vez de crecer sin límite
+                    largest = max(self._pending.values(), key=len)
+                    del largest[next(iter(largest))]
+                    self._count -= 1
+                    self.stats["backpressure"] += 1
+                    self.stats["dropped"] += 1
+                    shed = True
+                self._count += 1
+            rows[key] = row
+            full = shed or len(rows) >= self.batch_size
+        self.stats["enqueued"] += 1
+        if full:
+            self._wake_flusher()
+        return True
+
+    def _wake_flusher(self) -> None:
+        if self._loop is None or self._wake is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            pass  # loop cerrado
+
+    def pending(self) -> int:
+        return self._count
+
+    # ── Flush ──────────────────────────────────────────────────────────
+
+    def flush(self) -> Dict[str, int]:
+        """Write everything pending (blocking). Returns ``{written, rejected, spilled}``."""
+        with self._flush_lock:
+            with self._lock:
+                groups = {g: list(rows.values()) for g, rows in self._pending.items() if rows}
+                self._pending = {}
+                self._count = 0
+            result = {"written": 0, "rejected": 0, "spilled": 0}
+            if groups:
+                result = self._write_groups(groups)
+            if result["written"] and result["spilled"] == 0:
+                replay = self._replay_spill()
+                for k in result:
+                    result[k] += replay[k]
+            self.stats["flushes"] += 1
+            self.stats["last_flush"] = time.time()
+        return result
+
+    def _write_groups(self, groups: Dict[GroupKey, List[Dict[str, Any]]]) -> Dict[str, int]:
+        result = {"written": 0, "rejected": 0, "spilled": 0}
+        supabase = get_supabase()
+        outage = False
+        for (table, on_conflict), rows in groups.items():
+            # PostgREST exige las mismas columnas en todas las filas de un batch
+            by_shape: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+            for row in rows:
+                by_shape.setdefault(tuple(sorted(row)), []).append(row)
+            for shape_rows in by_shape.values():
+                for i in range(0, len(shape_rows), self.batch_size):
+                    batch = shape_rows[i : i + self.batch_size]
+                    if outage:
+                        result["spilled"] += self._spill(table, on_conflict, batch)
+                        continue
+                    written, rejected, failed = self._write_batch(supabase, table, on_conflict, batch)
+                    result["written"] += written
+                    result["rejected"] += rejected
+                    if failed:
+                        outage = True
+                        result["spilled"] += self._spill(table, on_conflict, failed)
+        return result
+
+    def _write_batch(
+        self, supabase, table: str, on_conflict: Optional[str], batch: List[Dict[str, Any]]
+    ) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """Batch write; on error, row by row to separate rejected rows from an outage.
+
+        Returns:
+            ``(written, rejected, unwritten)``: ``unwritten`` no vacío = la DB
+            no responde y esas filas hay que guardarlas.
+        """
+        try:
+            self._execute(supabase, table, on_conflict, batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            return len(batch), 0, []
+        except Exception as e:
+            logger.warning(f"Write-behind batch {table} ({len(batch)} rows) failed, retrying per row: {e}")
+
+        written = rejected = failures = 0
+        for idx, row in enumerate(batch):
+            try:
+                self._execute(supabase, table, on_conflict, [row])
+                written += 1
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if written == 0 and failures >= _OUTAGE_FAILURES:
+                    logger.error(f"Write-behind {table}: DB unavailable ({e})")
+                    # Las que fallaron antes de detectar la caída también se guardan
+                    return 0, 0, batch[idx + 1 - failures:]
+                rejected += 1
+                logger.warning(f"Write-behind {table}: row rejected: {e}")
+        self.stats["written"] += written
+        self.stats["rejected"] += rejected
+        return written, rejected, []
+
+    @staticmethod
+    def _execute(supabase, table: str, on_conflict: Optional[str], rows: List[Dict[str, Any]]) -> None:
+        query = supabase.table(table)
+        if on_conflict:
+            query.upsert(rows, on_conflict=on_conflict).execute()
+        else:
+            query.insert(rows).execute()
+
+    # ── Spill a disco ──────────────────────────────────────────────────
+
+    def _spill(self, table: str, on_conflict: Optional[str], rows: List[Dict[str, Any]]) -> int:
+        lines = [
+            json.dumps({"table": table, "on_conflict": on_conflict, "row": r}, default=str) + "\n"
+            for r in rows
+        ]
+        try:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+            kept = []
+            for line in lines:
+                if size + len(line) > self.spill_max_bytes:
+                    break
+                kept.append(line)
+                size += len(line)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.writelines(kept)
+        except OSError as e:
+            logger.error(f"Write-behind spill to {self.spill_path} failed: {e}")
+            kept = []
+        dropped = len(lines) - len(kept)
+        self.stats["spilled"] += len(kept)
+        if dropped:
+            self.stats["dropped"] += dropped
+            logger.error(f"Write-behind spill file full: dropped {dropped} {table} rows")
+        return len(kept)
+
+    def _replay_spill(self) -> Dict[str, int]:
+        """Reintentar las filas del spill file (se llama con la DB respondiendo)."""
+        result = {"written": 0, "rejected": 0, "spilled": 0}
+        if not os.path.exists(self.spill_path):
+            return result
+        try:
+            with open(self.spill_path, encoding="utf-8") as f:
+                lines = f.readlines()
+            os.remove(self.spill_path)
+        except OSError as e:
+            logger.error(f"Write-behind could not read spill file: {e}")
+            return result
+
+        groups: Dict[GroupKey, List[Dict[str, Any]]] = {}
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # línea truncada por un corte
+            groups.setdefault((entry["table"], entry.get("on_conflict")), []).append(entry["row"])
+        result = self._write_groups(groups)
+        self.stats["replayed"] += result["written"]
+        logger.info(f"Write-behind replayed {result['written']}/{len(lines)} spilled rows")
+        return result
+
+    # ── Ciclo de vida ──────────────────────────────────────────────────
+
+    def start(self) -> asyncio.Task:
+        """Arrancar el flusher en el event loop actual."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._running = True
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Write-behind buffer started (batch={self.batch_size}, every {self.flush_seconds}s, "
+            f"max_pending={self.max_pending})"
+        )
+        return self._task
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Write-behind flush error: {e}")
+
+    async def stop(self) -> Dict[str, int]:
+        """Detener el flusher y escribir lo pendiente (graceful shutdown)."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        result = await asyncio.to_thread(self.flush)
+        logger.info(f"Write-behind buffer stopped: {result}")
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        return {"running": self._running, "pending": self._count, **self.stats}
+
+
+_buffer = WriteBehindBuffer()
+
+
+def get_write_behind() -> WriteBehindBuffer:
+    return _buffer
+
+
+def enqueue(table: str, row: Dict[str, Any], on_conflict: Optional[str] = None) -> bool:
+    """Shortcut al buffer global; False = el caller debe escribir directo."""
+    return _buffer.enqueue(table, row, on_conflict)
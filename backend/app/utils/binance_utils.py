@@ -1,5 +1,9 @@
 """
 Utilidades compartidas para la integración con Binance.
+
+Las tablas de precisión son el fallback: cuando ``exchange_filters`` carga
+``exchangeInfo`` registra acá los filtros reales (``set_symbol_filters``) y
+todos los redondeos pasan a usarlos.
 """
 
 from math import floor as _floor
@@ -14,6 +18,58 @@ _SYMBOL_PRECISION = {
 }
 _DEFAULT_PRECISION = (2, 0.01)
 
+# Tick size de precio por símbolo (filtro PRICE_FILTER del testnet)
+_SYMBOL_TICK = {
+    "BTCUSDT": (2, 0.01),
+    "ETHUSDT": (2, 0.01),
+    "SOLUSDT": (2, 0.01),
+    "BNBUSDT": (2, 0.01),
+    "XRPUSDT": (4, 0.0001),
+}
+_DEFAULT_TICK = (2, 0.01)
+
+# Filtros leídos del exchange (pisan las tablas de arriba)
+_LIVE_PRECISION: dict = {}
+_LIVE_TICK: dict = {}
+
+
+def step_decimals(step: float) -> int:
+    """Decimales de un step/tick size (0.00001 -> 5, 1.0 -> 0)."""
+    text = f"{step:.10f}".rstrip("0")
+    return len(text.split(".")[1]) if "." in text else 0
+
+
+def floor_to_step(qty: float, step: float, decimals: int) -> float:
+    """Floor al step sin perder uno por error de float (0.00029 / 0.00001 = 28.999...)."""
+    units = qty / step
+    nearest = round(units)
+    if abs(units - nearest) < 1e-9:     # ya está sobre un step
+        return round(nearest * step, decimals)
+    return round(_floor(units) * step, decimals)
+
+
+def set_symbol_filters(symbol: str, step_size: float, tick_size: float) -> None:
+    """Registrar LOT_SIZE.stepSize y PRICE_FILTER.tickSize reales de un símbolo."""
+    if step_size > 0:
+        _LIVE_PRECISION[symbol] = (step_decimals(step_size), step_size)
+    if tick_size > 0:
+        _LIVE_TICK[symbol] = (step_decimals(tick_size), tick_size)
+
+
+def clear_symbol_filters() -> None:
+    _LIVE_PRECISION.clear()
+    _LIVE_TICK.clear()
+
+
+def quantity_precision(symbol: str) -> tuple:
+    """``(decimales, step)`` de cantidad: filtro real si se cargó, si no la tabla."""
+    return _LIVE_PRECISION.get(symbol) or _SYMBOL_PRECISION.get(symbol, _DEFAULT_PRECISION)
+
+
+def price_precision(symbol: str) -> tuple:
+    """``(decimales, tick)`` de precio: filtro real si se cargó, si no la tabla."""
+    return _LIVE_TICK.get(symbol) or _SYMBOL_TICK.get(symbol, _DEFAULT_TICK)
+
 
 def round_quantity(symbol: str, qty: float) -> float:
     """
@@ -21,6 +77,11 @@ def round_quantity(symbol: str, qty: float) -> float:
     Usa floor para nunca exceder la tenencia disponible.
     Evita errores 400 Bad Request por cantidad inválida.
     """
-    decimals, step = _SYMBOL_PRECISION.get(symbol, _DEFAULT_PRECISION)
-    floored = _floor(qty / step) * step
-    return round(floored, decimals)
+    decimals, step = quantity_precision(symbol)
+    return floor_to_step(qty, step, decimals)
+
+
+def round_price(symbol: str, price: float) -> float:
+    """Redondea el precio al tick size del símbolo (filtro PRICE_FILTER)."""
+    decimals, tick = price_precision(symbol)
+    return round(round(price / tick) * tick, decimals)
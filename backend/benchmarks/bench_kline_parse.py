@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Benchmark: kline parse throughput, dict path vs typed NumPy path.
+
+Usage (desde backend/):
+    python benchmarks/bench_kline_parse.py [--rows 200000] [--repeat 3]
+
+Reporta segundos por millón de velas y velas/segundo para:
+  - REST arrays → dicts (``_parse_kline`` por fila, camino legacy)
+  - REST arrays → batch tipado (``parse_raw_klines``)
+  - batch tipado → dicts para upsert (``to_db_rows``)
+  - CSV de data.binance.vision → batch tipado (``parse_csv_lines``)
+  - filas de DB → DataFrame (pd.to_datetime/to_numeric vs from_db_rows + to_frame)
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.kline_arrays import (  # noqa: E402
+    from_db_rows,
+    parse_csv_lines,
+    parse_raw_klines,
+    to_db_rows,
+    to_frame,
+)
+from app.services.kline_collector import _parse_kline  # noqa: E402
+
+START_MS = 1_704_067_200_000  # 2024-01-01
+MIN_MS = 60_000
+_DF_COLS = ["open", "high", "low", "close", "volume", "quote_volume", "trades_count"]
+
+
+def _make_raw(n: int) -> list[list]:
+    rng = np.random.default_rng(42)
+    px = 40_000 + np.cumsum(rng.normal(0, 10, n))
+    raw = []
+    for i in range(n):
+        ot = START_MS + i * MIN_MS
+        p = px[i]
+        raw.append([
+            ot, f"{p:.2f}", f"{p + 5:.2f}", f"{p - 5:.2f}", f"{p + 1:.2f}", "12.345",
+            ot + MIN_MS - 1, "493800.12", 321, "6.1", "244000.5", "0",
+        ])
+    return raw
+
+
+def _legacy_frame(rows: list[dict]) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    df["open_time"] = pd.to_datetime(df["open_time"], utc=True)
+    for col in _DF_COLS:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df.set_index("open_time")
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    n = args.rows
+
+    raw = _make_raw(n)
+    csv_lines = [",".join(str(v) for v in k) + "\n" for k in raw]
+    batch = parse_raw_klines(raw)
+    db_rows = to_db_rows("BTCUSDT", "1m", batch)
+
+    cases = [
+        ("rest -> dicts (legacy)", lambda: [_parse_kline("BTCUSDT", "1m", k) for k in raw]),
+        ("rest -> typed batch", lambda: parse_raw_klines(raw)),
+        ("typed batch -> db rows", lambda: to_db_rows("BTCUSDT", "1m", batch)),
+        ("csv -> typed batch", lambda: parse_csv_lines(csv_lines)),
+        ("db rows -> frame (legacy)", lambda: _legacy_frame(db_rows)),
+        ("db rows -> frame (typed)", lambda: to_frame(from_db_rows(db_rows), _DF_COLS)),
+    ]
+
+    print(f"{n:,} candles, best of {args.repeat}")
+    print(f"{'path':<28}{'s / 1M candles':>16}{'candles / s':>16}")
+    for name, fn in cases:
+        elapsed = _time(fn, args.repeat)
+        print(f"{name:<28}{elapsed * 1_000_000 / n:>16.3f}{n / elapsed:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Benchmark: portfolio VaR/CVaR per proposal and covariance update per candle.
+
+Usage (desde backend/):
+    python benchmarks/bench_portfolio_var.py [--symbols 50] [--positions 10] [--iterations 2000]
+
+Alimenta ``PortfolioRisk`` con velas sintéticas correlacionadas y mide:
+``impact`` (exposiciones del book + VaR/CVaR paramétrico e histórico antes y
+después del proposal — lo que corre en cada validación) y ``observe`` (una
+vela cerrada, O(N²)). Reporta p50/p95/media en µs; el presupuesto por
+proposal es < 1 ms a 50 símbolos.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Tuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.portfolio_risk import PortfolioRisk  # noqa: E402
+
+HOUR_MS = 3_600_000
+
+
+def _measure(fn: Callable[[], object], iterations: int) -> Tuple[float, float, float]:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples), p95, statistics.fmean(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--positions", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--window", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    n = args.symbols
+    factor = rng.normal(0, 0.008, size=(args.window + 50, 1))
+    returns = factor + rng.normal(0, 0.006, size=(args.window + 50, n))
+    closes = 100 * np.cumprod(1 + returns, axis=0)
+    symbols = [f"SYM{i}USDT" for i in range(n)]
+
+    model = PortfolioRisk(lam=0.94, window=args.window, confidence=0.99)
+    for t, row in enumerate(closes):
+        model.observe(t * HOUR_MS, dict(zip(symbols, row)))
+    book = [
+        {"symbol": s, "current_quantity": 1.0, "current_price": float(closes[-1, i])}
+        for i, s in enumerate(symbols[: args.positions])
+    ]
+
+    print(f"{n} symbols, {args.positions} open positions, window {args.window}, {args.iterations} iterations")
+    impact = model.impact(book, symbols[-1], "buy", 100.0)
+    print(f"book VaR99 param ${impact.before.parametric_var:.2f} / hist ${impact.before.historical_var:.2f}, "
+          f"marginal ${impact.marginal:+.2f}")
+
+    next_bar = [len(closes)]
+
+    def observe_one():
+        model.observe(next_bar[0] * HOUR_MS, dict(zip(symbols, closes[-1])))
+        next_bar[0] += 1
+
+    print(f"{'operation':<28}{'p50 µs':>10}{'p95 µs':>10}{'mean µs':>10}")
+    cases = [
+        ("impact (per proposal)", lambda: model.impact(book, symbols[-1], "buy", 100.0)),
+        ("observe (per candle)", observe_one),
+    ]
+    for name, fn in cases:
+        fn()  # warm-up
+        p50, p95, mean = _measure(fn, args.iterations)
+        print(f"{name:<28}{p50:>10.1f}{p95:>10.1f}{mean:>10.1f}")
+
+
+
+if __name__ == "__main__":
+    main()
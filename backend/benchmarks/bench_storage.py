@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Benchmark: query latency, embedded SQLite store vs Supabase REST.
+
+Usage (desde backend/):
+    python benchmarks/bench_storage.py [--iterations 200] [--klines 5000] [--rest]
+
+Corre las queries típicas de un tick (posiciones abiertas, últimas velas,
+conteo de proposals, update de una posición, upsert de un batch de velas)
+contra ``LocalClient`` en memoria y en archivo (WAL) y reporta p50/p95/media
+en ms. Con ``--rest`` también mide el camino PostgREST usando
+SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY del entorno — sólo las queries de
+lectura: el benchmark nunca escribe en Supabase.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.local_store import LocalClient  # noqa: E402
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _klines(n: int, offset: int = 0) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(offset, offset + n):
+        ot = START + timedelta(minutes=i)
+        rows.append({
+            "symbol": "BTCUSDT", "interval": "1m",
+            "open_time": ot.isoformat(), "close_time": (ot + timedelta(seconds=59)).isoformat(),
+            "open": 40_000.0 + i, "high": 40_005.0 + i, "low": 39_995.0 + i, "close": 40_001.0 + i,
+            "volume": 12.3, "quote_volume": 493_800.1, "trades_count": 321,
+        })
+    return rows
+
+
+def _seed(client: Any, klines: int) -> str:
+    for start in range(0, klines, 1000):
+        client.table("klines_ohlcv").upsert(
+            _klines(min(1000, klines - start), start), on_conflict="symbol,interval,open_time"
+        ).execute()
+    position_id = ""
+    for i, symbol in enumerate(("BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "XRPUSDT")):
+        row = client.table("positions").insert({
+            "symbol": symbol, "side": "long", "entry_price": 100.0 + i, "entry_quantity": 1.0,
+            "entry_notional": 100.0 + i, "current_quantity": 1.0,
+            "status": "open" if i < 3 else "closed",
+        }).execute().data[0]
+        position_id = position_id or row["id"]
+    for i in range(200):
+        client.table("trade_proposals").insert({
+            "type": "buy", "symbol": "BTCUSDT", "quantity": 0.001, "notional": 50.0,
+            "status": ("executed", "rejected", "error", "dead_letter")[i % 4],
+        }).execute()
+    return position_id
+
+
+def _read_cases(client: Any) -> List[Tuple[str, Callable[[], Any]]]:
+    return [
+        ("open positions", lambda: client.table("positions").select("*").in_("status", ["open", "partially_closed"]).execute()),
+        ("latest 200 klines", lambda: client.table("klines_ohlcv").select("open_time,open,high,low,close,volume")
+            .eq("symbol", "BTCUSDT").eq("interval", "1m").order("open_time", desc=True).limit(200).execute()),
+        ("count dead letters", lambda: client.table("trade_proposals").select("id", count="exact").eq("status", "dead_letter").execute()),
+    ]
+
+
+def _write_cases(client: Any, position_id: str, klines: int) -> List[Tuple[str, Callable[[], Any]]]:
+    batch = _klines(500, klines - 250)  # mitad update, mitad insert la primera vez
+    return [
+        ("update position", lambda: client.table("positions").update({"current_price": 101.5}).eq("id", position_id).execute()),
+        ("upsert 500 klines", lambda: client.table("klines_ohlcv").upsert(batch, on_conflict="symbol,interval,open_time").execute()),
+    ]
+
+
+def _measure(fn: Callable[[], Any], iterations: int) -> Tuple[float, float, float]:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples), p95, statistics.fmean(samples)
+
+
+def _report(backend: str, cases: List[Tuple[str, Callable[[], Any]]], iterations: int) -> None:
+    for name, fn in cases:
+        fn()  # warm-up
+        p50, p95, mean = _measure(fn, iterations)
+        print(f"{backend:<14}{name:<22}{p50:>10.3f}{p95:>10.3f}{mean:>10.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--klines", type=int, default=5000)
+    parser.add_argument("--rest", action="store_true", help="medir también Supabase REST (sólo lecturas)")
+    args = parser.parse_args()
+
+    print(f"{args.iterations} iterations, {args.klines:,} klines seeded")
+    print(f"{'backend':<14}{'query':<22}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend, path in (("sqlite-mem", ":memory:"), ("sqlite-file", os.path.join(tmp, "bench.db"))):
+            client = LocalClient(path)
+            position_id = _seed(client, args.klines)
+            _report(backend, _read_cases(client) + _write_cases(client, position_id, args.klines), args.iterations)
+            client.close()
+
+    if args.rest:
+        from supabase import create_client
+        from app.config import settings
+        if not settings.supabase_url or not settings.supabase_service_role_key:
+            print("rest: SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY not set, skipped")
+            return
+        client = create_client(settings.supabase_url, settings.supabase_service_role_key)
+        _report("supabase-rest", _read_cases(client), max(1, args.iterations // 10))
+
+
+if __name__ == "__main__":
+    main()
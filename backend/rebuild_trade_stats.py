@@ -0,0 +1,59 @@
+"""Reconstruir / verificar los agregados de trades (trade_aggregates).
+
+Recalcula todo desde las posiciones cerradas y compara con lo almacenado
+(bucket ``all`` y los últimos 30 días).
+
+Uso:
+    cd backend
+    python rebuild_trade_stats.py            # verificar y reescribir
+    python rebuild_trade_stats.py --check    # sólo verificar (exit 1 si hay diferencias)
+"""
+
+import argparse
+import logging
+import sys
+import os
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Cargar .env desde la raíz del proyecto
+from dotenv import load_dotenv
+root_env = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
+load_dotenv(root_env)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%H:%M:%S",
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rebuild trade aggregates from closed positions")
+    parser.add_argument("--check", action="store_true", help="Sólo verificar, no escribir")
+    args = parser.parse_args()
+
+    from app.services.trade_stats import get_trade_stats
+
+    store = get_trade_stats()
+    store.load(rebuild_if_empty=False)
+    result = store.rebuild(persist=not args.check)
+
+    print(f"Closed positions: {result['trades']} | aggregate rows: {result['rows']}")
+    for m in result["mismatches"][:50]:
+        print(f"  {m['scope']}/{m['scope_key']}/{m['bucket']} {m['field']}: "
+              f"stored={m['stored']} rebuilt={m['rebuilt']}")
+    if len(result["mismatches"]) > 50:
+        print(f"  ... {len(result['mismatches']) - 50} more")
+    if not result["mismatches"]:
+        print("Aggregates match the closed positions")
+    elif not args.check:
+        print("Aggregates rewritten from closed positions")
+    return 1 if args.check and result["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
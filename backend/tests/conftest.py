@@ -71,3 +71,36 @@ def mock_supabase() -> MagicMock:
     mock.table.return_value.delete.return_value.eq.return_value.execute.return_value = empty
     mock.table.return_value.select.return_value.eq.return_value.gte.return_value.execute.return_value = empty
     return mock
+
+
+@pytest.fixture(autouse=True)
+def _reset_position_book():
+    """Book, trailing engine, trade stats, mark-to-market, cuenta, reconciliación, lecturas quant, modelo de VaR, user stream, trazas de latencia, filtros del exchange y scheduler de velas son singletons de proceso: aislar cada test."""
+    from app.services.position_book import get_position_book
+    from app.services.trailing_engine import get_trailing_engine
+    from app.services.trade_stats import get_trade_stats
+    from app.services.mark_to_market import get_mark_to_market
+    from app.services.reconciliation import reset_reconciliation_state
+    from app.services.account_state import get_account_state
+    from app.services.quant_orchestrator import reset_readings
+    from app.services.portfolio_risk import get_portfolio_risk
+    from app.services.user_stream import get_user_stream
+    from app.services.latency_trace import reset_traces
+    from app.services.exchange_filters import get_exchange_filters
+    from app.services.candle_scheduler import get_candle_scheduler
+    get_position_book().clear()
+    get_trailing_engine().reset()
+    get_trade_stats().clear()
+    get_mark_to_market().reset()
+    reset_reconciliation_state()
+    get_account_state().reset()
+    reset_readings()
+    get_portfolio_risk().reset()
+    get_user_stream().reset()
+    reset_traces()
+    get_exchange_filters().reset()
+    get_candle_scheduler().reset()
+    yield
+    get_position_book().clear()
+    get_trade_stats().clear()
+    get_trailing_engine().reset()
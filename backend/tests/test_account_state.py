@@ -0,0 +1,124 @@
+"""Tests para account_state.py — un get_account por tick + ledger de fills propios."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.account_state import AccountState, split_symbol
+
+
+def _account(usdt="1000", btc="0"):
+    return {"canTrade": True, "balances": [
+        {"asset": "USDT", "free": usdt, "locked": "0"},
+        {"asset": "BTC", "free": btc, "locked": "0"},
+    ]}
+
+
+def _free(account, asset):
+    return next(float(b["free"]) for b in account["balances"] if b["asset"] == asset)
+
+
+@pytest.fixture
+def exchange():
+    with patch("app.services.account_state.binance_client") as bc:
+        bc.get_account = AsyncMock(return_value=_account())
+        yield bc
+
+
+def test_split_symbol():
+    assert split_symbol("BTCUSDT") == ("BTC", "USDT")
+    assert split_symbol("ETHBTC") == ("ETH", "BTC")
+    assert split_symbol("SOLFDUSD") == ("SOL", "FDUSD")
+
+
+@pytest.mark.asyncio
+async def test_many_readers_share_one_refresh(exchange):
+    state = AccountState()
+    results = await asyncio.gather(*(state.get_account() for _ in range(5)))
+    await state.get_account()
+
+    exchange.get_account.assert_awaited_once()
+    assert all(_free(r, "USDT") == 1000 for r in results)
+    assert results[0]["canTrade"] is True
+    assert results[0]["freshness"]["source"] == "exchange"
+    assert state.stats["hits"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_buy_fill_adjusts_ledger_between_refreshes(exchange):
+    state = AccountState()
+    await state.get_account()
+    state.apply_order("BTCUSDT", "BUY", {
+        "executedQty": "0.002", "cummulativeQuoteQty": "100.0",
+        "fills": [{"price": "50000", "qty": "0.002", "commission": "0.000002", "commissionAsset": "BTC"}],
+    })
+
+    account = await state.get_account()
+    exchange.get_account.assert_awaited_once()
+    assert _free(account, "USDT") == pytest.approx(900.0)
+    assert _free(account, "BTC") == pytest.approx(0.001998)
+    assert account["freshness"]["fills_since_refresh"] == 1
+    assert account["freshness"]["source"] == "ledger"
+
+
+@pytest.mark.asyncio
+async def test_sell_without_quote_qty_uses_fills_and_frees_locked(exchange):
+    exchange.get_account.return_value = {"balances": [
+        {"asset": "USDT", "free": "0", "locked": "0"},
+        {"asset": "BTC", "free": "0", "locked": "0.01"},  # bloqueado por el OCO recién cancelado
+    ]}
+    state = AccountState()
+    await state.get_account()
+    state.apply_order("BTCUSDT", "SELL", {
+        "executedQty": "0.01", "fills": [{"price": "50000", "qty": "0.01", "commission": "0.5", "commissionAsset": "USDT"}],
+    })
+
+    assert await state.free("USDT") == pytest.approx(499.5)
+    assert await state.free("BTC") == 0
+    assert state._balances["BTC"]["locked"] == pytest.approx(0)
+
+
+@pytest.mark.asyncio
+async def test_expiry_and_invalidate_force_refresh(exchange):
+    state = AccountState()
+    await state.get_account()
+    await state.get_account(max_age=0)
+    assert exchange.get_account.await_count == 2
+
+    state.invalidate("exchange-side fill")
+    await state.get_account()
+    assert exchange.get_account.await_count == 3
+    assert state.stats["invalidations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_logs_ledger_drift(exchange):
+    state = AccountState()
+    await state.get_account()
+    state.apply_order("BTCUSDT", "BUY", {"executedQty": "0.002", "cummulativeQuoteQty": "100.0", "fills": []})
+
+    state.observe(_account(usdt="850", btc="0.002"))  # el exchange cobró más de lo que esperábamos
+    assert state.stats["drift_events"] == 1
+    assert await state.free("USDT") == 850
+    assert state.freshness()["fills_since_refresh"] == 0
+
+
+@pytest.mark.asyncio
+async def test_proposals_in_one_tick_cost_one_account_call(mock_supabase):
+    """validate_proposal + compute_position_size para N proposals = 1 get_account."""
+    from app.services.position_sizer import compute_position_size
+    from app.services.risk_manager import validate_proposal
+
+    get_account = AsyncMock(return_value=_account(usdt="5000"))
+    ind = MagicMock(atr_14=500.0)
+    with patch("app.services.binance_client.get_account", get_account), \
+         patch("app.services.binance_client.get_price", AsyncMock(return_value={"price": "50000"})), \
+         patch("app.services.position_sizer.compute_indicators", return_value=ind), \
+         patch("app.services.position_sizer.get_supabase", return_value=mock_supabase), \
+         patch("app.services.risk_manager.get_supabase", return_value=mock_supabase):
+        for symbol in ("BTCUSDT", "ETHUSDT", "SOLUSDT"):
+            await compute_position_size(symbol, "1h")
+            await validate_proposal("buy", symbol, 0.001, 50.0, 50000.0)
+
+    get_account.assert_awaited_once()
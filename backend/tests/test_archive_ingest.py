@@ -0,0 +1,179 @@
+"""Tests para archive_ingest.py — ingesta streaming de ZIPs de data.binance.vision.
+
+Todos los tests corren offline contra un directorio temporal con el mismo
+layout que data.binance.vision (SYMBOL/INTERVAL/file.zip + .CHECKSUM).
+"""
+
+import asyncio
+import hashlib
+import zipfile
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+import pytest
+
+from app.services.kline_arrays import KLINE_DTYPE, parse_csv_lines, to_db_rows
+from app.services.ml.archive_ingest import (
+    LocalArchiveSource,
+    archive_filename,
+    ingest_symbol_archive,
+    month_range,
+)
+
+HOUR_MS = 3_600_000
+NOW = datetime(2025, 4, 15, tzinfo=timezone.utc)
+
+
+def _csv_rows(start_ms: int, n: int, micros: bool = False, skip: set[int] = frozenset()) -> str:
+    lines = []
+    for i in range(n):
+        if i in skip:
+            continue
+        ot = start_ms + i * HOUR_MS
+        ct = ot + HOUR_MS - 1
+        if micros:
+            ot, ct = ot * 1000, ct * 1000 + 999
+        lines.append(f"{ot},100.0,101.0,99.0,100.5,10.0,{ct},1005.0,42,5.0,502.5,0")
+    return "\n".join(lines) + "\n"
+
+
+def _write_month(root, symbol, year, month, body: str, checksum: str | None = "auto"):
+    folder = root / symbol / "1h"
+    folder.mkdir(parents=True, exist_ok=True)
+    name = archive_filename(symbol, "1h", year, month)
+    path = folder / name
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(name.replace(".zip", ".csv"), body)
+    if checksum == "auto":
+        checksum = hashlib.sha256(path.read_bytes()).hexdigest()
+    if checksum is not None:
+        (folder / (name + ".CHECKSUM")).write_text(f"{checksum}  {name}\n")
+    return path
+
+
+def _month_start_ms(year, month):
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class _CollectingSink:
+    def __init__(self):
+        self.batches = []
+        self.max_batch = 0
+
+    async def __call__(self, symbol, interval, batch):
+        self.batches.append(batch.copy())
+        self.max_batch = max(self.max_batch, len(batch))
+        await asyncio.sleep(0)
+        return len(batch)
+
+
+def test_month_range_uses_calendar_months():
+    """Los meses se calculan por calendario, sin duplicar ni saltear (bug de 30 días)."""
+    assert month_range(3, NOW) == [(2025, 1), (2025, 2), (2025, 3)]
+    assert month_range(2, datetime(2025, 1, 31, tzinfo=timezone.utc)) == [(2024, 11), (2024, 12)]
+
+
+def test_parse_csv_lines_normalizes_microseconds_and_skips_header():
+    lines = ["open_time,open,high,low,close\n"] + _csv_rows(1_735_689_600_000, 2, micros=True).splitlines(True)
+    batch = parse_csv_lines(lines)
+    assert batch.dtype == KLINE_DTYPE
+    assert batch["open_time"].tolist() == [1_735_689_600_000, 1_735_689_600_000 + HOUR_MS]
+    assert batch["close_time"][0] == 1_735_689_600_000 + HOUR_MS - 1
+    assert batch["trades_count"][0] == 42
+
+
+def test_to_db_rows_keeps_millisecond_close_time():
+    batch = parse_csv_lines(_csv_rows(1_735_689_600_000, 1).splitlines())
+    row = to_db_rows("BTCUSDT", "1h", batch)[0]
+    assert row["open_time"] == "2025-01-01T00:00:00.000Z"
+    assert row["close_time"] == "2025-01-01T00:59:59.999Z"
+    assert row["close"] == 100.5 and row["trades_count"] == 42
+
+
+@pytest.mark.asyncio
+async def test_ingest_streams_months_in_bounded_chunks(tmp_path):
+    for year, month in [(2025, 1), (2025, 2), (2025, 3)]:
+        start = _month_start_ms(year, month)
+        n = 24 * (31 if month != 2 else 28)
+        _write_month(tmp_path, "BTCUSDT", year, month, _csv_rows(start, n))
+
+    sink = _CollectingSink()
+    result = await ingest_symbol_archive(
+        "BTCUSDT", "1h", months_back=3, source=LocalArchiveSource(tmp_path),
+        sink=sink, chunk_rows=100, max_concurrency=2, now=NOW,
+    )
+
+    assert result["total_fetched"] == 24 * (31 + 28 + 31)
+    assert result["total_stored"] == result["total_fetched"]
+    assert result["failed_months"] == 0
+    assert result["gaps_found"] == 0
+    assert all(m["checksum_verified"] for m in result["months_detail"])
+    # Memoria acotada: ningún batch supera chunk_rows
+    assert sink.max_batch <= 100
+    all_times = np.sort(np.concatenate([b["open_time"] for b in sink.batches]))
+    assert len(np.unique(all_times)) == len(all_times)
+
+
+@pytest.mark.asyncio
+async def test_checksum_mismatch_marks_month_failed(tmp_path):
+    _write_month(tmp_path, "ETHUSDT", 2025, 3, _csv_rows(_month_start_ms(2025, 3), 24), checksum="0" * 64)
+
+    sink = _CollectingSink()
+    result = await ingest_symbol_archive(
+        "ETHUSDT", "1h", months_back=1, source=LocalArchiveSource(tmp_path), sink=sink, now=NOW,
+    )
+
+    assert result["failed_months"] == 1
+    assert result["checksum_failures"] == 1
+    assert result["total_stored"] == 0
+    assert sink.batches == []
+
+
+@pytest.mark.asyncio
+async def test_missing_months_and_gaps_are_reported(tmp_path):
+    start = _month_start_ms(2025, 3)
+    _write_month(tmp_path, "SOLUSDT", 2025, 3, _csv_rows(start, 48, skip={10, 11, 30}))
+
+    result = await ingest_symbol_archive(
+        "SOLUSDT", "1h", months_back=2, source=LocalArchiveSource(tmp_path),
+        sink=_CollectingSink(), chunk_rows=7, now=NOW,
+    )
+
+    assert result["failed_months"] == 1  # febrero no existe
+    assert result["total_fetched"] == 45
+    assert result["gaps_found"] == 2
+
+
+@pytest.mark.asyncio
+async def test_require_checksum_rejects_unsigned_archives(tmp_path):
+    _write_month(tmp_path, "BNBUSDT", 2025, 3, _csv_rows(_month_start_ms(2025, 3), 24), checksum=None)
+
+    result = await ingest_symbol_archive(
+        "BNBUSDT", "1h", months_back=1, source=LocalArchiveSource(tmp_path),
+        sink=_CollectingSink(), require_checksum=True, now=NOW,
+    )
+
+    assert result["failed_months"] == 1
+    assert result["total_fetched"] == 0
+    assert result["months_detail"][0]["error_kind"] == "checksum"
+
+
+@pytest.mark.asyncio
+async def test_fetch_error_fails_only_that_month(tmp_path):
+    for month in (2, 3):
+        _write_month(tmp_path, "XRPUSDT", 2025, month, _csv_rows(_month_start_ms(2025, month), 24))
+
+    class _FlakySource(LocalArchiveSource):
+        async def fetch(self, symbol, interval, filename):
+            if "2025-02" in filename:
+                raise httpx.ConnectError("connection reset")
+            return await super().fetch(symbol, interval, filename)
+
+    result = await ingest_symbol_archive(
+        "XRPUSDT", "1h", months_back=2, source=_FlakySource(tmp_path), sink=_CollectingSink(), now=NOW,
+    )
+
+    assert result["failed_months"] == 1 and result["checksum_failures"] == 0
+    assert result["total_fetched"] == 24
+    assert [m["error_kind"] for m in result["months_detail"]] == ["fetch", None]
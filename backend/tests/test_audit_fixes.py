@@ -138,25 +138,24 @@ async def test_commission_conversion_fallback_on_error():
 
 @pytest.mark.asyncio
 async def test_stale_proposals_get_expired():
-    """Proposals older than 1h in draft/approved should be expired."""
+    """Proposals older than 1h in draft/approved should be expired (one bulk UPDATE)."""
     from app.services.reconciliation import _expire_stale_proposals
 
     sb = MagicMock()
-    old_proposal = {"id": "old-1", "symbol": "BTCUSDT", "type": "buy", "status": "approved"}
+    old_proposal = {"id": "old-1", "symbol": "BTCUSDT", "type": "buy", "status": "rejected"}
 
-    # select returns stale proposals for each status
-    sb.table.return_value.select.return_value.eq.return_value.lt.return_value.execute.return_value = MagicMock(
+    # update ... where status in (...) and created_at < cutoff → filas vencidas
+    update = sb.table.return_value.update
+    update.return_value.in_.return_value.lt.return_value.execute.return_value = MagicMock(
         data=[old_proposal]
     )
-    # update chain
-    sb.table.return_value.update.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock()
 
     count = await _expire_stale_proposals(sb)
 
-    assert count >= 1
-    # Verify update was called with expired status
-    update_calls = sb.table.return_value.update.call_args_list
-    assert any("expired" in str(c) for c in update_calls)
+    assert count == 1
+    assert update.call_count == 1
+    assert "expired" in str(update.call_args)
+    update.return_value.in_.assert_called_once_with("status", ["draft", "validated", "approved"])
 
 
 @pytest.mark.asyncio
@@ -165,12 +164,12 @@ async def test_fresh_proposals_not_expired():
     from app.services.reconciliation import _expire_stale_proposals
 
     sb = MagicMock()
-    # No stale proposals found
-    sb.table.return_value.select.return_value.eq.return_value.lt.return_value.execute.return_value = MagicMock(
+    # The bulk update matches no rows
+    sb.table.return_value.update.return_value.in_.return_value.lt.return_value.execute.return_value = MagicMock(
         data=[]
     )
 
     count = await _expire_stale_proposals(sb)
 
     assert count == 0
-    sb.table.return_value.update.assert_not_called()
+    sb.table.return_value.select.assert_not_called()
@@ -0,0 +1,215 @@
+"""Tests para bulk_reader.py — paginación keyset contra un stand-in de PostgREST.
+
+``_FakePostgrest`` implementa el subconjunto de filtros que usa el reader
+(eq/gt/lt/gte/lte, or=(...) con and(...), order, limit, range) sobre una lista
+en memoria, con la misma semántica de orden que Postgres para las columnas
+usadas (strings ISO del mismo formato ordenan igual que los timestamps).
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from app.services.bulk_reader import BulkReader, keyset_condition, kline_reader, read_klines
+
+HOUR = 3_600_000
+T0 = 1_735_689_600_000
+
+
+def _iso(ms: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(ms / 1000))
+
+
+def _split_top(text: str) -> list[str]:
+    parts, depth, quoted, cur = [], 0, False, ""
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        if not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    return parts + [cur]
+
+
+_OPS = {
+    "eq": lambda a, b: a == b, "gt": lambda a, b: a > b, "lt": lambda a, b: a < b,
+    "gte": lambda a, b: a >= b, "lte": lambda a, b: a <= b,
+}
+
+
+def _compile(expr: str):
+    if expr.startswith("and("):
+        subs = [_compile(p) for p in _split_top(expr[4:-1])]
+        return lambda row: all(f(row) for f in subs)
+    col, op, value = expr.split(".", 2)
+    value = value.strip('"')
+    return lambda row: _OPS[op](str(row[col]), value)
+
+
+class _Query:
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.preds, self.orders, self._limit, self._offset = [], [], None, 0
+
+    def select(self, cols):
+        self.cols = [c.strip() for c in cols.split(",")]
+        return self
+
+    def _cmp(self, op, col, value):
+        self.preds.append(lambda r: _OPS[op](str(r[col]), str(value)))
+        return self
+
+    def eq(self, c, v): return self._cmp("eq", c, v)
+    def gt(self, c, v): return self._cmp("gt", c, v)
+    def lt(self, c, v): return self._cmp("lt", c, v)
+    def gte(self, c, v): return self._cmp("gte", c, v)
+    def lte(self, c, v): return self._cmp("lte", c, v)
+
+    def or_(self, expr):
+        subs = [_compile(p) for p in _split_top(expr)]
+        self.preds.append(lambda r: any(f(r) for f in subs))
+        return self
+
+    def order(self, col, desc=False):
+        self.orders.append((col, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def execute(self):
+        self.db.requests += 1
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        rows = [r for r in self.db.tables[self.table] if all(p(r) for p in self.preds)]
+        for col, desc in reversed(self.orders):
+            rows.sort(key=lambda r: r[col], reverse=desc)
+        rows = rows[self._offset:self._offset + self._limit]
+        data = [r if self.cols == ["*"] else {c: r[c] for c in self.cols} for r in rows]
+        if self.db.on_execute:
+            self.db.on_execute(self.db)
+        return type("Resp", (), {"data": data})()
+
+
+class _FakePostgrest:
+    def __init__(self, tables, latency=0.0, on_execute=None):
+        self.tables, self.latency, self.on_execute = tables, latency, on_execute
+        self.requests = 0
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+def _klines(pairs, n):
+    rows = []
+    for sym, iv in pairs:
+        for i in range(n):
+            rows.append({
+                "symbol": sym, "interval": iv, "open_time": _iso(T0 + i * HOUR),
+                "close": 100.0 + i, "trades_count": i,
+            })
+    return rows
+
+
+def test_keyset_condition_expands_row_comparison():
+    last = {"symbol": "BTCUSDT", "interval": "1h", "open_time": "2025-01-01T00:00:00+00:00"}
+    cond = keyset_condition(["symbol", "interval", "open_time"], last)
+    assert cond == (
+        "symbol.gt.BTCUSDT,"
+        "and(symbol.eq.BTCUSDT,interval.gt.1h),"
+        'and(symbol.eq.BTCUSDT,interval.eq.1h,open_time.gt."2025-01-01T00:00:00+00:00")'
+    )
+
+
+def test_composite_keyset_reads_whole_table_once():
+    pairs = [("BTCUSDT", "1h"), ("BTCUSDT", "4h"), ("ETHUSDT", "1h")]
+    db = _FakePostgrest({"klines_ohlcv": _klines(pairs, 25)})
+    reader = kline_reader(None, None, columns=["close"], page_size=7, client=db)
+
+    seen = [(r["symbol"], r["interval"], r["open_time"]) for r in reader.rows()]
+
+    assert len(seen) == 75
+    assert len(set(seen)) == 75
+    assert seen == sorted(seen)
+    assert reader.stats["pages"] == 11
+
+
+def test_concurrent_upserts_do_not_duplicate_or_skip_rows():
+    """Filas insertadas detrás del cursor desplazan offset, pero no a keyset."""
+    base = _klines([("BTCUSDT", "1h")], 30)
+    original = {r["open_time"] for r in base}
+    inserted = iter(range(1, 100))
+
+    def backfill_older(db):
+        # Un backfill inserta velas más viejas que todo lo leído
+        i = next(inserted)
+        db.tables["klines_ohlcv"].append(
+            {"symbol": "BTCUSDT", "interval": "1h", "open_time": _iso(T0 - i * HOUR),
+             "close": 1.0, "trades_count": 0}
+        )
+
+    db = _FakePostgrest({"klines_ohlcv": list(base)}, on_execute=backfill_older)
+    keyset = [r["open_time"] for r in kline_reader("BTCUSDT", "1h", page_size=5, client=db).rows()]
+    assert len(keyset) == len(set(keyset))
+    assert original <= set(keyset)
+
+    # Misma carga con offset: duplica filas que ya había devuelto
+    db = _FakePostgrest({"klines_ohlcv": list(base)}, on_execute=backfill_older)
+    offset_rows, offset = [], 0
+    while True:
+        page = (db.table("klines_ohlcv").select("open_time").eq("symbol", "BTCUSDT")
+                .order("open_time").range(offset, offset + 4).execute().data)
+        offset_rows += [r["open_time"] for r in page]
+        if len(page) < 5:
+            break
+        offset += 5
+    assert len(offset_rows) > len(set(offset_rows))
+
+
+def test_read_klines_descending_limit_returns_latest_ascending():
+    db = _FakePostgrest({"klines_ohlcv": _klines([("BTCUSDT", "1h"), ("ETHUSDT", "1h")], 40)})
+    batch = read_klines("BTCUSDT", "1h", columns=["open_time", "close"],
+                        limit=12, descending=True, page_size=5, client=db)
+
+    assert len(batch) == 12
+    assert batch["open_time"].tolist() == [T0 + i * HOUR for i in range(28, 40)]
+    assert batch["close"][-1] == 139.0
+    assert np.all(np.diff(batch["open_time"]) == HOUR)
+    assert db.requests == 3  # 5 + 5 + 2, sin página extra
+
+
+def test_prefetch_overlaps_next_fetch_with_processing():
+    db = _FakePostgrest({"t": [{"id": f"{i:04d}"} for i in range(40)]}, latency=0.02)
+    fetching = threading.Event()
+    overlaps = 0
+
+    def mark(_db):
+        fetching.set()
+
+    db.on_execute = mark
+    reader = BulkReader("t", page_size=10, client=db)
+    ids = []
+    for page in reader.pages():
+        fetching.clear()
+        time.sleep(0.05)  # "procesar" la página
+        overlaps += fetching.is_set()
+        ids += [r["id"] for r in page]
+
+    assert ids == [f"{i:04d}" for i in range(40)]
+    # La página siguiente se trajo mientras se procesaba la actual
+    assert overlaps >= 3
+
+    sequential = BulkReader("t", page_size=10, client=db, prefetch=False)
+    assert [r["id"] for r in sequential.rows()] == ids
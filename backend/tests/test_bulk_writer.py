@@ -0,0 +1,175 @@
+"""Tests para bulk_writer.py — ingesta COPY + merge con fallback a PostgREST."""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+
+from app.services import bulk_writer
+from app.services.bulk_writer import (
+    KLINE_COLUMNS,
+    bulk_write,
+    bulk_write_frame,
+    bulk_write_klines,
+    merge_statement,
+)
+from app.services.kline_arrays import parse_raw_klines
+
+
+class _FakeCopy:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write_row(self, row):
+        self.sink.append(tuple(row))
+
+
+class _FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.db.statements.append(sql)
+        if sql.startswith("INSERT"):
+            self.rowcount = len(self.db.copied)
+
+    def copy(self, sql):
+        self.db.statements.append(sql)
+        return _FakeCopy(self.db.copied)
+
+
+class _FakePsycopg:
+    """Stand-in mínimo de psycopg 3: connect → cursor → copy/execute."""
+
+    def __init__(self, fail=False):
+        self.statements, self.copied, self.fail = [], [], fail
+        self.committed = False
+
+    def connect(self, dsn):
+        if self.fail:
+            raise OSError("connection refused")
+        db = self
+
+        class _Conn:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def cursor(self):
+                return _FakeCursor(db)
+
+            def commit(self):
+                db.committed = True
+
+        return _Conn()
+
+
+def _settings(url="postgresql://localhost/test", copy=True):
+    return SimpleNamespace(database_url=url, bulk_ingest_copy=copy, storage_backend="supabase")
+
+
+def test_merge_statement_dedups_and_upserts_in_one_statement():
+    sql = merge_statement("ml_features_1h", "_stage", ["symbol", "open_time", "rsi"], ["symbol", "open_time"])
+    assert sql == (
+        'INSERT INTO "ml_features_1h" ("symbol", "open_time", "rsi") '
+        'SELECT DISTINCT ON ("symbol", "open_time") "symbol", "open_time", "rsi" FROM "_stage" '
+        'ORDER BY "symbol", "open_time", ctid DESC '
+        'ON CONFLICT ("symbol", "open_time") DO UPDATE SET "rsi" = EXCLUDED."rsi"'
+    )
+    assert merge_statement("ml_predictions", "_s", ["a"]) == 'INSERT INTO "ml_predictions" ("a") SELECT "a" FROM "_s"'
+
+
+def test_copy_path_streams_rows_and_merges():
+    fake = _FakePsycopg()
+    rows = [("BTCUSDT", i) for i in range(1200)]
+    with patch.object(bulk_writer, "settings", _settings()), \
+         patch.object(bulk_writer, "_load_psycopg", return_value=fake), \
+         patch.object(bulk_writer, "get_supabase") as sb:
+        result = bulk_write("t", ["symbol", "n"], rows, conflict=["symbol", "n"])
+
+    sb.assert_not_called()
+    assert result["method"] == "copy"
+    assert result["written"] == 1200 and result["rows_per_sec"] > 0
+    assert fake.copied == rows
+    assert fake.committed
+    assert fake.statements[0].startswith('CREATE TEMP TABLE "_stage_t" (LIKE "t"')
+    assert fake.statements[1] == 'COPY "_stage_t" ("symbol", "n") FROM STDIN'
+    assert "ON CONFLICT" in fake.statements[2]
+
+
+def test_rest_fallback_when_no_database_url(mock_supabase):
+    mock_supabase.table.return_value.upsert.return_value.execute.side_effect = (
+        lambda: MagicMock(data=[{}] * 500)
+    )
+    rows = [("BTCUSDT", i) for i in range(1200)]
+    with patch.object(bulk_writer, "settings", _settings(url="")), \
+         patch.object(bulk_writer, "get_supabase", return_value=mock_supabase):
+        result = bulk_write("t", ["symbol", "n"], rows, conflict=["symbol", "n"])
+
+    upsert = mock_supabase.table.return_value.upsert
+    assert result["method"] == "rest"
+    assert upsert.call_count == 3
+    assert upsert.call_args_list[0].kwargs["on_conflict"] == "symbol,n"
+    assert upsert.call_args_list[2].args[0][-1] == {"symbol": "BTCUSDT", "n": 1199}
+    assert result["rows"] == 1200
+
+
+def test_copy_failure_falls_back_to_rest(mock_supabase):
+    mock_supabase.table.return_value.insert.return_value.execute.return_value = MagicMock(data=[{}, {}])
+    with patch.object(bulk_writer, "settings", _settings()), \
+         patch.object(bulk_writer, "_load_psycopg", return_value=_FakePsycopg(fail=True)), \
+         patch.object(bulk_writer, "get_supabase", return_value=mock_supabase):
+        result = bulk_write("ml_predictions", ["y"], [(1.0,), (2.0,)])
+
+    assert result["method"] == "rest"
+    assert result["written"] == 2
+    mock_supabase.table.return_value.insert.assert_called_once_with([{"y": 1.0}, {"y": 2.0}])
+
+
+def test_bulk_write_frame_cleans_nan_and_timestamps():
+    df = pd.DataFrame({
+        "symbol": ["BTCUSDT", "BTCUSDT"],
+        "open_time": pd.to_datetime(["2025-01-01T03:00:00+03:00", "2025-01-01T01:00:00Z"], utc=True),
+        "y": [np.nan, np.inf],
+        "fold": [0, 1],
+    })
+    with patch.object(bulk_writer, "bulk_write", return_value={"written": 2}) as bw:
+        bulk_write_frame("ml_predictions", df)
+
+    table, columns, rows, conflict = bw.call_args.args
+    assert columns == ["symbol", "open_time", "y", "fold"]
+    assert rows == [
+        ("BTCUSDT", "2025-01-01T00:00:00+00:00", None, 0),
+        ("BTCUSDT", "2025-01-01T01:00:00+00:00", None, 1),
+    ]
+    assert conflict is None
+
+
+def test_bulk_write_klines_builds_tuples_without_dicts():
+    raw = [[1_735_689_600_000, "1", "2", "0.5", "1.5", "10", 1_735_693_199_999, "15", 7, "4", "6", "0"]]
+    with patch.object(bulk_writer, "bulk_write", return_value={"written": 1}) as bw:
+        bulk_write_klines("BTCUSDT", "1h", parse_raw_klines(raw))
+
+    table, columns, rows, conflict = bw.call_args.args
+    assert table == "klines_ohlcv" and columns == KLINE_COLUMNS
+    row = dict(zip(columns, rows[0]))
+    assert row["open_time"] == "2025-01-01T00:00:00.000Z"
+    assert row["close_time"] == "2025-01-01T00:59:59.999Z"
+    assert row["trades_count"] == 7 and row["close"] == 1.5
+    assert conflict == ("symbol", "interval", "open_time")
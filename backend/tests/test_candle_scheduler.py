@@ -0,0 +1,137 @@
+"""Tests para candle_scheduler.py — disparo por cierre de vela, coalescing y lag por job."""
+
+import asyncio
+from contextlib import contextmanager
+from unittest.mock import AsyncMock, patch
+
+from app.services import candle_scheduler as cs
+from app.services.candle_scheduler import CandleJob, get_candle_scheduler
+
+HOUR = 3_600_000
+MINUTE = 60_000
+
+
+def _job(name="analysis", interval="1h", fn=None, **kw):
+    return CandleJob(name, interval, fn or AsyncMock(), **kw)
+
+
+def test_due_fires_once_per_close_after_settle():
+    scheduler = get_candle_scheduler()
+    job = scheduler.add(_job())
+    job.last_close_ms = 10 * HOUR
+
+    assert scheduler.due(now_ms=11 * HOUR + 1_000) == []            # dentro del settle (2s)
+    assert scheduler.due(now_ms=11 * HOUR + 2_500) == [(job, 11 * HOUR)]
+    job.last_close_ms = 11 * HOUR
+    assert scheduler.due(now_ms=11 * HOUR + 30 * MINUTE) == []       # misma vela: nada que recalcular
+
+
+def test_missed_closes_coalesce_into_one_run():
+    scheduler = get_candle_scheduler()
+    job = scheduler.add(_job())
+    job.last_close_ms = 10 * HOUR
+
+    due = scheduler.due(now_ms=13 * HOUR + 5_000)
+    assert due == [(job, 13 * HOUR)]                                 # una corrida, sobre el último cierre
+    assert job.coalesced == 2 and scheduler.stats["coalesced"] == 2
+
+
+def test_next_wake_is_earliest_close_plus_settle():
+    scheduler = get_candle_scheduler()
+    scheduler.add(_job("klines", "1m"))
+    scheduler.add(_job("analysis", "1h"))
+
+    assert scheduler.next_wake_ms(now_ms=10 * HOUR + 30_000) == 10 * HOUR + MINUTE + 2_000
+    assert scheduler.next_wake_ms(now_ms=10 * HOUR + 500) == 10 * HOUR + 2_000   # el cierre de las 10:00 aún no asentó
+
+
+async def test_batch_runs_stages_in_order_inside_scope_and_records_lag():
+    order = []
+
+    def recorder(name, delay=0.0, fail=False):
+        async def run(close_ms):
+            await asyncio.sleep(delay)
+            order.append(name)
+            if fail:
+                raise RuntimeError("boom")
+        return run
+
+    scopes = []
+
+    @contextmanager
+    def scope(close_ms):
+        scopes.append(close_ms)
+        yield
+
+    scheduler = get_candle_scheduler()
+    scheduler.set_jobs([
+        _job("signals", "1h", recorder("signals"), stage=3),
+        _job("analysis", "1h", recorder("analysis:BTC", 0.01), symbol="BTCUSDT", stage=1),
+        _job("analysis", "1h", recorder("analysis:ETH", fail=True), symbol="ETHUSDT", stage=1),
+        _job("klines", "1m", recorder("klines")),
+    ])
+    now = cs._now_ms()
+    ran = await scheduler.run_due(now_ms=now, scope=scope)
+
+    assert ran == 4
+    assert order[0] == "klines" and order[-1] == "signals"          # un job fallido no corta el batch
+    assert scopes == [int((now - 2_000) // MINUTE * MINUTE)]
+    status = scheduler.status()
+    assert status["errors"] == 1 and status["batches"] == 1
+    btc = status["jobs"]["analysis:BTCUSDT@1h"]
+    assert btc["runs"] == 1 and btc["lag_ms"]["count"] == 1 and btc["last_duration_ms"] >= 10
+    assert status["jobs"]["analysis:ETHUSDT@1h"]["errors"] == 1
+    assert await scheduler.run_due(now_ms=now) == 0                  # ya corrió esta vela
+
+
+async def test_run_starts_immediately_and_stop_wakes_the_sleep():
+    scheduler = get_candle_scheduler()
+    ran = asyncio.Event()
+
+    async def fn(close_ms):
+        ran.set()
+
+    scheduler.add(_job("analysis", "1d", fn))
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.wait_for(ran.wait(), 1)
+    assert scheduler.running
+
+    scheduler.stop()                                                 # durmiendo hasta el próximo cierre diario
+    await asyncio.wait_for(task, 1)
+    assert not scheduler.running and scheduler.status()["next_wake_ms"] is not None
+
+
+def test_quant_candle_jobs_replace_tick_modulo_schedule():
+    from app.services import quant_orchestrator as qo
+
+    with patch.object(qo.settings, "kline_resample_enabled", True), \
+         patch.object(qo.settings, "portfolio_var_enabled", True):
+        jobs = {job.key: job for job in qo.candle_jobs(["BTCUSDT", "ETHUSDT"])}
+
+    assert jobs["klines@1m"].stage == 0
+    assert {"analysis:BTCUSDT@1h", "analysis:ETHUSDT@1h", "quant_tick@1h"} <= set(jobs)
+    assert jobs["analysis:BTCUSDT@1h"].stage == 1 and jobs["portfolio_risk@1h"].stage == 2
+    assert jobs["performance_metrics@6h"].step_ms == 6 * HOUR
+    assert jobs["kline_gaps@360m"].step_ms == 6 * HOUR
+
+
+async def test_analysis_job_runs_every_module_on_primary_close():
+    from app.services import quant_orchestrator as qo
+
+    jobs = {job.key: job for job in qo.candle_jobs(["BTCUSDT"])}
+    with patch.object(qo, "_process_symbol", AsyncMock()) as process:
+        await jobs["analysis:BTCUSDT@1h"].fn(10 * HOUR)
+    process.assert_awaited_once_with("BTCUSDT", "1h", modules=qo.ANALYSIS_MODULES)
+
+
+async def test_signals_job_runs_last_and_respects_kill_switch():
+    from app.services import trading_loop
+
+    with patch.object(trading_loop.settings, "quant_enabled", False):
+        jobs = trading_loop._candle_jobs()
+    assert [job.key for job in jobs] == ["signals@1h"] and jobs[0].stage == 3
+
+    with patch.object(trading_loop.settings, "trading_enabled", False), \
+         patch.object(trading_loop, "_generate_signals", AsyncMock()) as gen:
+        await trading_loop._on_primary_close(10 * HOUR)
+    gen.assert_not_awaited()
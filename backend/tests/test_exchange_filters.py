@@ -0,0 +1,125 @@
+"""Tests para exchange_filters.py — exchangeInfo cacheado y órdenes pre-validadas."""
+
+import hashlib
+import hmac
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services import binance_client
+from app.services.exchange_filters import OrderFilterError, get_exchange_filters
+from app.utils.binance_utils import round_price, round_quantity
+
+
+def _symbol_info(symbol="BTCUSDT", step="0.00010000", min_qty="0.00010000", tick="0.10000000",
+                 min_notional="5.00000000", market_step=None):
+    filters = [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.1", "maxPrice": "1000000", "tickSize": tick},
+        {"filterType": "LOT_SIZE", "minQty": min_qty, "maxQty": "9000.0", "stepSize": step},
+        {"filterType": "NOTIONAL", "minNotional": min_notional, "applyMinToMarket": True,
+         "maxNotional": "9000000", "applyMaxToMarket": False, "avgPriceMins": 5},
+    ]
+    if market_step:
+        filters.append({"filterType": "MARKET_LOT_SIZE", "minQty": "0", "maxQty": "100", "stepSize": market_step})
+    return {"symbol": symbol, "status": "TRADING", "filters": filters}
+
+
+async def _load(*infos):
+    with patch.object(binance_client, "get_exchange_info", AsyncMock(return_value={"symbols": list(infos)})) as info:
+        await get_exchange_filters().refresh(["BTCUSDT"])
+    return info
+
+
+async def test_refresh_registers_live_filters_for_all_rounding():
+    assert round_quantity("BTCUSDT", 0.000123) == pytest.approx(0.00012)   # tabla fija: step 0.00001
+    info = await _load(_symbol_info())
+
+    info.assert_awaited_once_with(["BTCUSDT"])
+    assert round_quantity("BTCUSDT", 0.000123) == pytest.approx(0.0001)    # LOT_SIZE real: step 0.0001
+    assert round_price("BTCUSDT", 65000.123) == pytest.approx(65000.1)
+    assert get_exchange_filters().status()["symbols"] == ["BTCUSDT"]
+
+
+async def test_prepare_order_floors_formats_and_validates():
+    await _load(_symbol_info(market_step="0.00100000"))
+    filters = get_exchange_filters()
+
+    order = filters.prepare_order("BTCUSDT", "buy", "LIMIT", 0.00056, price=65000.06)
+    assert order.params == {"symbol": "BTCUSDT", "side": "BUY", "type": "LIMIT", "quantity": "0.0005",
+                            "price": "65000.1", "timeInForce": "GTC"}
+
+    market = filters.prepare_order("BTCUSDT", "SELL", "MARKET", 0.0056, reference_price=65000.0)
+    assert market.params["quantity"] == "0.005" and market.quantity == pytest.approx(0.005)  # MARKET_LOT_SIZE
+
+    with pytest.raises(OrderFilterError, match="minNotional"):
+        filters.prepare_order("BTCUSDT", "BUY", "LIMIT", 0.0001, price=40000.0)      # $4 < $5
+    with pytest.raises(OrderFilterError, match="minQty"):
+        filters.prepare_order("BTCUSDT", "BUY", "MARKET", 0.00009, reference_price=65000.0)
+    assert filters.stats["rejected"] == 2
+
+
+async def test_quantity_already_on_step_is_not_floored_one_step_down():
+    await _load(_symbol_info(step="0.00001000", min_qty="0.00001000"))
+    filters = get_exchange_filters()
+
+    assert filters.template("BTCUSDT").floor_quantity(0.00029) == pytest.approx(0.00029)   # 0.00029/0.00001 = 28.999…
+    order = filters.prepare_order("BTCUSDT", "SELL", "MARKET", round_quantity("BTCUSDT", 0.00029))
+    assert order.params["quantity"] == "0.00029"
+    assert all(filters.template("BTCUSDT").floor_quantity(i * 0.00001) == pytest.approx(i * 0.00001)
+               for i in range(1, 5000))
+    assert filters.template("BTCUSDT").floor_quantity(0.000299) == pytest.approx(0.00029)
+
+
+def test_prepare_order_without_exchange_info_uses_table_precision():
+    order = get_exchange_filters().prepare_order("BTCUSDT", "BUY", "MARKET", 0.0000123, reference_price=1.0)
+    assert order.params["quantity"] == "0.00001"          # nunca "1e-05"
+    assert get_exchange_filters().stats["fallbacks"] == 1
+
+
+async def test_maybe_refresh_respects_ttl_and_survives_errors():
+    filters = get_exchange_filters()
+    failing = AsyncMock(side_effect=RuntimeError("proxy down"))
+    with patch.object(binance_client, "get_exchange_info", failing):
+        assert await filters.maybe_refresh() is False
+    assert filters.stats["refresh_errors"] == 1 and not filters.loaded
+
+    ok = AsyncMock(return_value={"symbols": [_symbol_info()]})
+    with patch.object(binance_client, "get_exchange_info", ok):
+        assert await filters.maybe_refresh() is True
+        assert await filters.maybe_refresh() is False      # dentro del TTL: sin I/O
+    assert ok.await_count == 1
+
+
+def test_sign_matches_plain_hmac():
+    params = {"symbol": "BTCUSDT", "side": "BUY", "quantity": "0.001", "timestamp": 1}
+    expected = hmac.new(b"secret", b"symbol=BTCUSDT&side=BUY&quantity=0.001&timestamp=1", hashlib.sha256).hexdigest()
+    assert binance_client._sign(params, "secret") == expected
+    assert binance_client._sign(params, "secret") == expected    # clave cacheada, mismo resultado
+
+
+async def test_shared_http_client_is_reused_within_a_loop():
+    first = binance_client._get_client()
+    assert binance_client._get_client() is first
+    await binance_client.close_client()
+    assert binance_client._get_client() is not first
+    await binance_client.close_client()
+
+
+async def test_executor_rejects_filtered_order_without_exchange_call():
+    from app.services import executor
+
+    await _load(_symbol_info())
+    sb = MagicMock()
+    claimed = {"id": "p1", "symbol": "BTCUSDT", "type": "buy", "quantity": "0.00005", "price": "65000",
+               "order_type": "MARKET", "retry_count": 0}
+    sb.table.return_value.update.return_value.eq.return_value.eq.return_value.execute.return_value.data = [claimed]
+
+    with patch.object(executor.settings, "trading_enabled", True), \
+         patch.object(executor, "get_supabase", return_value=sb), \
+         patch.object(executor.binance_client, "place_order", AsyncMock()) as place, \
+         patch.object(executor, "_log_risk_event", AsyncMock()):
+        result = await executor.execute_proposal("p1")
+
+    assert result["success"] is False and "minQty" in result["error"]
+    assert result["status"] == "error"                      # permanente: sin retry
+    place.assert_not_awaited()
@@ -0,0 +1,157 @@
+"""Tests para execution_scheduler.py — carriles por símbolo, reservas y rate budget."""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.execution_scheduler import ExecutionScheduler, OrderRateBudget
+
+
+def _proposal(pid, symbol, type_="buy", notional=50.0):
+    return {"id": pid, "symbol": symbol, "type": type_, "notional": notional}
+
+
+class _Recorder:
+    """execute_proposal falso que registra inicio/fin y solapamientos."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.log = []
+        self.running = set()
+        self.max_parallel = 0
+
+    async def __call__(self, pid):
+        self.running.add(pid)
+        self.max_parallel = max(self.max_parallel, len(self.running))
+        self.log.append(("start", pid, set(self.running)))
+        await asyncio.sleep(self.delay)
+        self.running.discard(pid)
+        self.log.append(("end", pid, None))
+        return {"success": True, "proposal_id": pid}
+
+
+def _loaded_book(supabase_rows=()):
+    from app.services.position_book import get_position_book
+    book = get_position_book()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value.data = list(supabase_rows)
+    book.load(sb)
+    return book
+
+
+@pytest.fixture
+def usdt():
+    state = MagicMock()
+    state.free = AsyncMock(return_value=1000.0)
+    with patch("app.services.execution_scheduler.get_account_state", return_value=state):
+        yield state
+
+
+@pytest.mark.asyncio
+async def test_symbols_run_concurrently_and_keep_order_per_symbol(usdt):
+    _loaded_book()
+    execute = _Recorder(delay=0.1)
+    proposals = [_proposal("a1", "BTCUSDT", "sell"), _proposal("b1", "ETHUSDT", "sell"),
+                 _proposal("a2", "BTCUSDT"), _proposal("c1", "SOLUSDT", "sell")]
+    scheduler = ExecutionScheduler(execute, max_concurrency=4, budget=OrderRateBudget(100, burst=10))
+
+    t0 = time.perf_counter()
+    results = await scheduler.run(proposals)
+    elapsed = time.perf_counter() - t0
+
+    assert [r["proposal_id"] for r in results] == ["a1", "b1", "a2", "c1"]
+    assert elapsed < 0.3  # en serie serían >= 0.4s
+    starts = [pid for kind, pid, _ in execute.log if kind == "start"]
+    assert starts.index("a1") < starts.index("a2")
+    a2_start = next(running for kind, pid, running in execute.log if kind == "start" and pid == "a2")
+    assert "a1" not in a2_start
+    assert scheduler.stats["lanes"] == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit(usdt):
+    _loaded_book()
+    execute = _Recorder()
+    proposals = [_proposal(f"p{i}", f"S{i}USDT", "sell") for i in range(6)]
+    await ExecutionScheduler(execute, max_concurrency=2, budget=OrderRateBudget(100, burst=10)).run(proposals)
+    assert execute.max_parallel == 2
+
+
+@pytest.mark.asyncio
+async def test_buys_wait_when_balance_is_reserved(usdt):
+    _loaded_book()
+    usdt.free.return_value = 100.0
+    execute = _Recorder()
+    proposals = [_proposal("b1", "BTCUSDT", notional=60.0), _proposal("b2", "ETHUSDT", notional=60.0)]
+    scheduler = ExecutionScheduler(execute, max_concurrency=4, budget=OrderRateBudget(100, burst=10))
+    await scheduler.run(proposals)
+
+    assert execute.max_parallel == 1
+    assert scheduler.stats["admission_waits"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_buys_wait_for_free_position_slot(usdt):
+    _loaded_book([{"id": "p1", "symbol": "XRPUSDT", "status": "open"},
+                  {"id": "p2", "symbol": "ADAUSDT", "status": "open"}])
+    execute = _Recorder()
+    proposals = [_proposal("b1", "BTCUSDT"), _proposal("b2", "ETHUSDT"), _proposal("s1", "XRPUSDT", "sell")]
+    with patch("app.services.execution_scheduler.settings.risk_max_open_positions", 3):
+        await ExecutionScheduler(execute, max_concurrency=4, budget=OrderRateBudget(100, burst=10)).run(proposals)
+
+    b2_start = next(running for kind, pid, running in execute.log if kind == "start" and pid == "b2")
+    assert "b1" not in b2_start  # el segundo BUY no se superpone: sólo quedaba un slot
+
+
+@pytest.mark.asyncio
+async def test_order_rate_budget_paces_orders():
+    budget = OrderRateBudget(rate=20, burst=1)
+    t0 = time.perf_counter()
+    for _ in range(3):
+        await budget.acquire()
+    assert time.perf_counter() - t0 >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_execute_all_approved_uses_scheduler(mock_supabase, usdt):
+    from app.services import executor
+
+    rows = [_proposal("a1", "BTCUSDT"), _proposal("b1", "ETHUSDT")]
+    mock_supabase.table.return_value.select.return_value.eq.return_value.order.return_value.execute.return_value.data = rows
+
+    async def fake_execute(pid):
+        return {"success": pid == "a1"}
+
+    with patch.object(executor, "execute_proposal", side_effect=fake_execute):
+        result = await executor.execute_all_approved(mock_supabase)
+
+    assert result == {"executed": 1, "failed": 1, "total": 2, "results": [{"success": True}, {"success": False}]}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_execute_all_approved_runs_are_serialized(mock_supabase, usdt):
+    from app.services import executor
+
+    executed = set()                                  # a1 sigue "approved" hasta que se ejecuta
+    query = mock_supabase.table.return_value.select.return_value.eq.return_value.order.return_value
+    query.execute.side_effect = lambda: MagicMock(data=[] if "a1" in executed else [_proposal("a1", "BTCUSDT")])
+    active, overlap = 0, []
+
+    async def fake_execute(pid):
+        nonlocal active
+        active += 1
+        overlap.append(active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        executed.add(pid)
+        return {"success": True}
+
+    with patch.object(executor, "execute_proposal", side_effect=fake_execute):
+        first, second = await asyncio.gather(
+            executor.execute_all_approved(mock_supabase), executor.execute_all_approved(mock_supabase),
+        )
+
+    assert first["executed"] == 1 and second["total"] == 0
+    assert overlap == [1]
@@ -0,0 +1,82 @@
+"""Tests para kline_arrays.py — camino de parseo tipado de klines."""
+
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.kline_arrays import (
+    KLINE_DTYPE,
+    from_db_rows,
+    iso_to_ms,
+    parse_raw_klines,
+    to_db_rows,
+    to_frame,
+)
+
+T0 = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+RAW = [
+    [T0, "42000.00", "42500.00", "41800.00", "42300.00", "100.5",
+     T0 + 3_599_999, "4230000.00", 1500, "50.2", "2115000.00", "0"],
+    [T0 + 3_600_000, "42300.00", "42400.00", "42100.00", "42200.00", "80.0",
+     T0 + 7_199_999, "3376000.00", 900, "40.0", "1688000.00", "0"],
+]
+
+
+def test_parse_raw_klines_matches_legacy_dict_parser():
+    from app.services.kline_collector import _parse_kline
+
+    batch = parse_raw_klines(RAW)
+    assert batch.dtype == KLINE_DTYPE
+    assert batch["open_time"].dtype == np.int64
+    rows = to_db_rows("BTCUSDT", "1h", batch)
+    legacy = _parse_kline("BTCUSDT", "1h", RAW[0])
+    for key in ("open", "high", "low", "close", "volume", "quote_volume",
+                "trades_count", "taker_buy_base_volume", "taker_buy_quote_volume"):
+        assert rows[0][key] == legacy[key]
+    assert iso_to_ms([rows[0]["open_time"]])[0] == iso_to_ms([legacy["open_time"]])[0]
+    assert type(rows[0]["open_time"]) is str
+
+
+def test_from_db_rows_round_trip():
+    batch = parse_raw_klines(RAW)
+    back = from_db_rows(to_db_rows("BTCUSDT", "1h", batch))
+    assert np.array_equal(back, batch)
+
+
+def test_from_db_rows_handles_partial_select_and_nulls():
+    rows = [
+        {"open_time": "2024-01-01T00:00:00+00:00", "close": "42300.5", "trades_count": None},
+        {"open_time": "2024-01-01T01:00:00+00:00", "close": None, "trades_count": 7},
+    ]
+    batch = from_db_rows(rows)
+    assert batch["open_time"].tolist() == [T0, T0 + 3_600_000]
+    assert batch["close"][0] == 42300.5 and np.isnan(batch["close"][1])
+    assert batch["trades_count"].tolist() == [0, 7]
+    assert batch["high"].tolist() == [0.0, 0.0]
+
+
+def test_iso_to_ms_falls_back_for_non_utc_offsets():
+    values = ["2024-01-01T00:00:00+00:00", "2024-01-01T03:00:00+03:00", "2024-01-01T00:00:00.500Z"]
+    assert iso_to_ms(values).tolist() == [T0, T0, T0 + 500]
+
+
+def test_to_frame_builds_utc_index():
+    df = to_frame(parse_raw_klines(RAW), ["open", "close", "volume"])
+    assert list(df.columns) == ["open", "close", "volume"]
+    assert df.index.name == "open_time"
+    assert str(df.index.tz) == "UTC"
+    assert df.index[0] == pd.Timestamp("2024-01-01", tz="UTC")
+
+
+@pytest.mark.asyncio
+async def test_fetch_klines_uses_typed_path():
+    from app.services import kline_collector
+
+    with patch.object(kline_collector.binance_client, "get_klines", AsyncMock(return_value=RAW)):
+        rows = await kline_collector.fetch_klines("BTCUSDT", "1h", limit=2)
+
+    assert [r["open_time"] for r in rows] == ["2024-01-01T00:00:00.000Z", "2024-01-01T01:00:00.000Z"]
+    assert rows[1]["close_time"] == "2024-01-01T01:59:59.999Z"
+    assert rows[0]["symbol"] == "BTCUSDT" and rows[0]["interval"] == "1h"
@@ -75,3 +75,59 @@ async def test_collect_latest_handles_empty_response(mock_supabase):
         from app.services.kline_collector import collect_latest
         # Should not raise
         await collect_latest("BTCUSDT", "1h")
+
+
+@pytest.mark.asyncio
+async def test_get_klines_status_uses_single_rpc(mock_supabase):
+    """Status should come from one get_klines_coverage RPC, not per-pair queries."""
+    from datetime import datetime, timezone, timedelta
+
+    last_closed = (datetime.now(timezone.utc) - timedelta(hours=3)).replace(minute=0, second=0, microsecond=0)
+    rpc_result = MagicMock()
+    rpc_result.data = [{
+        "symbol": "BTCUSDT", "interval": "1h", "candle_count": 500,
+        "first_open_time": "2025-01-01T00:00:00+00:00",
+        "last_open_time": last_closed.isoformat(),
+        "gap_count": 2, "missing_candles": 5,
+    }]
+    mock_supabase.rpc.return_value.execute.return_value = rpc_result
+
+    with patch("app.services.kline_collector.get_supabase", return_value=mock_supabase), \
+         patch("app.services.kline_collector.settings") as mock_settings:
+        mock_settings.quant_symbols = "BTCUSDT,ETHUSDT"
+        from app.services.kline_collector import get_klines_status, INTERVALS
+        status = await get_klines_status()
+
+    mock_supabase.rpc.assert_called_once_with("get_klines_coverage", {"p_symbols": ["BTCUSDT", "ETHUSDT"]})
+    mock_supabase.table.assert_not_called()
+    assert len(status) == 2 * len(INTERVALS)
+
+    btc_1h = next(s for s in status if s["symbol"] == "BTCUSDT" and s["interval"] == "1h")
+    assert btc_1h["count"] == 500
+    assert btc_1h["gap_count"] == 2
+    # Última vela cerró hace ~2h (open hace 3h + 1h de duración)
+    assert 2 * 3600 - 5 <= btc_1h["freshness_lag_seconds"] <= 3 * 3600
+
+    eth_1m = next(s for s in status if s["symbol"] == "ETHUSDT" and s["interval"] == "1m")
+    assert eth_1m["count"] == 0 and eth_1m["freshness_lag_seconds"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_klines_status_in_progress_candle_has_zero_lag(mock_supabase):
+    from datetime import datetime, timezone
+
+    current = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    rpc_result = MagicMock()
+    rpc_result.data = [{"symbol": "BTCUSDT", "interval": "1h", "candle_count": 1,
+                        "first_open_time": current.isoformat(), "last_open_time": current.isoformat(),
+                        "gap_count": 0, "missing_candles": 0}]
+    mock_supabase.rpc.return_value.execute.return_value = rpc_result
+
+    with patch("app.services.kline_collector.get_supabase", return_value=mock_supabase), \
+         patch("app.services.kline_collector.settings") as mock_settings:
+        mock_settings.quant_symbols = "BTCUSDT"
+        from app.services.kline_collector import get_klines_status
+        status = await get_klines_status()
+
+    btc_1h = next(s for s in status if s["interval"] == "1h")
+    assert btc_1h["freshness_lag_seconds"] == 0
@@ -0,0 +1,151 @@
+"""Tests para kline_gaps.py — scanner vectorizado, reporte de completitud y reparación."""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+from app.services.kline_gaps import (
+    completeness_report,
+    merge_gap_ranges,
+    ms_to_iso,
+    repair_gaps,
+    scan_and_repair,
+    scan_gaps,
+)
+from app.services.ml.data_ingest import check_gaps
+
+HOUR = 3_600_000
+MIN = 60_000
+T0 = 1_735_689_600_000  # 2025-01-01T00:00:00Z
+
+
+def _columns(pairs):
+    sym, iv, ot = [], [], []
+    for symbol, interval, times in pairs:
+        sym += [symbol] * len(times)
+        iv += [interval] * len(times)
+        ot += list(times)
+    return sym, iv, ot
+
+
+def test_scan_gaps_groups_by_pair_in_one_pass():
+    btc = [T0 + i * HOUR for i in range(10) if i not in (3, 4, 7)]
+    eth = [T0 + i * MIN for i in range(5)]
+    sym, iv, ot = _columns([("BTCUSDT", "1h", btc), ("ETHUSDT", "1m", eth)])
+    # Entrada desordenada: el scanner ordena por (symbol, interval, open_time)
+    order = np.random.default_rng(0).permutation(len(ot))
+    gaps = scan_gaps(np.array(sym)[order], np.array(iv)[order], np.array(ot)[order])
+
+    assert gaps == [
+        {"symbol": "BTCUSDT", "interval": "1h", "start_ms": T0 + 3 * HOUR, "end_ms": T0 + 4 * HOUR, "missing": 2},
+        {"symbol": "BTCUSDT", "interval": "1h", "start_ms": T0 + 7 * HOUR, "end_ms": T0 + 7 * HOUR, "missing": 1},
+    ]
+
+
+def test_scan_gaps_ignores_boundaries_between_pairs():
+    sym, iv, ot = _columns([
+        ("BTCUSDT", "1h", [T0, T0 + HOUR]),
+        ("BTCUSDT", "4h", [T0 + 40 * HOUR]),
+        ("ETHUSDT", "1h", [T0 - 100 * HOUR]),
+    ])
+    assert scan_gaps(sym, iv, ot) == []
+
+
+def test_merge_gap_ranges_respects_page_span():
+    gaps = [
+        {"symbol": "BTCUSDT", "interval": "1m", "start_ms": T0, "end_ms": T0, "missing": 1},
+        {"symbol": "BTCUSDT", "interval": "1m", "start_ms": T0 + 10 * MIN, "end_ms": T0 + 11 * MIN, "missing": 2},
+        {"symbol": "BTCUSDT", "interval": "1m", "start_ms": T0 + 5000 * MIN, "end_ms": T0 + 5000 * MIN, "missing": 1},
+        {"symbol": "ETHUSDT", "interval": "1m", "start_ms": T0 + 12 * MIN, "end_ms": T0 + 12 * MIN, "missing": 1},
+    ]
+    merged = merge_gap_ranges(gaps, max_span_candles=1000)
+
+    assert [(m["symbol"], m["start_ms"], m["end_ms"], m["gaps"]) for m in merged] == [
+        ("BTCUSDT", T0, T0 + 11 * MIN, 2),
+        ("BTCUSDT", T0 + 5000 * MIN, T0 + 5000 * MIN, 1),
+        ("ETHUSDT", T0 + 12 * MIN, T0 + 12 * MIN, 1),
+    ]
+    assert merged[0]["missing"] == 3
+
+
+def test_completeness_report_percentages_and_duplicates():
+    times = [T0 + i * HOUR for i in range(10) if i != 5] + [T0]
+    sym, iv, ot = _columns([("BTCUSDT", "1h", times)])
+    report = completeness_report(sym, iv, ot)
+
+    assert len(report) == 1
+    row = report[0]
+    assert row["expected"] == 10 and row["candles"] == 9 and row["missing"] == 1
+    assert row["duplicates"] == 1
+    assert row["completeness_pct"] == 90.0
+
+    # Ventana explícita más amplia que los datos: faltan también los bordes
+    windowed = completeness_report(sym, iv, ot, start_ms=T0 - 10 * HOUR + 1, end_ms=T0 + 9 * HOUR + 5)
+    assert windowed[0]["expected"] == 19
+    assert windowed[0]["missing"] == 10
+
+
+def test_completeness_report_includes_pairs_without_candles():
+    sym, iv, ot = _columns([("BTCUSDT", "1h", [T0 + i * HOUR for i in range(10)])])
+    report = completeness_report(sym, iv, ot, start_ms=T0, end_ms=T0 + 9 * HOUR,
+                                 pairs=[("BTCUSDT", "1h"), ("ETHUSDT", "1h")])
+
+    eth = next(r for r in report if r["symbol"] == "ETHUSDT")
+    assert eth["candles"] == 0 and eth["completeness_pct"] == 0.0    # serie ausente, no "completa"
+    assert eth["expected"] == eth["missing"] == 10
+    assert completeness_report([], [], [], pairs=[("SOLUSDT", "4h")])[0]["completeness_pct"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_repair_gaps_fetches_merged_windows():
+    gaps = [
+        {"symbol": "BTCUSDT", "interval": "1h", "start_ms": T0, "end_ms": T0, "missing": 1},
+        {"symbol": "BTCUSDT", "interval": "1h", "start_ms": T0 + 5 * HOUR, "end_ms": T0 + 6 * HOUR, "missing": 2},
+    ]
+    repair = AsyncMock(return_value=3)
+    result = await repair_gaps(gaps, repair=repair)
+
+    repair.assert_awaited_once_with("BTCUSDT", "1h", T0, T0 + 6 * HOUR)
+    assert result == {"windows": 1, "requested_candles": 3, "stored": 3, "failed_windows": 0}
+
+
+@pytest.mark.asyncio
+async def test_scan_and_repair_only_scans_pairs_flagged_by_coverage():
+    sb = MagicMock()
+    sb.rpc.return_value.execute.return_value.data = [
+        {"symbol": "BTCUSDT", "interval": "1h", "gap_count": 1},
+        {"symbol": "BTCUSDT", "interval": "4h", "gap_count": 0},
+    ]
+    times = np.array([T0, T0 + 3 * HOUR], dtype=np.int64)
+    loader = MagicMock(return_value=times)
+    repair = AsyncMock(return_value={"windows": 1, "requested_candles": 2, "stored": 2, "failed_windows": 0})
+
+    with patch("app.services.kline_gaps.get_supabase", return_value=sb), \
+         patch("app.services.kline_gaps.load_open_times", loader), \
+         patch("app.services.kline_gaps.repair_gaps", repair):
+        result = await scan_and_repair(["BTCUSDT"], days=30)
+
+    # la RPC cuenta gaps sólo dentro de la ventana que se escanea y repara
+    start_ms = loader.call_args.args[2]
+    sb.rpc.assert_called_once_with("get_klines_coverage", {"p_symbols": ["BTCUSDT"], "p_since": ms_to_iso(start_ms)})
+    loader.assert_called_once()
+    assert loader.call_args.args[:2] == ("BTCUSDT", "1h")
+    assert result["gaps_found"] == 1 and result["missing_candles"] == 2
+    assert result["repair"]["stored"] == 2
+
+
+def test_check_gaps_keeps_legacy_output():
+    klines = [
+        {"open_time": "2025-01-01T00:00:00+00:00"},
+        {"open_time": "2025-01-01T01:00:00+00:00"},
+        {"open_time": "2025-01-01T04:00:00+00:00"},
+    ]
+    gaps = check_gaps(klines, HOUR)
+    assert gaps == [{
+        "after": "2025-01-01T01:00:00+00:00",
+        "before": "2025-01-01T04:00:00+00:00",
+        "expected_ms": HOUR,
+        "actual_ms": 3 * HOUR,
+        "missing_candles": 2,
+    }]
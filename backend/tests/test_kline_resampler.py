@@ -0,0 +1,131 @@
+"""Tests para kline_resampler.py — derivación local de timeframes desde velas 1m."""
+
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pytest
+
+from app.services.kline_arrays import KLINE_DTYPE
+from app.services.kline_resampler import KlineResampler, compare_candles, resample
+
+MIN_MS = 60_000
+DAY0 = 1_735_689_600_000  # 2025-01-01T00:00:00Z
+
+
+def _base(start_ms: int, n: int, skip: set = frozenset()) -> np.ndarray:
+    idx = [i for i in range(n) if i not in skip]
+    out = np.zeros(len(idx), dtype=KLINE_DTYPE)
+    ot = start_ms + np.asarray(idx, dtype=np.int64) * MIN_MS
+    px = 100.0 + np.asarray(idx, dtype=np.float64)
+    out["open_time"] = ot
+    out["close_time"] = ot + MIN_MS - 1
+    out["open"] = px
+    out["high"] = px + 2
+    out["low"] = px - 1
+    out["close"] = px + 0.5
+    out["volume"] = 1.0
+    out["quote_volume"] = px
+    out["trades_count"] = 3
+    out["taker_buy_base_volume"] = 0.5
+    out["taker_buy_quote_volume"] = px / 2
+    return out
+
+
+def _raw(batch: np.ndarray) -> list:
+    return [
+        [int(r["open_time"]), str(r["open"]), str(r["high"]), str(r["low"]), str(r["close"]),
+         str(r["volume"]), int(r["close_time"]), str(r["quote_volume"]), int(r["trades_count"]),
+         str(r["taker_buy_base_volume"]), str(r["taker_buy_quote_volume"]), "0"]
+        for r in batch
+    ]
+
+
+def test_resample_aggregates_ohlcv_on_epoch_buckets():
+    out = resample(_base(DAY0, 10), "1m", "5m")
+
+    assert out["open_time"].tolist() == [DAY0, DAY0 + 5 * MIN_MS]
+    assert out["close_time"][0] == DAY0 + 5 * MIN_MS - 1
+    first = out[0]
+    assert first["open"] == 100.0
+    assert first["close"] == 104.5
+    assert first["high"] == 106.0
+    assert first["low"] == 99.0
+    assert first["volume"] == 5.0
+    assert first["trades_count"] == 15
+
+
+def test_resample_partial_candle_rules():
+    # Bucket sin cabecera (empieza en el minuto 2) → se descarta
+    headless = resample(_base(DAY0 + 2 * MIN_MS, 8), "1m", "5m")
+    assert headless["open_time"].tolist() == [DAY0 + 5 * MIN_MS]
+
+    # Bucket en curso contiguo → se emite como vela viva
+    live = resample(_base(DAY0, 7), "1m", "5m")
+    assert live["open_time"].tolist() == [DAY0, DAY0 + 5 * MIN_MS]
+    assert live["close"][-1] == 106.5
+    assert len(resample(_base(DAY0, 7), "1m", "5m", include_partial=False)) == 1
+
+    # Hueco interno → el bucket no es derivable
+    gapped = resample(_base(DAY0, 10, skip={2}), "1m", "5m")
+    assert gapped["open_time"].tolist() == [DAY0 + 5 * MIN_MS]
+
+
+def test_resample_rejects_non_aligned_targets():
+    with pytest.raises(ValueError):
+        resample(_base(DAY0, 5), "1m", "1w")
+    with pytest.raises(ValueError):
+        resample(_base(DAY0, 5), "5m", "7m")
+
+
+def test_resampler_update_returns_only_touched_buckets():
+    rs = KlineResampler("1m", ["1m", "5m", "1h"])
+    rs.update("BTCUSDT", _base(DAY0, 12))
+
+    refreshed = _base(DAY0 + 11 * MIN_MS, 2)
+    refreshed["close"][0] = 999.0
+    derived = rs.update("BTCUSDT", refreshed)
+
+    assert derived["5m"]["open_time"].tolist() == [DAY0 + 10 * MIN_MS]
+    assert derived["5m"]["close"][-1] == refreshed["close"][-1]
+    assert derived["1h"]["high"][0] == rs.buffer("BTCUSDT")["high"].max()
+    assert len(rs.buffer("BTCUSDT")) == 13
+
+
+def test_compare_candles_flags_mismatches_on_closed_candles():
+    base = _base(DAY0, 15)
+    derived = resample(base, "1m", "5m")
+    exchange = derived.copy()
+    assert compare_candles(derived, exchange) == []
+
+    exchange["high"][0] += 1.0
+    exchange["volume"][-1] += 1.0  # vela en curso: se ignora
+    mismatches = compare_candles(derived, exchange)
+    assert [(m["open_time"], m["field"]) for m in mismatches] == [(DAY0, "high")]
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_collects_base_only_and_stores_once():
+    from app.services import quant_orchestrator as qo
+
+    now_ms = DAY0 + 30 * MIN_MS
+    base = _base(DAY0, 30)
+    get_klines = AsyncMock(return_value=_raw(base))
+    store = AsyncMock(return_value=0)
+
+    with patch.object(qo, "_resampler", None), \
+         patch.object(qo.settings, "kline_resample_enabled", True), \
+         patch.object(qo.settings, "kline_resample_check_ticks", 0), \
+         patch("app.services.binance_client.get_klines", get_klines), \
+         patch("app.services.kline_collector.store_klines", store), \
+         patch.object(qo, "datetime") as dt:
+        dt.now.return_value.timestamp.return_value = now_ms / 1000
+        await qo._collect_klines(["BTCUSDT", "ETHUSDT"], tick=1)
+
+    assert get_klines.await_count == 2
+    assert {c.kwargs["interval"] for c in get_klines.await_args_list} == {"1m"}
+    assert get_klines.await_args_list[0].kwargs["start_time"] == DAY0
+    store.assert_awaited_once()
+    rows = store.await_args.args[0]
+    intervals = {(r["symbol"], r["interval"]) for r in rows}
+    assert ("BTCUSDT", "1d") in intervals and ("ETHUSDT", "15m") in intervals
+    assert sum(1 for r in rows if r["symbol"] == "BTCUSDT" and r["interval"] == "5m") == 6
@@ -0,0 +1,174 @@
+"""Tests para latency_trace.py — etapas, hitos y percentiles vela → señal → fill."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services import latency_trace as lt
+
+
+def test_last_candle_close_is_open_of_current_candle():
+    hour = 3_600_000
+    assert lt.last_candle_close_ms("1h", now_ms=5 * hour + 1234) == 5 * hour
+    assert lt.last_candle_close_ms("1h", now_ms=5 * hour) == 5 * hour
+
+
+def test_span_outside_trace_is_noop():
+    with lt.span("validate"):
+        pass
+    assert lt.get_latency_stats().summary()["stages"] == {}
+
+
+async def test_proposal_inherits_tick_spans_for_its_symbol():
+    with lt.tick_trace() as tick:
+        with lt.span("quant_tick"):
+            with lt.span("analysis", "BTCUSDT"):
+                pass
+            with lt.span("analysis", "ETHUSDT"):
+                pass
+        with lt.proposal_trace("BTCUSDT") as trace:
+            with lt.span("validate"):
+                await asyncio.sleep(0.01)
+
+    stages = [s["stage"] for s in trace.spans]
+    assert stages == ["analysis", "quant_tick", "validate"]          # sin el análisis de ETH
+    assert trace.tick_id == tick.trace_id and trace.origin_ms == tick.origin_ms
+    assert {"tick_lag", "candle_to_signal"} <= set(trace.marks)
+
+    summary = lt.get_latency_stats().summary()
+    assert summary["stages"]["analysis"]["count"] == 2                # heredadas no se cuentan dos veces
+    assert summary["stages"]["validate"]["p50"] >= 10
+    assert set(summary["by_symbol"]) == {"BTCUSDT", "ETHUSDT"}
+    assert "validate" in lt.get_latency_stats().summary("BTCUSDT")["stages"]
+
+
+async def test_execution_resumes_pending_trace_and_marks_fill():
+    with lt.proposal_trace("SOLUSDT") as trace:
+        lt.attach(trace, "p-1")
+        with lt.span("validate"):
+            pass
+
+    # ejecutado más tarde (execute_all_approved): misma traza
+    with lt.execution_trace("p-1") as resumed:
+        with lt.span("place_order"):
+            pass
+        lt.mark_fill()
+        payload = lt.trace_payload()["latency_trace"]
+
+    assert resumed is trace
+    assert [s["stage"] for s in payload["spans"]] == ["validate", "place_order"]
+    marks = payload["marks"]
+    assert marks["signal_to_fill"] == pytest.approx(marks["candle_to_fill"] - marks["candle_to_signal"])
+
+    stages = lt.get_latency_stats().summary("SOLUSDT")["stages"]
+    assert stages["validate"]["count"] == 1 and stages["place_order"]["count"] == 1
+    assert stages["candle_to_fill"]["count"] == 1
+    assert lt.get_latency_stats().traces == 1                        # retomada: una sola traza
+
+
+def test_inline_execution_that_raises_drops_the_pending_trace():
+    with lt.proposal_trace("BTCUSDT") as trace:
+        lt.attach(trace, "p-2")
+        with pytest.raises(RuntimeError):
+            with lt.execution_trace("p-2") as active:                # inline desde _submit_proposal
+                assert active is trace
+                raise RuntimeError("order rejected")
+
+    assert "p-2" not in lt._pending
+
+
+def test_summary_percentiles_from_persisted_traces():
+    stats = lt.LatencyStats(maxlen=1000)
+    for i in range(1, 101):
+        stats.observe_dict({"symbol": "BTCUSDT", "spans": [{"stage": "place_order", "at_ms": 0, "ms": float(i)}],
+                            "marks": {"candle_to_fill": 1000.0 + i}})
+
+    place = stats.summary("BTCUSDT")["stages"]["place_order"]
+    assert place["count"] == 100
+    assert place["p50"] == pytest.approx(50.5) and place["p95"] == pytest.approx(95.05)
+    assert place["p99"] == pytest.approx(99.01) and place["max"] == 100
+    assert stats.summary()["by_symbol"]["BTCUSDT"]["candle_to_fill"]["count"] == 100
+
+
+def test_disabled_tracing_records_nothing():
+    with patch.object(lt.settings, "latency_trace_enabled", False):
+        with lt.tick_trace() as tick, lt.proposal_trace("BTCUSDT") as trace:
+            with lt.span("validate"):
+                pass
+            assert lt.trace_payload() == {}
+    assert tick is None and trace is None
+    assert lt.get_latency_stats().traces == 0
+
+
+async def test_execute_proposal_persists_trace_with_fill():
+    from app.services import executor
+
+    sb = MagicMock()
+    proposal = {"id": "p-9", "symbol": "BTCUSDT", "type": "sell", "quantity": 0.001, "price": 100.0,
+                "order_type": "MARKET"}
+    sb.table.return_value.update.return_value.eq.return_value.eq.return_value.execute.return_value.data = [proposal]
+    order = {"orderId": 1, "status": "FILLED", "executedQty": "0.001",
+             "fills": [{"price": "100", "qty": "0.001", "commission": "0", "commissionAsset": "USDT"}]}
+
+    with patch.object(executor.settings, "trading_enabled", True), \
+         patch.object(executor, "get_supabase", return_value=sb), \
+         patch.object(executor.protective_orders, "release_symbol", AsyncMock(return_value=False)), \
+         patch.object(executor.binance_client, "place_order", AsyncMock(return_value=order)), \
+         patch.object(executor, "_close_position", AsyncMock()), \
+         patch.object(executor, "_log_risk_event", AsyncMock()):
+        with lt.proposal_trace("BTCUSDT") as trace:
+            lt.attach(trace, "p-9")
+            result = await executor.execute_proposal("p-9")
+
+    assert result["success"]
+    updates = [c.args[0] for c in sb.table.return_value.update.call_args_list]
+    executed = next(u for u in updates if u.get("status") == "executed")
+    assert "latency_trace" not in executed                            # columna opcional fuera del write del fill
+    persisted = next(u for u in updates if "latency_trace" in u)["latency_trace"]
+    assert persisted["trace_id"] == trace.trace_id
+    assert {"claim", "place_order"} <= {s["stage"] for s in persisted["spans"]}
+    assert "candle_to_fill" in persisted["marks"]
+    assert "position_update" in {s["stage"] for s in trace.spans}
+
+
+async def test_fill_is_recorded_when_latency_trace_column_is_missing():
+    from app.services import executor
+
+    sb = MagicMock()
+    proposal = {"id": "p-10", "symbol": "BTCUSDT", "type": "buy", "quantity": 0.001, "price": 100.0,
+                "order_type": "MARKET"}
+    sb.table.return_value.update.return_value.eq.return_value.eq.return_value.execute.return_value.data = [proposal]
+    sb.table.return_value.insert.return_value.execute.return_value.data = [{"id": "pos-10", "symbol": "BTCUSDT"}]
+    writes = []
+
+    def update(values):
+        writes.append(values)
+        query = MagicMock()
+        if "latency_trace" in values:
+            query.eq.return_value.execute.side_effect = Exception(
+                "PGRST204: Could not find the 'latency_trace' column of 'trade_proposals'")
+        else:
+            query.eq.return_value.eq.return_value.execute.return_value.data = [proposal]
+        return query
+
+    sb.table.return_value.update.side_effect = update
+    order = {"orderId": 1, "status": "FILLED", "executedQty": "0.001",
+             "fills": [{"price": "100", "qty": "0.001", "commission": "0", "commissionAsset": "USDT"}]}
+
+    with patch.object(executor.settings, "trading_enabled", True), \
+         patch.object(executor, "get_supabase", return_value=sb), \
+         patch.object(executor.protective_orders, "protection_enabled", return_value=False), \
+         patch.object(executor.binance_client, "place_order", AsyncMock(return_value=order)), \
+         patch.object(executor.binance_client, "get_price", AsyncMock(return_value={"price": "100"})), \
+         patch.object(executor, "_compute_sl_tp", return_value=(95.0, 110.0)), \
+         patch.object(executor, "_log_risk_event", AsyncMock()):
+        with lt.proposal_trace("BTCUSDT") as trace:
+            lt.attach(trace, "p-10")
+            result = await executor.execute_proposal("p-10")
+
+    assert result["success"]
+    assert any(w.get("status") == "executed" for w in writes)
+    sb.table.return_value.insert.assert_called_once()
+    assert "latency_trace" not in sb.table.return_value.insert.call_args.args[0]
+    assert sum("latency_trace" in w for w in writes) == 1             # tras el primer rechazo no se reintenta
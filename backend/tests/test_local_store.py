@@ -0,0 +1,157 @@
+"""Tests para local_store.py — backend SQLite con la interfaz de supabase-py."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+from app.services.local_store import LocalClient, LocalStoreError, load_schema
+
+
+@pytest.fixture
+def db():
+    client = LocalClient(":memory:")
+    yield client
+    client.close()
+
+
+def _position(symbol="BTCUSDT", **extra):
+    return {"symbol": symbol, "side": "long", "entry_price": 100.0, "entry_quantity": 1.0,
+            "entry_notional": 100.0, "current_quantity": 1.0, **extra}
+
+
+def _kline(i, close=1.0):
+    ot = datetime(2026, 10, 19, tzinfo=timezone.utc) + timedelta(hours=i)
+    return {"symbol": "BTCUSDT", "interval": "1h", "open_time": ot.isoformat(),
+            "open": 1.0, "high": 1.0, "low": 1.0, "close": close, "volume": 1.0}
+
+
+def test_schema_follows_migrations():
+    schema = load_schema()
+    assert {"klines_ohlcv", "positions", "trade_proposals", "risk_events", "backtest_results",
+            "ml_training_runs", "ml_predictions", "trade_aggregates"} <= set(schema)
+    assert "chat_history" in schema and "chat_messages" not in schema  # RENAME TO
+    assert ("symbol", "interval", "open_time") in schema["klines_ohlcv"].unique
+    assert schema["trade_aggregates"].primary_key == ("scope", "scope_key", "bucket")
+    assert "protection_order_list_id" in schema["positions"].columns  # ADD COLUMN posterior
+    assert schema["positions"].touch_updated_at and not schema["risk_events"].touch_updated_at
+
+
+def test_insert_applies_defaults_and_round_trips_types(db):
+    row = db.table("trade_proposals").insert({
+        "type": "buy", "symbol": "BTCUSDT", "quantity": "0.001", "notional": 50,
+        "risk_checks": [{"name": "balance", "passed": True}], "auto_approved": True,
+    }).execute().data[0]
+
+    assert row["status"] == "draft" and row["retry_count"] == 0 and row["order_type"] == "MARKET"
+    assert row["quantity"] == pytest.approx(0.001) and row["auto_approved"] is True
+    assert row["risk_checks"] == [{"name": "balance", "passed": True}]
+    assert row["id"] and row["created_at"].endswith("+00:00")
+
+
+def test_update_touches_updated_at_and_returns_rows(db):
+    pos = db.table("positions").insert(_position(updated_at="2026-01-01T00:00:00Z")).execute().data[0]
+
+    resp = db.table("positions").update({"status": "closed"}).eq("id", pos["id"]).execute()
+
+    assert resp.data[0]["status"] == "closed"
+    assert resp.data[0]["updated_at"] > "2026-01-01T00:00:00.000000+00:00"
+    assert db.table("positions").update({"status": "open"}).eq("id", "missing").execute().data == []
+
+
+def test_upsert_on_conflict_updates_only_given_columns(db):
+    first = db.table("klines_ohlcv").upsert([_kline(0), _kline(1)], on_conflict="symbol,interval,open_time").execute().data
+    db.table("klines_ohlcv").upsert([_kline(1, close=2.0), _kline(2)], on_conflict="symbol,interval,open_time").execute()
+
+    rows = db.table("klines_ohlcv").select("id,close", count="exact").order("open_time").execute()
+    assert rows.count == 3
+    assert [r["close"] for r in rows.data] == [1.0, 2.0, 1.0]
+    assert rows.data[1]["id"] == first[1]["id"]  # la fila existente conserva su id
+
+
+def test_filters_modifiers_and_postgrest_or_grammar(db):
+    db.table("klines_ohlcv").upsert([_kline(i) for i in range(6)], on_conflict="symbol,interval,open_time").execute()
+    q = lambda: db.table("klines_ohlcv").select("open_time")  # noqa: E731
+
+    # timestamps con Z / +00:00 / sin microsegundos comparan igual
+    assert len(q().gte("open_time", "2026-10-19T03:00:00Z").execute().data) == 3
+    assert len(q().order("open_time", desc=True).range(1, 2).execute().data) == 2
+    cond = 'open_time.gt."2026-10-19T04:00:00+00:00",and(symbol.eq.BTCUSDT,open_time.eq."2026-10-19T00:00:00+00:00")'
+    assert len(q().or_(cond).execute().data) == 2
+    assert q().not_.in_("interval", ["1h"]).execute().data == []
+
+    db.table("trade_proposals").insert([
+        {"type": "buy", "symbol": "BTCUSDT", "quantity": 1, "notional": 1, "binance_order_id": 7},
+        {"type": "buy", "symbol": "ETHUSDT", "quantity": 1, "notional": 1},
+    ]).execute()
+    rows = db.table("trade_proposals").select("symbol").not_.is_("binance_order_id", "null").execute().data
+    assert rows == [{"symbol": "BTCUSDT"}]
+
+
+def test_errors_look_like_postgrest(db):
+    with pytest.raises(LocalStoreError, match="does not exist"):
+        db.table("positions").insert(_position(no_such_column=1)).execute()
+    with pytest.raises(LocalStoreError) as exc:
+        db.table("positions").select("*").eq("symbol", "NOPE").single().execute()
+    assert exc.value.code == "PGRST116"
+    assert db.table("positions").select("*").eq("symbol", "NOPE").maybe_single().execute().data is None
+    with pytest.raises(LocalStoreError, match="not available"):
+        db.rpc("run_data_retention").execute()
+
+
+def test_rpcs_with_local_implementation(db):
+    open_pos = db.table("positions").insert(_position()).execute().data[0]
+    closed = db.table("positions").insert(_position(status="closed")).execute().data[0]
+    marks = [{"id": p["id"], "current_price": 110.0, "unrealized_pnl": 10.0, "unrealized_pnl_percent": 10.0}
+             for p in (open_pos, closed)]
+
+    assert db.rpc("mark_positions_to_market", {"p_marks": marks}).execute().data == 1
+
+    db.table("klines_ohlcv").upsert([_kline(i) for i in (0, 1, 2, 5)], on_conflict="symbol,interval,open_time").execute()
+    since = _kline(0)["open_time"]
+    cov = db.rpc("get_klines_coverage", {"p_symbols": ["BTCUSDT"], "p_since": since}).execute().data
+    assert cov[0]["candle_count"] == 4 and cov[0]["gap_count"] == 1 and cov[0]["missing_candles"] == 2
+    # el gap queda antes de la ventana: no se cuenta, pero los totales siguen siendo de toda la historia
+    cov = db.rpc("get_klines_coverage", {"p_symbols": ["BTCUSDT"], "p_since": _kline(5)["open_time"]}).execute().data
+    assert cov[0]["candle_count"] == 4 and cov[0]["gap_count"] == 0 and cov[0]["first_open_time"].startswith("2026-10-19T00:00:00")
+
+
+def test_bulk_reader_keyset_pagination_over_local_store(db):
+    from app.services.bulk_reader import BulkReader
+
+    db.table("klines_ohlcv").upsert([_kline(i) for i in range(25)], on_conflict="symbol,interval,open_time").execute()
+    reader = BulkReader("klines_ohlcv", "open_time", keys=("symbol", "interval", "open_time"),
+                        filters=[("eq", "symbol", "BTCUSDT")], page_size=10, client=db)
+    rows = list(reader.rows())
+
+    assert len(rows) == 25 and reader.stats["pages"] == 3
+    assert [r["open_time"] for r in rows] == sorted(r["open_time"] for r in rows)
+
+
+def test_trade_stats_persist_and_reload_through_local_store(db):
+    from app.services.trade_stats import TradeStatsStore
+
+    store = TradeStatsStore()
+    store.load(db, rebuild_if_empty=False)
+    for i, pnl in enumerate((5.0, -2.0, 3.0)):
+        store.record_close(db, {"symbol": "BTCUSDT", "strategy_id": None, "realized_pnl": pnl,
+                                "entry_notional": 100.0, "closed_at": f"2026-10-19T0{i}:00:00+00:00"})
+
+    reloaded = TradeStatsStore()
+    reloaded.load(db, rebuild_if_empty=False)
+    assert reloaded.window().trades == 3
+    assert reloaded.window().pnl_sum == pytest.approx(6.0)
+    assert reloaded.window(scope="symbol", key="BTCUSDT").max_drawdown == pytest.approx(store.window().max_drawdown)
+
+
+def test_get_supabase_selects_sqlite_backend(tmp_path):
+    from app import db as db_module
+
+    with patch.object(db_module.settings, "storage_backend", "sqlite"), \
+         patch.object(db_module.settings, "sqlite_path", str(tmp_path / "local.db")), \
+         patch.object(db_module, "_client", None):
+        client = db_module.get_supabase()
+        client.table("risk_events").insert({"event_type": "order_executed", "severity": "info", "message": "x"}).execute()
+        assert len(client.table("risk_events").select("id").execute().data) == 1
+        client.close()
+    assert (tmp_path / "local.db").exists()
@@ -0,0 +1,108 @@
+"""Tests para mark_to_market.py — uPnL de todas las posiciones con un snapshot de precios."""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.mark_to_market import MarkToMarket, compute_marks
+
+
+def _pos(pid, symbol, entry=100.0, qty=2.0, commission=0.5):
+    return {"id": pid, "symbol": symbol, "side": "long", "status": "open",
+            "entry_price": entry, "current_quantity": qty, "entry_notional": entry * qty,
+            "total_commission": commission, "current_price": entry}
+
+
+def _db(positions):
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.in_.return_value.execute.return_value = MagicMock(data=positions)
+    return sb
+
+
+def _prices(mapping):
+    return AsyncMock(return_value=[{"symbol": s, "price": str(p)} for s, p in mapping.items()])
+
+
+def test_compute_marks_values_and_missing_price_fallback():
+    snap = compute_marks([_pos("a", "BTCUSDT"), _pos("b", "ETHUSDT", entry=50.0)], {"BTCUSDT": 110.0})
+
+    marked, unmarked = snap.positions
+    assert marked["unrealized_pnl"] == pytest.approx(10.0 * 2 - 0.5)
+    assert marked["unrealized_pnl_percent"] == pytest.approx(19.5 / 200 * 100)
+    assert "uPnL: $19.5000" in marked["display"]
+    assert "display" not in unmarked  # sin precio: queda como estaba
+    assert snap.in_positions == pytest.approx(110.0 * 2 + 50.0 * 2)
+    assert snap.unrealized_pnl == pytest.approx(19.5)
+
+
+@pytest.mark.asyncio
+async def test_run_uses_one_price_call_and_one_rpc():
+    mtm = MarkToMarket()
+    sb = _db([_pos("a", "BTCUSDT"), _pos("b", "ETHUSDT"), _pos("c", "BTCUSDT")])
+    with patch("app.services.mark_to_market.binance_client.get_prices", _prices({"BTCUSDT": 101, "ETHUSDT": 99})) as gp:
+        snap = await mtm.run(sb)
+
+    gp.assert_awaited_once_with(["BTCUSDT", "ETHUSDT"])
+    name, params = sb.rpc.call_args.args
+    assert name == "mark_positions_to_market"
+    assert [m["id"] for m in params["p_marks"]] == ["a", "b", "c"]
+    sb.table.return_value.update.assert_not_called()
+    assert snap.persisted and mtm.latest() is snap
+
+
+@pytest.mark.asyncio
+async def test_run_respects_cadence_unless_forced():
+    mtm = MarkToMarket()
+    sb = _db([_pos("a", "BTCUSDT")])
+    with patch("app.services.mark_to_market.binance_client.get_prices", _prices({"BTCUSDT": 101})), \
+         patch("app.services.mark_to_market.settings.mark_to_market_seconds", 60):
+        first = await mtm.run(sb)
+        assert await mtm.run(sb) is first
+        await mtm.run(sb, force=True)
+
+    assert sb.rpc.call_count == 2 and mtm.stats["skipped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_rpc_falls_back_to_row_updates():
+    mtm = MarkToMarket()
+    sb = _db([_pos("a", "BTCUSDT"), _pos("b", "BTCUSDT")])
+    sb.rpc.return_value.execute.side_effect = Exception("function mark_positions_to_market does not exist")
+    with patch("app.services.mark_to_market.binance_client.get_prices", _prices({"BTCUSDT": 101})):
+        await mtm.run(sb)
+
+    assert sb.table.return_value.update.call_count == 2
+    assert mtm.stats["legacy_writes"] == 2
+
+
+@pytest.mark.asyncio
+async def test_run_is_not_persisted_when_every_write_fails():
+    mtm = MarkToMarket()
+    sb = _db([_pos("a", "BTCUSDT"), _pos("b", "BTCUSDT")])
+    sb.rpc.return_value.execute.side_effect = Exception("function mark_positions_to_market does not exist")
+    sb.table.return_value.update.return_value.eq.return_value.in_.return_value.execute.side_effect = Exception("timeout")
+    with patch("app.services.mark_to_market.binance_client.get_prices", _prices({"BTCUSDT": 101})):
+        snap = await mtm.run(sb)
+
+    assert not snap.persisted
+    status = mtm.status()
+    assert status["write_failures"] == 1 and status["rows_written"] == 0
+    assert status["persisted"] is False and "timeout" in status["last_error"]
+
+
+@pytest.mark.asyncio
+async def test_read_only_portfolio_does_not_write():
+    from app.services.portfolio import get_portfolio_state
+
+    sb = _db([_pos("a", "BTCUSDT")])
+    with patch("app.services.portfolio.get_supabase", return_value=sb), \
+         patch("app.services.binance_client.get_account",
+               AsyncMock(return_value={"balances": [{"asset": "USDT", "free": "1000", "locked": "0"}]})), \
+         patch("app.services.mark_to_market.binance_client.get_prices", _prices({"BTCUSDT": 110})):
+        state = await get_portfolio_state()
+
+    assert state["unrealized_pnl"] == pytest.approx(19.5)
+    assert state["total_portfolio_value"] == pytest.approx(1000 + 220)
+    sb.rpc.assert_not_called()
+    sb.table.return_value.update.assert_not_called()
+    sb.table.return_value.insert.assert_not_called()
@@ -0,0 +1,129 @@
+"""Tests para portfolio_risk.py — covarianza EWMA incremental y VaR/CVaR del book."""
+
+import time
+from statistics import NormalDist
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.portfolio_risk import PortfolioRisk, get_portfolio_risk, sync_closed_candles
+
+HOUR_MS = 3_600_000
+
+
+def _feed(model, closes_matrix, symbols):
+    for t, row in enumerate(closes_matrix):
+        model.observe(t * HOUR_MS, dict(zip(symbols, row)))
+
+
+def _random_closes(n_bars, n_symbols, seed=7, corr=None):
+    rng = np.random.default_rng(seed)
+    rets = rng.normal(0, 0.01, size=(n_bars, n_symbols))
+    if corr is not None:
+        rets = rets @ np.linalg.cholesky(corr).T
+    return 100 * np.cumprod(1 + rets, axis=0), rets
+
+
+def test_incremental_ewma_matches_batch_formula():
+    closes, _ = _random_closes(120, 3)
+    model = PortfolioRisk(lam=0.94, window=200, confidence=0.99)
+    _feed(model, closes, ["A", "B", "C"])
+
+    r = closes[1:] / closes[:-1] - 1
+    w = (1 - 0.94) * 0.94 ** np.arange(len(r) - 1, -1, -1)
+    expected = (r * w[:, None]).T @ r / (1 - 0.94 ** len(r))
+    assert model.observations == 119 and model.ready
+    np.testing.assert_allclose(model._cov_hat, expected, rtol=1e-10)
+
+
+def test_single_asset_var_and_cvar():
+    returns = np.linspace(-0.05, 0.05, 101)
+    model = PortfolioRisk(lam=0.94, window=101, confidence=0.99)
+    closes = 100 * np.cumprod(np.concatenate([[1.0], 1 + returns]))
+    _feed(model, closes[:, None], ["A"])
+
+    report = model.measure(np.array([1000.0]))[0]
+    sigma = np.sqrt(model._cov_hat[0, 0]) * 1000
+    z = NormalDist().inv_cdf(0.99)
+    assert report.parametric_var == pytest.approx(z * sigma)
+    assert report.parametric_cvar == pytest.approx(sigma * NormalDist().pdf(z) / 0.01)
+    assert report.historical_var == pytest.approx(0.049 * 1000)        # 2º peor retorno
+    assert report.historical_cvar == pytest.approx(0.0495 * 1000)      # media de los 2 peores
+
+
+def test_marginal_var_reflects_correlation():
+    corr = np.array([[1.0, 0.9, -0.8], [0.9, 1.0, -0.7], [-0.8, -0.7, 1.0]])
+    closes, _ = _random_closes(300, 3, corr=corr)
+    model = PortfolioRisk(lam=0.97, window=200, confidence=0.99)
+    _feed(model, closes, ["BTCUSDT", "ETHUSDT", "HEDGEUSDT"])
+    book = [{"symbol": "BTCUSDT", "current_quantity": 10, "current_price": 100.0}]
+
+    same_way = model.impact(book, "ETHUSDT", "buy", 1000.0)
+    hedge = model.impact(book, "HEDGEUSDT", "buy", 1000.0)
+    exit_ = model.impact(book, "BTCUSDT", "sell", 1000.0)
+
+    assert same_way.marginal > 0 > hedge.marginal
+    assert exit_.after.worst == 0.0 and exit_.marginal < 0
+    unknown = model.impact(book, "NEWUSDT", "buy", 50.0)
+    assert unknown.uncovered_exposure == 50.0 and unknown.marginal == pytest.approx(0.0)
+
+
+def test_sync_only_feeds_new_closed_candles():
+    index = pd.date_range("2026-10-19", periods=40, freq="h", tz="UTC", name="open_time")
+    frames = {
+        "BTCUSDT": pd.DataFrame({"close": np.linspace(100, 140, 40)}, index=index),
+        "ETHUSDT": pd.DataFrame({"close": np.linspace(50, 60, 35)}, index=index[5:]),  # listado después
+    }
+    last_open_ms = int(index[-1].timestamp() * 1000)
+    with patch("app.services.technical_analysis._load_klines_df", side_effect=lambda s, iv, limit: frames[s]):
+        # la última vela sigue abierta
+        assert sync_closed_candles(["BTCUSDT", "ETHUSDT"], "1h", now_ms=last_open_ms + HOUR_MS - 1) == 39
+        assert sync_closed_candles(["BTCUSDT", "ETHUSDT"], "1h", now_ms=last_open_ms + HOUR_MS - 1) == 0
+        assert sync_closed_candles(["BTCUSDT", "ETHUSDT"], "1h", now_ms=last_open_ms + HOUR_MS) == 1
+
+    model = get_portfolio_risk()
+    assert model.symbols == ["BTCUSDT", "ETHUSDT"] and model.observations == 39
+    assert model.last_bar == last_open_ms
+
+
+def test_measure_is_sub_millisecond_at_50_symbols():
+    closes, _ = _random_closes(250, 50)
+    symbols = [f"S{i}USDT" for i in range(50)]
+    model = PortfolioRisk(lam=0.94, window=200, confidence=0.99)
+    _feed(model, closes, symbols)
+    book = [{"symbol": s, "current_quantity": 1.0, "current_price": 100.0} for s in symbols[:10]]
+
+    samples = []
+    for _ in range(200):
+        t0 = time.perf_counter()
+        model.impact(book, "S20USDT", "buy", 100.0)
+        samples.append(time.perf_counter() - t0)
+    assert np.median(samples) < 0.001
+
+
+@pytest.mark.asyncio
+async def test_enhanced_validation_gates_book_var(mock_supabase):
+    from app.services.quant_risk import validate_proposal_enhanced
+
+    closes, _ = _random_closes(100, 2, corr=np.array([[1.0, 0.95], [0.95, 1.0]]))
+    _feed(get_portfolio_risk(), closes, ["BTCUSDT", "ETHUSDT"])
+    book = [{"symbol": "ETHUSDT", "current_quantity": 400, "current_price": 100.0}]
+
+    with patch("app.services.quant_risk.load_open_positions", return_value=book), \
+         patch("app.services.quant_risk.load_usdt_free", new_callable=AsyncMock, return_value=1e6), \
+         patch("app.services.quant_risk.load_daily_pnl", return_value=0.0), \
+         patch("app.services.quant_risk.compute_entropy", return_value=None), \
+         patch("app.services.quant_risk.detect_regime", return_value=None), \
+         patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=None), \
+         patch("app.services.quant_risk.settings.risk_max_open_positions", 5), \
+         patch("app.services.quant_risk.settings.risk_max_account_utilization", 1.0), \
+         patch("app.services.quant_risk.get_supabase", return_value=mock_supabase):
+        entry = await validate_proposal_enhanced("buy", "BTCUSDT", 0.01, 400.0, 40000.0)
+        exit_ = await validate_proposal_enhanced("sell", "ETHUSDT", 400, 40000.0, 100.0, is_exit=True)
+
+    var_check = next(c for c in entry.checks if c.name == "portfolio_var")
+    assert entry.approved is False and var_check.passed is False
+    assert var_check.value > var_check.limit
+    assert next(c for c in exit_.checks if c.name == "portfolio_var").passed is True
@@ -0,0 +1,135 @@
+"""Tests para position_book.py — book en memoria de posiciones abiertas."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.position_book import PositionBook, get_position_book
+
+
+def _pos(pid, symbol="BTCUSDT", sl="69000.0", tp="72000.0", opened_at="2026-10-19T00:00:00+00:00"):
+    return {
+        "id": pid, "symbol": symbol, "entry_price": "70000.0", "entry_quantity": "0.001",
+        "current_quantity": "0.001", "stop_loss_price": sl, "take_profit_price": tp,
+        "total_commission": "0", "status": "open", "opened_at": opened_at,
+    }
+
+
+def _db(rows):
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=rows)
+    return sb
+
+
+def test_load_and_reads_return_copies():
+    book = PositionBook()
+    book.load(_db([_pos("b", opened_at="2026-10-19T02:00:00+00:00"), _pos("a", "ETHUSDT")]))
+
+    assert book.loaded and book.count() == 2 and book.count("ETHUSDT") == 1
+    assert [p["id"] for p in book.open_positions()] == ["a", "b"]  # oldest first
+    snapshot = book.open_positions("BTCUSDT")[0]
+    snapshot["stop_loss_price"] = "1"
+    assert book.get("b")["stop_loss_price"] == "69000.0"
+
+
+def test_verify_resyncs_from_db_and_reports_drift():
+    book = PositionBook()
+    book.load(_db([_pos("a"), _pos("b")]))
+    book.update("a", stop_loss_price="69500.0")
+
+    # DB: "b" cerrada por fuera, "c" abierta por fuera, "a" con SL distinto
+    drift = book.verify(_db([_pos("a", sl="69400.0"), _pos("c", "SOLUSDT")]))
+
+    assert drift == {"missing": ["c"], "stale": ["b"], "changed": ["a"]}
+    assert book.get("a")["stop_loss_price"] == "69400.0"
+    assert {p["id"] for p in book.open_positions()} == {"a", "c"}
+    assert book.verify(_db([_pos("a", sl="69400.0"), _pos("c", "SOLUSDT")])) == {
+        "missing": [], "stale": [], "changed": [],
+    }
+
+
+@pytest.mark.asyncio
+async def test_subscribers_receive_events_and_drop_oldest_when_full():
+    book = PositionBook()
+    book.load(_db([]))
+    queue = book.subscribe(maxsize=2)
+
+    book.add(_pos("a"))
+    book.update("a", stop_loss_price="69800.0")
+    book.remove("a", status="closed")
+
+    assert book.stats["dropped_events"] == 1
+    kinds = [queue.get_nowait().kind, queue.get_nowait().kind]
+    assert kinds == ["updated", "closed"]
+
+    events = []
+
+    async def consume():
+        async for event in book.events():
+            events.append(event)
+            if len(events) == 2:
+                break
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0)
+    book.add(_pos("z"))
+    book.update("z", stop_loss_price="70100.0")
+    await asyncio.wait_for(task, 1)
+    assert [(e.kind, e.changes) for e in events] == [("opened", {}), ("updated", {"stop_loss_price": "70100.0"})]
+    assert len(book._subscribers) == 1  # el iterador se desuscribió al salir
+
+
+def test_insert_without_returned_row_forces_reload():
+    book = PositionBook()
+    book.load(_db([]))
+    book.add({})
+    assert not book.loaded
+
+
+@pytest.mark.asyncio
+async def test_fast_loop_reads_book_without_db_queries():
+    book = get_position_book()
+    book.load(_db([_pos("a", sl="69000.0", tp="72000.0")]))
+
+    sb = MagicMock()
+    with patch("app.services.trading_loop.get_supabase", return_value=sb), \
+         patch("app.services.trading_loop.binance_client") as bc, \
+         patch("app.services.trading_loop._execute_sl_tp", new_callable=AsyncMock) as exec_sl, \
+         patch("app.services.trading_loop.compute_chandelier_sl", return_value=None), \
+         patch("app.services.technical_analysis.compute_indicators", return_value=None):
+        bc.get_price_safe = AsyncMock(return_value={"price": "71500.0"})
+        from app.services.trading_loop import _check_stop_losses
+        for _ in range(3):
+            await _check_stop_losses()
+
+    exec_sl.assert_not_called()
+    # Solo el UPDATE del trailing stop; ninguna lectura de positions
+    sb.table.return_value.select.assert_not_called()
+    sb.table.return_value.update.assert_called_once()
+    new_sl = sb.table.return_value.update.call_args.args[0]["stop_loss_price"]
+    assert book.get("a")["stop_loss_price"] == new_sl > 69000.0
+
+
+@pytest.mark.asyncio
+async def test_executor_keeps_book_in_sync():
+    from app.services.executor import _close_position, _open_position
+
+    book = get_position_book()
+    book.load(_db([]))
+    sb = MagicMock()
+    inserted = _pos("new-1")
+    sb.table.return_value.insert.return_value.execute.return_value = MagicMock(data=[inserted])
+
+    with patch("app.services.executor.binance_client") as bc, \
+         patch("app.services.executor._compute_sl_tp", return_value=(69000.0, 72000.0)), \
+         patch("app.services.executor._log_risk_event", new_callable=AsyncMock):
+        bc.get_price = AsyncMock(return_value={"price": "70000.0"})
+        await _open_position(sb, "BTCUSDT", 70000.0, 0.001, 1, "p1", 0.0, "USDT", None)
+        assert book.count("BTCUSDT") == 1
+
+        await _close_position(sb, "BTCUSDT", 71000.0, 0.001, 2, "p2", 0.0, "USDT")
+
+    assert book.count() == 0
+    sb.table.return_value.select.assert_not_called()
+    assert sb.table.return_value.update.call_args.args[0]["status"] == "closed"
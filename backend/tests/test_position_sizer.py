@@ -20,7 +20,8 @@ async def test_returns_result_with_valid_data(mock_supabase):
     ind = _mock_indicators(atr=500.0)
     with patch("app.services.position_sizer.compute_indicators", return_value=ind), \
          patch("app.services.position_sizer.get_supabase", return_value=mock_supabase), \
-         patch("app.services.position_sizer.binance_client") as mock_bc:
+         patch("app.services.position_sizer.binance_client") as mock_bc, \
+         patch("app.services.account_state.binance_client", mock_bc):
         mock_bc.get_price = AsyncMock(return_value={"price": "50000.00"})
         mock_bc.get_account = AsyncMock(return_value={
             "balances": [{"asset": "USDT", "free": "10000.00"}]
@@ -42,7 +43,8 @@ async def test_hard_cap_is_respected(mock_supabase):
 
     with patch("app.services.position_sizer.compute_indicators", return_value=ind), \
          patch("app.services.position_sizer.get_supabase", return_value=mock_supabase), \
-         patch("app.services.position_sizer.binance_client") as mock_bc:
+         patch("app.services.position_sizer.binance_client") as mock_bc, \
+         patch("app.services.account_state.binance_client", mock_bc):
         mock_bc.get_price = AsyncMock(return_value={"price": "50000.00"})
         mock_bc.get_account = AsyncMock(return_value={
             "balances": [{"asset": "USDT", "free": "100000.00"}]
@@ -63,7 +65,8 @@ async def test_fallback_with_no_trade_history(mock_supabase):
 
     with patch("app.services.position_sizer.compute_indicators", return_value=ind), \
          patch("app.services.position_sizer.get_supabase", return_value=mock_supabase), \
-         patch("app.services.position_sizer.binance_client") as mock_bc:
+         patch("app.services.position_sizer.binance_client") as mock_bc, \
+         patch("app.services.account_state.binance_client", mock_bc):
         mock_bc.get_price = AsyncMock(return_value={"price": "50000.00"})
         mock_bc.get_account = AsyncMock(return_value={
             "balances": [{"asset": "USDT", "free": "10000.00"}]
@@ -81,7 +84,8 @@ async def test_returns_none_when_no_indicators(mock_supabase):
     """Should return None when indicators (and hence ATR) are unavailable."""
     with patch("app.services.position_sizer.compute_indicators", return_value=None), \
          patch("app.services.position_sizer.get_supabase", return_value=mock_supabase), \
-         patch("app.services.position_sizer.binance_client") as mock_bc:
+         patch("app.services.position_sizer.binance_client") as mock_bc, \
+         patch("app.services.account_state.binance_client", mock_bc):
         mock_bc.get_price = AsyncMock(return_value={"price": "50000.00"})
         mock_bc.get_account = AsyncMock(return_value={
             "balances": [{"asset": "USDT", "free": "10000.00"}]
@@ -0,0 +1,251 @@
+"""Tests para protective_orders.py — OCO SL/TP en el exchange con fast loop como backstop."""
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services import protective_orders
+from app.services.position_book import get_position_book
+
+
+def _settings(**kw):
+    base = dict(
+        exchange_protection_enabled=True, protection_stop_limit_offset_pct=0.003,
+        protection_fallback_stop_limit=True, protection_poll_seconds=0, protection_retry_seconds=0,
+    )
+    return SimpleNamespace(**{**base, **kw})
+
+
+def _pos(**kw):
+    return {
+        "id": "pos-1", "symbol": "BTCUSDT", "entry_price": "70000.0", "entry_quantity": "0.001",
+        "current_quantity": "0.001", "stop_loss_price": "69000.0", "take_profit_price": "72000.0",
+        "total_commission": "0", "status": "open", "opened_at": "2026-10-19T00:00:00+00:00",
+        "protection_mode": "oco", "protection_order_list_id": 7,
+        "protection_sl_order_id": 11, "protection_tp_order_id": 12, **kw,
+    }
+
+
+def _oco_response():
+    return {
+        "orderListId": 7,
+        "orderReports": [
+            {"orderId": 11, "type": "STOP_LOSS_LIMIT"},
+            {"orderId": 12, "type": "LIMIT_MAKER"},
+        ],
+    }
+
+
+@pytest.fixture(autouse=True)
+def _clear_throttle():
+    protective_orders._last_poll.clear()
+    protective_orders._last_attempt.clear()
+
+
+@pytest.mark.asyncio
+async def test_place_protection_rounds_prices_and_maps_legs():
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc:
+        bc.place_oco_order = AsyncMock(return_value=_oco_response())
+        fields = await protective_orders.place_protection("BTCUSDT", 0.0012345, 69000.004, 72000.0)
+
+    assert bc.place_oco_order.call_args.args == ("BTCUSDT", "SELL", 0.00123, 72000.0, 69000.0, 68793.0)
+    assert fields == {
+        "protection_mode": "oco", "protection_order_list_id": 7,
+        "protection_sl_order_id": 11, "protection_tp_order_id": 12,
+    }
+
+
+@pytest.mark.asyncio
+async def test_oco_rejected_falls_back_to_stop_limit():
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc:
+        bc.place_oco_order = AsyncMock(return_value={"code": -1013, "msg": "Filter failure"})
+        bc.place_stop_limit_order = AsyncMock(return_value={"orderId": 99})
+        fields = await protective_orders.place_protection("BTCUSDT", 0.001, 69000.0, 72000.0)
+
+    assert fields["protection_mode"] == "stop_limit"
+    assert fields["protection_sl_order_id"] == 99 and fields["protection_tp_order_id"] is None
+
+
+@pytest.mark.asyncio
+async def test_sync_detects_exchange_fill_and_closes_position():
+    book = get_position_book()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[_pos()])
+    book.load(sb)
+
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc, \
+         patch("app.services.executor._log_risk_event", new_callable=AsyncMock) as log_event:
+        bc.get_order_list = AsyncMock(return_value={"listOrderStatus": "ALL_DONE"})
+        bc.get_order = AsyncMock(side_effect=lambda sym, oid: (
+            {"status": "FILLED", "executedQty": "0.001", "cummulativeQuoteQty": "68.95"}
+            if oid == 11 else {"status": "EXPIRED", "executedQty": "0"}
+        ))
+        bc.get_my_trades = AsyncMock(return_value=[{"commission": "0.05", "commissionAsset": "USDT"}])
+        closed = await protective_orders.sync_position(sb, book.get("pos-1"))
+
+    assert closed is True
+    assert book.count() == 0
+    update = sb.table.return_value.update.call_args.args[0]
+    assert update["status"] == "closed" and update["exit_order_id"] == 11
+    assert update["exit_price"] == pytest.approx(68950.0)
+    assert log_event.call_args.args[1] == "stop_loss"
+
+
+@pytest.mark.asyncio
+async def test_trailing_update_is_cancel_replace():
+    book = get_position_book()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[_pos()])
+    book.load(sb)
+    new_oco = {"orderListId": 8, "orderReports": [
+        {"orderId": 21, "type": "STOP_LOSS_LIMIT"}, {"orderId": 22, "type": "LIMIT_MAKER"},
+    ]}
+
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc, \
+         patch("app.services.technical_analysis.compute_indicators", return_value=None):
+        bc.cancel_order_list = AsyncMock(return_value={"orderListId": 7})
+        bc.place_oco_order = AsyncMock(return_value=new_oco)
+        from app.services.trading_loop import _update_trailing_stop
+        await _update_trailing_stop(sb, book.get("pos-1"), current_price=71500.0, sl=69000.0, tp=72000.0)
+
+    bc.cancel_order_list.assert_awaited_once_with("BTCUSDT", 7)
+    update = sb.table.return_value.update.call_args.args[0]
+    assert update["protection_order_list_id"] == 8 and update["protection_sl_order_id"] == 21
+    assert book.get("pos-1")["stop_loss_price"] == update["stop_loss_price"] > 69000.0
+
+
+@pytest.mark.asyncio
+async def test_replace_stop_uses_net_quantity_when_commission_was_in_base_asset():
+    # compra de 0.001 BTC con 0.000001 BTC de comisión: en balance quedan 0.000999
+    position = _pos(protection_quantity="0.000999")
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc:
+        bc.cancel_order_list = AsyncMock(return_value={"orderListId": 7})
+        bc.place_oco_order = AsyncMock(return_value=_oco_response())
+        fields = await protective_orders.replace_stop(MagicMock(), position, 69500.0, 72000.0)
+
+    assert bc.place_oco_order.call_args.args[2] == pytest.approx(0.00099)   # no la bruta 0.001
+    assert fields["protection_order_list_id"] == 7
+
+
+@pytest.mark.asyncio
+async def test_replace_stop_keeps_or_restores_protection_when_replacement_fails():
+    with patch.object(protective_orders, "settings", _settings(protection_fallback_stop_limit=False)), \
+         patch.object(protective_orders, "binance_client") as bc:
+        bc.cancel_order_list = AsyncMock(return_value={"orderListId": 7})
+        # stop por encima del TP: no se puede colocar, el OCO actual no se toca
+        kept = await protective_orders.replace_stop(MagicMock(), _pos(), 72500.0, 72000.0)
+        bc.cancel_order_list.assert_not_awaited()
+        assert kept["protection_order_list_id"] == 7
+
+        bc.place_oco_order = AsyncMock(side_effect=[{"code": -2010, "msg": "insufficient balance"}, _oco_response()])
+        restored = await protective_orders.replace_stop(MagicMock(), _pos(), 69500.0, 72000.0)
+
+    assert [c.args[4] for c in bc.place_oco_order.call_args_list] == [69500.0, 69000.0]   # nuevo, y el anterior
+    assert restored["protection_sl_order_id"] == 11
+
+
+@pytest.mark.asyncio
+async def test_exit_sell_skipped_when_protection_already_filled():
+    book = get_position_book()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[_pos()])
+    book.load(sb)
+
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc, \
+         patch("app.services.executor._log_risk_event", new_callable=AsyncMock):
+        bc.cancel_order_list = AsyncMock(side_effect=RuntimeError("400 Client Error: Unknown order list"))
+        bc.get_order = AsyncMock(side_effect=lambda sym, oid: (
+            {"status": "FILLED", "executedQty": "0.001", "cummulativeQuoteQty": "72.0"}
+            if oid == 12 else {"status": "EXPIRED", "executedQty": "0"}
+        ))
+        bc.get_my_trades = AsyncMock(return_value=[])
+        filled = await protective_orders.release_symbol(sb, "BTCUSDT")
+
+    assert filled is True
+    assert book.count("BTCUSDT") == 0
+    assert sb.table.return_value.update.call_args.args[0]["exit_price"] == pytest.approx(72000.0)
+
+
+@pytest.mark.asyncio
+async def test_same_fill_from_stream_and_fast_loop_closes_once():
+    import asyncio
+
+    book = get_position_book()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[_pos()])
+    book.load(sb)
+    fill = {"order_id": 11, "trigger": "stop_loss", "price": 68950.0, "quantity": 0.001,
+            "commission": 0.0000001, "commission_asset": "BTC"}
+
+    async def slow_convert(amount, asset):
+        await asyncio.sleep(0.01)          # la conversión de la comisión cede el loop
+        return 0.05
+
+    with patch("app.services.executor._convert_commission_to_usdt", side_effect=slow_convert), \
+         patch("app.services.executor._log_risk_event", new_callable=AsyncMock), \
+         patch("app.services.executor.get_trade_stats") as stats:
+        first, second = await asyncio.gather(
+            protective_orders.record_fill(sb, book.get("pos-1"), fill),
+            protective_orders.record_fill(sb, book.get("pos-1"), fill),
+        )
+        late = await protective_orders.record_fill(sb, _pos(), fill)   # copia vieja de la posición
+
+    assert (first, second, late) == (True, False, False)
+    assert sb.table.return_value.update.call_count == 1
+    assert sb.table.return_value.update.call_args.args[0]["total_commission"] == pytest.approx(0.05)
+    assert stats.return_value.record_close.call_count == 1
+    assert not protective_orders._closing
+
+
+@pytest.mark.asyncio
+async def test_open_position_inserts_row_before_placing_net_oco():
+    from app.services import executor
+
+    calls = []
+    sb = MagicMock()
+    sb.table.return_value.insert.return_value.execute.side_effect = lambda: calls.append("insert") or MagicMock(
+        data=[{**_pos(), "protection_mode": None, "protection_order_list_id": None,
+               "protection_sl_order_id": None, "protection_tp_order_id": None}])
+
+    async def place_oco(*args):
+        calls.append("oco")
+        return _oco_response()
+
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc, \
+         patch.object(executor.binance_client, "get_price", AsyncMock(return_value={"price": "70000"})), \
+         patch.object(executor, "_compute_sl_tp", return_value=(69000.0, 72000.0)), \
+         patch.object(executor, "_log_risk_event", new_callable=AsyncMock):
+        bc.place_oco_order = AsyncMock(side_effect=place_oco)
+        await executor._open_position(sb, "BTCUSDT", 70000.0, 0.00100, 1, "p1", 0.07, "BTC", None, 0.000001)
+
+    assert calls == ["insert", "oco"]
+    assert bc.place_oco_order.call_args.args[2] == pytest.approx(0.00099)   # 0.001 − comisión en BTC
+    update = sb.table.return_value.update.call_args.args[0]
+    assert update["protection_order_list_id"] == 7
+    assert update["protection_quantity"] == pytest.approx(0.000999)           # para los re-placements
+    assert get_position_book().get("pos-1")["protection_sl_order_id"] == 11
+
+
+@pytest.mark.asyncio
+async def test_protection_is_cancelled_when_it_cannot_be_persisted():
+    sb = MagicMock()
+    sb.table.return_value.update.return_value.eq.return_value.execute.side_effect = RuntimeError("db down")
+    position = _pos(protection_mode=None, protection_order_list_id=None,
+                    protection_sl_order_id=None, protection_tp_order_id=None)
+
+    with patch.object(protective_orders, "settings", _settings()), \
+         patch.object(protective_orders, "binance_client") as bc:
+        bc.place_oco_order = AsyncMock(return_value=_oco_response())
+        bc.cancel_order_list = AsyncMock(return_value={"orderListId": 7})
+        fields = await protective_orders.protect_position(sb, position, 0.001)
+
+    bc.cancel_order_list.assert_awaited_once_with("BTCUSDT", 7)
+    assert fields == protective_orders.no_protection()
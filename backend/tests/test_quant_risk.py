@@ -1,30 +1,20 @@
-"""Unit tests for quant_risk.py -- verifies all 8 risk checks."""
+"""Unit tests for quant_risk.py -- verifies all 9 risk checks and the concurrent engine."""
+
+import asyncio
+import time
+from contextlib import contextmanager
 
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
-from app.models import ValidationResult, RiskCheck
-
-
-def _base_ok():
-    """Base validation that passes all 5 base checks."""
-    checks = [
-        RiskCheck(name="position_size", passed=True, message="OK", value=100.0, limit=500.0),
-        RiskCheck(name="max_open_positions", passed=True, message="OK", value=1.0, limit=3.0),
-        RiskCheck(name="account_balance", passed=True, message="OK", value=9900.0, limit=100.0),
-        RiskCheck(name="account_utilization", passed=True, message="OK", value=0.1, limit=0.8),
-        RiskCheck(name="daily_loss_limit", passed=True, message="OK", value=0.0, limit=-200.0),
-    ]
-    return ValidationResult(approved=True, auto_approved=False, risk_score=10.0,
-                            checks=checks, rejection_reason=None)
 
 
-def _base_fail():
-    """Base validation that fails (position size too large)."""
-    checks = [
-        RiskCheck(name="position_size", passed=False, message="Too large", value=600.0, limit=500.0),
-    ]
-    return ValidationResult(approved=False, auto_approved=False, risk_score=80.0,
-                            checks=checks, rejection_reason="Too large")
+@contextmanager
+def _inputs(usdt_free=9900.0, positions=(), daily_pnl=0.0):
+    """Datos de cuenta / posiciones / PnL diario que consumen los 5 checks base."""
+    with patch("app.services.quant_risk.load_usdt_free", new_callable=AsyncMock, return_value=usdt_free), \
+         patch("app.services.quant_risk.load_open_positions", return_value=list(positions)), \
+         patch("app.services.quant_risk.load_daily_pnl", return_value=daily_pnl):
+        yield
 
 
 def _entropy(tradable=True, ratio=0.5):
@@ -51,9 +41,9 @@ def _sizing(usd=200.0):
 
 
 @pytest.mark.asyncio
-async def test_all_8_checks_pass(mock_supabase):
-    """All 8 checks should pass when market conditions are favorable."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+async def test_all_9_checks_pass(mock_supabase):
+    """All 9 checks should pass when market conditions are favorable."""
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("ranging", 50.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -65,14 +55,16 @@ async def test_all_8_checks_pass(mock_supabase):
         )
 
     assert result.approved is True
-    assert len(result.checks) == 8
+    # buy entry: position_size, max_open_positions, symbol_concentration,
+    # account (balance + utilization: 2 resultados), daily_loss_limit + 4 quant
+    assert len(result.checks) == 10
     assert all(c.passed for c in result.checks)
 
 
 @pytest.mark.asyncio
 async def test_entropy_gate_blocks_noisy_market(mock_supabase):
     """High entropy (ratio > threshold) should block the trade."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(False, 0.92)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("ranging", 50.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -92,7 +84,7 @@ async def test_entropy_gate_blocks_noisy_market(mock_supabase):
 @pytest.mark.asyncio
 async def test_volatile_regime_blocks_trade(mock_supabase):
     """Volatile regime with confidence > 60% should block all trades."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("volatile", 75.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -112,7 +104,7 @@ async def test_volatile_regime_blocks_trade(mock_supabase):
 @pytest.mark.asyncio
 async def test_contra_trend_sell_in_uptrend_blocked(mock_supabase):
     """Selling during strong uptrend (confidence > 80%) should be blocked."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("trending_up", 98.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -132,7 +124,7 @@ async def test_contra_trend_sell_in_uptrend_blocked(mock_supabase):
 @pytest.mark.asyncio
 async def test_contra_trend_buy_in_downtrend_blocked(mock_supabase):
     """Buying during strong downtrend (confidence > 80%) should be blocked."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("trending_down", 98.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -149,7 +141,7 @@ async def test_contra_trend_buy_in_downtrend_blocked(mock_supabase):
 @pytest.mark.asyncio
 async def test_kelly_size_validation_blocks_oversized_trade(mock_supabase):
     """Notional exceeding 1.5x recommended size should fail kelly_size_validation."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("ranging", 50.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(50.0)), \
@@ -170,7 +162,7 @@ async def test_kelly_size_validation_blocks_oversized_trade(mock_supabase):
 @pytest.mark.asyncio
 async def test_exit_sell_in_uptrend_allowed(mock_supabase):
     """is_exit=True should allow sell even in strong uptrend."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("trending_up", 80.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -191,7 +183,7 @@ async def test_exit_sell_in_uptrend_allowed(mock_supabase):
 @pytest.mark.asyncio
 async def test_exit_buy_still_blocked_contra_trend(mock_supabase):
     """is_exit=False should still block buy in strong downtrend (no regression)."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_ok()), \
+    with _inputs(), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("trending_down", 98.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -212,7 +204,7 @@ async def test_exit_buy_still_blocked_contra_trend(mock_supabase):
 @pytest.mark.asyncio
 async def test_base_rejection_propagates(mock_supabase):
     """A failing base check should result in overall rejection."""
-    with patch("app.services.quant_risk._base_validate", return_value=_base_fail()), \
+    with _inputs(daily_pnl=-500.0), \
          patch("app.services.quant_risk.compute_entropy", return_value=_entropy(True, 0.5)), \
          patch("app.services.quant_risk.detect_regime", return_value=_regime("ranging", 50.0)), \
          patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
@@ -224,3 +216,115 @@ async def test_base_rejection_propagates(mock_supabase):
         )
 
     assert result.approved is False
+    assert result.rejection_reason.startswith("Daily PnL")
+
+
+@pytest.mark.asyncio
+async def test_in_memory_rejection_skips_all_loads(mock_supabase):
+    """Oversized notional fails before any I/O: account, entropy, regime, sizing never load."""
+    compute_entropy = MagicMock(return_value=_entropy(True, 0.5))
+    sizing = AsyncMock(return_value=_sizing(200.0))
+    with _inputs(), \
+         patch("app.services.quant_risk.compute_entropy", compute_entropy), \
+         patch("app.services.quant_risk.detect_regime", return_value=_regime("ranging", 50.0)), \
+         patch("app.services.quant_risk.compute_position_size", sizing), \
+         patch("app.services.quant_risk.load_usdt_free", new_callable=AsyncMock) as usdt, \
+         patch("app.services.quant_risk.get_supabase", return_value=mock_supabase):
+        from app.services.quant_risk import validate_proposal_enhanced
+        result = await validate_proposal_enhanced(
+            trade_type="buy", symbol="BTCUSDT",
+            quantity=0.012, notional=600.0, current_price=50000.0,
+        )
+
+    assert result.approved is False
+    assert [c.name for c in result.checks] == ["position_size"]
+    compute_entropy.assert_not_called()
+    sizing.assert_not_awaited()
+    usdt.assert_not_awaited()
+    assert "position_size" in result.timings_ms and not any(k.startswith("load:") for k in result.timings_ms)
+
+
+@pytest.mark.asyncio
+async def test_without_short_circuit_every_check_reports(mock_supabase):
+    with _inputs(), \
+         patch("app.services.quant_risk.settings.risk_short_circuit", False), \
+         patch("app.services.quant_risk.compute_entropy", return_value=_entropy(False, 0.92)), \
+         patch("app.services.quant_risk.detect_regime", return_value=_regime("volatile", 75.0)), \
+         patch("app.services.quant_risk.compute_position_size", new_callable=AsyncMock, return_value=_sizing(200.0)), \
+         patch("app.services.quant_risk.get_supabase", return_value=mock_supabase):
+        from app.services.quant_risk import validate_proposal_enhanced
+        result = await validate_proposal_enhanced(
+            trade_type="buy", symbol="BTCUSDT",
+            quantity=0.002, notional=100.0, current_price=50000.0,
+        )
+
+    assert len(result.checks) == 10
+    assert [c.name for c in result.checks if not c.passed] == ["entropy_gate", "regime_check"]
+    assert result.risk_score == pytest.approx(100 / 500 * 40 + 2 * 15)
+    assert {"load:account", "load:entropy", "load:regime", "load:sizing", "entropy_gate", "total"} <= set(result.timings_ms)
+
+
+@pytest.mark.asyncio
+async def test_loads_run_concurrently(mock_supabase):
+    """Entropy and regime (sync, to_thread) overlap with the async account/sizing loads."""
+    def slow_entropy(symbol, interval):
+        time.sleep(0.1)
+        return _entropy(True, 0.5)
+
+    def slow_regime(symbol, interval):
+        time.sleep(0.1)
+        return _regime("ranging", 50.0)
+
+    async def slow_sizing(symbol, interval, ctx=None):
+        await asyncio.sleep(0.1)
+        return _sizing(200.0)
+
+    with _inputs(), \
+         patch("app.services.quant_risk.compute_entropy", side_effect=slow_entropy), \
+         patch("app.services.quant_risk.detect_regime", side_effect=slow_regime), \
+         patch("app.services.quant_risk.compute_position_size", side_effect=slow_sizing), \
+         patch("app.services.quant_risk.get_supabase", return_value=mock_supabase):
+        from app.services.quant_risk import validate_proposal_enhanced
+        result = await validate_proposal_enhanced(
+            trade_type="buy", symbol="BTCUSDT",
+            quantity=0.002, notional=100.0, current_price=50000.0,
+        )
+
+    assert result.approved is True
+    assert result.timings_ms["total"] < 250  # en serie serían >= 300ms
+
+
+@pytest.mark.asyncio
+async def test_tick_context_readings_are_reused(mock_supabase):
+    """La lectura de entropía/régimen del tick no se recalcula por proposal."""
+    from app.services.tick_context import TickContext
+    from datetime import datetime, timezone
+
+    ctx = TickContext(now=datetime.now(timezone.utc), symbols=["BTCUSDT"], thresholds={},
+                      closed_window_minutes=30, _positions=[])
+    compute_entropy = MagicMock(return_value=_entropy(True, 0.5))
+    detect_regime = MagicMock(return_value=_regime("ranging", 50.0))
+    sizing = AsyncMock(return_value=_sizing(200.0))
+    with _inputs(), \
+         patch("app.services.quant_risk.compute_entropy", compute_entropy), \
+         patch("app.services.quant_risk.detect_regime", detect_regime), \
+         patch("app.services.quant_risk.compute_position_size", sizing), \
+         patch("app.services.quant_risk.get_supabase", return_value=mock_supabase):
+        from app.services.quant_risk import validate_proposal_enhanced
+        ctx.reading("entropy", "BTCUSDT", "1h", compute_entropy)  # la señal ya la pidió
+        for _ in range(3):
+            result = await validate_proposal_enhanced(
+                trade_type="buy", symbol="BTCUSDT",
+                quantity=0.002, notional=100.0, current_price=50000.0, ctx=ctx,
+            )
+        assert result.approved is True
+        compute_entropy.assert_called_once()
+        detect_regime.assert_called_once()
+        sizing.assert_awaited_once()
+
+        ctx.note_proposal({"symbol": "BTCUSDT", "type": "buy"}, executed=True)
+        await validate_proposal_enhanced(
+            trade_type="buy", symbol="ETHUSDT",
+            quantity=0.002, notional=100.0, current_price=50000.0, ctx=ctx,
+        )
+    assert sizing.await_count == 2  # el fill invalida el sizing memoizado
@@ -0,0 +1,131 @@
+"""Tests para query_budget.py — conteo de queries por scope y detección de N+1."""
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services import query_budget as qb
+from app.services.query_budget import (
+    QueryBudgetExceeded, current_scope, instrument, query_scope, recent_reports,
+)
+
+
+def _client(rows=None):
+    raw = MagicMock()
+    raw.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value = MagicMock(
+        data=rows if rows is not None else [{"id": "a"}]
+    )
+    return instrument(raw), raw
+
+
+def _lookup(sb, symbol):
+    return sb.table("positions").select("id").eq("symbol", symbol).eq("status", "open").execute()
+
+
+def test_counts_per_table_and_caller_with_returned_rows():
+    sb, _ = _client(rows=[{"id": "abc"}, {"id": "def"}])
+    with query_scope("tick") as scope:
+        _lookup(sb, "BTCUSDT")
+        sb.table("risk_events").insert({"event_type": "x"}).execute()
+
+    report = scope.report()
+    assert report["queries"] == 2
+    assert set(report["by_table"]) == {"positions", "risk_events"}
+    assert report["by_table"]["positions"]["rows"] == 2
+    assert any(c.endswith("_lookup") for c in report["by_caller"])
+    assert recent_reports()[-1]["scope"] == "tick"
+
+
+def test_payload_bytes_come_from_the_content_length_header():
+    import httpx
+    from postgrest import SyncPostgrestClient
+
+    body = b'[{"id": "abc"}, {"id": "def"}]'
+    transport = httpx.MockTransport(lambda request: httpx.Response(
+        200, content=body, headers={"content-type": "application/json"}))
+    postgrest = SyncPostgrestClient("http://db.test/rest/v1", http_client=httpx.Client(transport=transport))
+    sb = instrument(SimpleNamespace(postgrest=postgrest, table=postgrest.from_))
+
+    with query_scope("tick") as scope:
+        sb.table("positions").select("id").execute()
+        sb.table("positions").select("id").execute()
+
+    positions = scope.report()["by_table"]["positions"]
+    assert positions["rows"] == 4 and positions["bytes"] == 2 * len(body)
+    assert postgrest.session.event_hooks["response"].count(qb._on_response) == 1   # hook instalado una vez
+
+
+def test_outside_scope_passes_through_untouched():
+    sb, raw = _client()
+    assert current_scope() is None
+    resp = _lookup(sb, "BTCUSDT")
+    assert resp.data == [{"id": "a"}]
+    raw.table.assert_called_with("positions")
+
+
+def test_repeated_query_shape_is_flagged_as_n_plus_one():
+    sb, _ = _client()
+    with query_scope("tick") as scope:
+        for sym in ("BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "XRPUSDT"):
+            _lookup(sb, sym)  # mismos filtros, distintos valores = misma forma
+
+    suspects = scope.n_plus_one(threshold=5)
+    assert len(suspects) == 1
+    shape, count, _callers = suspects[0]
+    assert shape == "positions:select(id).eq(symbol).eq(status)" and count == 5
+
+
+def test_strict_budget_fails_on_the_offending_query():
+    sb, _ = _client()
+    with pytest.raises(QueryBudgetExceeded, match="budget 2"):
+        with query_scope("test", budget=2, strict=True):
+            for sym in ("A", "B", "C"):
+                _lookup(sb, sym)
+
+
+def test_non_strict_budget_only_reports():
+    sb, _ = _client()
+    with query_scope("tick", budget=1) as scope:
+        _lookup(sb, "A")
+        _lookup(sb, "B")
+    assert scope.over_budget() and scope.report()["over_budget"] is True
+
+
+def test_nested_scopes_and_threads_record_into_parents():
+    sb, _ = _client()
+
+    async def run():
+        with query_scope("outer") as outer:
+            with query_scope("inner") as inner:
+                await asyncio.to_thread(_lookup, sb, "BTCUSDT")
+            _lookup(sb, "ETHUSDT")
+        return outer, inner
+
+    outer, inner = asyncio.run(run())
+    assert inner.total.count == 1 and outer.total.count == 2
+
+
+@pytest.mark.asyncio
+async def test_tick_context_keeps_cooldown_checks_within_budget():
+    """El camino viejo (2 queries de cooldown por símbolo) es N+1; el contexto del tick no."""
+    from app.services.signal_generator import _cooled_down
+    from app.services.tick_context import TickContext
+
+    symbols = [f"S{i}USDT" for i in range(6)]
+    thresholds = {"signal_cooldown_minutes": 180}
+    sb = instrument(MagicMock())
+
+    with patch("app.services.signal_generator._get_thresholds", return_value=thresholds):
+        with query_scope("legacy") as legacy:
+            for sym in symbols:
+                _cooled_down(sym, "buy", sb)
+    assert legacy.total.count == 2 * len(symbols) and legacy.n_plus_one(threshold=len(symbols))
+
+    with patch("app.services.tick_context.binance_client.get_prices", new_callable=AsyncMock, return_value=[]):
+        with query_scope("ctx", budget=3, strict=True) as scoped:
+            ctx = await TickContext.load(sb, symbols, thresholds, 180)
+            for sym in symbols:
+                _cooled_down(sym, "buy", sb, ctx=ctx)
+    assert scoped.total.count == 3 and not scoped.n_plus_one(threshold=2)
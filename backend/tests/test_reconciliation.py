@@ -0,0 +1,143 @@
+"""Tests para reconciliation.py — corridas incrementales, caché de órdenes y cadencia adaptativa."""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services import reconciliation
+from app.services.position_book import get_position_book
+from app.services.reconciliation import (
+    get_reconciliation_state, maybe_run_reconciliation, run_reconciliation,
+)
+
+
+def _proposal(pid, oid, status="approved", updated_at="2026-10-19T10:00:00+00:00"):
+    return {"id": pid, "symbol": "BTCUSDT", "binance_order_id": oid, "status": status,
+            "type": "buy", "quantity": 0.001, "updated_at": updated_at}
+
+
+def _db(active=(), delta=()):
+    """Supabase mock con una tabla (MagicMock) por nombre."""
+    tables = {name: MagicMock() for name in ("trade_proposals", "reconciliation_runs", "positions")}
+    tp = tables["trade_proposals"]
+    tp.select.return_value.not_.is_.return_value.in_.return_value.execute.return_value = MagicMock(data=list(active))
+    tp.select.return_value.gte.return_value.execute.return_value = MagicMock(data=list(delta))
+    tp.update.return_value.in_.return_value.lt.return_value.execute.return_value = MagicMock(data=[])
+    tables["positions"].select.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
+    tables["reconciliation_runs"].insert.return_value.execute.return_value = MagicMock(data=[{"id": "run-1"}])
+    sb = MagicMock()
+    sb.table.side_effect = lambda name: tables[name]
+    return sb, tables
+
+
+@pytest.fixture
+def exchange():
+    with patch("app.services.reconciliation.binance_client") as bc, \
+         patch("app.services.reconciliation.send_telegram", new_callable=AsyncMock, return_value=True):
+        bc.get_open_orders = AsyncMock(return_value=[])
+        bc.get_order = AsyncMock(return_value={"status": "FILLED"})
+        bc.get_account = AsyncMock(return_value={"balances": [{"asset": "USDT", "free": "1000", "locked": "0"}]})
+        yield bc
+
+
+async def _run(sb, **kwargs):
+    with patch("app.services.reconciliation.get_supabase", return_value=sb):
+        return await run_reconciliation(**kwargs)
+
+
+@pytest.mark.asyncio
+async def test_full_run_checks_exchange_and_writes_one_run_row(exchange):
+    sb, tables = _db(active=[_proposal("p1", 111)])
+
+    result = await _run(sb)
+
+    assert result["mode"] == "full" and result["status"] == "success"
+    assert [d["type"] for d in result["divergences"]] == ["stale"]
+    exchange.get_open_orders.assert_awaited_once()
+    exchange.get_order.assert_awaited_once_with("BTCUSDT", 111)
+    assert result["cost"]["exchange_calls"] == 3  # open orders + get_order + account
+    runs = tables["reconciliation_runs"]
+    runs.insert.assert_called_once()
+    runs.update.assert_not_called()
+    assert runs.insert.call_args.args[0]["cost"]["orders_checked"] == 1
+
+
+@pytest.mark.asyncio
+async def test_idle_incremental_run_reads_only_the_delta(exchange):
+    sb, tables = _db(active=[_proposal("p1", 111)])
+    await _run(sb)
+    exchange.reset_mock()
+
+    assert await maybe_run_reconciliation() is None  # cadencia no vencida, sin actividad
+    result = await _run(sb)
+
+    assert result["mode"] == "incremental" and result["activity"] == []
+    assert result["cost"]["exchange_calls"] == 0
+    exchange.get_open_orders.assert_not_awaited()
+    tables["trade_proposals"].select.return_value.gte.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_book_activity_triggers_exchange_check_with_cached_terminal_orders(exchange):
+    sb, _ = _db(active=[_proposal("p1", 111)])
+    with patch("app.services.reconciliation.get_supabase", return_value=sb):
+        await maybe_run_reconciliation()  # primera corrida (suscribe al book)
+        get_position_book().add({"id": "pos-1", "symbol": "BTCUSDT", "current_quantity": 0.001})
+        assert reconciliation.reconciliation_due()
+        result = await maybe_run_reconciliation()
+
+    assert result["mode"] == "incremental" and result["activity"] == ["position_opened"]
+    assert exchange.get_open_orders.await_count == 2
+    exchange.get_order.assert_awaited_once()  # FILLED quedó en caché
+    assert result["cost"]["orders_cached"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cadence_backs_off_when_idle_and_resets_on_activity(exchange):
+    sb, _ = _db()
+    with patch.object(reconciliation.settings, "reconciliation_fast_seconds", 60), \
+         patch.object(reconciliation.settings, "reconciliation_idle_seconds", 240):
+        intervals = []
+        for _ in range(4):
+            intervals.append((await _run(sb))["next_run_seconds"])
+        reconciliation.note_activity("fill")
+        intervals.append((await _run(sb))["next_run_seconds"])
+
+    assert intervals == [120, 240, 240, 240, 60]
+
+
+@pytest.mark.asyncio
+async def test_delta_drops_proposals_that_left_active_states(exchange):
+    sb, tables = _db(active=[_proposal("p1", 111), _proposal("p2", 222, status="executed")])
+    await _run(sb)
+    assert set(get_reconciliation_state().proposals) == {"p1", "p2"}
+
+    tables["trade_proposals"].select.return_value.gte.return_value.execute.return_value = MagicMock(
+        data=[_proposal("p1", 111, status="rejected", updated_at="2026-10-19T10:05:00+00:00")]
+    )
+    result = await _run(sb)
+
+    assert set(get_reconciliation_state().proposals) == {"p2"}
+    assert result["activity"] == ["proposals_changed"]
+    assert get_reconciliation_state().watermark.isoformat() == "2026-10-19T10:05:00+00:00"
+
+
+@pytest.mark.asyncio
+async def test_run_row_without_cost_columns_falls_back(exchange):
+    sb, tables = _db()
+    runs = tables["reconciliation_runs"]
+    ok = MagicMock(data=[{"id": "run-2"}])
+
+    def insert(record):
+        q = MagicMock()
+        if "cost" in record:
+            q.execute.side_effect = Exception("column \"cost\" does not exist")
+        else:
+            q.execute.return_value = ok
+        return q
+
+    runs.insert.side_effect = insert
+    result = await _run(sb)
+
+    assert result["run_id"] == "run-2"
+    assert get_reconciliation_state().cost_columns is False
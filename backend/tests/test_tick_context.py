@@ -0,0 +1,172 @@
+"""Tests para tick_context.py — prefetch por tick del generador de señales."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.position_book import get_position_book
+from app.services.tick_context import TickContext
+
+THRESHOLDS = {
+    "buy_rsi_max": 50.0, "buy_adx_min": 25.0, "buy_entropy_max": 0.70,
+    "sell_rsi_min": 65.0, "signal_cooldown_minutes": 180, "max_open_positions": 3,
+}
+
+
+def _ago(minutes):
+    return (datetime.now(timezone.utc) - timedelta(minutes=minutes)).isoformat()
+
+
+def _db(open_rows=None, proposals=None, closed=None):
+    """Mock con una respuesta por tabla/forma de query."""
+    sb = MagicMock()
+    tables = {
+        "positions": MagicMock(),
+        "trade_proposals": MagicMock(),
+    }
+    pos = tables["positions"].select.return_value
+    pos.eq.return_value.execute.return_value = MagicMock(data=open_rows or [])
+    pos.eq.return_value.gte.return_value.execute.return_value = MagicMock(data=closed or [])
+    tables["trade_proposals"].select.return_value.gte.return_value.execute.return_value = MagicMock(
+        data=proposals or []
+    )
+    sb.table.side_effect = lambda name: tables[name]
+    return sb
+
+
+async def _load(sb, symbols=("BTCUSDT", "ETHUSDT"), prices=None):
+    tickers = [{"symbol": s, "price": str(p)} for s, p in (prices or {}).items()]
+    with patch("app.services.tick_context.binance_client.get_prices", new_callable=AsyncMock, return_value=tickers):
+        return await TickContext.load(sb, list(symbols), THRESHOLDS, 180)
+
+
+@pytest.mark.asyncio
+async def test_load_issues_one_query_per_table_regardless_of_symbols():
+    sb = _db(open_rows=[{"id": "p1", "symbol": "BTCUSDT", "opened_at": _ago(300)}])
+    symbols = [f"SYM{i}USDT" for i in range(20)]
+
+    ctx = await _load(sb, symbols)
+
+    # open positions + recently closed + recent proposals
+    assert sb.table.call_count == 3
+    assert ctx.open_symbols() == {"BTCUSDT"} and ctx.open_count() == 1
+
+
+@pytest.mark.asyncio
+async def test_uses_position_book_when_loaded():
+    book = get_position_book()
+    book.load(_db(open_rows=[{"id": "p1", "symbol": "ETHUSDT", "opened_at": _ago(10)}]))
+    sb = _db()
+
+    ctx = await _load(sb)
+
+    assert sb.table.call_count == 2  # sólo cooldowns
+    assert ctx.open_symbols() == {"ETHUSDT"}
+
+
+@pytest.mark.asyncio
+async def test_cooldowns_from_prefetched_rows():
+    sb = _db(
+        proposals=[{"symbol": "BTCUSDT", "type": "sell", "created_at": _ago(30)}],
+        closed=[{"symbol": "ETHUSDT", "closed_at": _ago(60)}],
+    )
+    ctx = await _load(sb)
+
+    assert ctx.cooled_down("BTCUSDT", "buy") is True
+    assert ctx.cooled_down("BTCUSDT", "sell") is False
+    assert ctx.cooled_down("ETHUSDT", "buy") is False   # post-close guard
+    assert ctx.cooled_down("ETHUSDT", "sell") is True   # el guard sólo aplica a BUY
+
+    ctx.note_proposal({"symbol": "SOLUSDT", "type": "buy", "created_at": _ago(0)})
+    assert ctx.cooled_down("SOLUSDT", "buy") is False
+
+
+@pytest.mark.asyncio
+async def test_executed_buy_updates_positions_and_drops_cached_account():
+    ctx = await _load(_db())
+    get_account = AsyncMock(return_value={"balances": []})
+    await ctx.memo_async("account", get_account)
+    await ctx.memo_async("account", get_account)
+    assert get_account.await_count == 1
+
+    ctx.note_proposal({"id": "x", "symbol": "BTCUSDT", "type": "buy", "created_at": _ago(0)}, executed=True)
+
+    assert ctx.open_count() == 1
+    await ctx.memo_async("account", get_account)
+    assert get_account.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_executed_buy_counts_its_exposure():
+    ctx = await _load(_db(open_rows=[{"id": "p1", "symbol": "ETHUSDT", "entry_notional": 40.0}]))
+    get_position_book().add({"id": "pos-9", "symbol": "SOLUSDT", "entry_proposal_id": "y",
+                             "entry_quantity": 0.5, "entry_notional": 75.0})
+
+    ctx.note_proposal({"id": "x", "symbol": "BTCUSDT", "type": "buy", "created_at": _ago(0),
+                       "quantity": 0.001, "price": 70000.0, "notional": 70.0}, executed=True)
+    ctx.note_proposal({"id": "y", "symbol": "SOLUSDT", "type": "buy", "created_at": _ago(0),
+                       "quantity": 0.5, "price": 150.0}, executed=True)
+
+    rows = {p["symbol"]: p for p in ctx.open_positions}
+    assert rows["BTCUSDT"]["entry_notional"] == 70.0 and rows["BTCUSDT"]["current_quantity"] == 0.001
+    assert rows["SOLUSDT"]["id"] == "pos-9"                   # la fila que insertó el executor
+    assert sum(float(p["entry_notional"]) for p in ctx.open_positions) == 185.0
+
+
+@pytest.mark.asyncio
+async def test_executed_sell_starts_post_close_cooldown_in_the_same_tick():
+    ctx = await _load(_db(open_rows=[{"id": "p1", "symbol": "ETHUSDT", "entry_notional": 40.0}]))
+    assert ctx.cooled_down("ETHUSDT", "buy") is True
+
+    ctx.note_proposal({"id": "s", "symbol": "ETHUSDT", "type": "sell", "created_at": _ago(0)}, executed=True)
+
+    assert ctx.open_count() == 0
+    assert ctx.cooled_down("ETHUSDT", "buy") is False         # re-entrada rechazada hasta que pase la ventana
+
+
+@pytest.mark.asyncio
+async def test_cooldown_prefetch_failure_fails_open():
+    sb = _db()
+    sb.table.side_effect = None
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
+    sb.table.return_value.select.return_value.gte.return_value.execute.side_effect = RuntimeError("timeout")
+    sb.table.return_value.select.return_value.eq.return_value.gte.return_value.execute.side_effect = RuntimeError("timeout")
+
+    ctx = await _load(sb)
+
+    assert ctx.recent_proposals == [] and ctx.recently_closed == []
+    assert ctx.cooled_down("BTCUSDT", "buy") is True
+
+
+@pytest.mark.asyncio
+async def test_price_uses_bulk_prefetch_and_falls_back_per_symbol():
+    ctx = await _load(_db(), prices={"BTCUSDT": 70000.0})
+    with patch("app.services.tick_context.binance_client.get_price",
+               new_callable=AsyncMock, return_value={"price": "3500.0"}) as single:
+        assert await ctx.price("BTCUSDT") == 70000.0
+        assert await ctx.price("ETHUSDT") == 3500.0
+        assert await ctx.price("ETHUSDT") == 3500.0
+    single.assert_awaited_once_with("ETHUSDT")
+
+
+@pytest.mark.asyncio
+async def test_evaluate_symbol_with_context_skips_per_symbol_queries():
+    from app.services.signal_generator import _evaluate_symbol
+
+    ind = MagicMock(rsi_14=30.0, macd_histogram=2.0, adx_14=30.0, sma_20=51000.0, sma_50=50000.0,
+                    ppo=1.0, autocorr_1=0.1, volume_ratio=1.5)
+    ctx = await _load(_db(), prices={"BTCUSDT": 50000.0})
+    sb = MagicMock()
+
+    with patch("app.services.signal_generator.compute_indicators", return_value=ind), \
+         patch("app.services.signal_generator.compute_entropy", return_value=MagicMock(entropy_ratio=0.5)), \
+         patch("app.services.signal_generator.detect_regime", return_value=MagicMock(regime="ranging", confidence=50.0)), \
+         patch("app.services.signal_generator.binance_client") as mock_bc, \
+         patch("app.services.signal_generator._submit_proposal", new_callable=AsyncMock) as submit:
+        await _evaluate_symbol(sb, "BTCUSDT", ctx.open_symbols(), ctx.open_count(), ctx=ctx)
+
+    sb.table.assert_not_called()
+    mock_bc.get_price.assert_not_called()
+    submit.assert_awaited_once()
+    assert submit.call_args.kwargs["ctx"] is ctx
@@ -0,0 +1,166 @@
+"""Tests para trade_stats.py — agregados incrementales de trades cerrados."""
+
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from app.services.trade_stats import TradeAggregate, TradeStatsStore
+
+
+def _trades(n=40, seed=7):
+    rng = np.random.default_rng(seed)
+    start = datetime(2026, 9, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(n):
+        notional = float(rng.uniform(50, 500))
+        pnl = float(rng.normal(0.5, 8))
+        rows.append({
+            "id": f"p{i}", "symbol": ["BTCUSDT", "ETHUSDT"][i % 2], "strategy_id": "s1" if i % 3 else None,
+            "realized_pnl": pnl, "entry_notional": notional,
+            "closed_at": (start + timedelta(hours=13 * i)).isoformat(),
+        })
+    if n > 3:
+        rows[3]["realized_pnl"] = 0.0  # breakeven: cuenta en total, no en wins/losses
+    return rows
+
+
+def _reference(rows):
+    """Cálculo original sobre filas (copiado de _update_performance_metrics)."""
+    pnls = [float(p["realized_pnl"]) for p in rows]
+    notionals = [float(p.get("entry_notional", 0) or 1) for p in rows]
+    returns = np.array([p / n if n > 0 else 0 for p, n in zip(pnls, notionals)])
+    downside = returns[returns < 0]
+    cumulative = np.cumsum(pnls)
+    max_dd = round(float(np.min(cumulative - np.maximum.accumulate(cumulative))), 4)
+    return {
+        "sharpe_ratio": round(float(returns.mean() / returns.std() * np.sqrt(252)), 4),
+        "sortino_ratio": round(float(returns.mean() / downside.std() * np.sqrt(252)), 4),
+        "max_drawdown": max_dd,
+        "calmar_ratio": round(sum(pnls) * (252 / len(pnls)) / abs(max_dd), 4),
+        "win_rate": round(float((returns > 0).sum() / len(returns)), 4),
+        "expectancy": round(sum(pnls) / len(pnls), 8),
+        "total_trades": len(rows),
+    }
+
+
+def test_performance_matches_row_based_formulas():
+    rows = _trades()
+    perf = TradeAggregate.from_trades(rows).performance()
+    for key, expected in _reference(rows).items():
+        assert perf[key] == pytest.approx(expected, rel=1e-6, abs=1e-4), key
+
+
+@pytest.mark.parametrize("split", [1, 7, 20, 39])
+def test_merging_periods_equals_recomputing(split):
+    rows = _trades()
+    merged = TradeAggregate.from_trades(rows[:split])
+    merged.merge(TradeAggregate.from_trades(rows[split:]))
+    whole = TradeAggregate.from_trades(rows)
+    assert merged.trades == whole.trades and merged.wins == whole.wins
+    for name in ("pnl_sum", "return_sq_sum", "pnl_peak", "pnl_trough", "max_drawdown"):
+        assert getattr(merged, name) == pytest.approx(getattr(whole, name), abs=1e-9), name
+
+
+def test_kelly_stats_needs_ten_decided_trades_and_a_loss():
+    assert TradeAggregate.from_trades(_trades(n=9)).kelly_stats() is None
+    winners = [{"realized_pnl": 5.0, "entry_notional": 100} for _ in range(20)]
+    assert TradeAggregate.from_trades(winners).kelly_stats() is None
+
+    stats = TradeAggregate.from_trades(_trades()).kelly_stats()
+    assert stats["total_trades"] == 39  # el breakeven no cuenta
+    assert 0 < stats["win_rate"] < 1 and stats["avg_loss"] > 0
+
+
+def _store_with_history(rows):
+    """Store cargado (tabla vacía) con ``rows`` registrados uno por uno."""
+    store = TradeStatsStore()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.or_.return_value.execute.return_value = MagicMock(data=[])
+    with patch.object(TradeStatsStore, "rebuild", return_value={}):
+        store.load(sb)
+    for row in rows:
+        store.record_close(sb, row)
+    return store, sb
+
+
+def test_record_close_updates_scopes_and_buckets_with_one_upsert():
+    rows = _trades(n=3)
+    store, sb = _store_with_history(rows[:1])
+
+    upserted = sb.table.return_value.upsert.call_args.args[0]
+    keys = {(r["scope"], r["scope_key"], r["bucket"]) for r in upserted}
+    assert keys == {
+        ("all", "*", "all"), ("all", "*", "2026-09-01"),
+        ("symbol", "BTCUSDT", "all"), ("symbol", "BTCUSDT", "2026-09-01"),
+    }  # sin strategy_id no hay scope de estrategia
+    assert sb.table.return_value.upsert.call_args.kwargs["on_conflict"] == "scope,scope_key,bucket"
+
+    store.record_close(sb, rows[1])
+    assert store.window(scope="symbol", key="ETHUSDT").trades == 1
+    assert store.window(scope="strategy", key="s1").trades == 1
+    assert store.window().pnl_sum == pytest.approx(rows[0]["realized_pnl"] + rows[1]["realized_pnl"])
+
+
+def test_rolling_window_merges_daily_buckets():
+    rows = _trades()
+    store, _ = _store_with_history(rows)
+    today = date(2026, 9, 21)
+
+    recent = [r for r in rows if r["closed_at"][:10] >= "2026-09-15" and r["closed_at"][:10] <= "2026-09-21"]
+    window = store.window(days=7, today=today)
+    assert window.trades == len(recent)
+    assert window.max_drawdown == pytest.approx(TradeAggregate.from_trades(recent).max_drawdown)
+    assert store.window().trades == len(rows)
+
+
+def test_rebuild_reports_drift_and_rewrites():
+    rows = _trades(n=12)
+    store, sb = _store_with_history(rows)
+    store._aggs[("all", "*")]["all"].pnl_sum += 10.0  # drift simulado
+
+    with patch("app.services.bulk_reader.BulkReader.rows", return_value=iter(rows)), \
+         patch("app.services.bulk_writer.bulk_write_records") as write:
+        result = store.rebuild(sb)
+
+    assert result["trades"] == 12
+    assert [(m["scope"], m["bucket"], m["field"]) for m in result["mismatches"]] == [("all", "all", "pnl_sum")]
+    assert write.call_args.kwargs["conflict"] == ("scope", "scope_key", "bucket")
+    assert store.window().pnl_sum == pytest.approx(sum(r["realized_pnl"] for r in rows))
+
+
+def test_close_before_load_marks_stale_and_next_load_rebuilds():
+    store = TradeStatsStore()
+    sb = MagicMock()
+    store.record_close(sb, _trades(n=1)[0])
+    sb.table.assert_not_called()  # el cierre nunca consulta la DB
+    assert store.status()["stale"]
+
+    with patch.object(TradeStatsStore, "rebuild") as rebuild:
+        assert store.ensure_loaded(sb)
+    rebuild.assert_called_once_with(sb)
+
+
+def test_unavailable_table_falls_back_and_throttles_retries():
+    store = TradeStatsStore()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.or_.return_value.execute.side_effect = Exception("relation does not exist")
+    assert store.ensure_loaded(sb) is False
+    assert store.ensure_loaded(sb) is False
+    assert sb.table.return_value.select.call_count == 1
+    assert not store.loaded and store.stats["errors"] == 1
+
+
+def test_position_sizer_reads_aggregates_when_loaded():
+    from app.services import position_sizer
+    from app.services.trade_stats import get_trade_stats
+
+    store = get_trade_stats()
+    loaded, _ = _store_with_history(_trades())
+    store._aggs, store._loaded = loaded._aggs, True
+
+    with patch("app.services.position_sizer.get_supabase") as get_sb:
+        stats = position_sizer._get_trade_stats()
+    get_sb.assert_not_called()
+    assert stats == TradeAggregate.from_trades(_trades()).kelly_stats()
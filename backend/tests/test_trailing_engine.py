@@ -0,0 +1,93 @@
+"""Tests para trailing_engine.py — ATR por vela, high-water mark y persistencia coalescida."""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import trailing_engine
+from app.services.trailing_engine import AtrCache, TrailingEngine, trailing_stop_level
+
+HOUR = 3_600_000
+
+
+def _pos(pid="p1", entry=100.0):
+    return {"id": pid, "symbol": "BTCUSDT", "entry_price": str(entry)}
+
+
+def test_atr_computed_once_per_candle():
+    cache = AtrCache()
+    calls = []
+
+    def fake_indicators(symbol, interval):
+        calls.append(symbol)
+        return SimpleNamespace(atr_14=float(len(calls)))
+
+    with patch.object(trailing_engine.technical_analysis, "compute_indicators", side_effect=fake_indicators):
+        t0 = 1_735_689_600_000
+        assert [cache.get("BTCUSDT", "1h", t0 + i * 60_000) for i in range(30)] == [1.0] * 30
+        assert cache.get("BTCUSDT", "1h", t0 + HOUR) == 2.0  # vela nueva
+
+    assert len(calls) == 2
+    assert cache.hits == 29 and cache.misses == 2
+
+
+def test_primed_atr_skips_computation():
+    cache = AtrCache()
+    cache.prime("ETHUSDT", "1h", 12.5, now_ms=HOUR * 10 + 5)
+    with patch.object(trailing_engine.technical_analysis, "compute_indicators") as ci:
+        assert cache.get("ETHUSDT", "1h", now_ms=HOUR * 10 + 600_000) == 12.5
+    ci.assert_not_called()
+
+
+def test_high_water_mark_drives_chandelier():
+    # Entry 100, TP 110: al 80% con ATR=1 → chandelier = 108 - 2 = 106 > progress (105)
+    assert trailing_stop_level(100.0, 108.0, 95.0, 110.0, 1.0) == 106.0
+    assert trailing_stop_level(100.0, 102.0, 95.0, 110.0, 1.0) is None  # <30%
+
+    engine = TrailingEngine()
+    with patch.object(engine.atr_cache, "get", return_value=1.0), \
+         patch.object(trailing_engine, "settings", SimpleNamespace(quant_primary_interval="1h", trailing_persist_seconds=30)):
+        assert engine.evaluate(_pos(), 108.0, 95.0, 110.0) == 106.0
+        # El precio retrocede: el high-water mark se conserva y el stop no baja
+        assert engine.evaluate(_pos(), 104.0, 95.0, 110.0) is None
+        assert engine.effective_stop("p1", 95.0) == 106.0
+
+
+def test_persistence_is_coalesced():
+    engine = TrailingEngine()
+    cfg = SimpleNamespace(quant_primary_interval="1h", trailing_persist_seconds=30)
+    with patch.object(engine.atr_cache, "get", return_value=None), \
+         patch.object(trailing_engine, "settings", cfg):
+        engine.evaluate(_pos(), 105.0, 95.0, 110.0)
+        assert engine.should_persist("p1", now=1000.0)
+        engine.mark_persisted("p1", 102.0, now=1000.0)
+
+        for price in (106.0, 107.0, 108.0):
+            engine.evaluate(_pos(), price, 95.0, 110.0)
+            assert not engine.should_persist("p1", now=1010.0)
+        assert list(engine.pending(now=1010.0)) == []
+        assert list(engine.pending(now=1031.0)) == [("p1", 105.0)]
+        assert engine.stats["coalesced"] == 3
+
+
+@pytest.mark.asyncio
+async def test_fast_loop_writes_one_update_per_interval():
+    from app.services.position_book import get_position_book
+    from app.services.trading_loop import _update_trailing_stop, _flush_trailing_stops
+
+    book = get_position_book()
+    pos = {**_pos(), "stop_loss_price": "95.0", "take_profit_price": "110.0", "status": "open"}
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[pos])
+    book.load(sb)
+
+    engine = trailing_engine.get_trailing_engine()
+    with patch.object(engine.atr_cache, "get", return_value=None):
+        for price in (104.0, 105.0, 106.0, 107.0):
+            await _update_trailing_stop(sb, book.get("p1"), price, 95.0, 110.0)
+        assert sb.table.return_value.update.call_count == 1
+        assert await _flush_trailing_stops(sb, force=True) == 1
+
+    assert sb.table.return_value.update.call_count == 2
+    assert book.get("p1")["stop_loss_price"] == 104.0
@@ -0,0 +1,175 @@
+"""Tests para user_stream.py — executionReport / outboundAccountPosition contra un server local."""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from websockets.asyncio.server import serve
+
+from app.services import user_stream as us
+from app.services.user_stream import get_user_stream
+
+
+def _report(order_id, status, exec_type="TRADE", last_qty=0.0, last_price=0.0, cum_qty=0.0, cum_quote=0.0,
+            symbol="BTCUSDT", side="SELL", order_type="STOP_LOSS_LIMIT", orig_qty=0.002):
+    return {
+        "e": "executionReport", "E": 1_760_000_000_000, "s": symbol, "c": f"c{order_id}", "S": side,
+        "o": order_type, "q": str(orig_qty), "x": exec_type, "X": status, "i": order_id, "g": 77,
+        "l": str(last_qty), "L": str(last_price), "z": str(cum_qty), "Z": str(cum_quote),
+        "n": "0.01", "N": "USDT", "t": order_id * 10,
+    }
+
+
+@asynccontextmanager
+async def _fake_stream(events):
+    """Stand-in del websocket de Binance: manda ``events`` y deja la conexión abierta."""
+    paths = []
+
+    async def handler(ws):
+        paths.append(ws.request.path)
+        for event in events:
+            await ws.send(json.dumps(event))
+        await ws.wait_closed()
+
+    async with serve(handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        with patch.object(us.settings, "user_stream_ws_url", f"ws://127.0.0.1:{port}"), \
+             patch.object(us.binance_client, "create_listen_key", AsyncMock(return_value={"listenKey": "lk-test"})), \
+             patch.object(us.binance_client, "keepalive_listen_key", AsyncMock(return_value={})), \
+             patch.object(us.binance_client, "close_listen_key", AsyncMock(return_value={})) as close:
+            stream = get_user_stream()
+            stream.start()
+            try:
+                yield stream, paths
+            finally:
+                await stream.stop()
+        close.assert_awaited_once_with("lk-test")
+
+
+async def _until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timeout waiting for stream"
+        await asyncio.sleep(0.01)
+
+
+def _book_with(position):
+    from app.services.position_book import get_position_book
+    book = get_position_book()
+    sb = MagicMock()
+    sb.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [position]
+    book.load(sb)
+    return book
+
+
+async def test_protective_fill_closes_position_from_stream():
+    position = {"id": "pos-12345678", "symbol": "BTCUSDT", "status": "open", "current_quantity": 0.002,
+                "protection_sl_order_id": 501, "protection_tp_order_id": 502, "protection_order_list_id": 77}
+    _book_with(position)
+    events = [
+        _report(501, "NEW", exec_type="NEW"),
+        _report(501, "PARTIALLY_FILLED", last_qty=0.001, last_price=95.0, cum_qty=0.001, cum_quote=0.095),
+        _report(501, "FILLED", last_qty=0.001, last_price=94.0, cum_qty=0.002, cum_quote=0.189),
+    ]
+    with patch("app.services.protective_orders.record_fill", new_callable=AsyncMock) as record_fill, \
+         patch("app.db.get_supabase", return_value=MagicMock()):
+        async with _fake_stream(events) as (stream, paths):
+            await _until(lambda: record_fill.await_count == 1)
+            assert paths == ["/lk-test"]
+            assert stream.is_live()
+
+    _, pos, fill = record_fill.await_args.args
+    assert pos["id"] == "pos-12345678"
+    assert fill["trigger"] == "stop_loss" and fill["order_id"] == 501
+    assert fill["quantity"] == pytest.approx(0.002)
+    assert fill["price"] == pytest.approx(94.5)                 # promedio de los dos fills
+    assert fill["commission"] == pytest.approx(0.02) and fill["commission_asset"] == "USDT"
+    assert stream.stats["partial_fills"] == 1 and stream.stats["protective_fills"] == 1
+    assert not stream.is_live()
+
+
+async def test_partial_fill_is_tracked_without_closing():
+    _book_with({"id": "pos-1", "symbol": "BTCUSDT", "status": "open", "protection_sl_order_id": 601,
+                "protection_tp_order_id": 602})
+    stream = get_user_stream()
+    with patch("app.services.protective_orders.record_fill", new_callable=AsyncMock) as record_fill:
+        await stream.handle(_report(602, "PARTIALLY_FILLED", last_qty=0.0005, last_price=110.0,
+                                    cum_qty=0.0005, cum_quote=0.055, order_type="LIMIT_MAKER"))
+
+    record = stream.order(602)
+    assert record.status == "PARTIALLY_FILLED" and not record.terminal
+    assert record.executed_qty == pytest.approx(0.0005) and record.avg_price == pytest.approx(110.0)
+    assert record.order_list_id == 77 and len(record.fills) == 1
+    record_fill.assert_not_awaited()
+
+
+async def test_wait_for_resolves_on_terminal_status():
+    stream = get_user_stream()
+    waiter = asyncio.create_task(stream.wait_for(900, timeout=1.0))
+    await asyncio.sleep(0)
+    await stream.handle(_report(900, "NEW", exec_type="NEW", side="BUY", order_type="MARKET"))
+    assert not waiter.done()
+    await stream.handle(_report(900, "FILLED", last_qty=0.002, last_price=100.0, cum_qty=0.002,
+                                cum_quote=0.2, side="BUY", order_type="MARKET"))
+
+    record = await waiter
+    assert record.status == "FILLED" and record.avg_price == pytest.approx(100.0)
+    assert await stream.wait_for(901, timeout=0.01) is None
+
+
+async def test_balance_updates_and_ledger_dedup():
+    from app.services.account_state import get_account_state
+
+    state = get_account_state()
+    state.observe({"balances": [{"asset": "USDT", "free": "100", "locked": "0"},
+                                {"asset": "BTC", "free": "0", "locked": "0"}]})
+    stream = get_user_stream()
+    await stream.handle(_report(700, "FILLED", last_qty=0.001, last_price=50.0, cum_qty=0.001,
+                                cum_quote=0.05, side="BUY", order_type="MARKET"))
+    await stream.handle({"e": "outboundAccountPosition", "E": 1, "u": 1,
+                         "B": [{"a": "USDT", "f": "49.95", "l": "0"}, {"a": "BTC", "f": "0.001", "l": "0"}]})
+
+    # la respuesta REST de la misma orden llega después: no se descuenta dos veces
+    state.apply_order("BTCUSDT", "BUY", {"orderId": 700, "executedQty": "0.001", "cummulativeQuoteQty": "0.05"})
+
+    assert await state.free("USDT") == pytest.approx(49.95)
+    assert await state.free("BTC") == pytest.approx(0.001)
+    assert state.freshness()["source"] == "stream"
+    assert stream.stats["balance_updates"] == 1
+
+
+async def test_reconciliation_uses_stream_order_state():
+    from app.services import reconciliation
+
+    stream = get_user_stream()
+    await stream.handle(_report(800, "CANCELED", exec_type="CANCELED"))
+    cost = {"orders_cached": 0, "exchange_calls": 0, "orders_checked": 0}
+
+    with patch.object(reconciliation.binance_client, "get_order", AsyncMock(return_value={"status": "FILLED"})) as get_order:
+        stream._connected = True
+        assert await reconciliation._order_status("BTCUSDT", 800, cost) == "CANCELED"
+        get_order.assert_not_awaited()
+        stream._connected = False  # desconectado: vuelve al exchange
+        assert await reconciliation._order_status("BTCUSDT", 801, cost) == "FILLED"
+
+    assert cost == {"orders_cached": 1, "exchange_calls": 1, "orders_checked": 1}
+
+
+async def test_protection_poll_backs_off_while_stream_is_live():
+    from app.services import protective_orders
+
+    position = {"id": "pos-2", "symbol": "BTCUSDT", "protection_sl_order_id": 1, "protection_order_list_id": 2}
+    stream = get_user_stream()
+    stream._connected = True
+    with patch.object(protective_orders, "poll_protection", AsyncMock(return_value=("active", None))) as poll, \
+         patch.object(protective_orders.settings, "protection_poll_seconds", 0), \
+         patch.object(protective_orders.settings, "user_stream_safety_poll_seconds", 3600):
+        await protective_orders.sync_position(MagicMock(), position)
+        await protective_orders.sync_position(MagicMock(), position)
+        assert poll.await_count == 1
+        stream._connected = False
+        await protective_orders.sync_position(MagicMock(), position)
+        assert poll.await_count == 2
+    protective_orders._last_poll.pop("pos-2", None)
@@ -0,0 +1,156 @@
+"""Tests para write_behind.py — batching de telemetría fuera del camino de trading."""
+
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.write_behind import WriteBehindBuffer
+
+
+def _buffer(tmp_path, **kwargs):
+    buf = WriteBehindBuffer(
+        batch_size=kwargs.pop("batch_size", 100),
+        flush_seconds=kwargs.pop("flush_seconds", 60),
+        max_pending=kwargs.pop("max_pending", 1000),
+        spill_path=str(tmp_path / "spill.jsonl"),
+        spill_max_bytes=kwargs.pop("spill_max_bytes", 1_000_000),
+    )
+    buf._running = True  # sin flusher: los tests llaman flush() a mano
+    return buf
+
+
+def _event(i, event_type="limit_hit"):
+    return {"event_type": event_type, "severity": "info", "message": f"e{i}", "details": {}}
+
+
+def test_not_running_returns_false_so_callers_write_directly(tmp_path):
+    buf = _buffer(tmp_path)
+    buf._running = False
+    assert buf.enqueue("risk_events", _event(1)) is False
+    assert buf.pending() == 0
+
+
+def test_flush_batches_inserts_and_coalesces_upserts(tmp_path):
+    buf = _buffer(tmp_path)
+    for i in range(5):
+        buf.enqueue("risk_events", _event(i))
+    buf.enqueue("market_regimes", {"symbol": "BTCUSDT", "interval": "1h", "regime": "ranging"}, "symbol,interval")
+    buf.enqueue("market_regimes", {"symbol": "BTCUSDT", "interval": "1h", "regime": "volatile"}, "symbol,interval")
+    assert buf.pending() == 6
+
+    sb = MagicMock()
+    with patch("app.services.write_behind.get_supabase", return_value=sb):
+        result = buf.flush()
+
+    assert result == {"written": 6, "rejected": 0, "spilled": 0}
+    inserted = sb.table.return_value.insert.call_args.args[0]
+    assert len(inserted) == 5
+    upserted = sb.table.return_value.upsert.call_args.args[0]
+    assert upserted == [{"symbol": "BTCUSDT", "interval": "1h", "regime": "volatile"}]
+    assert buf.pending() == 0 and buf.stats["coalesced"] == 1
+
+
+def test_rejected_row_does_not_sink_the_batch(tmp_path):
+    buf = _buffer(tmp_path)
+    buf.enqueue("risk_events", _event(1))
+    buf.enqueue("risk_events", _event(2, event_type="not_allowed"))
+    buf.enqueue("risk_events", _event(3))
+
+    def insert(rows):
+        q = MagicMock()
+        if any(r["event_type"] == "not_allowed" for r in rows):
+            q.execute.side_effect = Exception("violates check constraint")
+        return q
+
+    sb = MagicMock()
+    sb.table.return_value.insert.side_effect = insert
+    with patch("app.services.write_behind.get_supabase", return_value=sb):
+        result = buf.flush()
+
+    assert result == {"written": 2, "rejected": 1, "spilled": 0}
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_outage_spills_to_disk_and_replays_after_recovery(tmp_path):
+    buf = _buffer(tmp_path)
+    for i in range(4):
+        buf.enqueue("risk_events", _event(i))
+
+    down = MagicMock()
+    down.table.return_value.insert.return_value.execute.side_effect = Exception("connection refused")
+    with patch("app.services.write_behind.get_supabase", return_value=down):
+        assert buf.flush()["spilled"] == 4
+    lines = (tmp_path / "spill.jsonl").read_text().splitlines()
+    assert [json.loads(line)["row"]["message"] for line in lines] == ["e0", "e1", "e2", "e3"]
+
+    buf.enqueue("risk_events", _event(9))
+    up = MagicMock()
+    with patch("app.services.write_behind.get_supabase", return_value=up):
+        result = buf.flush()
+
+    assert result["written"] == 5 and buf.stats["replayed"] == 4
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_spill_file_is_bounded(tmp_path):
+    buf = _buffer(tmp_path, spill_max_bytes=300)
+    for i in range(10):
+        buf.enqueue("risk_events", _event(i))
+    down = MagicMock()
+    down.table.return_value.insert.return_value.execute.side_effect = Exception("timeout")
+    with patch("app.services.write_behind.get_supabase", return_value=down):
+        result = buf.flush()
+
+    assert (tmp_path / "spill.jsonl").stat().st_size <= 300
+    assert result["spilled"] + buf.stats["dropped"] == 10 and buf.stats["dropped"] > 0
+
+
+def test_backpressure_drops_oldest_without_io_in_producer(tmp_path):
+    buf = _buffer(tmp_path, max_pending=3)
+    sb = MagicMock()
+    with patch("app.services.write_behind.get_supabase", return_value=sb):
+        for i in range(4):
+            buf.enqueue("risk_events", _event(i))
+        sb.table.assert_not_called()                 # el productor nunca escribe
+
+    assert buf.stats["backpressure"] == 1 and buf.stats["dropped"] == 1
+    assert buf.pending() == 3
+    rows = [r for group in buf._pending.values() for r in group.values()]
+    assert [r["message"] for r in rows] == [_event(i)["message"] for i in (1, 2, 3)]
+
+
+@pytest.mark.asyncio
+async def test_size_threshold_wakes_flusher_and_stop_flushes(tmp_path):
+    buf = WriteBehindBuffer(batch_size=2, flush_seconds=60, max_pending=100,
+                            spill_path=str(tmp_path / "s.jsonl"), spill_max_bytes=1000)
+    sb = MagicMock()
+    with patch("app.services.write_behind.get_supabase", return_value=sb):
+        buf.start()
+        buf.enqueue("risk_events", _event(1))
+        buf.enqueue("risk_events", _event(2))
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if buf.stats["written"] == 2:
+                break
+        assert buf.stats["written"] == 2
+
+        buf.enqueue("risk_events", _event(3))
+        await buf.stop()
+
+    assert buf.stats["written"] == 3 and not buf.running
+    assert buf.enqueue("risk_events", _event(4)) is False
+
+
+@pytest.mark.asyncio
+async def test_trade_lifecycle_events_bypass_the_buffer(tmp_path):
+    from app.services import executor
+
+    buf = _buffer(tmp_path)
+    sb = MagicMock()
+    with patch("app.services.write_behind._buffer", buf):
+        await executor._log_risk_event(sb, "position_opened", "info", "Opened LONG 0.001 BTCUSDT @ 70000")
+
+    assert buf.pending() == 0                                        # nada que se pueda descartar o perder
+    assert sb.table.return_value.insert.call_args.args[0]["event_type"] == "position_opened"
@@ -12,8 +12,10 @@ import csv
 import json
 import os
 import sys
-import urllib.request
+import urllib.error
 import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -53,34 +55,45 @@ def load_env() -> dict[str, str]:
     return env
 
 
-def supabase_fetch_all(base_url: str, key: str, table: str, order_col: str) -> list[dict]:
+def _fetch_page(base_url: str, key: str, table: str, pk: str, after: str | None) -> list[dict]:
+    params = {
+        "select": "*",
+        "order": f"{pk}.asc",
+        "limit": str(PAGE_SIZE),
+    }
+    if after is not None:
+        params[pk] = f"gt.{after}"
+    url = f"{base_url}/rest/v1/{table}?{urllib.parse.urlencode(params)}"
+    req = urllib.request.Request(url, headers={
+        "apikey": key,
+        "Authorization": f"Bearer {key}",
+        "Accept": "application/json",
+    })
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def supabase_fetch_all(base_url: str, key: str, table: str, pk: str) -> list[dict]:
+    """Keyset pagination on the primary key (``pk > last``), prefetching the next page.
+
+    A diferencia de offset, cada página cuesta lo mismo en tablas grandes y
+    los upserts concurrentes no duplican ni saltean filas.
+    """
     results: list[dict] = []
-    offset = 0
-    while True:
-        params = {
-            "select": "*",
-            "order": f"{order_col}.asc",
-            "limit": str(PAGE_SIZE),
-            "offset": str(offset),
-        }
-        url = f"{base_url}/rest/v1/{table}?{urllib.parse.urlencode(params)}"
-        req = urllib.request.Request(url, headers={
-            "apikey": key,
-            "Authorization": f"Bearer {key}",
-            "Accept": "application/json",
-        })
-        try:
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                page = json.loads(resp.read().decode("utf-8"))
-        except urllib.error.HTTPError as e:
-            print(f"    ERROR fetching {table}: {e}")
-            return results
-        if not page:
-            break
-        results.extend(page)
-        if len(page) < PAGE_SIZE:
-            break
-        offset += PAGE_SIZE
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(_fetch_page, base_url, key, table, pk, None)
+        while pending is not None:
+            try:
+                page = pending.result()
+            except urllib.error.HTTPError as e:
+                print(f"    ERROR fetching {table}: {e}")
+                return results
+            pending = None
+            if not page:
+                break
+            if len(page) == PAGE_SIZE:
+                pending = pool.submit(_fetch_page, base_url, key, table, pk, page[-1][pk])
+            results.extend(page)
     return results
 
 
@@ -125,9 +138,9 @@ def main() -> int:
     manifest: dict[str, dict] = {}
     total_bytes = 0
     total_rows = 0
-    for table, _pk, order_col in TABLES:
+    for table, pk, _order_col in TABLES:
         print(f"  [{table}] fetching...", end=" ", flush=True)
-        rows = supabase_fetch_all(url, key, table, order_col)
+        rows = supabase_fetch_all(url, key, table, pk)
         path = out_dir / f"{table}.csv"
         size = write_csv(path, rows)
         manifest[table] = {"rows": len(rows), "bytes": size}
@@ -0,0 +1,85 @@
+-- Kline coverage RPC — status de klines en un solo round trip
+-- Date: 2026-10-19
+-- Context: kline_collector.get_klines_status hacía 2 queries PostgREST por cada
+--          combinación (símbolo × intervalo) en cada llamada a /klines/status/all.
+--          Esta función agrega count, primer/último open_time y cantidad de gaps
+--          por (symbol, interval) en una sola pasada sobre
+--          idx_klines_symbol_interval_time.
+--          El LAG para detectar gaps sólo corre sobre velas con
+--          open_time >= p_since (default: últimos 30 días); count y primer/último
+--          open_time siguen siendo de toda la historia (agregados sobre el índice).
+
+DROP FUNCTION IF EXISTS get_klines_coverage(TEXT[]);
+
+CREATE OR REPLACE FUNCTION get_klines_coverage(
+  p_symbols TEXT[] DEFAULT NULL,
+  p_since   TIMESTAMPTZ DEFAULT now() - INTERVAL '30 days'
+)
+RETURNS TABLE (
+  symbol          TEXT,
+  interval        TEXT,
+  candle_count    BIGINT,
+  first_open_time TIMESTAMPTZ,
+  last_open_time  TIMESTAMPTZ,
+  gap_count       BIGINT,
+  missing_candles BIGINT
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  WITH totals AS (
+    SELECT
+      k.symbol,
+      k.interval,
+      COUNT(*)         AS candle_count,
+      MIN(k.open_time) AS first_open_time,
+      MAX(k.open_time) AS last_open_time
+    FROM klines_ohlcv k
+    WHERE p_symbols IS NULL OR k.symbol = ANY (p_symbols)
+    GROUP BY k.symbol, k.interval
+  ),
+  ordered AS (
+    SELECT
+      k.symbol,
+      k.interval,
+      k.open_time,
+      k.open_time - LAG(k.open_time) OVER (
+        PARTITION BY k.symbol, k.interval ORDER BY k.open_time
+      ) AS step,
+      CASE k.interval
+        WHEN '1m'  THEN INTERVAL '1 minute'
+        WHEN '5m'  THEN INTERVAL '5 minutes'
+        WHEN '15m' THEN INTERVAL '15 minutes'
+        WHEN '1h'  THEN INTERVAL '1 hour'
+        WHEN '4h'  THEN INTERVAL '4 hours'
+        WHEN '1d'  THEN INTERVAL '1 day'
+      END AS expected
+    FROM klines_ohlcv k
+    WHERE (p_symbols IS NULL OR k.symbol = ANY (p_symbols))
+      AND (p_since IS NULL OR k.open_time >= p_since)
+  ),
+  gaps AS (
+    SELECT
+      o.symbol,
+      o.interval,
+      COUNT(*) AS gap_count,
+      SUM(
+        (EXTRACT(EPOCH FROM o.step) / EXTRACT(EPOCH FROM o.expected))::BIGINT - 1
+      )::BIGINT AS missing_candles
+    FROM ordered o
+    WHERE o.step > o.expected
+    GROUP BY o.symbol, o.interval
+  )
+  SELECT
+    t.symbol,
+    t.interval,
+    t.candle_count,
+    t.first_open_time,
+    t.last_open_time,
+    COALESCE(g.gap_count, 0)       AS gap_count,
+    COALESCE(g.missing_candles, 0) AS missing_candles
+  FROM totals t
+  LEFT JOIN gaps g USING (symbol, interval)
+  ORDER BY t.symbol, t.interval;
+$$;
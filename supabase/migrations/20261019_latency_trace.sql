@@ -0,0 +1,17 @@
+-- Trazas de latencia vela → señal → fill
+-- Date: 2026-10-19
+-- Context: no había timestamps a lo largo del camino run_quant_tick →
+--          generate_signals → _submit_proposal → execute_proposal →
+--          place_order. Cada proposal guarda su traza (etapas con duración
+--          e hitos candle_to_signal / candle_to_fill / signal_to_fill) y la
+--          posición abierta guarda la de su entrada. GET /quant/latency
+--          calcula p50/p95/p99 por etapa y símbolo (source=db usa estas columnas).
+
+ALTER TABLE trade_proposals
+  ADD COLUMN IF NOT EXISTS latency_trace JSONB;
+
+ALTER TABLE positions
+  ADD COLUMN IF NOT EXISTS latency_trace JSONB;
+
+COMMENT ON COLUMN trade_proposals.latency_trace IS
+  'Traza de latencia: {trace_id, tick_id, symbol, candle_close_ms, spans: [{stage, at_ms, ms}], marks: {candle_to_fill, ...}}';
@@ -0,0 +1,34 @@
+-- Mark-to-market RPC — precio/uPnL de todas las posiciones abiertas en un round trip
+-- Date: 2026-10-19
+-- Context: portfolio.get_portfolio_state hacía un UPDATE por posición en cada
+--          llamada (main loop y GET /portfolio). backend/app/services/mark_to_market.py
+--          calcula todas las marcas desde un solo snapshot de precios y las
+--          persiste con esta función, a lo sumo una vez por MARK_TO_MARKET_SECONDS.
+--          Sólo toca posiciones que siguen abiertas: una fila cerrada entre el
+--          snapshot y la escritura no se pisa.
+
+CREATE OR REPLACE FUNCTION mark_positions_to_market(p_marks JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+VOLATILE
+SECURITY DEFINER
+AS $$
+  WITH updated AS (
+    UPDATE positions p
+    SET
+      current_price          = m.current_price,
+      unrealized_pnl         = m.unrealized_pnl,
+      unrealized_pnl_percent = m.unrealized_pnl_percent,
+      updated_at             = NOW()
+    FROM jsonb_to_recordset(p_marks) AS m(
+      id                     UUID,
+      current_price          DECIMAL(20, 8),
+      unrealized_pnl         DECIMAL(20, 8),
+      unrealized_pnl_percent DECIMAL(10, 4)
+    )
+    WHERE p.id = m.id
+      AND p.status IN ('open', 'partially_closed')
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM updated;
+$$;
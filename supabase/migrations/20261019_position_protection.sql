@@ -0,0 +1,20 @@
+-- Protección SL/TP nativa en el exchange (OCO) para posiciones abiertas
+-- Date: 2026-10-19
+-- Context: SL/TP vivían sólo en positions y los hacía cumplir el fast loop
+--          consultando precios cada 2s. Con EXCHANGE_PROTECTION_ENABLED cada
+--          posición tiene un OCO SELL en Binance (LIMIT_MAKER en TP +
+--          STOP_LOSS_LIMIT en SL); acá se guardan sus ids para detectar fills,
+--          hacer cancel/replace en el trailing stop y sobrevivir reinicios.
+
+ALTER TABLE positions
+  ADD COLUMN IF NOT EXISTS protection_mode          TEXT,    -- 'oco' | 'stop_limit' | NULL
+  ADD COLUMN IF NOT EXISTS protection_order_list_id BIGINT,
+  ADD COLUMN IF NOT EXISTS protection_sl_order_id   BIGINT,
+  ADD COLUMN IF NOT EXISTS protection_tp_order_id   BIGINT,
+  ADD COLUMN IF NOT EXISTS protection_quantity      NUMERIC; -- neta: comisión en el asset base descontada
+
+COMMENT ON COLUMN positions.protection_mode IS
+  'Protección activa en el exchange: oco (SL+TP), stop_limit (sólo SL) o NULL (sólo polling del fast loop)';
+
+COMMENT ON COLUMN positions.protection_quantity IS
+  'Cantidad en balance a proteger (current_quantity menos la comisión cobrada en el asset base); NULL = current_quantity';
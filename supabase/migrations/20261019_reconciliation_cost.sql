@@ -0,0 +1,14 @@
+-- Costo y modo de cada corrida de reconciliación
+-- Date: 2026-10-19
+-- Context: la reconciliación pasó a ser incremental con cadencia adaptativa
+--          (backend/app/services/reconciliation.py). Cada corrida guarda si fue
+--          completa o incremental y cuánto costó: queries a la DB, llamadas al
+--          exchange, órdenes verificadas vs. en caché, propuestas leídas.
+--          La fila se inserta una vez al final (antes: INSERT 'running' + UPDATE).
+
+ALTER TABLE reconciliation_runs
+  ADD COLUMN IF NOT EXISTS mode TEXT CHECK (mode IN ('full', 'incremental')),
+  ADD COLUMN IF NOT EXISTS cost JSONB;
+
+COMMENT ON COLUMN reconciliation_runs.cost IS
+  'db_queries, db_ms, exchange_calls, orders_checked, orders_cached, proposals_read, duration_ms';
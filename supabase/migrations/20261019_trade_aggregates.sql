@@ -0,0 +1,34 @@
+-- Agregados incrementales de trades cerrados
+-- Date: 2026-10-19
+-- Context: Kelly sizing, portfolio y performance_metrics leían todas las
+--          posiciones cerradas en cada cálculo. executor._close_position
+--          ahora actualiza estas filas (sumas y prefijos de PnL, ver
+--          backend/app/services/trade_stats.py). Las ventanas rolling se
+--          arman combinando los buckets diarios.
+--          Verificación / reconstrucción: python backend/rebuild_trade_stats.py
+
+CREATE TABLE IF NOT EXISTS trade_aggregates (
+  scope TEXT NOT NULL CHECK (scope IN ('all', 'symbol', 'strategy')),
+  scope_key TEXT NOT NULL,            -- '*' para scope 'all'
+  bucket TEXT NOT NULL,               -- 'all' o día UTC de cierre 'YYYY-MM-DD'
+  trades INTEGER NOT NULL DEFAULT 0,
+  wins INTEGER NOT NULL DEFAULT 0,
+  losses INTEGER NOT NULL DEFAULT 0,
+  pnl_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  return_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  return_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  win_return_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  loss_return_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  loss_return_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  pnl_peak DOUBLE PRECISION NOT NULL DEFAULT 0,
+  pnl_trough DOUBLE PRECISION NOT NULL DEFAULT 0,
+  max_drawdown DOUBLE PRECISION NOT NULL DEFAULT 0,
+  last_closed_at TIMESTAMPTZ,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (scope, scope_key, bucket)
+);
+
+CREATE INDEX IF NOT EXISTS idx_trade_aggregates_bucket ON trade_aggregates(bucket);
+
+COMMENT ON TABLE trade_aggregates IS
+  'Estadísticas suficientes de trades cerrados por scope (all/symbol/strategy) y bucket (all o día UTC)';